@@ -38,6 +38,7 @@ from infinigen.core.placement.split_in_view import split_inview
 from infinigen.core.tagging import tag_object
 from infinigen.core.util import blender as butil
 from infinigen.core.util.blender import deep_clone_obj
+from infinigen.core.util.checkpoint import checkpointable
 from infinigen.core.util.math import FixedSeed
 
 from . import tree_flower
@@ -211,6 +212,7 @@ class GenericTreeFactory(AssetFactory):
 
 
 @gin.configurable
+@checkpointable("pickle")
 def random_season(weights=None):
     options = ["autumn", "summer", "spring", "winter"]
 
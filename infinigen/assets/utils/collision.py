@@ -0,0 +1,216 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import hashlib
+import logging
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+
+import gin
+import numpy as np
+import trimesh
+
+try:
+    import coacd
+except ImportError:
+    coacd = None
+
+logger = logging.getLogger(__name__)
+
+"""
+Simplified collision geometry for exported links.
+
+Each link mesh is approximated by at most `max_hulls` convex hulls of at most `max_hull_vertices`
+vertices each. If `coacd` is installed it is used for the decomposition, otherwise the mesh is
+recursively cut by axis-aligned planes while that still shrinks the total hull volume.
+Results are cached on disk by a hash of the mesh and the budgets, since the same part mesh is
+exported many times across links and seeds.
+"""
+
+
+def mesh_hash(vertices, faces, *params):
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(vertices, dtype=np.float32).tobytes())
+    h.update(np.ascontiguousarray(faces, dtype=np.int64).tobytes())
+    h.update(repr(params).encode())
+    return h.hexdigest()
+
+
+def _hull(points):
+    try:
+        return trimesh.convex.convex_hull(points)
+    except Exception:
+        # degenerate (flat or too few points), fall back to the bounding box
+        lo, hi = points.min(axis=0), points.max(axis=0)
+        extents = np.maximum(hi - lo, 1e-4)
+        box = trimesh.creation.box(extents=extents)
+        box.apply_translation((lo + hi) / 2)
+        return box
+
+
+def farthest_points(points, k):
+    """Greedy farthest-point subset of `points` with k elements, always keeping the first point"""
+    if len(points) <= k:
+        return points
+    chosen = np.zeros(k, dtype=np.int64)
+    dist = np.linalg.norm(points - points[0], axis=-1)
+    for i in range(1, k):
+        chosen[i] = np.argmax(dist)
+        dist = np.minimum(dist, np.linalg.norm(points - points[chosen[i]], axis=-1))
+    return points[chosen]
+
+
+def limit_hull_vertices(hull, max_vertices):
+    if len(hull.vertices) <= max_vertices:
+        return hull
+    return _hull(farthest_points(hull.vertices, max_vertices))
+
+
+def bisect_hulls(vertices, faces, max_hulls=8, min_gain=0.1, cuts=(0.25, 0.5, 0.75)):
+    """
+    Approximate convex decomposition by recursive bisection of the mesh's faces
+
+    The piece with the largest hull is cut by whichever axis-aligned plane (at the `cuts` fractions
+    of its bounding box) gives the smallest total child hull volume, as long as that is at least
+    `min_gain` smaller than the parent's hull volume.
+    """
+    centroids = vertices[faces].mean(axis=1)
+
+    def piece(face_idx):
+        hull = _hull(vertices[np.unique(faces[face_idx])])
+        return hull.volume, face_idx, hull
+
+    def best_split(face_idx):
+        c = centroids[face_idx]
+        lo, hi = c.min(axis=0), c.max(axis=0)
+        best = None
+        for axis in range(3):
+            for t in cuts:
+                below = c[:, axis] < lo[axis] + t * (hi[axis] - lo[axis])
+                if below.all() or not below.any():
+                    continue
+                children = [piece(face_idx[below]), piece(face_idx[~below])]
+                volume = children[0][0] + children[1][0]
+                if best is None or volume < best[0]:
+                    best = volume, children
+        return best
+
+    pieces = [piece(np.arange(len(faces)))]
+    frozen = []
+    while pieces and len(pieces) + len(frozen) < max_hulls:
+        pieces.sort(key=lambda p: p[0])
+        volume, face_idx, hull = pieces.pop()
+        split = best_split(face_idx)
+        if split is None or split[0] > (1 - min_gain) * volume:
+            frozen.append((volume, face_idx, hull))
+            continue
+        pieces += split[1]
+    return [hull for _, _, hull in pieces + frozen]
+
+
+def decompose(vertices, faces, max_hulls=8, max_hull_vertices=64, method="auto"):
+    """Convex pieces approximating the mesh, as a list of trimesh.Trimesh"""
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64)
+    if len(faces) == 0:
+        return []
+
+    if method == "auto":
+        method = "coacd" if coacd is not None else "bisect"
+
+    match method:
+        case "hull":
+            hulls = [_hull(vertices)]
+        case "bisect":
+            hulls = bisect_hulls(vertices, faces, max_hulls=max_hulls)
+        case "coacd":
+            if coacd is None:
+                raise ImportError(
+                    "method='coacd' requires the `coacd` package, use method='bisect' or `pip install coacd`"
+                )
+            parts = coacd.run_coacd(
+                coacd.Mesh(vertices, faces), max_convex_hull=max_hulls
+            )
+            hulls = [_hull(np.asarray(v)) for v, _ in parts]
+        case _:
+            raise ValueError(f"Unrecognized collision decomposition {method=}")
+
+    return [limit_hull_vertices(h, max_hull_vertices) for h in hulls]
+
+
+@gin.configurable
+class CollisionCache:
+    """Decompositions stored as <root>/<key[:2]>/<key>.npz, one vertices/faces pair per hull"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key):
+        return self.root / key[:2] / f"{key}.npz"
+
+    def load(self, key):
+        path = self.path(key)
+        if not path.exists():
+            return None
+        with np.load(path) as d:
+            n = int(d["n_hulls"])
+            return [
+                trimesh.Trimesh(d[f"vertices_{i}"], d[f"faces_{i}"], process=False)
+                for i in range(n)
+            ]
+
+    def store(self, key, hulls):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = dict(n_hulls=np.asarray(len(hulls)))
+        for i, h in enumerate(hulls):
+            arrays[f"vertices_{i}"] = np.asarray(h.vertices)
+            arrays[f"faces_{i}"] = np.asarray(h.faces)
+        tmp_path = path.with_name(f".{key}.tmp.npz")
+        np.savez(tmp_path, **arrays)
+        tmp_path.replace(path)
+
+
+@gin.configurable
+def collision_hulls(
+    mesh: trimesh.Trimesh,
+    max_hulls=8,
+    max_hull_vertices=64,
+    method="auto",
+    cache_root=None,
+):
+    """decompose() with an optional on-disk cache keyed by mesh content and budgets"""
+    cache = CollisionCache(cache_root) if cache_root is not None else None
+    key = mesh_hash(
+        mesh.vertices, mesh.faces, max_hulls, max_hull_vertices, method, "v1"
+    )
+    if cache is not None and (hulls := cache.load(key)) is not None:
+        return hulls
+    hulls = decompose(mesh.vertices, mesh.faces, max_hulls, max_hull_vertices, method)
+    if cache is not None:
+        cache.store(key, hulls)
+    return hulls
+
+
+def load_mesh(path):
+    mesh = trimesh.load(path, force="mesh", process=False)
+    return trimesh.Trimesh(mesh.vertices, mesh.faces, process=False)
+
+
+def _file_hulls(path, **kwargs):
+    return collision_hulls(load_mesh(path), **kwargs)
+
+
+def compute_collision_hulls(mesh_paths, n_workers=1, **kwargs):
+    """{path: hulls} for every mesh file, decomposed in a process pool when n_workers > 1"""
+    mesh_paths = list(mesh_paths)
+    func = partial(_file_hulls, **kwargs)
+    if n_workers == 1:
+        results = [func(p) for p in mesh_paths]
+    else:
+        with Pool(n_workers) as p:
+            results = p.map(func, mesh_paths)
+    return dict(zip(mesh_paths, results))
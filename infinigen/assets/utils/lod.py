@@ -0,0 +1,134 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import logging
+from pathlib import Path
+
+import gin
+import numpy as np
+import trimesh
+
+try:
+    import fast_simplification
+except ImportError:
+    fast_simplification = None
+
+logger = logging.getLogger(__name__)
+
+"""
+Level-of-detail versions of exported link meshes.
+
+Each LOD targets a fraction of the original face count, but never moves geometry further than
+`max_error` (relative to the mesh's bounding box diagonal); if the target can't be met within
+that bound the LOD keeps more faces. Quadric decimation via `fast_simplification` is used when it
+is installed, otherwise vertex clustering on a grid whose cell size is searched for the target.
+"""
+
+LOD_RATIOS = (0.5, 0.2, 0.05)
+
+
+def cluster_vertices(vertices, faces, cell, uv=None, uv_cell=1 / 64):
+    """
+    Merge all vertices within the same `cell`-sized grid cell into their mean
+
+    If uv is given, vertices are only merged when their uvs also share a uv_cell, so texture
+    seams are preserved. Returns (vertices, faces, uv), dropping degenerate and duplicate faces.
+    """
+    keys = np.floor((vertices - vertices.min(axis=0)) / cell).astype(np.int64)
+    if uv is not None:
+        keys = np.concatenate([keys, np.floor(uv / uv_cell).astype(np.int64)], axis=1)
+    _, inverse, counts = np.unique(
+        keys, axis=0, return_inverse=True, return_counts=True
+    )
+    inverse = inverse.reshape(-1)
+
+    def mean(arr):
+        out = np.zeros((len(counts), arr.shape[1]))
+        np.add.at(out, inverse, arr)
+        return out / counts[:, None]
+
+    new_faces = inverse[faces]
+    keep = (
+        (new_faces[:, 0] != new_faces[:, 1])
+        & (new_faces[:, 1] != new_faces[:, 2])
+        & (new_faces[:, 0] != new_faces[:, 2])
+    )
+    new_faces = new_faces[keep]
+    _, unique_idx = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+    new_faces = new_faces[np.sort(unique_idx)]
+    return mean(vertices), new_faces, None if uv is None else mean(uv)
+
+
+def decimate_clustering(vertices, faces, target_faces, max_error, uv=None, iters=12):
+    """Coarsest vertex clustering that keeps at least target_faces faces and moves vertices <= max_error"""
+    # a vertex moves at most one cell diagonal
+    cell_max = max_error / np.sqrt(3)
+    result = cluster_vertices(vertices, faces, cell_max, uv)
+    if len(result[1]) >= target_faces:
+        return result
+
+    best = vertices, faces, uv
+    lo, hi = np.log(cell_max * 1e-3), np.log(cell_max)
+    for _ in range(iters):
+        mid = (lo + hi) / 2
+        result = cluster_vertices(vertices, faces, np.exp(mid), uv)
+        if len(result[1]) >= target_faces:
+            best, lo = result, mid
+        else:
+            hi = mid
+    return best
+
+
+def decimate(mesh: trimesh.Trimesh, ratio, max_error=0.02):
+    """Simplify mesh to about ratio * its face count, moving no vertex more than max_error * diagonal"""
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces, dtype=np.int64)
+    target = max(int(len(faces) * ratio), 4)
+    if len(faces) <= target:
+        return mesh
+    error = max_error * np.linalg.norm(mesh.extents)
+
+    uv = getattr(mesh.visual, "uv", None)
+    if fast_simplification is not None and uv is None:
+        new_vertices, new_faces = fast_simplification.simplify(
+            vertices, faces, target_reduction=1 - ratio
+        )
+        result = trimesh.Trimesh(new_vertices, new_faces, process=False)
+        # quadric decimation has no hard error bound, so check it and fall back if violated
+        if np.abs(result.nearest.signed_distance(vertices)).max() <= error:
+            return result
+
+    new_vertices, new_faces, new_uv = decimate_clustering(
+        vertices, faces, target, error, uv=None if uv is None else np.asarray(uv)
+    )
+    visual = None
+    if new_uv is not None:
+        visual = trimesh.visual.TextureVisuals(
+            uv=new_uv, material=getattr(mesh.visual, "material", None)
+        )
+    return trimesh.Trimesh(new_vertices, new_faces, visual=visual, process=False)
+
+
+def lod_path(mesh_path, level):
+    mesh_path = Path(mesh_path)
+    return mesh_path.parent / f"{mesh_path.stem}_lod{level}{mesh_path.suffix}"
+
+
+@gin.configurable
+def generate_lods(mesh_path, ratios=LOD_RATIOS, max_error=0.02):
+    """
+    Write decimated copies of mesh_path beside it as <stem>_lod1.obj, <stem>_lod2.obj, ...
+
+    Returns [(path, face_count)] for level 0 (the original) and each LOD. Every level is decimated
+    from the original, so the error bound holds per level rather than accumulating.
+    """
+    mesh = trimesh.load(mesh_path, force="mesh", process=False)
+    levels = [(Path(mesh_path), len(mesh.faces))]
+    for level, ratio in enumerate(ratios, start=1):
+        lod = decimate(mesh, ratio, max_error=max_error)
+        path = lod_path(mesh_path, level)
+        lod.export(path)
+        levels.append((path, len(lod.faces)))
+        logger.debug(f"{path.name}: {len(lod.faces)}/{len(mesh.faces)} faces")
+    return levels
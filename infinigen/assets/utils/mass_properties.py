@@ -0,0 +1,166 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import logging
+import re
+
+import gin
+import numpy as np
+import trimesh
+
+logger = logging.getLogger(__name__)
+
+"""
+Volume, center of mass and inertia tensor for many link meshes at once.
+
+Every triangle forms a signed tetrahedron with the origin; summing their closed-form volume,
+first and second moments per mesh (one vectorized pass over all triangles of all meshes) gives
+exact mass properties for closed meshes. Meshes that are open or inside-out fall back to their
+convex hull.
+"""
+
+# kg / m^3
+DENSITIES = {
+    "wood": 700.0,
+    "metal": 7800.0,
+    "plastic": 1100.0,
+    "glass": 2500.0,
+    "ceramic": 2400.0,
+    "stone": 2600.0,
+    "fabric": 300.0,
+    "leather": 900.0,
+    "rubber": 1100.0,
+    "paper": 800.0,
+}
+DEFAULT_DENSITY = 1000.0
+
+# keywords in material names that identify each density category
+CATEGORY_KEYWORDS = {
+    "wood": ("wood", "plywood", "oak", "maple", "bamboo"),
+    "metal": ("metal", "steel", "brass", "aluminum", "iron", "chrome", "copper"),
+    "plastic": ("plastic", "acrylic"),
+    "glass": ("glass", "mirror"),
+    "ceramic": ("ceramic", "porcelain", "tile"),
+    "stone": ("stone", "marble", "granite", "concrete"),
+    "fabric": ("fabric", "cloth", "velvet", "sofa"),
+    "leather": ("leather",),
+    "rubber": ("rubber",),
+    "paper": ("paper", "cardboard"),
+}
+
+
+def name_tokens(name):
+    """Lowercase words of a material name, split at separators and camelCase: BrushedMetal_2.001 -> brushed, metal"""
+    return [w.lower() for w in re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])", name)]
+
+
+def material_category(names):
+    """
+    First density category with a keyword among the words of the material `names`, or None.
+    Whole words only, so that e.g. "environment" does not match "iron"
+    """
+    tokens = {t for name in names for t in name_tokens(name)}
+    tokens |= {t[:-1] for t in tokens if t.endswith("s")}  # tiles, metals
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if not tokens.isdisjoint(keywords):
+            return category
+    return None
+
+
+@gin.configurable
+def density_for(category, densities=None, default=DEFAULT_DENSITY):
+    densities = DENSITIES if densities is None else {**DENSITIES, **densities}
+    return densities.get(category, default)
+
+
+def tetra_moments(triangles):
+    """
+    Volume, first moment and second moment of each origin-based tetrahedron
+
+    triangles is (n, 3, 3). Returns vol (n,), first (n, 3) = int x dV and second (n, 3, 3) = int x x^T dV.
+    """
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    det = np.einsum("ij,ij->i", a, np.cross(b, c))
+    vol = det / 6
+    s = a + b + c
+    first = vol[:, None] * s / 4
+    outer = (
+        np.einsum("ni,nj->nij", a, a)
+        + np.einsum("ni,nj->nij", b, b)
+        + np.einsum("ni,nj->nij", c, c)
+        + np.einsum("ni,nj->nij", s, s)
+    )
+    second = det[:, None, None] / 120 * outer
+    return vol, first, second
+
+
+def mass_properties(vertices_list, faces_list, densities=None):
+    """
+    Mass properties of many meshes in one vectorized pass
+
+    Returns dict of arrays with one entry per mesh: volume (n,), mass (n,), center_mass (n, 3) and
+    inertia (n, 3, 3) about the center of mass. Meshes with non-positive volume get NaNs.
+    """
+    n = len(vertices_list)
+    densities = (
+        np.full(n, DEFAULT_DENSITY) if densities is None else np.asarray(densities)
+    )
+    counts = np.array([len(f) for f in faces_list])
+    if counts.sum() == 0:
+        triangles = np.zeros((0, 3, 3))
+    else:
+        triangles = np.concatenate(
+            [
+                np.asarray(v, dtype=np.float64)[np.asarray(f)]
+                for v, f in zip(vertices_list, faces_list)
+            ]
+        )
+    segment = np.repeat(np.arange(n), counts)
+
+    vol, first, second = tetra_moments(triangles)
+    volume = np.bincount(segment, vol, minlength=n)
+    moment = np.zeros((n, 3))
+    np.add.at(moment, segment, first)
+    cov = np.zeros((n, 3, 3))
+    np.add.at(cov, segment, second)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        valid = volume > 0
+        center = np.where(valid[:, None], moment / volume[:, None], np.nan)
+        # shift the second moment to the center of mass, then convert to the inertia tensor
+        cov = cov - volume[:, None, None] * np.einsum("ni,nj->nij", center, center)
+        mass = densities * volume
+        cov = cov * densities[:, None, None]
+        inertia = np.trace(cov, axis1=1, axis2=2)[:, None, None] * np.eye(3) - cov
+        inertia[~valid] = np.nan
+        mass[~valid] = np.nan
+
+    return dict(volume=volume, mass=mass, center_mass=center, inertia=inertia)
+
+
+def solid_for_integration(mesh: trimesh.Trimesh):
+    """mesh itself if it encloses a positive volume, otherwise its convex hull"""
+    # exported meshes duplicate vertices along uv seams, merge them before checking closure
+    mesh = trimesh.Trimesh(mesh.vertices, mesh.faces, process=True)
+    if mesh.is_watertight and mesh.is_winding_consistent and mesh.volume > 0:
+        return mesh, False
+    try:
+        return mesh.convex_hull, True
+    except Exception:
+        return None, True
+
+
+def meshes_mass_properties(meshes, densities=None):
+    """mass_properties() for trimesh.Trimesh objects, integrating open meshes as their convex hull"""
+    solids = []
+    for mesh in meshes:
+        solid, used_hull = solid_for_integration(mesh)
+        if solid is None:
+            solid = trimesh.Trimesh()
+        if used_hull:
+            logger.debug(f"Using convex hull for mass properties of {mesh}")
+        solids.append(solid)
+    return mass_properties(
+        [s.vertices for s in solids], [s.faces for s in solids], densities
+    )
@@ -36,6 +36,8 @@ from infinigen.core.util.blender import select_none
 
 import urdfpy
 from infinigen.tools import export
+from infinigen.assets.utils import collision as collision_utils
+from infinigen.assets.utils import lod, mass_properties
 import infinigen.assets.utils.usdutils as usdutils
 import math
 
@@ -596,13 +598,150 @@ def render_object_texture_and_save(obj, material, path):
     # #add camera
     # bpy.ops.render.render(write_still=True)
     # bpy.context.window.scene = original_scene 
+def link_collisions(mesh_path, hulls):
+    """Write each convex hull beside the link mesh and wrap them as urdfpy.Collision elements"""
+    mesh_path = Path(mesh_path)
+    elements = []
+    for i, hull in enumerate(hulls):
+        hull_path = mesh_path.parent / f"{mesh_path.stem}_collision_{i}.obj"
+        hull.export(hull_path)
+        elements.append(urdfpy.Collision(
+            name=f"{mesh_path.stem}_collision_{i}",
+            origin=None,
+            geometry=urdfpy.Geometry(mesh=urdfpy.Mesh(filename=str(hull_path), meshes=[hull])),
+        ))
+    return elements or None
+
+
+def save_lod_variants(robot, urdf_dir, lod_levels):
+    """
+    Save scene_lod{k}.urdf for each LOD level, with visual meshes swapped for their level-k version,
+    plus a lods.json manifest listing each level's URDF and total face count
+    """
+    urdf_dir = Path(urdf_dir)
+    n_levels = max((len(levels) for levels in lod_levels.values()), default=1)
+    visuals = [v for l in robot.links for v in (l.visuals or []) if v.geometry.mesh is not None]
+    originals = [(v.geometry.mesh.filename, v.geometry.mesh.meshes) for v in visuals]
+    manifest = []
+    for level in range(n_levels):
+        urdf_name = "scene.urdf" if level == 0 else f"scene_lod{level}.urdf"
+        faces = 0
+        for v, (filename, meshes) in zip(visuals, originals):
+            levels = lod_levels.get(filename)
+            if levels is None:
+                faces += sum(len(m.faces) for m in meshes)
+                continue
+            lod_file, lod_faces = levels[min(level, len(levels) - 1)]
+            faces += lod_faces
+            if level > 0:
+                v.geometry.mesh.filename = str(lod_file)
+                v.geometry.mesh.meshes = str(lod_file)
+        if level > 0:
+            robot.save(str(urdf_dir / urdf_name))
+        manifest.append(dict(level=level, urdf=urdf_name, faces=faces))
+    for v, (filename, meshes) in zip(visuals, originals):
+        v.geometry.mesh.filename = filename
+        v.geometry.mesh.meshes = meshes
+    with open(urdf_dir / "lods.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def link_densities(mesh_paths):
+    """Density of each link mesh, from the category of the material names in its .mtl file"""
+    densities = []
+    for mesh_path in mesh_paths:
+        mtl_path = Path(mesh_path).with_suffix(".mtl")
+        names = []
+        if mtl_path.exists():
+            names = [l.split(maxsplit=1)[-1] for l in mtl_path.read_text().splitlines() if l.startswith("newmtl")]
+        densities.append(mass_properties.density_for(mass_properties.material_category(names)))
+    return densities
+
+
+def link_inertials(mesh_paths):
+    """urdfpy.Inertial for every link mesh, computed together in one vectorized pass"""
+    mesh_paths = list(mesh_paths)
+    meshes = [collision_utils.load_mesh(p) for p in mesh_paths]
+    props = mass_properties.meshes_mass_properties(meshes, link_densities(mesh_paths))
+    inertials = {}
+    for i, mesh_path in enumerate(mesh_paths):
+        if not np.isfinite(props["mass"][i]) or props["mass"][i] <= 0:
+            inertials[mesh_path] = None
+            continue
+        origin = np.eye(4)
+        origin[:3, 3] = props["center_mass"][i]
+        inertials[mesh_path] = urdfpy.Inertial(mass=props["mass"][i], inertia=props["inertia"][i], origin=origin)
+    return inertials
+
+
 saved_objs = []
-def save_whole_object_normalized(object, path=None, idx="unknown", name=None, use_bpy=False):
+# parts whose bake waits for the rest of the asset, see defer_part_export
+deferred_parts = []
+
+
+def defer_part_export(part, export_file, before_export=None, texel_density=None, atlas_res=None):
+    """Queue a copy of part for export_deferred_parts, which bakes it together with the asset's other parts"""
+    clone = butil.deep_clone_obj(part, keep_materials=True, keep_modifiers=True)
+    deferred_parts.append(
+        dict(
+            obj=clone,
+            export_file=export_file,
+            before_export=before_export,
+            saved_idx=len(saved_objs) - 1,
+            texel_density=texel_density,
+            atlas_res=atlas_res,
+        )
+    )
+
+
+def export_deferred_parts():
+    """
+    Bake and export the deferred parts, all parts with the same settings in a single bake_scene
+    call so that small parts share atlas pages
+    """
+    global deferred_parts
+    pending, deferred_parts = deferred_parts, []
+    groups = {}
+    for entry in pending:
+        objs_folder = entry["export_file"].parents[2]  # <idx>/objs/<i>/<name>/<name>.obj
+        key = (objs_folder, entry["texel_density"], entry["atlas_res"])
+        groups.setdefault(key, []).append(entry)
+
+    for (objs_folder, texel_density, atlas_res), entries in groups.items():
+        hooks = {}
+        for entry in entries:
+            if entry["before_export"] is not None:
+                def hook(obj, entry=entry):
+                    entry["before_export"](obj)
+                    saved_objs[entry["saved_idx"]] = obj
+                hooks[entry["obj"]] = hook
+        export_files = {entry["obj"]: entry["export_file"] for entry in entries}
+        export_curr_scene(
+            list(export_files),
+            objs_folder,
+            format="obj",
+            image_res=1024,
+            vertex_colors=False,
+            individual_export=True,
+            texel_density=texel_density,
+            atlas_res=atlas_res,
+            export_files=export_files,
+            export_hooks=hooks,
+        )
+        for entry in entries:
+            if entry["obj"] not in hooks:
+                butil.delete(entry["obj"])
+
+
+@gin.configurable
+def save_whole_object_normalized(object, path=None, idx="unknown", name=None, use_bpy=False, collisions=True, collision_workers=1, lod_ratios=None, inertial=True, texel_density=None):
     global saved_objs
     global robot_tree, root
     global internal_bbox
+    export_deferred_parts()
     big_obj = join_objects(saved_objs)
-    save_obj_parts_add([big_obj], path, idx, name, first=False, use_bpy=True, parent_obj_id="")
+    save_obj_parts_add([big_obj], path, idx, name, first=False, use_bpy=True, parent_obj_id="", texel_density=texel_density, atlas_res=None)
     if idx == "unknown":
         idx = f"random_{np.random.randint(0, 10000)}"
     else:
@@ -842,6 +981,30 @@ def save_whole_object_normalized(object, path=None, idx="unknown", name=None, us
     origins["world"] = (0, 0, 0)
     print(robot_tree)
 
+    lod_levels = {}
+    if lod_ratios:
+        lod_levels = {p: lod.generate_lods(p, ratios=lod_ratios) for p in path_list}
+
+    inertials = link_inertials(path_list) if inertial else {}
+
+    def get_inertial(mesh_path):
+        if not inertial:
+            return None
+        if mesh_path not in inertials:
+            inertials.update(link_inertials([mesh_path]))
+        return inertials[mesh_path]
+
+    hulls = {}
+    if collisions:
+        hulls = collision_utils.compute_collision_hulls(path_list, n_workers=collision_workers)
+
+    def get_collision(mesh_path):
+        if not collisions:
+            return None
+        if mesh_path not in hulls:
+            hulls[mesh_path] = collision_utils.collision_hulls(collision_utils.load_mesh(mesh_path))
+        return link_collisions(mesh_path, hulls[mesh_path])
+
     root = urdfpy.Link("l_world", visuals=None, collisions=None, inertial=None)
     links["l_world"] = root
     for link in robot_tree.keys():
@@ -859,8 +1022,8 @@ def save_whole_object_normalized(object, path=None, idx="unknown", name=None, us
             if os.path.isfile(os.path.join(path, idx, "objs", f"{mesh_idx}.png")):
                 texture = urdfpy.Texture(filename=os.path.join(path, idx, "objs", f"{mesh_idx}.png"))
                 material = urdfpy.Material(name=get_link_name("material"), texture=texture)
-            collision = None#[urdfpy.Collision(name="temp", origin=None, geometry=urdfpy.Geometry(mesh=urdfpy.Mesh(filename=os.path.join(path, idx, "objs", f"{mesh_idx}",f"{mesh_idx}.obj"))))]
-            l = urdfpy.Link(f'l_{link}', visuals=[urdfpy.Visual(material=material, geometry=urdfpy.Geometry(mesh=urdfpy.Mesh(filename=os.path.join(path, idx, "objs",f"{mesh_idx}", f"{mesh_idx}.obj"))))], collisions=collision, inertial=None)
+            collision = get_collision(os.path.join(path, idx, "objs", f"{mesh_idx}", f"{mesh_idx}.obj"))
+            l = urdfpy.Link(f'l_{link}', visuals=[urdfpy.Visual(material=material, geometry=urdfpy.Geometry(mesh=urdfpy.Mesh(filename=os.path.join(path, idx, "objs",f"{mesh_idx}", f"{mesh_idx}.obj"))))], collisions=collision, inertial=get_inertial(os.path.join(path, idx, "objs", f"{mesh_idx}", f"{mesh_idx}.obj")))
             links[f"l_{link}"] = l
             #usdutils.add_mesh(os.path.join(path, idx, "objs", f"{link}", f"{link}.usd"), f"l_{link}", origins[link])
         else:
@@ -892,10 +1055,10 @@ def save_whole_object_normalized(object, path=None, idx="unknown", name=None, us
                 texture = urdfpy.Texture(filename=os.path.join(path, idx, "objs", f"{mesh_idx}.png"))
                 material = urdfpy.Material(name=get_link_name("material"), texture=texture)
             if parent != "world":
-                collision = None#[urdfpy.Collision(name="temp", origin=None, geometry=urdfpy.Geometry(mesh=urdfpy.Mesh(filename=os.path.join(path, idx, "objs", f"{mesh_idx}",f"{mesh_idx}.obj"))))]
+                collision = get_collision(os.path.join(path, idx, "objs", f"{mesh_idx}", f"{mesh_idx}.obj"))
             else:
                 collision = None
-            p = urdfpy.Link(f'l_{parent}', visuals=[urdfpy.Visual(material=material, geometry=urdfpy.Geometry(mesh=urdfpy.Mesh(filename=os.path.join(path, idx, "objs",f"{mesh_idx}",  f"{mesh_idx}.obj"))))], collisions=collision, inertial=None)
+            p = urdfpy.Link(f'l_{parent}', visuals=[urdfpy.Visual(material=material, geometry=urdfpy.Geometry(mesh=urdfpy.Mesh(filename=os.path.join(path, idx, "objs",f"{mesh_idx}",  f"{mesh_idx}.obj"))))], collisions=collision, inertial=get_inertial(os.path.join(path, idx, "objs", f"{mesh_idx}", f"{mesh_idx}.obj")))
             links[f"l_{parent}"] = p
             #usdutils.add_mesh(os.path.join(path, idx, "objs", f"{parent}", f"{parent}.usd"), f"l_{parent}", origins[parent])
         else:
@@ -1005,6 +1168,8 @@ def save_whole_object_normalized(object, path=None, idx="unknown", name=None, us
 
     robot = urdfpy.URDF("scene", list(links.values()), joints=joints)
     robot.save(os.path.join(path, idx, "scene.urdf"))
+    if lod_ratios:
+        save_lod_variants(robot, os.path.join(path, idx), lod_levels)
     shutil.rmtree(os.path.join(path, idx, path, idx, "objs"))
     shutil.copytree(os.path.join(path, idx, "objs"), os.path.join(path, idx, path, idx, "objs"))
     shutil.rmtree(os.path.join(path, idx, "objs"))
@@ -1078,9 +1243,14 @@ def save_obj_parts_join_objects(
     return obj
 
 
+@gin.configurable
 def save_obj_parts_add(
-    obj, path=None, idx="unknown", name=None, obj_name=None, first=True, use_bpy=False, parent_obj_id=None, joint_info=None, material=None, before_export=None
+    obj, path=None, idx="unknown", name=None, obj_name=None, first=True, use_bpy=False, parent_obj_id=None, joint_info=None, material=None, before_export=None, texel_density=None, atlas_res=None
 ):
+    """
+    texel_density: bake each part at a resolution matching its size, see export.plan_bake_resolutions
+    atlas_res: bake the parts later, all at once in save_whole_object_normalized, so small parts share atlases
+    """
     global saved_objs
     butil.select_none()
     if not isinstance(obj, list):
@@ -1104,7 +1274,7 @@ def save_obj_parts_add(
     # original_node_tree = bpy.context.scene.world.node_tree
     # Save a reference to the original scene
     original_scene = bpy.context.scene
-    saved = save_part_export_obj_normalized_add_json(obj, path, idx, name, first=first, use_bpy=use_bpy, parent_obj_id=parent_obj_id, joint_info=joint_info, material=material, before_export=before_export)
+    saved = save_part_export_obj_normalized_add_json(obj, path, idx, name, first=first, use_bpy=use_bpy, parent_obj_id=parent_obj_id, joint_info=joint_info, material=material, before_export=before_export, texel_density=texel_density, atlas_res=atlas_res)
     # We need to link all these objects into view_layer
     view_layer = bpy.context.view_layer
     for part in obj:
@@ -1289,8 +1459,16 @@ def export_curr_scene(
     image_res=1024,
     vertex_colors=False,
     individual_export=True,
-    before_export=None
+    before_export=None,
+    texel_density=None,
+    atlas_res=None,
+    export_files=None,
+    export_hooks=None,
 ) -> Path:
+    """
+    export_files: {obj: path} to write obj to, instead of output_folder/obj.name/obj.name.format
+    export_hooks: {obj: callable} called with obj right before it is written, like before_export
+    """
     global saved_obj, saved_objs
     #wait = input("Press Enter to continue.")
     export_usd = format in ["usda", "usdc"]
@@ -1348,6 +1526,8 @@ def export_curr_scene(
         vertex_colors=vertex_colors,
         export_usd=export_usd,
         objs=objs,
+        texel_density=texel_density,
+        atlas_res=atlas_res,
     )
 
     for collection, status in collection_views.items():
@@ -1374,9 +1554,11 @@ def export_curr_scene(
             # ):
             #     continue
             butil.select_none()
-            export_subfolder = export_folder / obj.name
-            export_subfolder.mkdir(exist_ok=True)
-            export_file = export_subfolder / f"{obj.name}.{format}"
+            if export_files is None:
+                export_file = export_folder / obj.name / f"{obj.name}.{format}"
+            else:
+                export_file = export_files[obj]
+            export_file.parent.mkdir(exist_ok=True, parents=True)
 
             obj.hide_viewport = False
             obj.select_set(True)
@@ -1384,6 +1566,8 @@ def export_curr_scene(
                 before_export(obj)
                 saved_objs.pop()
                 saved_objs.append(obj)
+            if export_hooks is not None and obj in export_hooks:
+                export_hooks[obj](obj)
             export.run_blender_export(export_file, format, vertex_colors, individual_export)
             saved_obj = obj.copy()
             #bpy.context.scene.objects.active = obj
@@ -1422,7 +1606,7 @@ def apply(obj, shader_func, selection=None, *args, **kwargs):
         write_material_index(o, material_index)
 
 def save_part_export_obj_normalized_add_json(
-    parts, path=None, idx="unknown", name=None, use_bpy=False, first=True, parent_obj_id=None, joint_info=None, material=None, before_export=None
+    parts, path=None, idx="unknown", name=None, use_bpy=False, first=True, parent_obj_id=None, joint_info=None, material=None, before_export=None, texel_density=None, atlas_res=None
 ):
     #render_object_texture_and_save(material, 'res.png')
     global robot_tree, root
@@ -1508,11 +1692,14 @@ def save_part_export_obj_normalized_add_json(
             if parent_obj_id is not None and root is None:
                 root = i + length
         saved.append(i + length)
-        if use_bpy:
+        if use_bpy and atlas_res is not None:
+            export_folder = Path(os.path.join(path, idx, f"objs/{i + length}"))
+            defer_part_export(part, export_folder / part.name / f"{part.name}.obj", before_export, texel_density, atlas_res)
+        elif use_bpy:
             #export.run_blender_export(Path(file_path), 'obj', True, True)
             #bpy.ops.export_scene.obj(filepath=file_path, use_selection=True)
             #os.remove(os.path.join(path, idx, f"objs/{i + length}.mtl"))
-            export_curr_scene([part], Path(os.path.join(path, idx, f"objs/{i + length}")), format="obj", image_res=1024, vertex_colors=False, individual_export=True, before_export=before_export)
+            export_curr_scene([part], Path(os.path.join(path, idx, f"objs/{i + length}")), format="obj", image_res=1024, vertex_colors=False, individual_export=True, before_export=before_export, texel_density=texel_density)
 
         # Save the current scene as a new .obj file
         else:
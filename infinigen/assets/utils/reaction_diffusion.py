@@ -6,10 +6,12 @@
 
 import math
 
-import bmesh
 import numpy as np
 from numpy.random import normal, uniform
 
+from infinigen.core import surface
+from infinigen.core.util import mesh_operators as mops
+
 
 def reaction_diffusion(
     obj,
@@ -22,50 +24,35 @@ def reaction_diffusion(
     feed_rate=0.055,
     kill_rate=0.062,
     perturb=0.05,
+    implicit=False,
 ):
     diff_a = diff_a * scale
     diff_b = diff_b * scale
-    bm = bmesh.new()
-    bm.from_mesh(obj.data)
-    bm.edges.ensure_lookup_table()
-    bm.verts.ensure_lookup_table()
-    n = len(bm.verts)
+    n = len(obj.data.vertices)
+    co = np.empty(n * 3)
+    obj.data.vertices.foreach_get("co", co)
     a = np.ones(n)
-    b = weight_fn(np.stack([v.co for v in bm.verts]))
-    edge_from = np.array([e.verts[0].index for e in bm.edges])
-    edge_to = np.array([e.verts[1].index for e in bm.edges])
-    size = max(len(v.link_edges) for v in bm.verts)
-    for _ in range(steps):
-        a_msg = a[edge_to] - a[edge_from]
-        b_msg = b[edge_to] - b[edge_from]
-        lap_a = np.bincount(edge_from, a_msg, size) - np.bincount(edge_to, a_msg, size)
-        lap_b = np.bincount(edge_from, b_msg, size) - np.bincount(edge_to, b_msg, size)
-        ab2 = a * b**2
-        new_a = a + (diff_a * lap_a - ab2 + feed_rate * (1 - a)) * dt
-        new_b = b + (diff_b * lap_b + ab2 - (kill_rate + feed_rate) * b) * dt
-        a = new_a
-        b = new_b
-
-    a_msg = a[edge_to] - a[edge_from]
-    b_msg = b[edge_to] - b[edge_from]
-    lap_a = np.bincount(edge_from, a_msg, size) - np.bincount(edge_to, a_msg, size)
-    lap_b = np.bincount(edge_from, b_msg, size) - np.bincount(edge_to, b_msg, size)
+    b = weight_fn(co.reshape(-1, 3))
+    a, b, lap_a, lap_b = mops.reaction_diffusion(
+        surface.mesh_operators(obj),
+        a,
+        b,
+        steps,
+        dt,
+        diff_a,
+        diff_b,
+        feed_rate,
+        kill_rate,
+        implicit=implicit,
+    )
 
     a *= 1 + normal(0, perturb, n)
     b *= 1 + normal(0, perturb, n)
     lap_a *= 1 + normal(0, perturb, n)
-    lap_a *= 1 + normal(0, perturb, n)
+    lap_b *= 1 + normal(0, perturb, n)
 
-    vg_a = obj.vertex_groups.new(name="A")
-    vg_b = obj.vertex_groups.new(name="B")
-    vg_la = obj.vertex_groups.new(name="LA")
-    vg_lb = obj.vertex_groups.new(name="LB")
-    for i in range(n):
-        vg_la.add([i], lap_a[i], "REPLACE")
-        vg_lb.add([i], lap_b[i], "REPLACE")
-        vg_a.add([i], a[i], "REPLACE")
-        vg_b.add([i], b[i], "REPLACE")
-    obj.vertex_groups.update()
+    for name, weights in {"A": a, "B": b, "LA": lap_a, "LB": lap_b}.items():
+        surface.attribute_to_vertex_group(obj, weights, name=name)
     obj.data.update()
 
 
@@ -1,13 +1,13 @@
 # Copyright (C) 2023, Princeton University.
 # This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
 
+import contextlib
 import logging
 import os
 import pickle
 import shutil
 import time
 import typing
-from collections import defaultdict
 from pathlib import Path
 
 # ruff: noqa: E402
@@ -16,7 +16,6 @@ os.environ["OPENCV_IO_ENABLE_OPENEXR"] = "1"  # This must be done BEFORE import
 
 import bpy
 import gin
-from frozendict import frozendict
 
 import infinigen.assets.scatters
 from infinigen.core import init, surface
@@ -26,8 +25,11 @@ from infinigen.core.rendering.resample import resample_scene
 from infinigen.core.tagging import tag_system
 from infinigen.core.util import blender as butil
 from infinigen.core.util import exporting
+from infinigen.core.util.frame_export import FrameExportPool, FrameSnapshot
 from infinigen.core.util.logging import Timer, create_text_file, save_polycounts
 from infinigen.core.util.math import int_hash
+from infinigen.core.util.mesh_continuity import MeshIdTracker
+from infinigen.core.util.mesh_export import MeshHistory
 from infinigen.core.util.organization import Task
 from infinigen.terrain import Terrain
 from infinigen.tools.export import export_scene, triangulate_meshes
@@ -92,7 +94,13 @@ def save_meshes(
     frame_range,
     resample_idx=False,
     point_trajectory_src_frame=1,
+    incremental=False,
 ):
+    """
+    incremental: meshes whose geometry did not change since an earlier frame reference that
+    frame's npz instead of saving it again, see infinigen.core.util.mesh_export.read_mesh_arrays.
+    Run infinigen.tools.expand_mesh_refs on the output before customgt (opengl_gt) reads it
+    """
     if resample_idx is not None and resample_idx > 0:
         resample_scene(int_hash((scene_seed, resample_idx)))
 
@@ -101,8 +109,7 @@ def save_meshes(
     for col in bpy.data.collections:
         col.hide_viewport = col.hide_render  # hide it if it doesn't need rendering
 
-    previous_frame_mesh_id_mapping = frozendict()
-    current_frame_mesh_id_mapping = defaultdict(dict)
+    mesh_ids = MeshIdTracker()
 
     # save static meshes
     for obj in bpy.data.objects:
@@ -113,37 +120,38 @@ def save_meshes(
     logger.info("Working on static objects")
     exporting.save_obj_and_instances(
         frame_info_folder / "static_mesh",
-        previous_frame_mesh_id_mapping,
-        current_frame_mesh_id_mapping,
+        mesh_ids,
     )
-    previous_frame_mesh_id_mapping = frozendict(current_frame_mesh_id_mapping)
-    current_frame_mesh_id_mapping.clear()
 
     for obj in bpy.data.objects:
         obj.hide_viewport = not (not obj.hide_render and not is_static(obj))
+    history = MeshHistory() if incremental else None
 
-    for frame_idx in set(
-        [point_trajectory_src_frame]
-        + list(range(int(frame_range[0]), int(frame_range[1] + 2)))
-    ):
-        bpy.context.scene.frame_set(frame_idx)
-        bpy.context.view_layer.update()
-        frame_info_folder = Path(output_folder) / f"frame_{frame_idx:04d}"
-        frame_info_folder.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Working on frame {frame_idx}")
-
-        exporting.save_obj_and_instances(
-            frame_info_folder / "mesh",
-            previous_frame_mesh_id_mapping,
-            current_frame_mesh_id_mapping,
-        )
-        cam_util.save_camera_parameters(
-            camera_ids=cam_util.get_cameras_ids(),
-            output_folder=frame_info_folder / "cameras",
-            frame=frame_idx,
-        )
-        previous_frame_mesh_id_mapping = frozendict(current_frame_mesh_id_mapping)
-        current_frame_mesh_id_mapping.clear()
+    # blender only evaluates the frames, writing them happens on the pool's threads unless
+    # a frame is over its byte budget
+    pool = FrameExportPool(output_folder, history=history)
+    try:
+        for frame_idx in set(
+            [point_trajectory_src_frame]
+            + list(range(int(frame_range[0]), int(frame_range[1] + 2)))
+        ):
+            bpy.context.scene.frame_set(frame_idx)
+            bpy.context.view_layer.update()
+            logger.info(f"Working on frame {frame_idx}")
+            pool.submit(
+                FrameSnapshot(
+                    frame=frame_idx,
+                    meshes=exporting.mesh_entries(mesh_ids),
+                    cameras=cam_util.camera_snapshot(
+                        camera_ids=cam_util.get_cameras_ids(), frame=frame_idx
+                    ),
+                )
+            )
+    except BaseException:
+        with contextlib.suppress(Exception):
+            pool.close()
+        raise
+    pool.close()
 
 
 def validate_version(scene_version):
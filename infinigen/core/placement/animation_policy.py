@@ -8,6 +8,7 @@
 
 import logging
 from copy import copy, deepcopy
+from functools import cached_property
 
 import bpy
 import gin
@@ -21,7 +22,13 @@ from tqdm import tqdm
 
 from infinigen.assets.utils.geometry.curve import Curve
 from infinigen.core.placement.path_finding import path_finding
+from infinigen.core.placement.segment_bvh import SegmentBVH
+from infinigen.core.placement.trajectory_validation import (
+    TRANSFORM_PATHS,
+    check_freespace,
+)
 from infinigen.core.util import blender as butil
+from infinigen.core.util.fcurves import KeyframeArrays
 from infinigen.core.util.math import lerp
 from infinigen.core.util.random import random_general
 
@@ -32,6 +39,43 @@ class PolicyError(ValueError):
     pass
 
 
+def object_triangles(obj, depsgraph):
+    """Vertices and triangles of obj's evaluated mesh, in the object space BVHTree.FromObject uses"""
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        verts = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", verts)
+        tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("vertices", tris)
+    finally:
+        eval_obj.to_mesh_clear()
+    return verts.reshape(-1, 3), tris.reshape(-1, 3)
+
+
+class SceneBVH:
+    """
+    BVHTree.FromObject(obj) which also keeps obj's triangles, and can be used wherever the BVHTree
+    is. validate_keyframe_range checks keyframe steps against a SegmentBVH of them in one batch,
+    built on first use
+    """
+
+    def __init__(self, obj, depsgraph=None):
+        depsgraph = depsgraph or bpy.context.evaluated_depsgraph_get()
+        self.bvh = BVHTree.FromObject(obj, depsgraph)
+        self.vertices, self.triangles = object_triangles(obj, depsgraph)
+
+    @cached_property
+    def segment_bvh(self):
+        return SegmentBVH(self.vertices, self.triangles)
+
+    def __getattr__(self, name):
+        if name == "bvh":
+            raise AttributeError(name)
+        return getattr(self.bvh, name)
+
+
 def get_altitude(loc, scene_bvh, dir=Vector((0.0, 0.0, -1.0))):
     *_, straight_down_dist = scene_bvh.ray_cast(loc, dir)
     return straight_down_dist
@@ -322,6 +366,73 @@ class AnimPolicyFollowObject:
         return Vector(pos), None, time, "BEZIER"
 
 
+def transform_keyframe_arrays(obj):
+    """
+    {(data_path, array_index): KeyframeArrays} of obj's location / rotation fcurves, or None if
+    something other than plain keyframes drives them and they need blender to evaluate
+    """
+    anim = obj.animation_data
+    if anim is None or anim.action is None:
+        return {}
+    if any(d.data_path in TRANSFORM_PATHS for d in anim.drivers) or len(
+        anim.nla_tracks
+    ):
+        return None
+
+    fcurves = {}
+    for fc in anim.action.fcurves:
+        if fc.data_path not in TRANSFORM_PATHS:
+            continue
+        if fc.mute or len(fc.modifiers) or fc.extrapolation != "CONSTANT":
+            return None
+        kf = KeyframeArrays.from_keyframe_points(fc.keyframe_points)
+        if (kf.interpolation < 0).any():
+            return None
+        fcurves[(fc.data_path, fc.array_index)] = kf
+    return fcurves
+
+
+def validate_keyframe_range_batched(
+    obj,
+    start_frame,
+    end_frame,
+    bvhtree: SegmentBVH,
+    validate_pose_func=None,
+    stride=5,
+    check_straight_line=True,
+):
+    """
+    validate_keyframe_range with the freespace checks of all frames done at once from the fcurves,
+    so only validate_pose_func needs frame_set, and only for frames that pass them.
+    None if the fcurves can't be evaluated outside blender
+    """
+    fcurves = transform_keyframe_arrays(obj)
+    if fcurves is None:
+        return None
+    result = check_freespace(
+        bvhtree,
+        fcurves,
+        start_frame,
+        end_frame,
+        location=obj.location,
+        rotation_euler=obj.rotation_euler,
+        stride=stride,
+        check_straight_line=check_straight_line,
+    )
+    if result is None:
+        return None
+    frames, n_clear = result
+
+    if validate_pose_func is not None:
+        for frame_idx in frames[:n_clear]:
+            bpy.context.scene.frame_set(int(frame_idx))
+            if not validate_pose_func(obj):
+                logger.debug(f"{frame_idx} validate_pose_func failed")
+                return False
+
+    return n_clear == len(frames)
+
+
 def validate_keyframe_range(
     obj,
     start_frame,
@@ -331,6 +442,21 @@ def validate_keyframe_range(
     stride=5,  # runs faster but imperfect precision
     check_straight_line=True,  # rules out proposals faster, but has imperfect precision
 ):
+    segment_bvh = bvhtree.segment_bvh if isinstance(bvhtree, SceneBVH) else bvhtree
+    if isinstance(segment_bvh, SegmentBVH):
+        valid = validate_keyframe_range_batched(
+            obj,
+            start_frame,
+            end_frame,
+            segment_bvh,
+            validate_pose_func,
+            stride,
+            check_straight_line,
+        )
+        if valid is not None:
+            return valid
+        logger.debug(f"{obj.name=} fcurves need blender to evaluate, using frame_set")
+
     last_pos = deepcopy(obj.location)
 
     def freespace_ray_check(a, b):
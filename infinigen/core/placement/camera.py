@@ -13,7 +13,6 @@ from copy import deepcopy
 from dataclasses import dataclass
 from functools import partial
 from itertools import chain
-from pathlib import Path
 
 import bpy
 import gin
@@ -26,11 +25,13 @@ from tqdm import tqdm
 
 from infinigen.core.nodes import node_utils
 from infinigen.core.nodes.node_wrangler import Nodes, NodeWrangler
+from infinigen.core.placement.visibility import sensor_grid
 from infinigen.core.rendering.post_render import colorize_depth
 from infinigen.core.tagging import tag_system
 from infinigen.core.util import blender as butil
 from infinigen.core.util import camera
 from infinigen.core.util.blender import SelectObjects, delete
+from infinigen.core.util.frame_export import write_camera_files
 from infinigen.core.util.logging import Timer
 from infinigen.core.util.organization import SelectionCriterions
 from infinigen.core.util.random import random_general
@@ -46,46 +47,18 @@ CAMERA_RIGS_DIRNAME = "CameraRigs"
 @gin.configurable
 def get_sensor_coords(cam, H, W, sparse=False):
     camd = cam.data
-    f_in_m = camd.lens / 1000
     scene = bpy.context.scene
-    resolution_x_in_px = W
-    resolution_y_in_px = H
-
-    scale = scene.render.resolution_percentage / 100
-    sensor_width_in_m = camd.sensor_width / 1000
-    sensor_height_in_m = camd.sensor_height / 1000
-    assert abs(sensor_width_in_m / sensor_height_in_m - W / H) < 1e-4, (
-        sensor_width_in_m,
-        sensor_height_in_m,
-        W,
+    relative_cam_coords = sensor_grid(
+        camd.lens,
+        camd.sensor_width,
+        camd.sensor_height,
         H,
+        W,
+        sensor_fit=camd.sensor_fit,
+        pixel_aspect_ratio=scene.render.pixel_aspect_x / scene.render.pixel_aspect_y,
+        scale=scene.render.resolution_percentage / 100,
     )
 
-    pixel_aspect_ratio = scene.render.pixel_aspect_x / scene.render.pixel_aspect_y
-    if camd.sensor_fit == "VERTICAL":
-        # the sensor height is fixed (sensor fit is horizontal),
-        # the sensor width is effectively changed with the pixel aspect ratio
-        s_u = (
-            resolution_x_in_px * scale / sensor_width_in_m / pixel_aspect_ratio
-        )  # pixels per milimeter
-        s_v = resolution_y_in_px * scale / sensor_height_in_m
-
-    else:  # 'HORIZONTAL' and 'AUTO'
-        # the sensor width is fixed (sensor fit is horizontal),
-        # the sensor height is effectively changed with the pixel aspect ratio
-        pixel_aspect_ratio = scene.render.pixel_aspect_x / scene.render.pixel_aspect_y
-        s_u = resolution_x_in_px * scale / sensor_width_in_m
-        s_v = resolution_y_in_px * scale * pixel_aspect_ratio / sensor_height_in_m
-
-    u_0 = resolution_x_in_px * scale / 2  # cx (in pixels) Usually is just W/2
-    v_0 = resolution_y_in_px * scale / 2  # cx (in pixels) Usually is just H/2
-    xx, yy = np.meshgrid(np.arange(W).astype(float), np.arange(H).astype(float))
-    coords_x = (xx - u_0) / s_u  # relative, in mm
-    coords_y = (yy - v_0 + 1) / s_v  # relative, in mm
-
-    coords_z = np.full(coords_x.shape, -f_in_m)
-    relative_cam_coords = np.stack((coords_x, coords_y, coords_z), axis=-1)
-
     cam_coords_vectors = np.empty((H, W), dtype=Vector)
     pixel_locs = np.stack((np.meshgrid(np.arange(W), np.arange(H))), axis=-1).reshape(
         (W * H, 2)
@@ -490,7 +463,7 @@ def build_bvh_and_attrs(objs, tags_queries):
             obj.select_set(True)
         bpy.ops.object.join()
         obj = bpy.context.view_layer.objects.active
-    bvh = BVHTree.FromObject(obj, bpy.context.evaluated_depsgraph_get())
+    bvh = animation_policy.SceneBVH(obj)
     from infinigen.terrain.utils import Mesh
 
     with butil.ViewportMode(obj, "EDIT"):
@@ -704,11 +677,11 @@ def animate_cameras(
 
 
 @gin.configurable
-def save_camera_parameters(camera_ids, output_folder, frame, use_dof=False):
-    output_folder = Path(output_folder)
-    output_folder.mkdir(exist_ok=True, parents=True)
+def camera_snapshot(camera_ids, frame, use_dof=False):
+    """The arrays save_camera_parameters writes, as {camview file name: arrays}"""
     if frame is not None:
         bpy.context.scene.frame_set(frame)
+    cameras = {}
     for camera_pair_id, camera_id in camera_ids:
         camera_obj = get_camera(camera_pair_id, camera_id)
         if use_dof is not None:
@@ -718,7 +691,6 @@ def save_camera_parameters(camera_ids, output_folder, frame, use_dof=False):
         suffix = get_suffix(
             dict(cam_rig=camera_pair_id, resample=0, frame=frame, subcam=camera_id)
         )
-        output_file = output_folder / f"camview{suffix}.npz"
 
         height_width = np.array(
             (
@@ -729,7 +701,14 @@ def save_camera_parameters(camera_ids, output_folder, frame, use_dof=False):
         T = np.asarray(camera_obj.matrix_world, dtype=np.float64) @ np.diag(
             (1.0, -1.0, -1.0, 1.0)
         )  # Y down Z forward (aka opencv)
-        np.savez(output_file, K=np.asarray(K, dtype=np.float64), T=T, HW=height_width)
+        cameras[f"camview{suffix}.npz"] = dict(
+            K=np.asarray(K, dtype=np.float64), T=T, HW=height_width
+        )
+    return cameras
+
+
+def save_camera_parameters(camera_ids, output_folder, frame, use_dof=False):
+    write_camera_files(output_folder, camera_snapshot(camera_ids, frame, use_dof))
 
 
 if __name__ == "__main__":
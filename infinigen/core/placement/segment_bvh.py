@@ -0,0 +1,339 @@
+# Copyright (C) 2023, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import logging
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+"""
+CPU ray / segment queries against static triangle geometry, without Blender.
+
+SegmentBVH is an AABB tree: triangles are sorted along a morton curve and grouped into leaves of
+LEAF_SIZE, with a complete binary tree of boxes over the leaves, stored root first so the
+children of node k are 2k + 1 and 2k + 2. With numba installed, each ray walks the tree in a
+compiled kernel that releases the GIL, so callers can trace from several threads at once.
+Without it, all rays descend the tree together one level at a time in numpy and the candidate
+triangles they reach are intersected with a vectorized Moller-Trumbore test.
+"""
+
+LEAF_SIZE = 4
+MORTON_BITS = 10
+
+# bounds the (segment, candidate triangle) pairs held in memory at once
+MAX_CANDIDATE_PAIRS = 2**18
+
+
+def morton_codes(points, lo, hi):
+    """Interleaved MORTON_BITS-bit coordinates of points within the box lo, hi"""
+    extent = np.where(hi > lo, hi - lo, 1)
+    q = ((points - lo) / extent * (2**MORTON_BITS - 1)).astype(np.int64)
+    codes = np.zeros(len(points), dtype=np.int64)
+    for bit in range(MORTON_BITS):
+        for axis in range(3):
+            codes |= ((q[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+
+def segment_box_overlap(origins, directions, lo, hi):
+    """Whether each segment origins + t * directions, t in [0, 1], passes through each box lo, hi"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1 = (lo - origins) / directions
+        t2 = (hi - origins) / directions
+    near = np.minimum(t1, t2)
+    far = np.maximum(t1, t2)
+    # segments parallel to a slab are either always or never within it
+    parallel = directions == 0
+    inside = (lo <= origins) & (origins <= hi)
+    near = np.where(parallel, np.where(inside, -np.inf, np.inf), near)
+    far = np.where(parallel, np.where(inside, np.inf, -np.inf), far)
+    near, far = near.max(axis=-1), far.min(axis=-1)
+    return (near <= far) & (near <= 1) & (far >= 0) & (lo <= hi).all(axis=-1)
+
+
+def segment_triangle_intersect(origins, directions, triangles):
+    """Fraction t in [0, 1] where origins + t * directions crosses each triangle, nan if it doesn't"""
+    v0, v1, v2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    e1, e2 = v1 - v0, v2 - v0
+    p = np.cross(directions, e2)
+    det = np.einsum("ij,ij->i", e1, p)
+    s = origins - v0
+    q = np.cross(s, e1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_det = 1 / det
+        u = np.einsum("ij,ij->i", s, p) * inv_det
+        v = np.einsum("ij,ij->i", directions, q) * inv_det
+        t = np.einsum("ij,ij->i", e2, q) * inv_det
+        hit = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= 1)
+    return np.where(hit, t, np.nan)
+
+
+class SegmentBVH:
+    """Static triangle geometry answering batches of segment queries"""
+
+    def __init__(self, vertices, faces, use_numba=None):
+        self.use_numba = numba is not None if use_numba is None else use_numba
+        if self.use_numba and numba is None:
+            raise ImportError("SegmentBVH(use_numba=True) requires numba")
+
+        vertices = np.asarray(vertices, dtype=np.float64)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        triangles = vertices[faces]
+
+        self.bounds = (
+            np.stack([triangles.min(axis=(0, 1)), triangles.max(axis=(0, 1))])
+            if len(faces)
+            else np.zeros((2, 3))
+        )
+        centroids = triangles.mean(axis=1)
+        self.order = np.argsort(morton_codes(centroids, *self.bounds), kind="stable")
+        self.triangles = triangles[self.order]
+        normals = np.cross(
+            triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.face_normals = normals / np.linalg.norm(
+                normals, axis=-1, keepdims=True
+            )
+
+        # levels[0] is the root, levels[-1] the leaves; padding leaves get empty boxes
+        n_leaves = max(1, -(-len(faces) // LEAF_SIZE))
+        depth = int(np.ceil(np.log2(n_leaves)))
+        padded = np.empty((2**depth * LEAF_SIZE, 2, 3))
+        padded[:, 0], padded[:, 1] = np.inf, -np.inf
+        padded[: len(faces), 0] = self.triangles.min(axis=1)
+        padded[: len(faces), 1] = self.triangles.max(axis=1)
+        padded = padded.reshape(2**depth, LEAF_SIZE, 2, 3)
+        boxes = np.stack([padded[:, :, 0].min(axis=1), padded[:, :, 1].max(axis=1)], 1)
+        self.levels = [boxes]
+        while len(boxes) > 1:
+            boxes = boxes.reshape(-1, 2, 2, 3)
+            boxes = np.stack(
+                [boxes[:, :, 0].min(axis=1), boxes[:, :, 1].max(axis=1)], 1
+            )
+            self.levels.insert(0, boxes)
+        nodes = np.concatenate(self.levels)
+        self.node_lo = np.ascontiguousarray(nodes[:, 0])
+        self.node_hi = np.ascontiguousarray(nodes[:, 1])
+        self.edges = np.stack(
+            [
+                self.triangles[:, 0],
+                self.triangles[:, 1] - self.triangles[:, 0],
+                self.triangles[:, 2] - self.triangles[:, 0],
+            ],
+            axis=1,
+        )
+
+    @classmethod
+    def from_trimesh(cls, mesh):
+        return cls(mesh.vertices, mesh.faces)
+
+    def candidates(self, origins, directions):
+        """(segment, sorted triangle) index pairs of the leaves each segment passes through"""
+        seg = np.arange(len(origins))
+        node = np.zeros(len(origins), dtype=np.int64)
+        for i, boxes in enumerate(self.levels):
+            if i > 0:
+                seg = np.repeat(seg, 2)
+                node = (2 * node[:, None] + np.arange(2)).reshape(-1)
+            keep = segment_box_overlap(
+                origins[seg], directions[seg], boxes[node, 0], boxes[node, 1]
+            )
+            seg, node = seg[keep], node[keep]
+
+        tri = (LEAF_SIZE * node[:, None] + np.arange(LEAF_SIZE)).reshape(-1)
+        seg = np.repeat(seg, LEAF_SIZE)
+        keep = tri < len(self.triangles)
+        return seg[keep], tri[keep]
+
+    def ray_hits(self, origins, directions, max_t=np.inf):
+        """
+        Nearest hit of every ray origins[i] + t * directions[i], 0 <= t <= max_t: t (inf if there
+        is none) and the index of the face hit (-1 if none)
+        """
+        origins = np.atleast_2d(np.asarray(origins, dtype=np.float64))
+        directions = np.atleast_2d(np.asarray(directions, dtype=np.float64))
+        t = np.full(len(origins), np.inf)
+        face = np.full(len(origins), -1, dtype=np.int64)
+        if len(origins) == 0 or len(self.triangles) == 0:
+            return t, face
+
+        # nothing is hit further away than the farthest corner of the bounds
+        reach = np.linalg.norm(
+            np.abs(self.bounds - origins[:, None]).max(axis=1), axis=-1
+        )
+        length = np.linalg.norm(directions, axis=-1)
+        with np.errstate(divide="ignore"):
+            max_t = np.minimum(
+                max_t, np.where(length > 0, reach / length * 1.000001, 0)
+            )
+
+        if self.use_numba:
+            _first_hits(
+                self.node_lo,
+                self.node_hi,
+                self.edges,
+                LEAF_SIZE,
+                origins,
+                directions,
+                np.ascontiguousarray(max_t),
+                t,
+                face,
+            )
+        else:
+            frac, face = self._segment_hits(
+                origins, origins + directions * max_t[:, None]
+            )
+            t = np.where(face >= 0, frac * max_t, np.inf)
+        hit = face >= 0
+        face[hit] = self.order[face[hit]]
+        return t, face
+
+    def segment_hits(self, a, b):
+        """
+        First intersection of every segment a[i] -> b[i] with the geometry: the fraction of the
+        way along the segment (inf if there is none) and the index of the face hit (-1 if none)
+        """
+        a = np.atleast_2d(np.asarray(a, dtype=np.float64))
+        b = np.atleast_2d(np.asarray(b, dtype=np.float64))
+        return self.ray_hits(a, b - a, 1.0)
+
+    def _segment_hits(self, a, b):
+        """segment_hits in numpy, faces indexed into the morton-sorted triangles"""
+        frac = np.full(len(a), np.inf)
+        face = np.full(len(a), -1, dtype=np.int64)
+        seg, cand = self.candidates(a, b - a)
+        for i in range(0, len(cand), MAX_CANDIDATE_PAIRS):
+            s, c = seg[i : i + MAX_CANDIDATE_PAIRS], cand[i : i + MAX_CANDIDATE_PAIRS]
+            t = segment_triangle_intersect(a[s], b[s] - a[s], self.triangles[c])
+            hit = np.flatnonzero(t < frac[s])
+            if not hit.size:
+                continue
+            # keep the nearest hit per segment
+            order = np.lexsort((c[hit], t[hit], s[hit]))
+            s, c, t = s[hit][order], c[hit][order], t[hit][order]
+            first = np.concatenate([[True], s[1:] != s[:-1]])
+            frac[s[first]] = t[first]
+            face[s[first]] = c[first]
+        return frac, face
+
+    def ray_cast(self, origin, direction, distance=np.inf):
+        """Same result layout as mathutils.bvhtree.BVHTree.ray_cast, so either can be used as a scene bvh"""
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        length = np.linalg.norm(direction)
+        if length == 0:
+            return None, None, None, None
+        direction = direction / length
+        (dist,), (face,) = self.ray_hits(origin, direction, distance)
+        if face < 0:
+            return None, None, None, None
+        return origin + dist * direction, self.face_normals[face], int(face), dist
+
+
+def _box_entry(lo, hi, k, ox, oy, oz, ix, iy, iz, best):
+    """Where the ray with inverse direction ix, iy, iz enters box k within [0, best], inf if not"""
+    if lo[k, 0] > hi[k, 0]:
+        return np.inf  # padding
+    t1, t2 = (lo[k, 0] - ox) * ix, (hi[k, 0] - ox) * ix
+    near, far = max(min(t1, t2), 0.0), min(max(t1, t2), best)
+    t1, t2 = (lo[k, 1] - oy) * iy, (hi[k, 1] - oy) * iy
+    near, far = max(near, min(t1, t2)), min(far, max(t1, t2))
+    t1, t2 = (lo[k, 2] - oz) * iz, (hi[k, 2] - oz) * iz
+    near, far = max(near, min(t1, t2)), min(far, max(t1, t2))
+    return near if near <= far else np.inf
+
+
+def _inverse(x):
+    # huge rather than inf, so a zero offset times it is 0 and not nan
+    return 1 / x if x != 0 else 1e300
+
+
+def _first_hits_kernel(
+    lo, hi, edges, leaf_size, origins, directions, max_t, out_t, out_face
+):
+    n_internal = len(lo) // 2
+    n_tris = len(edges)
+    stack = np.empty(128, dtype=np.int64)
+    stack_near = np.empty(128, dtype=np.float64)
+    for r in range(len(origins)):
+        ox, oy, oz = origins[r, 0], origins[r, 1], origins[r, 2]
+        dx, dy, dz = directions[r, 0], directions[r, 1], directions[r, 2]
+        ix, iy, iz = _inverse(dx), _inverse(dy), _inverse(dz)
+        best, best_face = max_t[r], -1
+
+        stack[0] = 0
+        stack_near[0] = _box_entry(lo, hi, 0, ox, oy, oz, ix, iy, iz, best)
+        sp = 1 if stack_near[0] < np.inf else 0
+        while sp > 0:
+            sp -= 1
+            k = stack[sp]
+            if stack_near[sp] > best:
+                continue
+
+            if k < n_internal:
+                # the child the ray enters first goes on top, so the other may get culled
+                a, b = 2 * k + 1, 2 * k + 2
+                near_a = _box_entry(lo, hi, a, ox, oy, oz, ix, iy, iz, best)
+                near_b = _box_entry(lo, hi, b, ox, oy, oz, ix, iy, iz, best)
+                if near_b < near_a:
+                    a, b, near_a, near_b = b, a, near_b, near_a
+                if near_b < np.inf:
+                    stack[sp], stack_near[sp] = b, near_b
+                    sp += 1
+                if near_a < np.inf:
+                    stack[sp], stack_near[sp] = a, near_a
+                    sp += 1
+                continue
+
+            leaf = k - n_internal
+            for j in range(leaf * leaf_size, min((leaf + 1) * leaf_size, n_tris)):
+                # moller-trumbore with scalars, edges precomputed as in the numpy path
+                e1x, e1y, e1z = edges[j, 1, 0], edges[j, 1, 1], edges[j, 1, 2]
+                e2x, e2y, e2z = edges[j, 2, 0], edges[j, 2, 1], edges[j, 2, 2]
+                px, py, pz = (
+                    dy * e2z - dz * e2y,
+                    dz * e2x - dx * e2z,
+                    dx * e2y - dy * e2x,
+                )
+                det = e1x * px + e1y * py + e1z * pz
+                if det == 0:
+                    continue
+                sx, sy, sz = (
+                    ox - edges[j, 0, 0],
+                    oy - edges[j, 0, 1],
+                    oz - edges[j, 0, 2],
+                )
+                u = (sx * px + sy * py + sz * pz) / det
+                if u < 0 or u > 1:
+                    continue
+                qx, qy, qz = (
+                    sy * e1z - sz * e1y,
+                    sz * e1x - sx * e1z,
+                    sx * e1y - sy * e1x,
+                )
+                v = (dx * qx + dy * qy + dz * qz) / det
+                if v < 0 or u + v > 1:
+                    continue
+                t = (e2x * qx + e2y * qy + e2z * qz) / det
+                if t < 0 or t > best:
+                    continue
+                # same tie break as the numpy path, the lowest sorted face index
+                if t < best or best_face < 0 or j < best_face:
+                    best, best_face = t, j
+        if best_face >= 0:
+            out_t[r], out_face[r] = best, best_face
+
+
+if numba is not None:
+    _box_entry = numba.njit(inline="always")(_box_entry)
+    _inverse = numba.njit(inline="always")(_inverse)
+    _first_hits = numba.njit(nogil=True)(_first_hits_kernel)
+else:
+    _first_hits = None
@@ -7,44 +7,95 @@
 import logging
 
 import bpy
+import gin
 import numpy as np
-from mathutils.bvhtree import BVHTree
 from tqdm import trange
 
-from infinigen.core.placement.camera import get_sensor_coords
+from infinigen.core.placement.segment_bvh import SegmentBVH
+from infinigen.core.placement.visibility import (
+    FaceVertexIndex,
+    sensor_grid,
+    visibility_mask,
+)
 from infinigen.core.util import blender as butil
 from infinigen.core.util import camera as cam_util
 from infinigen.core.util.logging import Suppress
 
 
-def raycast_visiblity_mask(obj, cam, start=None, end=None, verbose=True):
-    bvh = BVHTree.FromObject(obj, bpy.context.evaluated_depsgraph_get())
+def mesh_visibility_arrays(obj):
+    """Triangles of obj in local space, the polygon of each, and the vertices of each polygon"""
+    mesh = obj.data
+    mesh.calc_loop_triangles()
+    verts = np.zeros(len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get("co", verts)
+    tris = np.zeros(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", tris)
+    tri_faces = np.zeros(len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get("polygon_index", tri_faces)
+
+    loop_start = np.zeros(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    loop_total = np.zeros(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    loop_vertices = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+    bvh = SegmentBVH(verts.reshape(-1, 3), tris.reshape(-1, 3))
+    face_vertices = FaceVertexIndex.from_polygons(loop_start, loop_total, loop_vertices)
+    return bvh, tri_faces, face_vertices
+
+
+@gin.configurable
+def raycast_visiblity_mask(
+    obj, cam, start=None, end=None, verbose=True, resolution=None, n_workers=1
+):
+    """
+    Mask of the vertices of obj seen by a ray through any sensor pixel of cam, in any frame.
+    resolution (H, W) defaults to the get_sensor_coords.H / W gin bindings, else the render
+    resolution
+    """
+    bvh, tri_faces, face_vertices = mesh_visibility_arrays(obj)
 
     if start is None:
         start = bpy.context.scene.frame_start
     if end is None:
         end = bpy.context.scene.frame_end
+    if resolution is None:
+        try:
+            H = gin.query_parameter("get_sensor_coords.H")
+            W = gin.query_parameter("get_sensor_coords.W")
+        except ValueError:
+            W, H = butil.get_camera_res().astype(int)
+    else:
+        H, W = resolution
 
-    mask = np.zeros(len(obj.data.vertices), dtype=bool)
+    # frame_set can only run here, so snapshot the cameras first and trace afterwards
+    scene = bpy.context.scene
+    frames = []
     rangeiter = trange if verbose else range
     for i in rangeiter(start, end + 1):
-        bpy.context.scene.frame_set(i)
-        invworld = obj.matrix_world.inverted()
-        sensor_coords, pix_it = get_sensor_coords(cam)
-        for x, y in pix_it:
-            direction = (
-                sensor_coords[y, x] - cam.matrix_world.translation
-            ).normalized()
-            origin = cam.matrix_world.translation
-            _, _, index, dist = bvh.ray_cast(
-                invworld @ origin, invworld.to_3x3() @ direction
-            )
-            if dist is None:
-                continue
-            for vi in obj.data.polygons[index].vertices:
-                mask[vi] = True
-
-    return mask
+        scene.frame_set(i)
+        grid = sensor_grid(
+            cam.data.lens,
+            cam.data.sensor_width,
+            cam.data.sensor_height,
+            H,
+            W,
+            sensor_fit=cam.data.sensor_fit,
+            pixel_aspect_ratio=scene.render.pixel_aspect_x
+            / scene.render.pixel_aspect_y,
+            scale=scene.render.resolution_percentage / 100,
+        )
+        frames.append((np.array(cam.matrix_world), grid, np.array(obj.matrix_world)))
+
+    return visibility_mask(
+        bvh,
+        face_vertices,
+        len(obj.data.vertices),
+        frames,
+        tri_faces=tri_faces,
+        n_workers=n_workers,
+    )
 
 
 def select_vertmask(obj, mask):
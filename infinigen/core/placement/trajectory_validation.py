@@ -0,0 +1,92 @@
+# Copyright (C) 2023, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import logging
+
+import numpy as np
+
+from infinigen.core.placement.segment_bvh import SegmentBVH
+from infinigen.core.util.fcurves import KeyframeArrays, evaluate_fcurve
+
+logger = logging.getLogger(__name__)
+
+"""
+Freespace validation of keyframed trajectories without Blender.
+
+validate_keyframe_range used to frame_set every frame it checks and cast one ray from the previous
+position. Here the object's location is evaluated from its fcurves at every frame in one call,
+and all consecutive segments are tested against static triangle geometry as one batch with
+a SegmentBVH.
+"""
+
+TRANSFORM_PATHS = ("location", "rotation_euler")
+
+
+def evaluate_transforms(fcurves, frames, location, rotation_euler):
+    """
+    location and rotation_euler (n, 3) at every frame, from fcurves {(data_path, array_index):
+    KeyframeArrays}. Channels without an fcurve keep the value given. Also returns the mask of
+    frames where every fcurve could be evaluated
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    result = {
+        "location": np.tile(np.asarray(location, dtype=np.float64), (len(frames), 1)),
+        "rotation_euler": np.tile(
+            np.asarray(rotation_euler, dtype=np.float64), (len(frames), 1)
+        ),
+    }
+    valid = np.ones(len(frames), dtype=bool)
+    for (data_path, index), kf in fcurves.items():
+        if data_path not in result:
+            continue
+        values, *_, ok = evaluate_fcurve(kf, frames)
+        result[data_path][:, index] = values
+        valid &= ok
+    return result["location"], result["rotation_euler"], valid
+
+
+def first_blocked_segment(bvh: SegmentBVH, start, points):
+    """Index of the first segment of the polyline start, points[0], points[1]... that hits bvh, None if clear"""
+    path = np.vstack([np.reshape(start, (1, 3)), points])
+    frac, _ = bvh.segment_hits(path[:-1], path[1:])
+    blocked = np.flatnonzero(np.isfinite(frac))
+    return int(blocked[0]) if blocked.size else None
+
+
+def check_freespace(
+    bvh: SegmentBVH,
+    fcurves: dict[tuple[str, int], KeyframeArrays],
+    start_frame,
+    end_frame,
+    location,
+    rotation_euler=(0, 0, 0),
+    stride=1,
+    check_straight_line=True,
+):
+    """
+    The ray checks of validate_keyframe_range for every frame at once. location / rotation_euler
+    are the object's current values, which is where the first segment starts from.
+
+    Returns the frames validate_keyframe_range visits and how many of them, in order, have a
+    free segment from the previous one (0 if the straight line check fails). None if the fcurves
+    can't be evaluated at every frame, in which case the caller should fall back to frame_set
+    """
+    frames = np.arange(start_frame, end_frame + 1, stride)
+    locations, _, valid = evaluate_transforms(
+        fcurves, np.append(frames, end_frame), location, rotation_euler
+    )
+    if not valid.all():
+        return None
+
+    if (
+        check_straight_line
+        and first_blocked_segment(bvh, location, locations[-1:]) is not None
+    ):
+        logger.debug("straight line check failed")
+        return frames, 0
+
+    blocked = first_blocked_segment(bvh, location, locations[:-1])
+    if blocked is None:
+        return frames, len(frames)
+    logger.debug(f"frame_idx={frames[blocked]} freespace_ray_check failed")
+    return frames, blocked
@@ -0,0 +1,158 @@
+# Copyright (C) 2023, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from infinigen.core.placement.segment_bvh import SegmentBVH
+
+logger = logging.getLogger(__name__)
+
+"""
+Which vertices of a mesh are seen by a camera over a range of frames, without Blender.
+
+The camera of each frame is given as its matrix_world plus a sensor grid (sensor_grid, the
+camera space points get_sensor_coords computes), the mesh as triangles in a SegmentBVH plus a
+FaceVertexIndex from faces to vertices. All rays of a frame are traced in one call, and frames
+can be traced from several threads since the SegmentBVH is read only.
+"""
+
+
+def sensor_grid(
+    lens,
+    sensor_width,
+    sensor_height,
+    H,
+    W,
+    sensor_fit="AUTO",
+    pixel_aspect_ratio=1.0,
+    scale=1.0,
+):
+    """(H, W, 3) camera space position of every pixel on the sensor, lens / sensor sizes in mm"""
+    f_in_m = lens / 1000
+    sensor_width_in_m = sensor_width / 1000
+    sensor_height_in_m = sensor_height / 1000
+    assert abs(sensor_width_in_m / sensor_height_in_m - W / H) < 1e-4, (
+        sensor_width_in_m,
+        sensor_height_in_m,
+        W,
+        H,
+    )
+
+    if sensor_fit == "VERTICAL":
+        # the sensor height is fixed (sensor fit is horizontal),
+        # the sensor width is effectively changed with the pixel aspect ratio
+        s_u = W * scale / sensor_width_in_m / pixel_aspect_ratio  # pixels per milimeter
+        s_v = H * scale / sensor_height_in_m
+    else:  # 'HORIZONTAL' and 'AUTO'
+        # the sensor width is fixed (sensor fit is horizontal),
+        # the sensor height is effectively changed with the pixel aspect ratio
+        s_u = W * scale / sensor_width_in_m
+        s_v = H * scale * pixel_aspect_ratio / sensor_height_in_m
+
+    u_0 = W * scale / 2  # cx (in pixels) Usually is just W/2
+    v_0 = H * scale / 2  # cx (in pixels) Usually is just H/2
+    xx, yy = np.meshgrid(np.arange(W).astype(float), np.arange(H).astype(float))
+    coords_x = (xx - u_0) / s_u  # relative, in mm
+    coords_y = (yy - v_0 + 1) / s_v  # relative, in mm
+    coords_z = np.full(coords_x.shape, -f_in_m)
+    return np.stack((coords_x, coords_y, coords_z), axis=-1)
+
+
+def ray_bundle(cam_matrix_world, grid, obj_matrix_world=None):
+    """
+    Origins and unit directions (n, 3) of the rays from the camera through every grid point,
+    in the local space of the object with obj_matrix_world
+    """
+    cam_matrix_world = np.asarray(cam_matrix_world, dtype=np.float64)
+    origin = cam_matrix_world[:3, 3]
+    points = grid.reshape(-1, 3) @ cam_matrix_world[:3, :3].T + origin
+    directions = points - origin
+    directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+
+    if obj_matrix_world is not None:
+        invworld = np.linalg.inv(np.asarray(obj_matrix_world, dtype=np.float64))
+        origin = invworld[:3, :3] @ origin + invworld[:3, 3]
+        directions = directions @ invworld[:3, :3].T
+    return np.broadcast_to(origin, directions.shape), directions
+
+
+def _ranges(starts, counts):
+    """Concatenation of arange(s, s + c) for every s, c"""
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+@dataclass
+class FaceVertexIndex:
+    """CSR index of the vertices of every face: those of face i are indices[indptr[i]:indptr[i + 1]]"""
+
+    indptr: np.ndarray
+    indices: np.ndarray
+
+    @classmethod
+    def from_polygons(cls, loop_start, loop_total, loop_vertices):
+        """From the foreach_get arrays of mesh.polygons and mesh.loops"""
+        loop_total = np.asarray(loop_total, dtype=np.int64)
+        return cls(
+            indptr=np.concatenate([[0], np.cumsum(loop_total)]),
+            indices=np.asarray(loop_vertices, dtype=np.int64)[
+                _ranges(np.asarray(loop_start, dtype=np.int64), loop_total)
+            ],
+        )
+
+    @classmethod
+    def from_faces(cls, faces):
+        faces = np.asarray(faces, dtype=np.int64)
+        return cls(
+            indptr=np.arange(0, faces.size + 1, faces.shape[1], dtype=np.int64),
+            indices=faces.reshape(-1),
+        )
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def vertex_mask(self, face_mask, n_verts):
+        """Mask of the vertices of any face in face_mask"""
+        counts = np.diff(self.indptr)[face_mask]
+        mask = np.zeros(n_verts, dtype=bool)
+        mask[self.indices[_ranges(self.indptr[:-1][face_mask], counts)]] = True
+        return mask
+
+
+def visible_faces(bvh: SegmentBVH, cam_matrix_world, grid, obj_matrix_world=None):
+    """Indices of the bvh faces hit by the rays of one frame"""
+    origins, directions = ray_bundle(cam_matrix_world, grid, obj_matrix_world)
+    _, face = bvh.ray_hits(origins, directions)
+    return np.unique(face[face >= 0])
+
+
+def visibility_mask(
+    bvh: SegmentBVH,
+    face_vertices: FaceVertexIndex,
+    n_verts,
+    frames,
+    tri_faces=None,
+    n_workers=1,
+):
+    """
+    Mask of the vertices of every face a camera ray hits in any of frames, each a tuple
+    (cam_matrix_world, grid, obj_matrix_world). tri_faces maps the bvh triangles to the faces of
+    face_vertices, for polygons that were triangulated
+    """
+
+    def trace(frame):
+        return visible_faces(bvh, *frame)
+
+    face_mask = np.zeros(len(face_vertices), dtype=bool)
+    if n_workers > 1:
+        with ThreadPoolExecutor(n_workers) as pool:
+            hits = list(pool.map(trace, frames))
+    else:
+        hits = map(trace, frames)
+    for tris in hits:
+        face_mask[tris if tri_faces is None else tri_faces[tris]] = True
+    return face_vertices.vertex_mask(face_mask, n_verts)
@@ -11,7 +11,7 @@ import os
 # ruff: noqa: E402
 os.environ["OPENCV_IO_ENABLE_OPENEXR"] = "1"  # This must be done BEFORE import cv2.
 
-import colorsys
+from multiprocessing import Pool
 from pathlib import Path
 
 import cv2
@@ -80,23 +80,84 @@ def colorize_depth(depth, scale_vmin=1.0):
     return np.ascontiguousarray(depth[..., :3] * 255, dtype=np.uint8)
 
 
+def _splitmix64(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hsv_to_rgb(h, s, v):
+    """Vectorized colorsys.hsv_to_rgb, returns an array of shape (*h.shape, 3)"""
+    h, s, v = (np.asarray(x, dtype=np.float64)[..., None] for x in (h, s, v))
+    k = np.mod(np.array([5.0, 3.0, 1.0]) + h * 6, 6)
+    return v - v * s * np.clip(np.minimum(k, 4 - k), 0, 1)
+
+
+def ids_to_colors(rows, seed=0):
+    """
+    Deterministic uint8 RGB color for each row of integer ids.
+
+    Hue is U(0,1), saturation U(0.1,1) and value 1, derived from a hash of (seed, *row)
+    so any number of rows is colored in one vectorized call.
+    """
+    rows = np.asarray(rows)
+    if rows.ndim == 1:
+        rows = rows[:, None]
+    h = np.full(rows.shape[0], np.uint64(seed), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for col in rows.T:
+            h = _splitmix64(h ^ col.astype(np.int64).view(np.uint64))
+        h2 = _splitmix64(h)
+    hue = (h >> np.uint64(11)).astype(np.float64) / 2.0**53
+    sat = 0.1 + 0.9 * (h2 >> np.uint64(11)).astype(np.float64) / 2.0**53
+    rgb = hsv_to_rgb(hue, sat, np.ones_like(hue))
+    return (rgb * 255).astype(np.uint8)
+
+
 def colorize_int_array(data, color_seed=0):
     H, W, *_ = data.shape
     data = data.reshape((H * W, -1))
-    uniq, indices = np.unique(data, return_inverse=True, axis=0)
-    random_states = [
-        np.random.RandomState(e[:2].astype(np.uint32) + color_seed) for e in uniq
-    ]
-    unique_colors = (
-        np.asarray(
-            [
-                colorsys.hsv_to_rgb(s.uniform(0, 1), s.uniform(0.1, 1), 1)
-                for s in random_states
-            ]
-        )
-        * 255
-    ).astype(np.uint8)
-    return unique_colors[indices].reshape((H, W, 3))
+    return ids_to_colors(data[:, :2], seed=color_seed).reshape((H, W, 3))
+
+
+EXR_KINDS = {
+    # filename prefix: (loader, colorizer)
+    "Vector": (load_flow, colorize_flow),
+    "Normal": (load_normals, colorize_normals),
+    "Depth": (load_depth, colorize_depth),
+    "IndexOB": (load_seg_mask, colorize_int_array),
+    "UniqueInstances": (load_uniq_inst, colorize_int_array),
+}
+
+
+def colorize_exr(path, loader, colorizer):
+    color = colorizer(loader(path))
+    if color is None:
+        return None
+    output_path = path.with_suffix(".png")
+    imwrite(output_path, color)
+    return output_path
+
+
+def _colorize_exr_by_kind(path):
+    kind = next(k for k in EXR_KINDS if path.name.startswith(k))
+    return colorize_exr(path, *EXR_KINDS[kind])
+
+
+def colorize_exr_folder(folder, n_workers=1):
+    """Write a .png visualization beside every recognized .exr pass in folder (recursively)"""
+    paths = sorted(
+        p
+        for p in Path(folder).rglob("*.exr")
+        if any(p.name.startswith(k) for k in EXR_KINDS)
+    )
+    if n_workers == 1:
+        outputs = [_colorize_exr_by_kind(p) for p in paths]
+    else:
+        with Pool(n_workers) as pool:
+            outputs = pool.map(_colorize_exr_by_kind, paths)
+    return [o for o in outputs if o is not None]
 
 
 if __name__ == "__main__":
@@ -106,8 +167,19 @@ if __name__ == "__main__":
     parser.add_argument("--seg_path", type=Path, default=None)
     parser.add_argument("--uniq_inst_path", type=Path, default=None)
     parser.add_argument("--normals_path", type=Path, default=None)
+    parser.add_argument(
+        "--input_folder",
+        type=Path,
+        default=None,
+        help="Colorize every recognized .exr pass under this folder",
+    )
+    parser.add_argument("--n_workers", type=int, default=1)
     args = parser.parse_args()
 
+    if args.input_folder is not None:
+        for output_path in colorize_exr_folder(args.input_folder, args.n_workers):
+            print(f"Wrote {output_path}")
+
     if args.flow_path is not None:
         try:
             flow_color = colorize_flow(load_flow(args.flow_path))
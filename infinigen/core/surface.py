@@ -16,7 +16,6 @@ import bpy
 import gin
 import numpy as np
 from mathutils import Vector
-from tqdm import trange
 
 from infinigen.core import tags as t
 from infinigen.core.nodes import node_info
@@ -28,6 +27,7 @@ from infinigen.core.nodes.node_wrangler import (
     isnode,
 )
 from infinigen.core.util import blender as butil
+from infinigen.core.util import mesh_operators as mops
 
 # from infinigen.assets.utils.object import save_objects
 
@@ -131,30 +131,43 @@ def new_attr_data(obj, attr, type, domain, data: np.array):
     attr.data.foreach_set(field, data.reshape(-1))
 
 
-def smooth_attribute(obj, name, iters=20, weight=0.05, verbose=False):
-    data = read_attr_data(obj, name)
-
-    edges = np.empty(len(obj.data.edges) * 2, dtype=int)
+def mesh_operators(obj):
+    """Cached sparse graph operators for obj's current vertex/edge topology"""
+    edges = np.empty(len(obj.data.edges) * 2, dtype=np.int64)
     obj.data.edges.foreach_get("vertices", edges)
-    edges = edges.reshape(-1, 2)
-
-    r = range(iters) if not verbose else trange(iters)
-    for _ in r:
-        vertex_weight = np.ones(len(obj.data.vertices))
-        data_out = data.copy()
+    return mops.get_mesh_operators(len(obj.data.vertices), edges.reshape(-1, 2))
 
-        data_out[edges[:, 0]] += data[edges[:, 1]] * weight
-        vertex_weight[edges[:, 0]] += weight
 
-        data_out[edges[:, 1]] += data[edges[:, 0]] * weight
-        vertex_weight[edges[:, 1]] += weight
-
-        data = data_out / vertex_weight[:, None]
-
-    write_attr_data(obj, name, data)
+def smooth_attribute(obj, name, iters=20, weight=0.05, verbose=False, implicit=False):
+    data = read_attr_data(obj, name)
+    smoothed = mops.smooth(
+        mesh_operators(obj),
+        data,
+        iters=iters,
+        weight=weight,
+        implicit=implicit,
+        verbose=verbose,
+    )
+    write_attr_data(obj, name, smoothed.astype(data.dtype))
 
 
 def attribute_to_vertex_group(obj, attr, name=None, min_thresh=0, binary=False):
+    """
+    attr is a scalar attribute of obj, or a (n_verts,) array of weights. Arrays are written as a
+    float attribute and converted by a single attribute_convert, rather than one
+    vertex_group.add() per vertex
+    """
+    if isinstance(attr, np.ndarray):
+        if name is None:
+            raise ValueError("attribute_to_vertex_group needs a name for array weights")
+        weights = np.clip(attr.astype(np.float32).reshape(-1), 0, 1)
+        weights = np.where(weights > min_thresh, 1.0 if binary else weights, 0)
+        with butil.SelectObjects(obj):
+            write_attr_data(obj, name, weights.astype(np.float32), "FLOAT", "POINT")
+            set_active(obj, name)
+            bpy.ops.geometry.attribute_convert(mode="VERTEX_GROUP")
+        return obj.vertex_groups[name]
+
     if name is None:
         name = attr if isinstance(attr, str) else attr.name
 
@@ -0,0 +1,342 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import time
+from pathlib import Path
+
+import gin
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+"""
+Content-addressed checkpoints of RandomStageExecutor stages.
+
+Every stage gets a key hashing the scene seed, its name, resolved seed, its `<name>_*` params and
+any others its function declares, the gin bindings of its function, a description of its
+arguments, and the key of the previous stage. The chain means any upstream change invalidates
+everything downstream. Stage functions opt in by declaring how to serialize their effects with
+@checkpointable(...):
+
+- "pickle": the return value, for stages whose only effect is what they return
+- "npz": a numpy array or dict of arrays returned by the stage
+- "blend": the collections the stage created (appended back from a .blend) plus the pickled return
+  value if it can be pickled
+
+A manifest.json in the checkpoint folder records each stage's key, status and artifact size, see
+infinigen.tools.stage_checkpoints to inspect or prune it.
+"""
+
+MANIFEST_NAME = "manifest.json"
+KEY_VERSION = 1
+
+
+def checkpointable(serializer="pickle", params=()):
+    """
+    Declare that run_stage may checkpoint the decorated stage function with `serializer`. params
+    names scene params other than `<name>_*` which the stage reads, they are part of its key.
+    """
+    if serializer not in SERIALIZERS:
+        raise ValueError(
+            f"Unrecognized checkpoint {serializer=}, options are {list(SERIALIZERS)}"
+        )
+
+    def decorator(fn):
+        fn.checkpoint_serializer = serializer
+        fn.checkpoint_params = tuple(params)
+        return fn
+
+    return decorator
+
+
+def _unwrap(fn):
+    while isinstance(fn, functools.partial):
+        fn = fn.func
+    return fn
+
+
+def stage_serializer(fn):
+    name = getattr(_unwrap(fn), "checkpoint_serializer", None)
+    return SERIALIZERS[name] if name is not None else None
+
+
+def _describe(value):
+    """Stable description of a stage argument for hashing; opaque objects only by type"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return repr(value)
+    if isinstance(value, (tuple, list)):
+        return "[" + ",".join(_describe(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return (
+            "{"
+            + ",".join(
+                f"{_describe(k)}:{_describe(v)}" for k, v in sorted(value.items())
+            )
+            + "}"
+        )
+    if isinstance(value, np.ndarray):
+        digest = hashlib.blake2b(np.ascontiguousarray(value).tobytes(), digest_size=16)
+        return f"ndarray{value.shape}{value.dtype}:{digest.hexdigest()}"
+    return type(value).__qualname__
+
+
+def gin_bindings(fn):
+    try:
+        return gin.get_bindings(_unwrap(fn))
+    except (ValueError, TypeError):
+        return {}
+
+
+def stage_key(prev_key, scene_seed, name, seed, params, fn, args=(), kwargs=None):
+    h = hashlib.sha256()
+    extra = getattr(_unwrap(fn), "checkpoint_params", ())
+    stage_params = {
+        k: v for k, v in params.items() if k.startswith(f"{name}_") or k in extra
+    }
+    fn_name = getattr(fn, "__qualname__", type(fn).__qualname__)
+    for part in (
+        KEY_VERSION,
+        prev_key,
+        scene_seed,
+        name,
+        seed,
+        _describe(stage_params),
+        _describe(gin_bindings(fn)),
+        fn_name,
+        _describe(list(args)),
+        _describe(kwargs or {}),
+    ):
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class PickleSerializer:
+    name = "pickle"
+
+    def begin(self):
+        return None
+
+    def save(self, folder, ret, state):
+        with open(folder / "ret.pkl", "wb") as f:
+            pickle.dump(ret, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, folder):
+        with open(folder / "ret.pkl", "rb") as f:
+            return pickle.load(f)
+
+
+class NpzSerializer:
+    name = "npz"
+
+    def begin(self):
+        return None
+
+    def save(self, folder, ret, state):
+        if isinstance(ret, dict):
+            arrays, kind = ret, "dict"
+        elif ret is None:
+            arrays, kind = {}, "none"
+        else:
+            arrays, kind = {"array": np.asarray(ret)}, "array"
+        np.savez(folder / "ret.npz", __kind__=np.array(kind), **arrays)
+
+    def load(self, folder):
+        with np.load(folder / "ret.npz", allow_pickle=False) as d:
+            kind = str(d["__kind__"])
+            arrays = {k: d[k] for k in d.files if k != "__kind__"}
+        match kind:
+            case "dict":
+                return arrays
+            case "array":
+                return arrays["array"]
+        return None
+
+
+class BlendSerializer:
+    name = "blend"
+
+    def begin(self):
+        import bpy
+
+        return {c.name for c in bpy.data.collections}
+
+    def save(self, folder, ret, state):
+        import bpy
+
+        created = [c for c in bpy.data.collections if c.name not in state]
+        children = {child.name for c in created for child in c.children}
+        parents = {}
+        for c in created:
+            if c.name in children:
+                continue
+            users = [p for p in bpy.data.collections if c.name in p.children]
+            parents[c.name] = users[0].name if users else None
+        bpy.data.libraries.write(
+            str(folder / "data.blend"), set(created), fake_user=True
+        )
+        try:
+            payload = pickle.dumps(ret, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning(f"Return value of blend checkpoint is not picklable: {e!r}")
+            payload = pickle.dumps(None)
+        with open(folder / "ret.pkl", "wb") as f:
+            f.write(payload)
+        (folder / "parents.json").write_text(json.dumps(parents))
+
+    def load(self, folder):
+        import bpy
+
+        parents = json.loads((folder / "parents.json").read_text())
+        with bpy.data.libraries.load(str(folder / "data.blend"), link=False) as (
+            data_from,
+            data_to,
+        ):
+            data_to.collections = [n for n in data_from.collections]
+        loaded = {c.name: c for c in data_to.collections}
+        for name, parent in parents.items():
+            if name not in loaded:
+                continue
+            target = bpy.data.collections.get(parent) if parent is not None else None
+            target = target or bpy.context.scene.collection
+            target.children.link(loaded[name])
+        with open(folder / "ret.pkl", "rb") as f:
+            return pickle.load(f)
+
+
+SERIALIZERS = {
+    "pickle": PickleSerializer(),
+    "npz": NpzSerializer(),
+    "blend": BlendSerializer(),
+}
+
+
+def folder_size(folder):
+    return sum(p.stat().st_size for p in Path(folder).rglob("*") if p.is_file())
+
+
+class StageCheckpointer:
+    """Artifacts under folder/<name>-<key prefix>/ and a manifest of every stage's status"""
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.folder / MANIFEST_NAME
+        self.manifest = load_manifest(self.manifest_path)
+        # entries not used by the latest run are stale and can be pruned
+        self.run_id = time.time()
+
+    def artifact_folder(self, name, key):
+        return self.folder / f"{name}-{key[:16]}"
+
+    def _write_manifest(self):
+        save_manifest(self.manifest_path, self.manifest)
+
+    def restore(self, name, key):
+        """(True, return value) if a complete checkpoint for key loads, else (False, None)"""
+        entry = self.manifest["stages"].get(key)
+        if entry is None or entry["status"] != "complete":
+            return False, None
+        serializer = SERIALIZERS[entry["serializer"]]
+        try:
+            ret = serializer.load(self.folder / entry["artifact"])
+        except Exception as e:
+            logger.warning(
+                f"Checkpoint of stage {name} at {entry['artifact']} failed to load, recomputing: {e!r}"
+            )
+            entry["status"] = "corrupt"
+            self._write_manifest()
+            return False, None
+        entry["last_run"] = self.run_id
+        self._write_manifest()
+        logger.info(f"Restored stage {name} from checkpoint {key[:16]}")
+        return True, ret
+
+    def begin(self, name, key, serializer):
+        self.manifest["stages"][key] = dict(
+            name=name,
+            key=key,
+            status="running",
+            serializer=serializer.name,
+            artifact=self.artifact_folder(name, key).name,
+            size=0,
+            updated=time.time(),
+            last_run=self.run_id,
+        )
+        self._write_manifest()
+        return serializer.begin()
+
+    def store(self, name, key, serializer, ret, state):
+        folder = self.artifact_folder(name, key)
+        tmp = folder.with_name(folder.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        entry = self.manifest["stages"][key]
+        try:
+            serializer.save(tmp, ret, state)
+        except Exception as e:
+            logger.warning(f"Could not checkpoint stage {name}: {e!r}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            entry["status"] = "failed"
+            self._write_manifest()
+            return
+        shutil.rmtree(folder, ignore_errors=True)
+        tmp.rename(folder)
+        entry.update(status="complete", size=folder_size(folder), updated=time.time())
+        self._write_manifest()
+
+
+def load_manifest(path):
+    path = Path(path)
+    if path.exists():
+        try:
+            return json.loads(path.read_text())
+        except json.JSONDecodeError as e:
+            logger.warning(f"Ignoring unreadable checkpoint manifest {path}: {e!r}")
+    return dict(version=KEY_VERSION, stages={})
+
+
+def save_manifest(path, manifest):
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, path)
+
+
+def stale_keys(manifest):
+    """Keys of entries which the most recent run neither restored nor stored"""
+    stages = manifest["stages"].values()
+    if not stages:
+        return []
+    latest = max(e.get("last_run", 0) for e in stages)
+    return [e["key"] for e in stages if e.get("last_run", 0) < latest]
+
+
+def prune(folder, keys):
+    """Remove the given stage keys and their artifacts from the checkpoint folder"""
+    folder = Path(folder)
+    manifest = load_manifest(folder / MANIFEST_NAME)
+    freed = 0
+    for key in keys:
+        entry = manifest["stages"].pop(key, None)
+        if entry is None:
+            continue
+        artifact = folder / entry["artifact"]
+        if artifact.exists():
+            freed += folder_size(artifact)
+            shutil.rmtree(artifact)
+    # artifacts no longer referenced by any entry, e.g. from a killed store()
+    referenced = {e["artifact"] for e in manifest["stages"].values()}
+    for child in folder.iterdir():
+        if child.is_dir() and child.name not in referenced:
+            freed += folder_size(child)
+            shutil.rmtree(child)
+    save_manifest(folder / MANIFEST_NAME, manifest)
+    return freed
@@ -4,20 +4,25 @@
 # Authors: Lahav Lipson
 
 
-import json
 import re
+from functools import lru_cache
 from itertools import chain, product
-from pathlib import Path
-from uuid import uuid4
 
 import bpy
 import gin
 import mathutils
 import numpy as np
 from bpy.types import DepsgraphObjectInstance
-from tqdm import tqdm
 
 from infinigen.core.util.math import int_hash
+from infinigen.core.util.mesh_continuity import MeshIdTracker
+from infinigen.core.util.mesh_export import MeshHistory, write_mesh_folder
+from infinigen.core.util.scene_snapshot import (
+    SceneSnapshot,
+    instance_items,
+    non_instance_items,
+    take_snapshot,
+)
 
 
 def get_mesh_data(obj):
@@ -68,9 +73,14 @@ def valid_int32(x):
     return -(2**31) <= x < 2**31
 
 
+@lru_cache(maxsize=None)
+def _name_hash(name):
+    return int_hash(name) - 2**31
+
+
 # See https://projects.blender.org/blender/blender/issues/60881 for logic
 def get_id(i: DepsgraphObjectInstance):
-    parent_hash = (int_hash(i.parent.name) - 2**31) if (i.parent is not None) else 0
+    parent_hash = _name_hash(i.parent.name) if (i.parent is not None) else 0
     t = list(i.persistent_id)
     if list(t) == [0] * 8:
         return (0, 0, parent_hash)
@@ -80,71 +90,34 @@ def get_id(i: DepsgraphObjectInstance):
     return (a, b, parent_hash)
 
 
-def get_all_instances():
-    vertex_info = {}
-    pbar = tqdm(bpy.context.evaluated_depsgraph_get().object_instances)
-    for deps_instance in pbar:
-        obj = deps_instance.object
-        pbar.set_description(f"Finding Instances: {obj.name[:20].ljust(20)}")
-        if (
-            (obj.type == "MESH")
-            and (deps_instance.is_instance)
-            and ("PARTICLE_SYSTEM" not in {m.type for m in obj.modifiers})
-        ):
-            mat = np.asarray(deps_instance.matrix_world, dtype=np.float32).copy()
-            if obj.data not in vertex_info:
-                vert_lookup, indices, loop_totals, masktag = get_mesh_data(obj)
-                vertex_info[obj.data] = dict(
-                    vertex_lookup=vert_lookup,
-                    is_instance=True,
-                    masktag=masktag,
-                    indices=indices,
-                    loop_totals=loop_totals,
-                    matrices=[],
-                    instance_ids=[],
-                    name=obj.name,
-                )
-            vertex_info[obj.data]["matrices"].append(mat)
-            vertex_info[obj.data]["instance_ids"].append(get_id(deps_instance))
-    return chain.from_iterable(
-        ((v["vertex_lookup"].shape[0], v["name"]), v) for v in vertex_info.values()
+def get_geometry(obj):
+    if obj.type == "CURVES":
+        hair_vertices, hair_radii = get_curve_data(obj)
+        return dict(vertex_lookup=hair_vertices, radii=hair_radii)
+    vert_lookup, indices, loop_totals, masktag = get_mesh_data(obj)
+    return dict(
+        vertex_lookup=vert_lookup,
+        indices=indices,
+        loop_totals=loop_totals,
+        masktag=masktag,
     )
 
 
-def get_all_non_instances():
-    pbar = tqdm(bpy.context.evaluated_depsgraph_get().object_instances)
-    for deps_instance in pbar:
-        obj = deps_instance.object
-        pbar.set_description(f"Finding Non-Instances: {obj.name[:20].ljust(20)}")
-        mat = np.asarray(deps_instance.matrix_world, dtype=np.float32).copy()[None]
-        if obj.type == "MESH":
-            if (not deps_instance.is_instance) and (
-                "PARTICLE_SYSTEM" not in {m.type for m in obj.modifiers}
-            ):
-                yield (len(obj.data.vertices), obj.name)
-                vert_lookup, indices, loop_totals, masktag = get_mesh_data(obj)
-                yield dict(
-                    vertex_lookup=vert_lookup,
-                    indices=indices,
-                    loop_totals=loop_totals,
-                    name=obj.name,
-                    matrices=mat,
-                    instance_ids=[get_id(deps_instance)],
-                    masktag=masktag,
-                    is_instance=False,
-                )
-        elif obj.type == "CURVES":
-            assert not deps_instance.is_instance
-            yield (len(obj.data.points) // 5, obj.name)  # //5 bc hair is inexpensive
-            hair_vertices, hair_radii = get_curve_data(obj)
-            yield dict(
-                vertex_lookup=hair_vertices,
-                radii=hair_radii,
-                name=obj.name,
-                matrices=mat,
-                instance_ids=[get_id(deps_instance)],
-                is_instance=False,
-            )
+def snapshot_scene():
+    return take_snapshot(
+        bpy.context.evaluated_depsgraph_get().object_instances,
+        get_id,
+        get_geometry,
+        data_key=lambda data: data.as_pointer(),
+    )
+
+
+def get_all_instances(snapshot: SceneSnapshot | None = None):
+    return instance_items(snapshot or snapshot_scene())
+
+
+def get_all_non_instances(snapshot: SceneSnapshot | None = None):
+    return non_instance_items(snapshot or snapshot_scene())
 
 
 def parse_group_from_name(name: str):
@@ -178,37 +151,29 @@ def calc_instance_bbox(matrices, verts):
     return combined_bbox, single_bbox
 
 
-def get_mesh_id_if_cached(name, num_verts, current_ids, previous_frame_mapping):
-    assert isinstance(current_ids, frozenset)
-    if releveant_entries := previous_frame_mapping.get(name):
-        for (nv, prev_ids), mesh_id in releveant_entries.items():
-            assert isinstance(prev_ids, frozenset)
-            if num_verts == nv:
-                for idd in current_ids:
-                    if idd in prev_ids:
-                        return mesh_id
-    return None
-
-
-@gin.configurable
-def save_obj_and_instances(
-    output_folder, previous_frame_mesh_id_mapping, current_frame_mesh_id_mapping
-):
-    output_folder = Path(output_folder)
-    output_folder.mkdir(exist_ok=True, parents=True)
+def mesh_entries(mesh_ids: MeshIdTracker):
+    """
+    Yields the (json_val, mesh_id, item) entries of write_mesh_folder for the current frame.
+    Non instanced meshes are read from Blender as they are yielded, so consume this before
+    Blender changes frames, see snapshot_meshes
+    """
     for atm_name in ["atmosphere", "atmosphere_fine", "KoleClouds"]:
         if atm_name in bpy.data.objects:
             bpy.data.objects.remove(bpy.data.objects[atm_name])
 
-    json_data = []
-    instance_mesh_data = get_all_instances()
-    singleton_mesh_data = get_all_non_instances()
-    npz_number = 1
-    filename = output_folder / f"saved_mesh_{npz_number:04d}.npz"
-    MAX_NUM_VERTS = int(5e6)  # lower if OOM
-    running_total_verts = 0
+    snapshot = snapshot_scene()
+    instance_mesh_data = list(get_all_instances(snapshot))
+    resolution = mesh_ids.resolve(
+        [
+            (object_name, num_verts, item["instance_ids"])
+            for (num_verts, object_name), item in zip(
+                instance_mesh_data[::2], instance_mesh_data[1::2]
+            )
+        ]
+    )
+    instance_mesh_ids = iter(resolution.mesh_ids)
+    singleton_mesh_data = get_all_non_instances(snapshot)
     current_obj_num_verts = None
-    npz_data = {}
     object_names_mapping = {}
     for item in chain(instance_mesh_data, singleton_mesh_data):
         if isinstance(item, tuple):
@@ -218,59 +183,16 @@ def save_obj_and_instances(
             if object_name not in object_names_mapping:
                 object_names_mapping[object_name] = len(object_names_mapping) + 1
 
-            # Flush the .npz to avoid OOM
-            if (len(npz_data) > 0) and (
-                (running_total_verts + current_obj_num_verts) >= MAX_NUM_VERTS
-            ):
-                np.savez(filename, **npz_data)
-                print(f"Saving to {filename}")
-                npz_data.clear()
-                running_total_verts = 0
-                npz_number += 1
-                filename = output_folder / f"saved_mesh_{npz_number:04d}.npz"
-
-            if current_obj_num_verts > MAX_NUM_VERTS:
-                print(
-                    f"WARNING: Object {object_name} is very large, with {current_obj_num_verts} vertices."
-                )
-
         else:
             is_instance = item["is_instance"]
             if is_instance:
-                instance_ids_set = frozenset(item["instance_ids"])
-                mesh_id = get_mesh_id_if_cached(
-                    object_name,
-                    current_obj_num_verts,
-                    instance_ids_set,
-                    previous_frame_mesh_id_mapping,
-                )
-                if mesh_id is None:
-                    mesh_id = uuid4().hex[:12]
-                current_frame_mesh_id_mapping[object_name][
-                    (current_obj_num_verts, instance_ids_set)
-                ] = mesh_id
+                mesh_id = next(instance_mesh_ids)
             else:
                 mesh_id = str(hex(int_hash(object_name)))[:12]
 
-            if "indices" in item:
-                npz_data[f"{mesh_id}_indices"] = item["indices"]
-                npz_data[f"{mesh_id}_loop_totals"] = item["loop_totals"]
-                npz_data[f"{mesh_id}_masktag"] = item["masktag"]
-            else:
-                npz_data[f"{mesh_id}_radii"] = item["radii"]
-            assert f"{mesh_id}_vertices" not in npz_data
-            npz_data[f"{mesh_id}_vertices"] = item["vertex_lookup"]
             matrices = np.asarray(item["matrices"], dtype=np.float32)
-            npz_data[f"{mesh_id}_transformations"] = matrices
-            instance_ids_array = np.asarray(item["instance_ids"], dtype=np.int32)
-            assert (
-                np.unique(instance_ids_array, axis=0).shape == instance_ids_array.shape
-            )
-            assert instance_ids_array.shape[1] == 3
-            npz_data[f"{mesh_id}_instance_ids"] = instance_ids_array
             obj = bpy.data.objects[object_name]
             json_val = {
-                "filename": filename.name,
                 "mesh_id": mesh_id,
                 "object_name": object_name,
                 "num_verts": current_obj_num_verts,
@@ -285,32 +207,21 @@ def save_obj_and_instances(
                 json_val["materials"] = obj.material_slots.keys()
                 json_val["unapplied_modifiers"] = obj.modifiers.keys()
             if not is_instance:
-                non_aa_bbox = np.asarray(
-                    [(obj.matrix_world @ mathutils.Vector(v)) for v in obj.bound_box],
-                    dtype=np.float32,
-                )
-                json_val["instance_bbox"] = calc_aa_bbox(non_aa_bbox).tolist()
+                json_val["instance_bbox"] = item["instance_bbox"].tolist()
                 # Todo add chain up parents
             else:
-                combined_bbox, instance_bbox = calc_instance_bbox(
-                    matrices, item["vertex_lookup"]
-                )
                 json_val.update(
                     {
-                        "bbox": combined_bbox.tolist(),
-                        "instance_bbox": instance_bbox.tolist(),
+                        "bbox": item["bbox"].tolist(),
+                        "instance_bbox": item["instance_bbox"].tolist(),
+                        **resolution.events(mesh_id),
                     }
                 )
             for child_obj in obj.children:
                 if child_obj.name not in object_names_mapping:
                     object_names_mapping[child_obj.name] = len(object_names_mapping) + 1
                 json_val["children"].append(object_names_mapping[child_obj.name])
-            json_data.append(json_val)
-            running_total_verts += current_obj_num_verts
-
-    if len(npz_data) > 0:
-        np.savez(filename, **npz_data)
-        print(f"Saving to {filename}")
+            yield json_val, mesh_id, item
 
     for obj in bpy.data.objects:
         if obj.hide_viewport:
@@ -333,7 +244,30 @@ def save_obj_and_instances(
                 if child_obj.name not in object_names_mapping:
                     object_names_mapping[child_obj.name] = len(object_names_mapping) + 1
                 json_val["children"].append(object_names_mapping[child_obj.name])
-            json_data.append(json_val)
+            yield json_val, None, None
+
+
+def snapshot_meshes(mesh_ids: MeshIdTracker):
+    """
+    Everything save_obj_and_instances needs from Blender for the current frame, as a list of
+    mesh_entries. Holds no references into Blender
+    """
+    return list(mesh_entries(mesh_ids))
+
 
-    # Save JSON
-    (output_folder / "saved_mesh.json").write_text(json.dumps(json_data, indent=4))
+@gin.configurable
+def save_obj_and_instances(
+    output_folder,
+    mesh_ids: MeshIdTracker,
+    history: MeshHistory | None = None,
+    frame: int | None = None,
+):
+    """
+    Save every visible mesh and curve to output_folder. If history is given, meshes whose
+    geometry is unchanged since it was last recorded only save their transformations and
+    instance_ids, plus a data_ref to the earlier geometry, see infinigen.core.util.mesh_export.
+    Shards are written in the background, configure MeshShardWriter for workers and compression.
+    Instanced meshes keep their mesh_id across calls through mesh_ids, see
+    infinigen.core.util.mesh_continuity
+    """
+    write_mesh_folder(output_folder, mesh_entries(mesh_ids), history, frame)
@@ -0,0 +1,207 @@
+# Copyright (c) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+"""
+Batch evaluation of keyframed fcurves without Blender.
+
+The keyframes of an fcurve are held as arrays (KeyframeArrays), and evaluate_fcurve returns the
+value and first / second derivative w.r.t. frame at any number of (sub-)frame times at once.
+Bezier segments are inverted for their curve parameter with a vectorized Newton iteration,
+safeguarded by bisection, over all queries at once. Semantics match the scalar evaluation in
+infinigen.core.util.imu, including its clamping of handles that overshoot the neighbouring
+keyframe: a query exactly on a keyframe uses the segment starting there, and queries outside
+the keyframes hold the first / last value with zero derivatives.
+"""
+
+CONSTANT, LINEAR, BEZIER = 0, 1, 2
+INTERPOLATION_CODES = {"CONSTANT": CONSTANT, "LINEAR": LINEAR, "BEZIER": BEZIER}
+
+NEWTON_MAX_ITER = 64
+NEWTON_TOL = 1e-13
+
+
+@dataclass
+class KeyframeArrays:
+    co: np.ndarray  # (n, 2) frame, value
+    handle_left: np.ndarray  # (n, 2)
+    handle_right: np.ndarray  # (n, 2)
+    interpolation: np.ndarray  # (n,) codes from INTERPOLATION_CODES, -1 if unsupported
+    interpolation_names: tuple = ()
+
+    @classmethod
+    def from_keyframe_points(cls, keyframe_points):
+        """From bpy keyframe_points, or anything with co, handle_left/right and interpolation"""
+
+        def xy(attr):
+            if hasattr(keyframe_points, "foreach_get"):
+                buf = np.empty(2 * len(keyframe_points), dtype=np.float32)
+                keyframe_points.foreach_get(attr, buf)
+                return buf.astype(np.float64).reshape(-1, 2)
+            return np.array(
+                [tuple(getattr(k, attr)) for k in keyframe_points], dtype=np.float64
+            ).reshape(-1, 2)
+
+        names = tuple(k.interpolation for k in keyframe_points)
+        return cls(
+            co=xy("co"),
+            handle_left=xy("handle_left"),
+            handle_right=xy("handle_right"),
+            interpolation=np.array(
+                [INTERPOLATION_CODES.get(n, -1) for n in names], dtype=np.int8
+            ),
+            interpolation_names=names,
+        )
+
+    def __len__(self):
+        return len(self.co)
+
+
+def sample_times(frame_start, frame_end, rate=1):
+    """rate samples per frame from frame_start up to and including frame_end"""
+    n = int(np.floor((frame_end - frame_start) * rate + 1e-9)) + 1
+    return frame_start + np.arange(n) / rate
+
+
+def bezier_control_points(kf: KeyframeArrays):
+    """(m, 4) control point x and y of the m segments, handles clamped as in imu.py"""
+    kfs, kls = kf.co[:-1, 0], kf.co[:-1, 1]
+    kfe, kle = kf.co[1:, 0], kf.co[1:, 1]
+    hr, hl = kf.handle_right[:-1], kf.handle_left[1:]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        overshoot_r = hr[:, 0] > kfe
+        cx1 = np.where(overshoot_r, kfe, hr[:, 0])
+        cy1 = np.where(
+            overshoot_r,
+            kls + (kfe - kfs) * ((hr[:, 1] - kls) / (hr[:, 0] - kfs)),
+            hr[:, 1],
+        )
+        overshoot_l = hl[:, 0] < kfs
+        cx2 = np.where(overshoot_l, kfs, hl[:, 0])
+        cy2 = np.where(
+            overshoot_l,
+            kle + (kfs - kfe) * ((hl[:, 1] - kle) / (hl[:, 0] - kfe)),
+            hl[:, 1],
+        )
+
+    cx = np.stack([kfs, cx1, cx2, kfe], axis=-1)
+    cy = np.stack([kls, cy1, cy2, kle], axis=-1)
+    return cx, cy
+
+
+def power_coefficients(c):
+    """(a, b, c, d) with bezier(t) = a t^3 + b t^2 + c t + d for control points c (..., 4)"""
+    p0, p1, p2, p3 = (np.ascontiguousarray(c[..., i]) for i in range(4))
+    return (
+        p3 - p0 + 3 * (p1 - p2),
+        3 * (p0 - 2 * p1 + p2),
+        3 * (p1 - p0),
+        p0,
+    )
+
+
+def cubic_derivatives(t, coeffs):
+    """Value, first and second derivative in t of the cubic with power coefficients coeffs"""
+    a, b, c, d = coeffs
+    value = ((a * t + b) * t + c) * t + d
+    d1 = (3 * a * t + 2 * b) * t + c
+    d2 = 6 * a * t + 2 * b
+    return value, d1, d2
+
+
+def solve_bezier_t(cx, x):
+    """
+    Curve parameter t in [0, 1] with bezier x(t) == x for every row of cx (n, 4) and x (n,).
+    Returns t and a mask of the queries that converged
+    """
+    x0, x3 = cx[:, 0], cx[:, 3]
+    span = x3 - x0
+    scale = np.maximum(np.maximum(np.abs(x0), np.abs(x3)), 1.0)
+    tol = NEWTON_TOL * scale
+    a, b, c, d = power_coefficients(cx)
+    d = d - x
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.clip(np.where(span != 0, (x - x0) / span, 0.0), 0.0, 1.0)
+        # x(0) = x0 <= x <= x3 = x(1), so [lo, hi] always brackets a root
+        lo, hi = np.zeros_like(t), np.ones_like(t)
+        for _ in range(NEWTON_MAX_ITER):
+            r = ((a * t + b) * t + c) * t + d
+            done = np.abs(r) <= tol
+            if done.all():
+                break
+            lo = np.where(r < 0, t, lo)
+            hi = np.where(r > 0, t, hi)
+            step = t - r / ((3 * a * t + 2 * b) * t + c)
+            bisect = ~np.isfinite(step) | (step <= lo) | (step >= hi)
+            t = np.where(done, t, np.where(bisect, 0.5 * (lo + hi), step))
+
+    r = ((a * t + b) * t + c) * t + d
+    return t, np.abs(r) <= 1e3 * tol
+
+
+def evaluate_fcurve(kf: KeyframeArrays, frames):
+    """
+    Value, first and second derivative w.r.t. frame of an fcurve at every time in frames, and a
+    mask of the samples that could be evaluated (False where a bezier could not be inverted)
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.zeros(frames.shape)
+    d1 = np.zeros(frames.shape)
+    d2 = np.zeros(frames.shape)
+    valid = np.ones(frames.shape, dtype=bool)
+    if len(kf) == 0:
+        return values, d1, d2, valid
+
+    key_frames = kf.co[:, 0]
+    values[frames < key_frames[0]] = kf.co[0, 1]
+    values[frames > key_frames[-1]] = kf.co[-1, 1]
+    if len(kf) == 1:
+        values[frames == key_frames[0]] = kf.co[0, 1]
+        return values, d1, d2, valid
+
+    inside = np.flatnonzero((frames >= key_frames[0]) & (frames <= key_frames[-1]))
+    seg = np.searchsorted(key_frames, frames[inside], side="right") - 1
+    seg = np.clip(seg, 0, len(kf) - 2)
+    mode = kf.interpolation[seg]
+
+    unsupported = np.flatnonzero(mode < 0)
+    if unsupported.size:
+        names = kf.interpolation_names
+        name = names[seg[unsupported[0]]] if names else kf.interpolation[seg[0]]
+        raise ValueError(
+            f"Keyframe interpolation mode {name} not a supported mode: constant, linear, bezier"
+        )
+
+    kfs, kls = kf.co[seg, 0], kf.co[seg, 1]
+    kfe, kle = kf.co[seg + 1, 0], kf.co[seg + 1, 1]
+
+    m = mode == CONSTANT
+    values[inside[m]] = kls[m]
+
+    m = mode == LINEAR
+    slope = (kle[m] - kls[m]) / (kfe[m] - kfs[m])
+    values[inside[m]] = kls[m] + (frames[inside[m]] - kfs[m]) * slope
+    d1[inside[m]] = slope
+
+    m = np.flatnonzero(mode == BEZIER)
+    if m.size:
+        cx, cy = bezier_control_points(kf)
+        cx, cy = cx[seg[m]], cy[seg[m]]
+        t, converged = solve_bezier_t(cx, frames[inside[m]])
+        y, dy, ddy = cubic_derivatives(t, power_coefficients(cy))
+        _, dx, ddx = cubic_derivatives(t, power_coefficients(cx))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values[inside[m]] = y
+            d1[inside[m]] = dy / dx
+            d2[inside[m]] = (ddy * dx - dy * ddx) / dx**3
+        valid[inside[m]] = converged
+
+    return values, d1, d2, valid
@@ -0,0 +1,273 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import contextlib
+import logging
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import chain
+from pathlib import Path
+
+import gin
+import numpy as np
+
+from infinigen.core.util.mesh_export import write_mesh_folder, write_shard
+
+logger = logging.getLogger(__name__)
+
+"""
+Blender-free half of execute_tasks.save_meshes. On the Blender thread every frame is reduced to
+a FrameSnapshot: the saved_mesh entries of exporting.mesh_entries and the camera parameters of
+camera.camera_snapshot, all plain python and numpy. A FrameExportPool turns snapshots into the
+frame's mesh/ and cameras/ folders on worker threads while Blender moves on to the next frame.
+
+submit() blocks while max_inflight_frames frames are queued or being written. It reads the mesh
+entries on the calling thread and holds them while the frames in flight stay under
+max_inflight_bytes, waiting for earlier frames to finish if needed. A frame over
+max_inflight_bytes on its own is written by submit() instead, streaming the rest of its entries
+through the shard writer, so snapshots never hold more than max_inflight_bytes of arrays. The
+instanced geometry of a frame is still read from Blender at once, see scene_snapshot.
+
+With a MeshHistory, frames read and update it one at a time in the order they were submitted,
+so data_refs are the same as when writing serially. When a frame fails, frames that haven't
+started are dropped, the folders the failed and dropped frames created are removed, and the
+pool raises a FrameExportError naming the frame.
+"""
+
+MAX_INFLIGHT_BYTES = 2**30  # lower if OOM
+
+
+def frame_folder(output_folder, frame):
+    return Path(output_folder) / f"frame_{frame:04d}"
+
+
+@dataclass
+class FrameSnapshot:
+    frame: int
+    # (json_val, mesh_id, item) entries, see mesh_export.write_mesh_folder, or an iterator
+    # of them that FrameExportPool.submit consumes
+    meshes: list
+    cameras: dict  # camview file name -> arrays
+
+
+def arrays_nbytes(arrays):
+    return sum(a.nbytes for a in arrays if isinstance(a, np.ndarray))
+
+
+def entry_nbytes(entry):
+    _, _, item = entry
+    return 0 if item is None else arrays_nbytes(item.values())
+
+
+def write_camera_files(output_folder, cameras):
+    output_folder = Path(output_folder)
+    output_folder.mkdir(exist_ok=True, parents=True)
+    for name, arrays in cameras.items():
+        write_shard(output_folder / name, arrays)
+
+
+def write_frame(
+    output_folder, snapshot: FrameSnapshot, history=None, history_turn=None
+):
+    folder = frame_folder(output_folder, snapshot.frame)
+    write_mesh_folder(
+        folder / "mesh", snapshot.meshes, history, snapshot.frame, history_turn
+    )
+    write_camera_files(folder / "cameras", snapshot.cameras)
+
+
+class FrameExportError(RuntimeError):
+    def __init__(self, frame):
+        super().__init__(f"Exporting frame {frame} failed")
+        self.frame = frame
+
+
+class _Dropped(Exception):
+    """Raised in frames that don't get written because an earlier one failed"""
+
+
+@gin.configurable
+class FrameExportPool:
+    """
+    Writes FrameSnapshots to frame_XXXX folders of output_folder on n_workers threads, or
+    synchronously in submit() if n_workers is 1
+    """
+
+    def __init__(
+        self,
+        output_folder,
+        history=None,
+        n_workers=4,
+        max_inflight_bytes=MAX_INFLIGHT_BYTES,
+        max_inflight_frames=None,
+    ):
+        self.output_folder = Path(output_folder)
+        self.history = history
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_inflight_frames = max_inflight_frames or 2 * n_workers
+        self.executor = (
+            ThreadPoolExecutor(n_workers, thread_name_prefix="frame-export")
+            if n_workers > 1
+            else None
+        )
+        self.inflight_bytes = 0
+        self.peak_inflight_bytes = 0
+        self.inflight_frames = 0
+        self._cond = threading.Condition()
+        self._futures = []
+        self._failed = None  # (ticket, frame, exception) of the earliest failed frame
+        self._tickets = 0
+        self._turn = 0
+        self._turns_done = set()
+
+    def _finish_turn(self, ticket):
+        with self._cond:
+            self._turns_done.add(ticket)
+            while self._turn in self._turns_done:
+                self._turns_done.remove(self._turn)
+                self._turn += 1
+            self._cond.notify_all()
+
+    def _fail(self, ticket, frame, e):
+        with self._cond:
+            if self._failed is not None and self._failed[0] <= ticket:
+                return
+            self._failed = (ticket, frame, e)
+        logger.error(f"Exporting frame {frame} failed: {e!r}")
+
+    @contextlib.contextmanager
+    def _history_turn(self, ticket, frame):
+        with self._cond:
+            self._cond.wait_for(lambda: self._turn == ticket)
+            if self._failed is not None:
+                raise _Dropped()
+        try:
+            yield
+        except BaseException as e:
+            self._fail(ticket, frame, e)  # before later frames get their turn
+            raise
+        finally:
+            self._finish_turn(ticket)
+
+    def _write(self, snapshot, ticket, nbytes):
+        folder = frame_folder(self.output_folder, snapshot.frame)
+        new = [
+            p for p in (folder, folder / "mesh", folder / "cameras") if not p.exists()
+        ]
+        cleanup = new[:1] if new and new[0] == folder else new
+        try:
+            if self._failed is not None:
+                raise _Dropped()
+            turn = None
+            if self.history is not None:
+                turn = self._history_turn(ticket, snapshot.frame)
+            write_frame(self.output_folder, snapshot, self.history, turn)
+        except BaseException as e:
+            for path in cleanup:
+                shutil.rmtree(path, ignore_errors=True)
+            if not isinstance(e, _Dropped):
+                self._fail(ticket, snapshot.frame, e)
+            raise
+        finally:
+            self._finish_turn(ticket)
+            self._release(nbytes, frames=1)
+
+    def _raise_failed(self):
+        """Drop queued frames, wait for running ones and raise, if a frame failed"""
+        if self._failed is None:
+            return
+        for future in self._futures:
+            future.cancel()
+        self.close()
+
+    def _reserve(self, nbytes):
+        self.inflight_bytes += nbytes
+        self.peak_inflight_bytes = max(self.peak_inflight_bytes, self.inflight_bytes)
+
+    def _release(self, nbytes, frames=0):
+        with self._cond:
+            self.inflight_bytes -= nbytes
+            self.inflight_frames -= frames
+            self._cond.notify_all()
+
+    def _capture(self, entries):
+        """
+        Reads entries into a list while the frames in flight stay under max_inflight_bytes.
+        Returns the list, the bytes reserved for it and the entries left, None if all fit
+        """
+        captured, nbytes = [], 0
+        try:
+            for entry in entries:
+                size = entry_nbytes(entry)
+                with self._cond:
+                    # with only this frame in flight, no more bytes will be freed
+                    self._cond.wait_for(
+                        lambda: (
+                            self.inflight_frames == 1
+                            or self.inflight_bytes + size <= self.max_inflight_bytes
+                        )
+                    )
+                    fits = self.inflight_bytes + size <= self.max_inflight_bytes
+                    if fits:
+                        self._reserve(size)
+                        nbytes += size
+                captured.append(entry)
+                if not fits:
+                    return captured, nbytes, entries
+        except BaseException:
+            self._release(nbytes)
+            raise
+        return captured, nbytes, None
+
+    def submit(self, snapshot: FrameSnapshot):
+        """
+        Queue a frame, its mesh entries are read before this returns. The pool owns snapshot
+        afterwards, don't modify it
+        """
+        self._raise_failed()
+        ticket = self._tickets
+        self._tickets += 1
+        nbytes = arrays_nbytes(
+            a for camera in snapshot.cameras.values() for a in camera.values()
+        )
+        with self._cond:
+            self._cond.wait_for(lambda: self.inflight_frames < self.max_inflight_frames)
+            self.inflight_frames += 1
+            self._reserve(nbytes)
+
+        meshes, rest = iter(snapshot.meshes), None
+        if self.executor is not None:
+            try:
+                meshes, captured_bytes, rest = self._capture(meshes)
+            except BaseException:
+                self._finish_turn(ticket)
+                self._release(nbytes, frames=1)
+                raise
+            nbytes += captured_bytes
+            if rest is not None:
+                meshes = chain(meshes, rest)
+        snapshot = FrameSnapshot(snapshot.frame, meshes, snapshot.cameras)
+
+        if self.executor is None or rest is not None:
+            # earlier frames are done, stream this one to its shards from here
+            try:
+                self._write(snapshot, ticket, nbytes)
+            except Exception:
+                pass
+            self._raise_failed()
+        else:
+            self._futures.append(
+                self.executor.submit(self._write, snapshot, ticket, nbytes)
+            )
+
+    def close(self):
+        """Wait for all frames, raises a FrameExportError if any failed"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self._futures.clear()
+        if self._failed is not None:
+            _, frame, e = self._failed
+            raise FrameExportError(frame) from e
@@ -11,6 +11,8 @@ from pathlib import Path
 import bpy
 import numpy as np
 
+from infinigen.core.util.fcurves import KeyframeArrays, evaluate_fcurve, sample_times
+
 logger = logging.getLogger(__name__)
 
 
@@ -100,96 +102,36 @@ def a_of_bezier(t, cx, cy):
     return -2 * (A * t**2 + B * t + C) / (D * t**2 + E * t + F) ** 2 / dx_dt
 
 
-def data_from_keyframes(keyframe_points, frame_start, frame_end, for_acceleration):
+def data_from_keyframes(
+    keyframe_points, frame_start, frame_end, for_acceleration, rate=1
+):
     """
-    Return imu (acceleration or rotational velocity) and location data for an fcurve
+    Return imu (acceleration or rotational velocity) and location data for an fcurve, sampled
+    rate times per frame
     """
-    frame_start = int(ceil(frame_start))
-    frame_end = int(floor(frame_end))
-
-    def f_to_i(frame, is_ceil):
-        f = min(max(frame, frame_start), frame_end) - frame_start
-        return ceil(f) if is_ceil else floor(f)
-
-    def i_to_f(index):
-        return index + frame_start
-
-    data = np.zeros(frame_end - frame_start + 1)
-    locs = np.zeros(frame_end - frame_start + 1)
-    locs[: f_to_i(keyframe_points[0].co[0], False)] = keyframe_points[0].co[1]
-    locs[f_to_i(keyframe_points[-1].co[0], True) :] = keyframe_points[-1].co[1]
-
-    for i in range(len(keyframe_points) - 1):
-        kfs = keyframe_points[i].co[0]
-        kfe = keyframe_points[i + 1].co[0]
-        kls = keyframe_points[i].co[1]
-        kle = keyframe_points[i + 1].co[1]
-
-        if kfs > frame_end or kfe < frame_start:
-            continue
-
-        if keyframe_points[i].interpolation == "CONSTANT":
-            locs[f_to_i(kfs, True) : f_to_i(kfe, False) + 1] = kls
-            data[f_to_i(kfs, True) : f_to_i(kfe, False) + 1] = 0
-
-        elif keyframe_points[i].interpolation == "LINEAR":
-            slope = (kle - kls) / (kfe - kfs)
-            for j in range(f_to_i(kfs, True), f_to_i(kfe, False) + 1):
-                locs[j] = kls + (i_to_f(j) - kfs) * slope
-                data[j] = 0 if for_acceleration else slope
-
-        elif keyframe_points[i].interpolation == "BEZIER":
-            # control points
-            cx, cy = np.zeros(4), np.zeros(4)
-            cx[0], cy[0] = kfs, kls
-            cx[-1], cy[-1] = kfe, kle
-
-            if keyframe_points[i].handle_right[0] > kfe:
-                cx[1] = kfe
-                cy[1] = kls + (kfe - kfs) * (
-                    (keyframe_points[i].handle_right[1] - kls)
-                    / (keyframe_points[i].handle_right[0] - kfs)
-                )
-            else:
-                cx[1] = keyframe_points[i].handle_right[0]
-                cy[1] = keyframe_points[i].handle_right[1]
-
-            if keyframe_points[i + 1].handle_left[0] < kfs:
-                cx[2] = kfs
-                cy[2] = kle + (kfs - kfe) * (
-                    (keyframe_points[i + 1].handle_left[1] - kle)
-                    / (keyframe_points[i + 1].handle_left[0] - kfe)
-                )
-            else:
-                cx[2] = keyframe_points[i + 1].handle_left[0]
-                cy[2] = keyframe_points[i + 1].handle_left[1]
-
-            for j in range(f_to_i(kfs, True), f_to_i(kfe, False) + 1):
-                roots = bezier_zeros(i_to_f(j), cx[0], cx[1], cx[2], cx[3])
-                if len(roots) == 0:
-                    raise Exception(
-                        "Bezier interpolation failed at frame {}".format(i_to_f(j))
-                    )
-                data[j] = (
-                    a_of_bezier(roots[0], cx, cy)
-                    if for_acceleration
-                    else v_of_bezier(roots[0], cx, cy)
-                )
-                locs[j] = y_of_bezier(roots[0], cy)
-
-        else:
-            raise Exception(
-                "Keyframe interpolation mode {} not a supported mode: constant, linear, bezier".format(
-                    keyframe_points[i].interpolation
-                )
+    frames = sample_times(int(ceil(frame_start)), int(floor(frame_end)), rate)
+    kf = KeyframeArrays.from_keyframe_points(keyframe_points)
+    try:
+        locs, velocity, acceleration, valid = evaluate_fcurve(kf, frames)
+    except ValueError as e:
+        raise Exception(str(e))
+    if not valid.all():
+        raise Exception(
+            "Bezier interpolation failed at frame {}".format(
+                format_timestamp(frames[~valid][0])
             )
+        )
+    return (acceleration if for_acceleration else velocity), locs
+
 
-    return data, locs
+def format_timestamp(frame):
+    frame = float(frame)
+    return str(int(frame)) if frame.is_integer() else str(frame)
 
 
-def get_imu_tum_data(object, start, end):
+def get_imu_tum_data(object, start, end, rate=1):
     """
-    Returns imu and tum data of camera in file formatted strings
+    Returns imu and tum data of camera in file formatted strings, sampled rate times per frame
     """
 
     if object.animation_data is None:
@@ -205,6 +147,9 @@ def get_imu_tum_data(object, start, end):
     if length <= 1:
         raise Exception(f"trajectory duration is too short: {length} frames")
 
+    frames = sample_times(start, end, rate)
+    length = len(frames)
+
     old_rotation = object.rotation_mode
     object.rotation_mode = "XYZ"
 
@@ -222,28 +167,45 @@ def get_imu_tum_data(object, start, end):
     for curve in object.animation_data.action.fcurves:
         if curve.data_path == "location":
             if curve.array_index == 0:
-                ax, x = data_from_keyframes(curve.keyframe_points, start, end, True)
+                ax, x = data_from_keyframes(
+                    curve.keyframe_points, start, end, True, rate
+                )
             elif curve.array_index == 1:
-                ay, y = data_from_keyframes(curve.keyframe_points, start, end, True)
+                ay, y = data_from_keyframes(
+                    curve.keyframe_points, start, end, True, rate
+                )
             elif curve.array_index == 2:
-                az, z = data_from_keyframes(curve.keyframe_points, start, end, True)
+                az, z = data_from_keyframes(
+                    curve.keyframe_points, start, end, True, rate
+                )
 
         elif curve.data_path == "rotation_euler":
             if curve.array_index == 0:
-                rvx, rx = data_from_keyframes(curve.keyframe_points, start, end, False)
+                rvx, rx = data_from_keyframes(
+                    curve.keyframe_points, start, end, False, rate
+                )
             elif curve.array_index == 1:
-                rvy, ry = data_from_keyframes(curve.keyframe_points, start, end, False)
+                rvy, ry = data_from_keyframes(
+                    curve.keyframe_points, start, end, False, rate
+                )
             elif curve.array_index == 2:
-                rvz, rz = data_from_keyframes(curve.keyframe_points, start, end, False)
+                rvz, rz = data_from_keyframes(
+                    curve.keyframe_points, start, end, False, rate
+                )
 
         else:
             raise Exception("Unsupported action fcurve: {}".format(curve.data_path))
 
     SMALL = float(1e-4)
 
+    def set_frame(frame):
+        bpy.context.scene.frame_set(
+            int(floor(frame)), subframe=float(frame - floor(frame))
+        )
+
     # check data accuracy
     for i in range(length):
-        bpy.context.scene.frame_set(i + start)
+        set_frame(frames[i])
         if x is not None:
             if abs(x[i] - object.location[0]) > SMALL:
                 raise Exception(
@@ -293,11 +255,11 @@ def get_imu_tum_data(object, start, end):
 
     # format data
     for i in range(length):
-        bpy.context.scene.frame_set(i + start)
+        set_frame(frames[i])
         imu_text.append(
             " ".join(
                 [
-                    str(i + start),
+                    format_timestamp(frames[i]),
                     str(rvx[i]),
                     str(rvy[i]),
                     str(rvz[i]),
@@ -310,7 +272,7 @@ def get_imu_tum_data(object, start, end):
         tum_text.append(
             " ".join(
                 [
-                    str(i + start),
+                    format_timestamp(frames[i]),
                     str(object.location[0]),
                     str(object.location[1]),
                     str(object.location[2]),
@@ -331,9 +293,10 @@ def save_imu_tum_files(
     objects: list[bpy.types.Object],
     start=bpy.context.scene.frame_start,
     end=bpy.context.scene.frame_end,
+    rate=1,
 ):
     """
-    Write imu and tum data to output files for each object.
+    Write imu and tum data to output files for each object, sampled rate times per frame.
     """
 
     output_folder = Path(output_folder)
@@ -346,7 +309,7 @@ def save_imu_tum_files(
 
     for i in range(len(objects)):
         try:
-            imu_text, tum_text = get_imu_tum_data(anim_objects[i], start, end)
+            imu_text, tum_text = get_imu_tum_data(anim_objects[i], start, end, rate)
             name = anim_objects[i].name.replace("/", "_")
         except Exception as e:
             logger.warning(
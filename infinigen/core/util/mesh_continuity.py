@@ -0,0 +1,211 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import logging
+from dataclasses import dataclass, field, replace
+from uuid import uuid4
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+"""
+mesh_id continuity of instanced meshes across the frames of save_meshes, without Blender.
+
+An instanced mesh has no stable name of its own, so it keeps the mesh_id of the previous frame's
+mesh with the same object name and vertex count that shares instance ids (get_id) with it.
+A MeshIdIndex holds one frame's (name, num_verts, instance_id) -> mesh_id as sorted 16 byte keys,
+so every id of a mesh is looked up with searchsorted instead of scanning the previous entries.
+
+A mesh takes the mesh_id it shares most instance ids with, ties going to the oldest mesh_id.
+If several meshes pick the same one, it continues in the mesh sharing most ids with it and the
+others get new ids. Previous meshes whose ids are now spread over several meshes (splits) and
+meshes that took over ids of several previous ones (merges) are reported in a MeshIdResolution.
+"""
+
+KEY_DTYPE = np.dtype((np.void, 16))
+
+
+def _pack(codes, ids):
+    """One key per (group code, instance id), comparable with searchsorted"""
+    keys = np.empty((len(ids), 4), dtype=np.int32)
+    keys[:, 0] = codes
+    keys[:, 1:] = ids
+    return keys.view(KEY_DTYPE).reshape(-1)
+
+
+def _stack_ids(meshes):
+    """Number of instance ids of every (name, num_verts, instance_ids) and all of them (n, 3)"""
+    counts = np.array([len(ids) for _, _, ids in meshes], dtype=np.int64)
+    ids = [np.asarray(ids, dtype=np.int64).reshape(-1, 3) for _, _, ids in meshes]
+    ids = np.concatenate(ids) if ids else np.empty((0, 3), dtype=np.int64)
+    return counts, ids.astype(np.int32)
+
+
+def _first_per_run(labels):
+    """Mask of the first element of every run of equal labels"""
+    first = np.ones(len(labels), dtype=bool)
+    first[1:] = labels[1:] != labels[:-1]
+    return first
+
+
+def _runs(labels, values):
+    """(label, values with that label) for every distinct label"""
+    order = np.argsort(labels, kind="stable")
+    labels, values = labels[order], values[order]
+    starts = np.flatnonzero(_first_per_run(labels))
+    return zip(labels[starts], np.split(values, starts[1:]))
+
+
+def _seniority(mesh_ids, births):
+    """Rank of every mesh_id by age, 0 for the oldest. Same-frame ids are ordered by value"""
+    order = sorted(range(len(mesh_ids)), key=lambda i: (births[i], mesh_ids[i]))
+    rank = np.empty(len(mesh_ids), dtype=np.int64)
+    rank[order] = np.arange(len(mesh_ids))
+    return rank
+
+
+@dataclass(frozen=True)
+class MeshIdIndex:
+    """The instance ids of one frame's instanced meshes and the mesh_id owning each of them"""
+
+    groups: dict = field(default_factory=dict)  # (name, num_verts) -> group code
+    keys: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=KEY_DTYPE))
+    owners: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    mesh_ids: tuple = ()
+    births: tuple = ()
+    seniority: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+
+    @classmethod
+    def build(cls, groups, counts, ids, mesh_ids, births):
+        """Index of the meshes with (name, num_verts) groups[i] and the next counts[i] rows of ids"""
+        codes = {g: i for i, g in enumerate(sorted(set(groups)))}
+        mesh = np.repeat(np.arange(len(groups)), counts)
+        keys = _pack(np.array([codes[g] for g in groups], dtype=np.int64)[mesh], ids)
+        order = np.argsort(keys, kind="stable")
+        return cls(
+            groups=codes,
+            keys=keys[order],
+            owners=mesh[order],
+            mesh_ids=tuple(mesh_ids),
+            births=tuple(births),
+            seniority=_seniority(mesh_ids, births),
+        )
+
+    def ranks(self, n_meshes):
+        """
+        Rank of each of the n_meshes indexed by its smallest key, which doesn't depend on the
+        order meshes were given in. Meshes without instance ids come last
+        """
+        _, first = np.unique(self.owners, return_index=True)
+        rank = np.full(n_meshes, len(self.keys), dtype=np.int64)
+        rank[self.owners[first]] = np.searchsorted(self.keys, self.keys[first])
+        return rank
+
+    def __len__(self):
+        return len(self.mesh_ids)
+
+    def overlaps(self, groups, counts, ids):
+        """
+        (mesh, owner, shared) for every pair of a mesh and a mesh_id of this index it shares
+        instance ids with, sorted by mesh then owner. Mesh i has (name, num_verts) groups[i] and
+        the next counts[i] rows of ids
+        """
+        empty = np.empty(0, dtype=np.int64)
+        if len(self) == 0 or len(ids) == 0:
+            return empty, empty, empty
+        codes = np.array([self.groups.get(g, -1) for g in groups], dtype=np.int64)
+        mesh = np.repeat(np.arange(len(groups)), counts)
+        keys = _pack(codes[mesh], ids)
+        left = np.searchsorted(self.keys, keys, side="left")
+        n = np.searchsorted(self.keys, keys, side="right") - left
+
+        # an id may be owned by several meshes of the same group, each gets its vote
+        pos = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(left, n)
+        pairs = np.repeat(mesh, n) * len(self) + self.owners[pos]
+        pairs, shared = np.unique(pairs, return_counts=True)
+        return pairs // len(self), pairs % len(self), shared
+
+
+@dataclass
+class MeshIdResolution:
+    """
+    mesh_ids of one frame's meshes. splits maps previous mesh_ids whose instances are now held
+    by several meshes to their mesh_ids, merges maps mesh_ids holding the instances of several
+    previous ones to those
+    """
+
+    mesh_ids: list[str]
+    splits: dict[str, list[str]]
+    merges: dict[str, list[str]]
+
+    def events(self, mesh_id):
+        """split_from / merged_from entries of mesh_id for saved_mesh.json, empty if neither"""
+        result = {}
+        split_from = sorted(prev for prev, cur in self.splits.items() if mesh_id in cur)
+        if split_from:
+            result["split_from"] = split_from
+        if mesh_id in self.merges:
+            result["merged_from"] = self.merges[mesh_id]
+        return result
+
+
+class MeshIdTracker:
+    """Assigns the mesh_ids of instanced meshes frame by frame, carried across frames"""
+
+    def __init__(self, new_id=None):
+        self.new_id = new_id or (lambda: uuid4().hex[:12])
+        self.index = MeshIdIndex()
+        self.frame = 0
+
+    def resolve(self, meshes):
+        """
+        mesh_ids for a frame's instanced meshes, each (name, num_verts, instance_ids), and the
+        split / merge events since the previous call. The result does not depend on the order of
+        meshes, except among meshes with identical name, num_verts and instance ids
+        """
+        groups = [(name, int(num_verts)) for name, num_verts, _ in meshes]
+        counts, ids = _stack_ids(meshes)
+        prev = self.index
+        mesh, owner, shared = prev.overlaps(groups, counts, ids)
+
+        # majority vote of each mesh, ties go to the oldest mesh_id
+        order = np.lexsort((prev.seniority[owner], -shared, mesh))
+        vote = order[_first_per_run(mesh[order])]
+
+        # a previous mesh_id continues in the mesh that shares most ids with it
+        nxt = MeshIdIndex.build(groups, counts, ids, (), ())
+        tag = nxt.ranks(len(meshes))
+        order = np.lexsort((tag[mesh[vote]], -shared[vote], owner[vote]))
+        winners = vote[order[_first_per_run(owner[vote][order])]]
+
+        mesh_ids = [None] * len(meshes)
+        births = [self.frame] * len(meshes)
+        for m, o in zip(mesh[winners], owner[winners]):
+            mesh_ids[m] = prev.mesh_ids[o]
+            births[m] = prev.births[o]
+        for m in sorted(range(len(meshes)), key=lambda m: (tag[m], groups[m])):
+            if mesh_ids[m] is None:
+                mesh_ids[m] = self.new_id()
+
+        splits = {
+            prev.mesh_ids[o]: sorted(mesh_ids[m] for m in cur)
+            for o, cur in _runs(owner, mesh)
+            if len(cur) > 1
+        }
+        merges = {
+            mesh_ids[m]: sorted(prev.mesh_ids[o] for o in sources)
+            for m, sources in _runs(mesh, owner)
+            if len(sources) > 1
+        }
+        if splits or merges:
+            logger.debug(f"{len(splits)} mesh_ids split, {len(merges)} merged")
+
+        self.index = replace(
+            nxt,
+            mesh_ids=tuple(mesh_ids),
+            births=tuple(births),
+            seniority=_seniority(mesh_ids, births),
+        )
+        self.frame += 1
+        return MeshIdResolution(mesh_ids, splits, merges)
@@ -0,0 +1,479 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import gin
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+"""
+Blender-free half of exporting.save_obj_and_instances: turns the mesh dicts yielded by
+get_all_instances / get_all_non_instances into saved_mesh_XXXX.npz shards.
+
+Each mesh is stored under `<mesh_id>_<field>` keys. In incremental mode a MeshHistory carried
+across frames remembers where each mesh's geometry was last written, together with a fingerprint
+of it. Meshes whose geometry did not change since then only store their per-frame fields, and
+their saved_mesh.json entry gets a `"data_ref": {"frame": N, "file": ..., "key": ...}` pointing at
+the npz (relative to the referencing folder) and mesh_id holding the geometry. Use
+read_mesh_arrays to load either format, or expand_refs to rewrite a folder to the full format.
+
+Shards are closed once they hold max_shard_bytes of arrays and handed to a ShardWriterPool, which
+serializes them on worker threads while the depsgraph walk continues. At most max_inflight_bytes
+of arrays are held by queued or running writes, submit() blocks until enough are finished. Each
+shard is written to a temporary file and renamed into place, and its sha256 and size are recorded
+in the saved_mesh.json entries of its meshes (file_sha256, file_size).
+
+Without a history and with compression="none" a folder is what customgt reads: every entry's
+filename names the .npz next to saved_mesh.json which holds all of its `<mesh_id>_<field>` arrays,
+wherever the shard boundaries fall. customgt can't follow data_refs or read .npz.zst shards,
+expand_refs (infinigen.tools.expand_mesh_refs) rewrites a folder without the former.
+"""
+
+MAX_SHARD_BYTES = 2**26
+MAX_INFLIGHT_BYTES = 2**28  # lower if OOM
+CODECS = ("none", "deflate", "zstd")
+# fixed zip member timestamps, so identical arrays give byte-identical shards
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+GEOMETRY_FIELDS = ("indices", "loop_totals", "masktag", "radii", "vertices")
+PER_FRAME_FIELDS = ("transformations", "instance_ids")
+FIELDS = GEOMETRY_FIELDS + PER_FRAME_FIELDS
+
+
+def item_arrays(item):
+    """The npz arrays of one mesh dict, keyed by field"""
+    arrays = {}
+    if "indices" in item:
+        arrays["indices"] = item["indices"]
+        arrays["loop_totals"] = item["loop_totals"]
+        arrays["masktag"] = item["masktag"]
+    else:
+        arrays["radii"] = item["radii"]
+    arrays["vertices"] = item["vertex_lookup"]
+    arrays["transformations"] = np.asarray(item["matrices"], dtype=np.float32)
+    instance_ids = np.asarray(item["instance_ids"], dtype=np.int32)
+    assert np.unique(instance_ids, axis=0).shape == instance_ids.shape
+    assert instance_ids.shape[1] == 3
+    arrays["instance_ids"] = instance_ids
+    return arrays
+
+
+def mesh_fingerprint(item):
+    """
+    Hash of a mesh dict's geometry. Vertex and face counts enter through the array shapes, the
+    buffers are hashed in place as filled by foreach_get in get_mesh_data / get_curve_data
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for field, arr in item_arrays(item).items():
+        if field in PER_FRAME_FIELDS:
+            continue
+        arr = np.ascontiguousarray(arr)
+        h.update(f"{field}:{arr.dtype.str}:{arr.shape};".encode())
+        h.update(arr.data)
+    return h.hexdigest()
+
+
+@dataclass
+class StoredGeometry:
+    fingerprint: str
+    path: Path
+    key: str
+    frame: int
+
+
+class MeshHistory:
+    """Where the geometry of each mesh_id was last written, carried across frames"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def lookup(self, mesh_id, fingerprint):
+        stored = self.entries.get(mesh_id)
+        if stored is None or stored.fingerprint != fingerprint:
+            return None
+        return stored
+
+    def record(self, mesh_id, fingerprint, path, frame):
+        self.entries[mesh_id] = StoredGeometry(fingerprint, Path(path), mesh_id, frame)
+
+
+def _write_npz(f, arrays, compression="none", level=None):
+    """np.savez / np.savez_compressed, with a choice of deflate level and fixed timestamps"""
+    compress_type = (
+        zipfile.ZIP_DEFLATED if compression == "deflate" else zipfile.ZIP_STORED
+    )
+    with zipfile.ZipFile(f, "w", allowZip64=True) as zf:
+        for key, arr in arrays.items():
+            info = zipfile.ZipInfo(f"{key}.npy", date_time=ZIP_DATE_TIME)
+            info.compress_type = compress_type
+            if compression == "deflate" and level is not None:
+                info._compresslevel = level
+            with zf.open(info, "w", force_zip64=True) as member:
+                np.lib.format.write_array(
+                    member, np.asanyarray(arr), allow_pickle=False
+                )
+
+
+def shard_suffix(compression):
+    return ".npz.zst" if compression == "zstd" else ".npz"
+
+
+def file_sha256(path, chunk_size=2**20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_shard(path, arrays, compression="none", level=None):
+    """Write arrays to path via a temporary file and rename, returns its sha256 and size"""
+    if compression not in CODECS:
+        raise ValueError(f"Unrecognized {compression=}, expected one of {CODECS}")
+    if compression == "zstd" and zstandard is None:
+        raise ImportError(
+            "compression='zstd' requires the `zstandard` package, use compression='deflate' or `pip install zstandard`"
+        )
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        if compression == "zstd":
+            buf = io.BytesIO()
+            _write_npz(buf, arrays)
+            cctx = zstandard.ZstdCompressor(level=3 if level is None else level)
+            tmp.write_bytes(cctx.compress(buf.getbuffer()))
+        else:
+            with open(tmp, "wb") as f:
+                _write_npz(f, arrays, compression, level)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return dict(file_sha256=file_sha256(path), file_size=path.stat().st_size)
+
+
+def load_shard(path):
+    """np.load for shards of any compression"""
+    path = Path(path)
+    if path.name.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"Reading {path} requires the `zstandard` package")
+        with open(path, "rb") as f:
+            data = zstandard.ZstdDecompressor().stream_reader(f).read()
+        return np.load(io.BytesIO(data))
+    return np.load(path)
+
+
+def verify_shards(folder):
+    """Names of shards in a saved_mesh folder whose sha256 or size differ from saved_mesh.json"""
+    folder = Path(folder)
+    entries = json.loads((folder / "saved_mesh.json").read_text())
+    expected = {
+        e["filename"]: (e["file_sha256"], e["file_size"])
+        for e in entries
+        if "file_sha256" in e
+    }
+    bad = []
+    for filename, (sha256, size) in sorted(expected.items()):
+        path = folder / filename
+        if (
+            not path.exists()
+            or path.stat().st_size != size
+            or file_sha256(path) != sha256
+        ):
+            bad.append(filename)
+    return bad
+
+
+class ShardWriterPool:
+    """
+    Writes shards on n_workers threads, or synchronously if n_workers is 0. submit() blocks while
+    the arrays of unfinished shards exceed max_inflight_bytes, unless nothing else is in flight
+    """
+
+    def __init__(
+        self,
+        n_workers=2,
+        max_inflight_bytes=MAX_INFLIGHT_BYTES,
+        compression="none",
+        level=None,
+    ):
+        if compression not in CODECS:
+            raise ValueError(f"Unrecognized {compression=}, expected one of {CODECS}")
+        self.max_inflight_bytes = max_inflight_bytes
+        self.compression = compression
+        self.level = level
+        self.executor = (
+            ThreadPoolExecutor(n_workers, thread_name_prefix="npz-writer")
+            if n_workers > 0
+            else None
+        )
+        self.inflight_bytes = 0
+        self.peak_inflight_bytes = 0
+        self._cond = threading.Condition()
+        self._futures = {}
+        self.results = {}
+
+    def _write(self, path, arrays, nbytes):
+        try:
+            return write_shard(path, arrays, self.compression, self.level)
+        finally:
+            with self._cond:
+                self.inflight_bytes -= nbytes
+                self._cond.notify_all()
+
+    def _raise_failed(self):
+        for future in self._futures.values():
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    def submit(self, path, arrays):
+        """Queue arrays to be written to path. The pool owns arrays afterwards, don't modify it"""
+        path = Path(path)
+        if self.executor is None:
+            self.results[path.name] = write_shard(
+                path, arrays, self.compression, self.level
+            )
+            return
+        self._raise_failed()
+        nbytes = sum(np.asarray(a).nbytes for a in arrays.values())
+        with self._cond:
+            while (
+                self.inflight_bytes > 0
+                and self.inflight_bytes + nbytes > self.max_inflight_bytes
+            ):
+                self._cond.wait()
+            self.inflight_bytes += nbytes
+            self.peak_inflight_bytes = max(
+                self.peak_inflight_bytes, self.inflight_bytes
+            )
+        self._futures[path.name] = self.executor.submit(
+            self._write, path, arrays, nbytes
+        )
+
+    def close(self):
+        """Wait for all writes, returns {filename: dict(file_sha256, file_size)}"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            futures, self._futures = self._futures, {}
+            for name, future in futures.items():
+                if future.exception() is not None:
+                    raise future.exception()
+                self.results[name] = future.result()
+        return self.results
+
+
+@gin.configurable
+class MeshShardWriter:
+    """
+    Accumulates mesh arrays into saved_mesh_XXXX.npz files of at most max_shard_bytes (unless a
+    single mesh is larger) and writes them through a ShardWriterPool
+    """
+
+    def __init__(
+        self,
+        output_folder,
+        history=None,
+        frame=None,
+        max_shard_bytes=MAX_SHARD_BYTES,
+        n_workers=2,
+        max_inflight_bytes=MAX_INFLIGHT_BYTES,
+        compression="none",
+        level=None,
+    ):
+        self.output_folder = Path(output_folder)
+        self.output_folder.mkdir(exist_ok=True, parents=True)
+        self.max_shard_bytes = max_shard_bytes
+        self.history = history
+        self.frame = frame
+        self.suffix = shard_suffix(compression)
+        self.pool = ShardWriterPool(
+            n_workers,
+            max_inflight_bytes,
+            compression,
+            level,
+        )
+        self.npz_number = 1
+        self.npz_data = {}
+        self.shard_bytes = 0
+
+    @property
+    def filename(self):
+        return self.output_folder / f"saved_mesh_{self.npz_number:04d}{self.suffix}"
+
+    def flush(self):
+        if len(self.npz_data) == 0:
+            return
+        print(f"Saving to {self.filename}")
+        self.pool.submit(self.filename, self.npz_data)
+        self.npz_data = {}
+        self.shard_bytes = 0
+        self.npz_number += 1
+
+    def add(self, mesh_id, item):
+        """Stage one mesh dict, returns the fields of its saved_mesh.json entry"""
+        arrays = item_arrays(item)
+        data_ref = None
+        if self.history is not None:
+            fingerprint = mesh_fingerprint(item)
+            if stored := self.history.lookup(mesh_id, fingerprint):
+                arrays = {k: arrays[k] for k in PER_FRAME_FIELDS}
+                data_ref = {
+                    "frame": stored.frame,
+                    "file": os.path.relpath(stored.path, self.output_folder),
+                    "key": stored.key,
+                }
+
+        nbytes = sum(arr.nbytes for arr in map(np.asarray, arrays.values()))
+        # Flush the .npz to avoid OOM
+        if len(self.npz_data) > 0 and self.shard_bytes + nbytes > self.max_shard_bytes:
+            self.flush()
+        if nbytes > self.max_shard_bytes:
+            print(
+                f"WARNING: Object {item['name']} is very large, with {nbytes / 2**20:.0f}MB of mesh data."
+            )
+        if self.history is not None and data_ref is None:
+            self.history.record(mesh_id, fingerprint, self.filename, self.frame)
+
+        assert f"{mesh_id}_transformations" not in self.npz_data
+        for field, arr in arrays.items():
+            self.npz_data[f"{mesh_id}_{field}"] = arr
+        self.shard_bytes += nbytes
+        json_val = {"filename": self.filename.name}
+        if data_ref is not None:
+            json_val["data_ref"] = data_ref
+        return json_val
+
+    def close(self):
+        """Finish all shards, returns {filename: dict(file_sha256, file_size)}"""
+        try:
+            self.flush()
+        finally:
+            shards = self.pool.close()
+        return shards
+
+
+def write_mesh_folder(
+    output_folder, entries, history=None, frame=None, history_turn=None
+):
+    """
+    Write a saved_mesh folder from the (json_val, mesh_id, item) entries of
+    exporting.mesh_entries, item None for entries without arrays. history_turn is held while
+    history is read and updated, so callers writing several frames at once can keep their order
+    """
+    output_folder = Path(output_folder)
+    writer = MeshShardWriter(output_folder, history=history, frame=frame)
+    json_data = []
+    try:
+        with history_turn or contextlib.nullcontext():
+            for json_val, mesh_id, item in entries:
+                if item is not None:
+                    json_val = {**writer.add(mesh_id, item), **json_val}
+                json_data.append(json_val)
+    except BaseException:
+        # let running writes finish before the caller cleans up
+        with contextlib.suppress(Exception):
+            writer.pool.close()
+        raise
+    shards = writer.close()
+    for json_val in json_data:
+        if "filename" in json_val:
+            json_val.update(shards[json_val["filename"]])
+    (output_folder / "saved_mesh.json").write_text(json.dumps(json_data, indent=4))
+
+
+class _ShardCache:
+    def __init__(self):
+        self.files = {}
+
+    def __call__(self, path):
+        path = Path(os.path.normpath(path))
+        if path not in self.files:
+            self.files[path] = load_shard(path)
+        return self.files[path]
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+
+def _entry_arrays(folder, entry, shards):
+    mesh_id = entry["mesh_id"]
+    own = shards(folder / entry["filename"])
+    arrays = {}
+    if ref := entry.get("data_ref"):
+        source, key = shards(folder / ref["file"]), ref["key"]
+        for field in GEOMETRY_FIELDS:
+            if f"{key}_{field}" in source.files:
+                arrays[field] = source[f"{key}_{field}"]
+    for field in FIELDS:
+        if f"{mesh_id}_{field}" in own.files:
+            arrays[field] = own[f"{mesh_id}_{field}"]
+    return {k: arrays[k] for k in FIELDS if k in arrays}
+
+
+def read_mesh_arrays(folder):
+    """{mesh_id: {field: array}} of a saved_mesh folder, with data_refs resolved"""
+    folder = Path(folder)
+    entries = json.loads((folder / "saved_mesh.json").read_text())
+    shards = _ShardCache()
+    try:
+        return {
+            e["mesh_id"]: _entry_arrays(folder, e, shards)
+            for e in entries
+            if "mesh_id" in e
+        }
+    finally:
+        shards.close()
+
+
+def expand_refs(folder):
+    """Rewrite a saved_mesh folder in place to the full format, without data_refs"""
+    folder = Path(folder)
+    json_path = folder / "saved_mesh.json"
+    entries = json.loads(json_path.read_text())
+    by_file = {}
+    for e in entries:
+        if "data_ref" in e:
+            by_file.setdefault(e["filename"], []).append(e)
+    if not by_file:
+        return
+    shards = _ShardCache()
+    try:
+        for filename, refs in by_file.items():
+            own = shards(folder / filename)
+            npz_data = {k: own[k] for k in own.files}
+            for e in refs:
+                arrays = _entry_arrays(folder, e, shards)
+                for field, arr in arrays.items():
+                    npz_data[f"{e['mesh_id']}_{field}"] = arr
+            shards.files.pop(Path(os.path.normpath(folder / filename))).close()
+            compression = "zstd" if filename.endswith(".zst") else "none"
+            checksum = write_shard(folder / filename, npz_data, compression)
+            for e in entries:
+                if e.get("filename") == filename and "file_sha256" in e:
+                    e.update(checksum)
+    finally:
+        shards.close()
+    for e in entries:
+        e.pop("data_ref", None)
+    json_path.write_text(json.dumps(entries, indent=4))
@@ -9,26 +9,85 @@ import os
 from contextlib import nullcontext
 from pathlib import Path
 
+import gin
 import numpy as np
 import pandas as pd
 import psutil
 
-from infinigen.core.util.blender import GarbageCollect, count_instance, count_objects
+from infinigen.core.util.checkpoint import (
+    StageCheckpointer,
+    stage_key,
+    stage_serializer,
+)
 from infinigen.core.util.logging import Timer
 from infinigen.core.util.math import FixedSeed, int_hash
+from infinigen.core.util.profiling import StageProfiler
 
 logger = logging.getLogger(__name__)
 
+# counters recorded for every stage even when profiling is disabled
+BASE_COUNTERS = ("obj_count", "instance_count")
 
+
+def blender_counters():
+    import bpy
+
+    from infinigen.core.util.blender import count_instance, count_objects
+
+    return {
+        "obj_count": count_objects,
+        "instance_count": count_instance,
+        "data_objects": lambda: len(bpy.data.objects),
+        "meshes": lambda: len(bpy.data.meshes),
+        "materials": lambda: len(bpy.data.materials),
+        "node_groups": lambda: len(bpy.data.node_groups),
+    }
+
+
+@gin.configurable
 class RandomStageExecutor:
-    def __init__(self, scene_seed, output_folder: Path, params):
+    """
+    Runs named, seeded, optionally random stages of scene generation and records their results
+
+    With profile=True every stage additionally records wall / cpu time, RSS before, after and at
+    peak, and all `counters` before and after, as nested spans; save_results then also writes a
+    Chrome trace next to the csv. counters maps column names to callables, blender_counters() by
+    default.
+
+    With checkpoint=True, stages whose function is decorated with checkpoint.checkpointable are
+    saved under checkpoint_folder (default <output_folder>/checkpoints) and restored instead of
+    run when their chained key matches a completed checkpoint.
+    """
+
+    def __init__(
+        self,
+        scene_seed,
+        output_folder: Path,
+        params,
+        profile=False,
+        counters=None,
+        sample_interval=0.02,
+        checkpoint=False,
+        checkpoint_folder=None,
+    ):
         self.scene_seed = scene_seed
         self.output_folder = output_folder
         self.params = params
+        self.counters = counters if counters is not None else blender_counters()
+        self.profiler = (
+            StageProfiler(self.counters, sample_interval) if profile else None
+        )
+        self.checkpointer = None
+        if checkpoint:
+            if checkpoint_folder is None:
+                checkpoint_folder = Path(output_folder) / "checkpoints"
+            self.checkpointer = StageCheckpointer(checkpoint_folder)
+        self._chain_key = None
 
         self.results = []
 
-    def _should_run_stage(self, name, use_chance, prereq):
+    def _skip_reason(self, name, use_chance, prereq):
+        """None if the stage should run, otherwise why not: "prereq", "disabled" or "chance" """
         if prereq is not None:
             try:
                 e = next(e for e in self.results if e["name"] == prereq)
@@ -36,18 +95,35 @@ class RandomStageExecutor:
                 raise ValueError(f"{self} could not find matching name for {prereq=}")
             if not e["ran"]:
                 logger.info(f"Skipping run_stage({name}...) due to unmet {prereq=}")
-                return
+                return "prereq"
         with FixedSeed(int_hash((self.scene_seed, name, 0))):
             if not self.params.get(f"{name}_enabled", True):
                 logger.debug(f"Not running {name} due to manually set not enabled")
-                return False
+                return "disabled"
             if use_chance and np.random.uniform() > self.params[f"{name}_chance"]:
                 logger.debug(f"Not running {name} due to random chance")
-                return False
-        return True
+                return "chance"
+        return None
+
+    def _should_run_stage(self, name, use_chance, prereq):
+        return self._skip_reason(name, use_chance, prereq) is None
+
+    def _base_counts(self):
+        return {k: self.counters[k]() for k in BASE_COUNTERS if k in self.counters}
+
+    def _span(self, name, **args):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.span(name, **args)
 
     def save_results(self, path):
         pd.DataFrame.from_records(self.results).to_csv(path)
+        if self.profiler is not None:
+            self.profiler.save_chrome_trace(Path(path).with_suffix(".trace.json"))
+
+    def close(self):
+        if self.profiler is not None:
+            self.profiler.close()
 
     def run_stage(
         self,
@@ -62,38 +138,89 @@ class RandomStageExecutor:
     ):
         mem_usage = psutil.Process(os.getpid()).memory_info().rss
 
-        will_run = self._should_run_stage(name, use_chance, prereq)
-
-        if not will_run:
-            self.results.append(
-                {
-                    "name": name,
-                    "ran": will_run,
-                    "mem_at_finish": mem_usage,
-                    "obj_count": count_objects(),
-                    "instance_count": count_instance(),
-                }
-            )
+        skip_reason = self._skip_reason(name, use_chance, prereq)
+
+        if skip_reason is not None:
+            if self.checkpointer is not None:
+                self._chain_key = stage_key(
+                    self._chain_key,
+                    self.scene_seed,
+                    name,
+                    f"skipped:{skip_reason}",
+                    self.params,
+                    fn,
+                )
+            record = {
+                "name": name,
+                "ran": False,
+                "skip_reason": skip_reason,
+                "mem_at_finish": mem_usage,
+            }
+            if self.profiler is not None:
+                record.update(_span_columns(self.profiler.skipped(name, skip_reason)))
+            else:
+                record.update(self._base_counts())
+            self.results.append(record)
             return default
 
-        gc_context = GarbageCollect() if gc else nullcontext()
+        if gc:
+            from infinigen.core.util.blender import GarbageCollect
+
+            gc_context = GarbageCollect()
+        else:
+            gc_context = nullcontext()
 
         seed = self.params.get(f"{name}_seed")
         if seed is None:
             seed = int_hash((self.scene_seed, name))
         logger.debug(f"run_stage({name=}) using {seed=}")
 
+        key, serializer = None, None
+        if self.checkpointer is not None:
+            key = stage_key(
+                self._chain_key,
+                self.scene_seed,
+                name,
+                seed,
+                self.params,
+                fn,
+                args,
+                kwargs,
+            )
+            serializer = stage_serializer(fn)
+            self._chain_key = key
+
         with FixedSeed(seed):
-            with Timer(name), gc_context:
-                ret = fn(*args, **kwargs)
+            # the span closes after garbage collection, so its counts and time include it
+            with Timer(name), self._span(name, seed=seed) as span, gc_context:
+                restored = False
+                if serializer is not None:
+                    restored, ret = self.checkpointer.restore(name, key)
+                if not restored:
+                    if serializer is not None:
+                        state = self.checkpointer.begin(name, key, serializer)
+                    ret = fn(*args, **kwargs)
+                    if serializer is not None:
+                        self.checkpointer.store(name, key, serializer, ret, state)
                 mem_usage = psutil.Process(os.getpid()).memory_info().rss
-                self.results.append(
-                    {
-                        "name": name,
-                        "ran": will_run,
-                        "mem_at_finish": mem_usage,
-                        "obj_count": count_objects(),
-                        "instance_count": count_instance(),
-                    }
-                )
-                return ret
+                record = {
+                    "name": name,
+                    "ran": True,
+                    "skip_reason": None,
+                    "mem_at_finish": mem_usage,
+                }
+                if self.checkpointer is not None:
+                    record.update(restored=restored, checkpoint_key=key)
+                if span is None:
+                    record.update(self._base_counts())
+                self.results.append(record)
+            if span is not None:
+                record.update(_span_columns(span))
+            if key is not None:
+                # nested stages don't run when this one is restored, so continue the chain from here
+                self._chain_key = key
+            return ret
+
+
+def _span_columns(span):
+    return {k: v for k, v in span.items() if k not in ("name", "skip_reason")}
@@ -0,0 +1,198 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+"""
+Structured per-stage profiling for RandomStageExecutor.
+
+Each stage is a span with wall and CPU time, RSS before / after / peak and arbitrary counters
+(e.g. blender object counts) before and after. Spans nest when stages run inside stages, and can
+be exported as Chrome trace events, viewable in chrome://tracing or https://ui.perfetto.dev.
+Peak RSS is tracked by a single background sampler thread, started only when profiling is used.
+"""
+
+
+def current_rss():
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+class RSSSampler:
+    """Background thread tracking the peak RSS seen while each of a stack of spans is open"""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self._peaks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="rss-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        process = psutil.Process(os.getpid())
+        while not self._stop.wait(self.interval):
+            rss = process.memory_info().rss
+            with self._lock:
+                for i, peak in enumerate(self._peaks):
+                    if rss > peak:
+                        self._peaks[i] = rss
+
+    def push(self, rss):
+        with self._lock:
+            self._peaks.append(rss)
+
+    def pop(self, rss):
+        """Peak of the innermost open span, including the final sample rss"""
+        with self._lock:
+            peak = max(self._peaks.pop(), rss)
+            # whatever the inner span saw was also seen by its parents
+            for i, p in enumerate(self._peaks):
+                self._peaks[i] = max(p, peak)
+        return peak
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class StageProfiler:
+    """
+    Records nested spans of stages. counters maps a name to a callable returning a number, each is
+    evaluated before and after every span.
+    """
+
+    def __init__(self, counters=None, sample_interval=0.02):
+        self.counters = counters or {}
+        self.sample_interval = sample_interval
+        self.spans = []
+        self._stack = []
+        self._sampler = None
+        self._t0 = time.perf_counter()
+
+    def _now(self):
+        return time.perf_counter() - self._t0
+
+    def _counts(self):
+        return {k: fn() for k, fn in self.counters.items()}
+
+    @contextmanager
+    def span(self, name, **args):
+        """Context recording one stage; yields the span dict, which is filled in on exit"""
+        if self._sampler is None:
+            self._sampler = RSSSampler(self.sample_interval)
+        rss_before = current_rss()
+        record = dict(
+            name=name,
+            span_id=len(self.spans),
+            parent_id=self._stack[-1]["span_id"] if self._stack else None,
+            depth=len(self._stack),
+            status="running",
+            skip_reason=None,
+            rss_before=rss_before,
+            **{f"{k}_before": v for k, v in self._counts().items()},
+            **args,
+        )
+        self.spans.append(record)
+        self._stack.append(record)
+        self._sampler.push(rss_before)
+        cpu_start = time.process_time()
+        record["start_s"] = self._now()
+        try:
+            yield record
+            record["status"] = "ok"
+        except BaseException:
+            record["status"] = "error"
+            raise
+        finally:
+            record["wall_s"] = self._now() - record["start_s"]
+            record["cpu_s"] = time.process_time() - cpu_start
+            record["rss_after"] = current_rss()
+            record["rss_peak"] = self._sampler.pop(record["rss_after"])
+            record.update(self._counts())
+            self._stack.pop()
+
+    def skipped(self, name, reason, **args):
+        """Record a stage that did not run as an instantaneous span"""
+        rss = current_rss()
+        counts = self._counts()
+        record = dict(
+            name=name,
+            span_id=len(self.spans),
+            parent_id=self._stack[-1]["span_id"] if self._stack else None,
+            depth=len(self._stack),
+            status="skipped",
+            skip_reason=reason,
+            rss_before=rss,
+            **{f"{k}_before": v for k, v in counts.items()},
+            **args,
+            start_s=self._now(),
+            wall_s=0.0,
+            cpu_s=0.0,
+            rss_after=rss,
+            rss_peak=rss,
+            **counts,
+        )
+        self.spans.append(record)
+        return record
+
+    def chrome_trace(self):
+        """Spans as a Chrome trace-event JSON object, timestamps in microseconds"""
+        pid = os.getpid()
+        events = [
+            dict(
+                name="process_name", ph="M", pid=pid, tid=0, args=dict(name="infinigen")
+            )
+        ]
+        for s in self.spans:
+            if "wall_s" not in s:
+                continue  # still running
+            args = {
+                k: v
+                for k, v in s.items()
+                if k not in ("name", "start_s", "wall_s") and v is not None
+            }
+            event = dict(
+                name=s["name"],
+                cat="stage",
+                pid=pid,
+                tid=0,
+                ts=s["start_s"] * 1e6,
+                args=args,
+            )
+            if s["status"] == "skipped":
+                event.update(ph="i", s="t")
+            else:
+                event.update(ph="X", dur=s["wall_s"] * 1e6)
+            events.append(event)
+            if s["status"] != "skipped":
+                events.append(
+                    dict(
+                        name="rss",
+                        ph="C",
+                        pid=pid,
+                        tid=0,
+                        ts=(s["start_s"] + s["wall_s"]) * 1e6,
+                        args=dict(rss_after=s["rss_after"], rss_peak=s["rss_peak"]),
+                    )
+                )
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def close(self):
+        if self._sampler is not None:
+            self._sampler.close()
+            self._sampler = None
@@ -0,0 +1,270 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import logging
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Callable
+
+import numpy as np
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+"""
+Columnar snapshot of the evaluated depsgraph, taken in one walk over its object_instances, for
+exporting.get_all_instances / get_all_non_instances and any other exporter to read from.
+
+Every depsgraph instance becomes one row: object name and type, a key of its evaluated data
+block, is_instance, whether it has a particle system, its instance id (exporting.get_id) and its
+matrix_world, stacked into (N, 4, 4). Geometry of instanced data blocks is extracted once per
+block while walking, since grouping and bounds need it. Other meshes and curves only keep their
+evaluated object and are extracted one at a time as non_instance_items reaches them, so only one
+of them is in memory at once. The grouping of instances by data block and the bounding boxes of
+every row are computed with numpy on these arrays, instance_items / non_instance_items turn them
+into the mesh dicts save_obj_and_instances writes. Nothing here imports bpy, the depsgraph is only walked through duck-typed attributes.
+"""
+
+CORNERS = np.array(list(product((0, 1), repeat=3)))  # calc_aa_bbox's corner order
+
+
+@dataclass
+class SceneSnapshot:
+    names: np.ndarray  # (N,) object names
+    types: np.ndarray  # (N,) object types, MESH, CURVES, ...
+    data_keys: np.ndarray  # (N,) int64 key of the evaluated obj.data, 0 if none
+    is_instance: np.ndarray  # (N,) bool
+    has_particles: np.ndarray  # (N,) bool, object has a PARTICLE_SYSTEM modifier
+    instance_ids: np.ndarray  # (N, 3) int64
+    matrices: np.ndarray  # (N, 4, 4) float32 matrix_world
+    # (N, 2, 3) local obj.bound_box min / max, nan for instances
+    bound_boxes: np.ndarray
+    geometry: dict = field(default_factory=dict)  # instanced data key -> dict of arrays
+    objects: dict = field(default_factory=dict)  # non instance row -> evaluated object
+    extract_geometry: Callable | None = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def instance_rows(self):
+        """Rows get_all_instances exports, grouped by data block"""
+        return (self.types == "MESH") & self.is_instance & ~self.has_particles
+
+    def non_instance_rows(self):
+        mesh = (self.types == "MESH") & ~self.is_instance & ~self.has_particles
+        return mesh | (self.types == "CURVES")
+
+
+def take_snapshot(object_instances, get_id, extract_geometry, data_key=hash):
+    """
+    Walks object_instances once. Only MESH and CURVES rows get an instance id from
+    get_id(deps_instance). Exported instances get their geometry from extract_geometry(obj),
+    called once per data_key(obj.data), exported non instances are extracted lazily by
+    non_instance_items
+    """
+    names, types, data_keys, is_instance = [], [], [], []
+    instance_ids, matrices = [], []
+    bound_boxes, particles, geometry, objects = {}, {}, {}, {}
+    for deps_instance in tqdm(object_instances, desc="Snapshotting depsgraph"):
+        obj = deps_instance.object
+        instance = deps_instance.is_instance
+        row = len(names)
+        names.append(obj.name)
+        types.append(obj.type)
+        is_instance.append(instance)
+        matrices.append(np.asarray(deps_instance.matrix_world, dtype=np.float32))
+        if obj.name not in particles:
+            particles[obj.name] = any(
+                m.type == "PARTICLE_SYSTEM" for m in obj.modifiers
+            )
+
+        if obj.type not in ("MESH", "CURVES"):
+            data_keys.append(0)
+            instance_ids.append((0, 0, 0))
+            continue
+        instance_ids.append(get_id(deps_instance))
+        key = data_key(obj.data)
+        data_keys.append(key)
+        if obj.type == "MESH" and particles[obj.name]:
+            continue
+        if instance:
+            if key not in geometry:
+                geometry[key] = extract_geometry(obj)
+        else:
+            objects[row] = obj
+            bound_boxes[row] = np.asarray(obj.bound_box, dtype=np.float64)
+
+    n = len(names)
+    bounds = np.full((n, 2, 3), np.nan)
+    for row, box in bound_boxes.items():
+        bounds[row] = box.min(axis=0), box.max(axis=0)
+    return SceneSnapshot(
+        names=np.array(names, dtype=object),
+        types=np.array(types, dtype=object),
+        data_keys=np.array(data_keys, dtype=np.int64),
+        is_instance=np.array(is_instance, dtype=bool),
+        has_particles=np.array([particles[name] for name in names], dtype=bool),
+        instance_ids=np.array(instance_ids, dtype=np.int64).reshape(n, 3),
+        matrices=np.array(matrices, dtype=np.float32).reshape(n, 4, 4),
+        bound_boxes=bounds,
+        geometry=geometry,
+        objects=objects,
+        extract_geometry=extract_geometry,
+    )
+
+
+@dataclass
+class RowGroups:
+    """Rows grouped by key: group i holds rows[starts[i]:starts[i + 1]], in row order"""
+
+    keys: np.ndarray
+    rows: np.ndarray
+    starts: np.ndarray
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def sizes(self):
+        return np.diff(np.append(self.starts, len(self.rows)))
+
+    def members(self, i):
+        end = self.starts[i + 1] if i + 1 < len(self) else len(self.rows)
+        return self.rows[self.starts[i] : end]
+
+    def group_of_rows(self):
+        """Group index of every entry of rows"""
+        return np.repeat(np.arange(len(self)), self.sizes)
+
+
+def group_rows(keys, mask):
+    """
+    Groups the rows where mask is set by their key, groups in order of first appearance like a
+    dict filled in row order
+    """
+    rows = np.flatnonzero(mask)
+    uniq, first, inverse = np.unique(keys[rows], return_index=True, return_inverse=True)
+    rank = np.empty(len(uniq), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(uniq))
+    group = rank[inverse.reshape(-1)]
+    order = np.argsort(group, kind="stable")
+    counts = np.bincount(group, minlength=len(uniq))
+    return RowGroups(
+        keys=uniq[np.argsort(rank)],
+        rows=rows[order],
+        starts=np.cumsum(counts) - counts,
+    )
+
+
+def aabb_corners(lo, hi):
+    """(..., 8, 3) corners of the boxes lo / hi (..., 3), ordered like calc_aa_bbox"""
+    return np.stack([lo, hi], axis=-2)[..., CORNERS, np.arange(3)]
+
+
+def local_bounds(vertices):
+    """min / max (2, 3) of vertices, nan if there are none"""
+    if len(vertices) == 0:
+        return np.full((2, 3), np.nan)
+    return np.stack([vertices.min(axis=0), vertices.max(axis=0)]).astype(np.float64)
+
+
+def transformed_bounds(matrices, lo, hi):
+    """
+    Axis aligned (lo, hi) of the boxes lo / hi (n, 3) transformed by matrices (n, 4, 4), with
+    the homogeneous divide of calc_instance_bbox
+    """
+    matrices = np.asarray(matrices, dtype=np.float64)
+    corners = aabb_corners(lo, hi)
+    points = corners @ matrices[:, :3, :3].transpose(0, 2, 1) + matrices[:, None, :3, 3]
+    w = corners @ matrices[:, 3, :3, None] + matrices[:, None, 3, 3:]
+    points /= w
+    return points.min(axis=1), points.max(axis=1)
+
+
+def group_bounds(groups: RowGroups, matrices, lo, hi):
+    """
+    calc_instance_bbox for every group at once: the bounds of all instances of group i, whose
+    local bounds are lo[i] / hi[i]
+    """
+    if len(groups) == 0:
+        return np.empty((0, 3)), np.empty((0, 3))
+    member = groups.group_of_rows()
+    world_lo, world_hi = transformed_bounds(
+        matrices[groups.rows], lo[member], hi[member]
+    )
+    return (
+        np.minimum.reduceat(world_lo, groups.starts),
+        np.maximum.reduceat(world_hi, groups.starts),
+    )
+
+
+def duplicate_ids(groups: RowGroups, instance_ids):
+    """Indices of the groups in which an instance id occurs more than once"""
+    keys = np.column_stack([groups.group_of_rows(), instance_ids[groups.rows]])
+    keys = keys[np.lexsort(keys.T[::-1])]
+    repeated = (keys[1:] == keys[:-1]).all(axis=1)
+    return np.unique(keys[1:][repeated, 0])
+
+
+def instance_items(snapshot: SceneSnapshot):
+    """
+    (num_verts, name) and the mesh dict of every instanced mesh, with the bbox / instance_bbox
+    corners of its saved_mesh.json entry
+    """
+    groups = group_rows(snapshot.data_keys, snapshot.instance_rows())
+    duplicated = duplicate_ids(groups, snapshot.instance_ids)
+    assert len(duplicated) == 0, [
+        snapshot.names[groups.members(i)[0]] for i in duplicated
+    ]
+
+    geometry = [snapshot.geometry[key] for key in groups.keys]
+    bounds = np.array([local_bounds(g["vertex_lookup"]) for g in geometry])
+    bounds = bounds.reshape(-1, 2, 3)
+    combined = aabb_corners(
+        *group_bounds(groups, snapshot.matrices, bounds[:, 0], bounds[:, 1])
+    )
+    single = aabb_corners(bounds[:, 0], bounds[:, 1])
+    for i, geo in enumerate(geometry):
+        rows = groups.members(i)
+        name = snapshot.names[rows[0]]
+        yield (geo["vertex_lookup"].shape[0], name)
+        yield dict(
+            geo,
+            is_instance=True,
+            matrices=snapshot.matrices[rows],
+            instance_ids=snapshot.instance_ids[rows],
+            name=name,
+            bbox=combined[i],
+            instance_bbox=single[i],
+        )
+
+
+def non_instance_items(snapshot: SceneSnapshot):
+    """
+    (num_verts, name) and the mesh dict of every other mesh and curve, with its instance_bbox.
+    Geometry is extracted as each row is reached, consume this lazily to keep one in memory
+    """
+    rows = np.flatnonzero(snapshot.non_instance_rows())
+    bboxes = aabb_corners(
+        *transformed_bounds(
+            snapshot.matrices[rows],
+            snapshot.bound_boxes[rows, 0],
+            snapshot.bound_boxes[rows, 1],
+        )
+    )
+    for row, bbox in zip(rows, bboxes):
+        geo = snapshot.extract_geometry(snapshot.objects[row])
+        name = snapshot.names[row]
+        if snapshot.types[row] == "CURVES":
+            assert not snapshot.is_instance[row]
+            yield (len(geo["vertex_lookup"]) // 5, name)  # //5 bc hair is inexpensive
+        else:
+            yield (len(geo["vertex_lookup"]), name)
+        yield dict(
+            geo,
+            name=name,
+            matrices=snapshot.matrices[row : row + 1],
+            instance_ids=snapshot.instance_ids[row : row + 1],
+            is_instance=False,
+            instance_bbox=bbox,
+        )
@@ -0,0 +1,95 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+
+"""
+Texel-density driven bake resolutions, and packing of small parts into shared texture atlases.
+
+Everything here is pure numpy, export.bake_scene reads the mesh/UV data out of blender and applies the results.
+"""
+
+
+def triangle_areas(verts, tris):
+    """Area of each triangle, verts is (N, 2) or (N, 3) and tris is (M, 3) indices into verts"""
+    a, b, c = (verts[tris[:, i]] for i in range(3))
+    if verts.shape[1] == 2:
+        ab, ac = b - a, c - a
+        return 0.5 * np.abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+    return 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=-1)
+
+
+def resolution_for_texel_density(
+    surface_area, uv_area, texel_density, min_res=32, max_res=4096
+):
+    """
+    Power-of-two texture side length giving roughly `texel_density` texels per meter
+
+    surface_area is in m^2, uv_area is the fraction of the unit UV square covered by UV islands
+    """
+    if surface_area <= 0:
+        return min_res
+    uv_area = np.clip(uv_area, 1e-3, 1)
+    side = math.sqrt(surface_area / uv_area) * texel_density
+    res = 2 ** math.ceil(math.log2(max(side, 1)))
+    return int(np.clip(res, min_res, max_res))
+
+
+@dataclass
+class AtlasTile:
+    page: int
+    x: int
+    y: int
+    size: int
+    atlas_res: int
+
+    @property
+    def name(self):
+        return f"atlas_{self.page}"
+
+
+@dataclass
+class AtlasSlot:
+    """A tile plus the per-bake-type images shared by every slot on the same atlas"""
+
+    tile: AtlasTile
+    padding: int = 0
+    images: dict = field(default_factory=dict)
+
+
+def pack_atlas(sizes, atlas_res):
+    """
+    Shelf-pack square tiles of power-of-two `sizes` into as few atlas_res x atlas_res pages as possible
+
+    Returns one AtlasTile per input size, in input order.
+    """
+    sizes = [int(s) for s in sizes]
+    for s in sizes:
+        if s > atlas_res or s & (s - 1):
+            raise ValueError(
+                f"Tile {s=} must be a power of two no larger than {atlas_res=}"
+            )
+
+    tiles = [None] * len(sizes)
+    page, x, y, shelf_height = 0, 0, 0, 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        s = sizes[i]
+        if x + s > atlas_res:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + s > atlas_res:
+            page, x, y, shelf_height = page + 1, 0, 0, 0
+        tiles[i] = AtlasTile(page=page, x=x, y=y, size=s, atlas_res=atlas_res)
+        x += s
+        shelf_height = max(shelf_height, s)
+    return tiles
+
+
+def remap_uvs(uv, tile: AtlasTile, padding=0):
+    """Map uvs in [0, 1]^2 into the tile's pixel rect, leaving `padding` pixels for bake margins"""
+    padding = min(padding, tile.size // 4)
+    inner = tile.size - 2 * padding
+    offset = np.array([tile.x + padding, tile.y + padding])
+    return (np.clip(uv, 0, 1) * inner + offset) / tile.atlas_res
@@ -0,0 +1,353 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import gin
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+"""
+Content-addressed store for baked texture passes.
+
+Many parts of one asset (all drawers of a cabinet, all knobs of an oven), and often the same part across
+seeds, share identical material graphs and geometry. bake_key() hashes everything a bake depends on, and
+BakeCache keeps one PNG per (key, bake_type) so export.bake_pass can skip the Cycles bake on a hit.
+"""
+
+# (foreach_get field, components per element) for attribute data types we hash
+ATTRIBUTE_FIELDS = {
+    "FLOAT": ("value", 1),
+    "INT": ("value", 1),
+    "INT8": ("value", 1),
+    "BOOLEAN": ("value", 1),
+    "FLOAT_VECTOR": ("vector", 3),
+    "FLOAT2": ("vector", 2),
+    "FLOAT_COLOR": ("color", 4),
+    "BYTE_COLOR": ("color", 4),
+}
+
+# node properties which only affect the UI, never the shading result
+UI_NODE_PROPERTIES = {
+    "name",
+    "label",
+    "location",
+    "width",
+    "width_hidden",
+    "height",
+    "dimensions",
+    "select",
+    "show_options",
+    "show_preview",
+    "show_texture",
+    "hide",
+    "use_custom_color",
+    "color",
+    "parent",
+    "type",
+    "is_active_output",
+}
+HASHED_PROPERTY_TYPES = {"BOOLEAN", "INT", "FLOAT", "STRING", "ENUM"}
+
+
+def _update(h, *values):
+    for v in values:
+        h.update(repr(v).encode())
+        h.update(b"\0")
+
+
+def _socket_value(socket):
+    if not hasattr(socket, "default_value"):
+        return None
+    v = socket.default_value
+    try:
+        return tuple(v)
+    except TypeError:
+        return v
+
+
+def _prop_value(node, prop):
+    v = getattr(node, prop.identifier)
+    if isinstance(v, set):  # enum flags
+        return sorted(v)
+    return tuple(v) if getattr(prop, "is_array", False) else v
+
+
+def hash_node_tree(h, node_tree, visited=None):
+    """Hash the shading-relevant content of node_tree (and any node groups it uses) into h"""
+    if visited is None:
+        visited = {}
+    ptr = node_tree.as_pointer()
+    if ptr in visited:
+        # datablock names differ between seeds, so refer to groups by visit order
+        _update(h, "group_ref", visited[ptr])
+        return
+    visited[ptr] = len(visited)
+
+    for node in sorted(node_tree.nodes, key=lambda n: n.name):
+        _update(h, node.name, node.bl_idname, node.mute)
+        for prop in node.bl_rna.properties:
+            if prop.identifier in UI_NODE_PROPERTIES or prop.identifier.startswith(
+                "bl_"
+            ):
+                continue
+            if prop.type not in HASHED_PROPERTY_TYPES or prop.is_readonly:
+                continue
+            _update(h, prop.identifier, _prop_value(node, prop))
+        for sockets in (node.inputs, node.outputs):
+            for socket in sockets:
+                _update(h, socket.identifier, _socket_value(socket))
+        if getattr(node, "color_ramp", None) is not None:
+            ramp = node.color_ramp
+            _update(h, ramp.interpolation, ramp.color_mode)
+            for el in ramp.elements:
+                _update(h, el.position, tuple(el.color))
+        if getattr(node, "mapping", None) is not None and hasattr(
+            node.mapping, "curves"
+        ):
+            for curve in node.mapping.curves:
+                _update(h, [(tuple(p.location), p.handle_type) for p in curve.points])
+        if getattr(node, "image", None) is not None:
+            _update(h, node.image.name, node.image.filepath)
+        if getattr(node, "node_tree", None) is not None:
+            hash_node_tree(h, node.node_tree, visited)
+
+    for link in sorted(
+        node_tree.links,
+        key=lambda l: (
+            l.to_node.name,
+            l.to_socket.identifier,
+            l.from_node.name,
+            l.from_socket.identifier,
+        ),
+    ):
+        _update(
+            h,
+            link.from_node.name,
+            link.from_socket.identifier,
+            link.to_node.name,
+            link.to_socket.identifier,
+            link.is_muted,
+        )
+
+
+# outputs given in world space, which change when the shaded object moves
+WORLD_SPACE_OUTPUTS = {
+    "ShaderNodeNewGeometry": {
+        "Position",
+        "Normal",
+        "Tangent",
+        "True Normal",
+        "Incoming",
+    },
+    "ShaderNodeTexCoord": {"Camera", "Window", "Reflection"},
+}
+# outputs relative to the scene camera
+CAMERA_SPACE_OUTPUTS = {"ShaderNodeTexCoord": {"Camera", "Window", "Reflection"}}
+CAMERA = "camera"
+
+
+def _linked(node, names):
+    return any(out.is_linked for out in node.outputs if out.name in names)
+
+
+def _node_dependencies(node):
+    """
+    Objects whose transform node's output depends on: None for the object being shaded, CAMERA
+    for the scene camera, or the object a node refers to
+    """
+    deps = []
+    match node.bl_idname:
+        case "ShaderNodeObjectInfo":
+            deps.append(None)
+        case "ShaderNodeCameraData":
+            deps += [None, CAMERA]
+        case "ShaderNodeVectorTransform":
+            if node.convert_from != node.convert_to:
+                deps.append(None)
+            if "CAMERA" in (node.convert_from, node.convert_to):
+                deps.append(CAMERA)
+        case "ShaderNodeAttribute":
+            if node.attribute_type != "GEOMETRY":
+                deps.append(None)
+    if node.bl_idname == "ShaderNodeTexCoord" and node.object is not None:
+        deps.append(node.object)
+    if _linked(node, WORLD_SPACE_OUTPUTS.get(node.bl_idname, ())):
+        deps.append(None)
+    if _linked(node, CAMERA_SPACE_OUTPUTS.get(node.bl_idname, ())):
+        deps.append(CAMERA)
+    return deps
+
+
+def _object_dependencies(node_tree, visited=None):
+    """Objects referenced by node_tree, see _node_dependencies"""
+    if visited is None:
+        visited = set()
+    if node_tree.as_pointer() in visited:
+        return []
+    visited.add(node_tree.as_pointer())
+    deps = []
+    for node in node_tree.nodes:
+        deps += _node_dependencies(node)
+        if getattr(node, "node_tree", None) is not None:
+            deps += _object_dependencies(node.node_tree, visited)
+    return deps
+
+
+def _foreach_array(collection, field, dims, dtype):
+    arr = np.empty(len(collection) * dims, dtype=dtype)
+    collection.foreach_get(field, arr)
+    return arr
+
+
+def hash_mesh(h, mesh):
+    """Hash vertex positions, topology, UVs and every numeric attribute of mesh into h"""
+    _update(h, len(mesh.vertices), len(mesh.polygons), len(mesh.loops))
+    h.update(_foreach_array(mesh.vertices, "co", 3, np.float32).tobytes())
+    h.update(_foreach_array(mesh.loops, "vertex_index", 1, np.int32).tobytes())
+    h.update(_foreach_array(mesh.polygons, "loop_total", 1, np.int32).tobytes())
+    h.update(_foreach_array(mesh.polygons, "material_index", 1, np.int32).tobytes())
+    for uv_layer in sorted(mesh.uv_layers, key=lambda l: l.name):
+        _update(h, "uv", uv_layer.name, uv_layer.active_render)
+        h.update(_foreach_array(uv_layer.data, "uv", 2, np.float32).tobytes())
+    for attr in sorted(mesh.attributes, key=lambda a: a.name):
+        if attr.data_type not in ATTRIBUTE_FIELDS or attr.name.startswith("."):
+            continue
+        field, dims = ATTRIBUTE_FIELDS[attr.data_type]
+        dtype = (
+            np.float32 if field != "value" or attr.data_type == "FLOAT" else np.int32
+        )
+        if attr.data_type == "BOOLEAN":
+            dtype = bool
+        _update(h, "attr", attr.name, attr.domain, attr.data_type)
+        h.update(_foreach_array(attr.data, field, dims, dtype).tobytes())
+
+
+def bake_key(obj, img_size, export_usd, scene):
+    """
+    Hash of everything that affects the baked passes of obj: materials, mesh, UVs, resolution and
+    scene's bake settings
+    """
+    h = hashlib.sha256()
+    _update(h, "bake_key_v2", img_size, export_usd)
+    bake = scene.render.bake
+    _update(h, bake.margin, bake.margin_type, scene.cycles.samples)
+
+    visited = {}
+    deps = []
+    for slot in obj.material_slots:
+        mat = slot.material
+        if mat is None:
+            _update(h, "empty_slot")
+            continue
+        _update(h, "material", mat.use_nodes)
+        if mat.use_nodes:
+            hash_node_tree(h, mat.node_tree, visited)
+            deps += _object_dependencies(mat.node_tree)
+
+    hash_mesh(h, obj.data)
+
+    # ObjectInfo.Random, world space positions and normals, texture coordinates relative to
+    # another object or the camera etc differ per object
+    for dep in dict.fromkeys(deps):
+        dep = {None: obj, CAMERA: scene.camera}.get(dep, dep)
+        if dep is None:
+            _update(h, "no_camera")
+            continue
+        _update(h, "object", dep.name, [tuple(r) for r in dep.matrix_world])
+
+    return h.hexdigest()
+
+
+@gin.configurable
+class BakeCache:
+    """
+    Directory of baked passes, stored as <root>/<key[:2]>/<key>/<bake_type>.png
+
+    Entries are evicted least-recently-used (by directory mtime, refreshed on every hit)
+    once the store grows beyond max_bytes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = 20 * 2**30):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._approx_bytes = None  # scanned lazily, then tracked incrementally
+
+    def entry_folder(self, key):
+        return self.root / key[:2] / key
+
+    def lookup(self, key, bake_type):
+        path = self.entry_folder(key) / f"{bake_type}.png"
+        if not path.exists():
+            self.misses += 1
+            return None
+        os.utime(path.parent)
+        self.hits += 1
+        logger.debug(f"Bake cache hit for {bake_type} {key=}")
+        return path
+
+    def store(self, key, bake_type, write_fn):
+        """Call write_fn(tmp_path) to produce the PNG, then atomically move it into the store"""
+        folder = self.entry_folder(key)
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"{bake_type}.png"
+        tmp_path = folder / f".{bake_type}.{os.getpid()}.tmp.png"
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        os.utime(folder)
+
+        if self._approx_bytes is None:
+            self._approx_bytes = self.size_bytes()
+        else:
+            self._approx_bytes += path.stat().st_size
+        if self._approx_bytes > self.max_bytes:
+            self._approx_bytes = self.evict()
+        return path
+
+    def entries(self):
+        for prefix in self.root.iterdir():
+            if not prefix.is_dir():
+                continue
+            for folder in prefix.iterdir():
+                size = sum(f.stat().st_size for f in folder.iterdir())
+                yield folder, folder.stat().st_mtime, size
+
+    def size_bytes(self):
+        return sum(size for _, _, size in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for folder, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            logger.info(f"Evicting bake cache entry {folder.name} ({size} bytes)")
+            shutil.rmtree(folder, ignore_errors=True)
+            total -= size
+        return total
+
+
+_bake_cache = None
+
+
+@gin.configurable
+def get_bake_cache(root=None):
+    """The BakeCache configured via gin (`get_bake_cache.root`), or None if caching is disabled"""
+    global _bake_cache
+    if root is None:
+        return None
+    if _bake_cache is None or _bake_cache.root != Path(root):
+        _bake_cache = BakeCache(root)
+    return _bake_cache
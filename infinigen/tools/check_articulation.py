@@ -0,0 +1,256 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+import json
+import logging
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import trimesh
+from scipy.ndimage import distance_transform_edt
+from tqdm import tqdm
+
+try:
+    import urdfpy
+except ImportError:
+    urdfpy = None
+
+logger = logging.getLogger(__name__)
+
+"""
+Headless QA of generated articulated assets.
+
+Each actuated joint is swept across its range with every other joint at rest, all samples at once
+via URDF.link_fk_batch. Every pair of links whose relative pose changes during the sweep is then
+tested for interpenetration by looking up one link's surface samples in the other's voxel SDF,
+including a door or drawer against the body it is attached to.
+
+Usage: python -m infinigen.tools.check_articulation <folder> [--n_workers N]
+Output:
+- <folder>/articulation_report.json # per-URDF invalid joint limits and colliding joint intervals
+"""
+
+CONTINUOUS_RANGE = (-np.pi, np.pi)
+
+
+class LinkSDF:
+    """Inside-depth of a mesh sampled on a voxel grid, in the mesh's own frame"""
+
+    def __init__(self, mesh: trimesh.Trimesh, resolution=64):
+        pitch = max(mesh.extents.max() / resolution, 1e-4)
+        voxels = mesh.voxelized(pitch)
+        try:
+            voxels = voxels.fill()
+        except Exception:
+            pass  # open meshes keep a surface shell
+        occupied = np.pad(voxels.matrix, 1)
+        # boundary voxels get depth 0, so merely touching surfaces don't count as penetrating
+        self.depth = np.maximum(distance_transform_edt(occupied) - 1, 0) * pitch
+        self.pitch = pitch
+        # voxels.transform maps voxel indices to the centers of those voxels
+        self.origin = voxels.transform[:3, 3] - pitch * 1.5
+
+    def query(self, points):
+        """Depth inside the mesh for each of (..., 3) points, 0 outside"""
+        idx = np.floor((points - self.origin) / self.pitch).astype(np.int64)
+        shape = np.array(self.depth.shape)
+        valid = np.all((idx >= 0) & (idx < shape), axis=-1)
+        idx = np.where(valid[..., None], idx, 0)
+        depth = self.depth[idx[..., 0], idx[..., 1], idx[..., 2]]
+        return np.where(valid, depth, 0)
+
+
+def sample_points(mesh: trimesh.Trimesh, count=512, seed=0):
+    points, _ = trimesh.sample.sample_surface(mesh, count, seed=seed)
+    return np.concatenate([points, mesh.vertices[:count]])
+
+
+def transform_points(poses, points):
+    """Apply (n, 4, 4) poses to (p, 3) points, giving (n, p, 3)"""
+    return np.einsum("nij,pj->npi", poses[:, :3, :3], points) + poses[:, None, :3, 3]
+
+
+def penetration_depth(sdf_a, points_a, sdf_b, points_b, poses_a, poses_b):
+    """Deepest penetration between links a and b for each of n pose pairs"""
+    rel = np.linalg.inv(poses_a) @ poses_b
+    b_in_a = sdf_a.query(transform_points(rel, points_b)).max(axis=-1)
+    a_in_b = sdf_b.query(transform_points(np.linalg.inv(rel), points_a)).max(axis=-1)
+    return np.maximum(b_in_a, a_in_b)
+
+
+def collision_intervals(values, colliding):
+    """Contiguous runs of True in `colliding`, as [(first_value, last_value), ...]"""
+    colliding = np.asarray(colliding, dtype=bool)
+    if not colliding.any():
+        return []
+    edges = np.diff(np.r_[False, colliding, False].astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1) - 1
+    return [(float(values[s]), float(values[e])) for s, e in zip(starts, stops)]
+
+
+def sweep_configurations(rest, joint_index, lower, upper, n_samples):
+    values = np.linspace(lower, upper, n_samples)
+    cfgs = np.tile(rest, (n_samples, 1))
+    cfgs[:, joint_index] = values
+    return values, cfgs
+
+
+def joint_range(joint):
+    if joint.joint_type == "continuous":
+        return CONTINUOUS_RANGE
+    if joint.limit is None:
+        return None
+    return joint.limit.lower, joint.limit.upper
+
+
+def link_mesh(link, use_collision=False):
+    """
+    Visual geometry of link. Collision meshes are convex decompositions of concave parts (a door
+    in its frame, a drawer in its carcass), which overlap at rest, so they are only used on request
+    """
+    if use_collision and link.collision_mesh is not None:
+        return link.collision_mesh
+    meshes = []
+    for visual in link.visuals:
+        for m in visual.geometry.meshes:
+            m = m.copy()
+            m.apply_transform(visual.origin)
+            meshes.append(m)
+    if not meshes:
+        return None
+    return trimesh.util.concatenate(meshes)
+
+
+def check_urdf(
+    urdf_path,
+    n_samples=64,
+    tolerance=0.005,
+    n_points=512,
+    sdf_resolution=64,
+    use_collision=False,
+):
+    """
+    Sweep every actuated joint of one URDF and report self-collisions and invalid limits
+
+    Hinges and sliders are usually modelled with touching geometry, which stays within tolerance.
+    Pairs which interpenetrate by more than tolerance at rest are reported as rest_collisions, and
+    during the sweep only count as colliding where they go deeper than at rest.
+    """
+    if urdfpy is None:
+        raise ImportError("check_articulation requires the `urdfpy` package")
+    robot = urdfpy.URDF.load(str(urdf_path))
+
+    meshes = {}
+    for link in robot.links:
+        mesh = link_mesh(link, use_collision)
+        if mesh is not None and len(mesh.faces) > 0:
+            meshes[link.name] = mesh
+    sdfs = {k: LinkSDF(m, sdf_resolution) for k, m in meshes.items()}
+    points = {k: sample_points(m, n_points) for k, m in meshes.items()}
+    names = sorted(meshes)
+    pairs = [(a, b) for i, a in enumerate(names) for b in names[i + 1 :]]
+
+    joints = robot.actuated_joints
+    invalid_limits = []
+    rest = np.zeros(len(joints))
+    for i, joint in enumerate(joints):
+        r = joint_range(joint)
+        if r is None or not np.all(np.isfinite(r)) or r[0] >= r[1]:
+            invalid_limits.append(joint.name)
+            continue
+        rest[i] = np.clip(0, *r)
+
+    rest_fk = robot.link_fk_batch(rest[None], links=names, use_names=True)
+    rest_depth = {}
+    for a, b in pairs:
+        depth = penetration_depth(
+            sdfs[a], points[a], sdfs[b], points[b], rest_fk[a], rest_fk[b]
+        )
+        rest_depth[a, b] = float(depth[0])
+    rest_colliding = {pair for pair, d in rest_depth.items() if d > tolerance}
+
+    collisions = {}
+    for i, joint in enumerate(joints):
+        if joint.name in invalid_limits:
+            continue
+        values, cfgs = sweep_configurations(rest, i, *joint_range(joint), n_samples)
+        fk = robot.link_fk_batch(cfgs, links=names, use_names=True)
+        for a, b in pairs:
+            rel = np.linalg.inv(fk[a]) @ fk[b]
+            if np.abs(rel - rel[:1]).max() < 1e-9:
+                continue  # this joint does not move a relative to b
+            depth = penetration_depth(
+                sdfs[a], points[a], sdfs[b], points[b], fk[a], fk[b]
+            )
+            threshold = tolerance
+            if (a, b) in rest_colliding:
+                threshold += rest_depth[a, b]
+            intervals = collision_intervals(values, depth > threshold)
+            if intervals:
+                collisions.setdefault(joint.name, []).append(
+                    dict(
+                        links=[a, b], intervals=intervals, max_depth=float(depth.max())
+                    )
+                )
+
+    return dict(
+        urdf=str(urdf_path),
+        valid=not invalid_limits and not rest_colliding and not collisions,
+        invalid_limits=invalid_limits,
+        rest_collisions=sorted([list(p) for p in rest_colliding]),
+        collisions=collisions,
+    )
+
+
+def _check_or_error(urdf_path, **kwargs):
+    try:
+        return check_urdf(urdf_path, **kwargs)
+    except Exception as e:
+        logger.warning(f"Failed to check {urdf_path}: {e!r}")
+        return dict(urdf=str(urdf_path), valid=False, error=repr(e))
+
+
+def check_folder(folder, n_workers=1, **kwargs):
+    urdfs = sorted(Path(folder).glob("**/*.urdf"))
+    func = partial(_check_or_error, **kwargs)
+    if n_workers == 1:
+        return [func(p) for p in tqdm(urdfs)]
+    with Pool(n_workers) as p:
+        return list(tqdm(p.imap(func, urdfs), total=len(urdfs)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--n_workers", type=int, default=1)
+    parser.add_argument("--n_samples", type=int, default=64)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.005,
+        help="Penetration depth in meters below which contact is ignored",
+    )
+    parser.add_argument(
+        "--use_collision",
+        action="store_true",
+        help="Check the links' collision meshes instead of their visual meshes",
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    reports = check_folder(
+        args.folder,
+        n_workers=args.n_workers,
+        n_samples=args.n_samples,
+        tolerance=args.tolerance,
+        use_collision=args.use_collision,
+    )
+    output = args.output or args.folder / "articulation_report.json"
+    with output.open("w") as f:
+        json.dump(reports, f, indent=2)
+    n_invalid = sum(not r["valid"] for r in reports)
+    print(f"{n_invalid}/{len(reports)} assets failed, report written to {output}")
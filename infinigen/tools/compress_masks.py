@@ -4,45 +4,241 @@
 # Authors: Lahav Lipson
 
 import argparse
+import os
+import zlib
+from functools import partial
+from multiprocessing import Pool
 from pathlib import Path
 
 import numpy as np
+from tqdm import tqdm
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+Masks are stored as a palette of unique values plus an index array into that palette.
+
+The chunked format additionally splits the index array into bands of `chunk_rows` rows, each
+compressed independently (deflate, or zstd if `zstandard` is installed). Each band is a separate
+member of the .npz, so `recover_rows` / `load_rows` only decode the bands they need.
+"""
+
+CHUNK_ROWS = 64
+CODECS = ("deflate", "zstd", "none")
 
 
 def show(x):
     return f"({x.shape} {x.dtype} {x.max()})"
 
 
-def compress(arr):
-    H, W, *_ = arr.shape
-    vals, indices = np.unique(
-        np.squeeze(arr.reshape((H * W, -1))), return_inverse=True, axis=0
-    )
-    max_ind = vals.shape[0] - 1
+def unique_rows(arr):
+    """
+    Equivalent to np.unique(arr, axis=0, return_inverse=True) for 2D integer arrays.
+
+    When the value range of all columns fits in an int64 the rows are packed into
+    a single integer key, which is much faster than np.unique's row-wise sort.
+    """
+    arr = np.asarray(arr)
+    if arr.ndim == 1:
+        arr = arr[:, None]
+    assert arr.ndim == 2 and np.issubdtype(arr.dtype, np.integer), arr.dtype
+
+    if arr.shape[0] == 0:
+        return arr.copy(), np.zeros(0, dtype=np.int64)
+
+    mins = arr.min(axis=0)
+    # in float, the span of a column can exceed the range of its own dtype
+    spans = arr.max(axis=0).astype(np.float64) - mins.astype(np.float64) + 1
+    if (
+        not np.isfinite(spans).all()
+        or (spans <= 0).any()
+        or np.sum(np.log2(spans)) >= 62
+    ):
+        uniq, inverse = np.unique(arr, axis=0, return_inverse=True)
+        return uniq, inverse.reshape(-1)
+
+    key = np.zeros(arr.shape[0], dtype=np.int64)
+    for col, lo, span in zip(arr.T, mins, spans.astype(np.int64)):
+        key *= span
+        if np.issubdtype(col.dtype, np.unsignedinteger):
+            key += (col - lo).astype(np.int64)  # col >= lo, can't wrap
+        else:
+            # subtracting in e.g. int32 would wrap for spans over 2**31
+            key += col.astype(np.int64) - np.int64(lo)
+    uniq_keys, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return arr[first], inverse.reshape(-1)
+
+
+def _index_dtype(max_ind):
     if max_ind < 2**8:
-        indices = indices.astype(np.uint8)
+        return np.uint8
     elif max_ind < 2**16:
-        indices = indices.astype(np.uint16)
+        return np.uint16
     else:
-        indices = indices.astype(np.uint32)
+        return np.uint32
+
+
+def _palette(arr):
+    H, W, *_ = arr.shape
+    vals, indices = unique_rows(arr.reshape((H * W, -1)))
+    if arr.ndim == 2:
+        vals = vals[:, 0]
+    return vals, indices.astype(_index_dtype(vals.shape[0] - 1))
+
+
+def compress(arr):
+    vals, indices = _palette(arr)
     return dict(vals=vals, indices=indices, shape=np.asarray(arr.shape))
 
 
+def _encode(buf, codec, level):
+    match codec:
+        case "deflate":
+            return zlib.compress(buf, level)
+        case "zstd":
+            if zstandard is None:
+                raise ImportError(
+                    "codec='zstd' requires the `zstandard` package, use codec='deflate' or `pip install zstandard`"
+                )
+            return zstandard.ZstdCompressor(level=level).compress(buf)
+        case "none":
+            return buf
+        case _:
+            raise ValueError(f"Unrecognized {codec=}, expected one of {CODECS}")
+
+
+def _decode(buf, codec):
+    match codec:
+        case "deflate":
+            return zlib.decompress(buf)
+        case "zstd":
+            if zstandard is None:
+                raise ImportError("Reading zstd masks requires the `zstandard` package")
+            return zstandard.ZstdDecompressor().decompress(buf)
+        case "none":
+            return buf
+        case _:
+            raise ValueError(f"Unrecognized {codec=}")
+
+
+def compress_chunked(arr, chunk_rows=CHUNK_ROWS, codec="deflate", level=6):
+    """Palette-index `arr` and compress its indices in independent bands of `chunk_rows` rows"""
+    H, W, *_ = arr.shape
+    vals, indices = _palette(arr)
+    indices = indices.reshape((H, W))
+    d = dict(
+        vals=vals,
+        shape=np.asarray(arr.shape),
+        chunk_rows=np.asarray(chunk_rows),
+        codec=np.asarray(codec),
+        index_dtype=np.asarray(indices.dtype.str),
+    )
+    for i, start in enumerate(range(0, H, chunk_rows)):
+        band = np.ascontiguousarray(indices[start : start + chunk_rows])
+        d[f"chunk_{i:05d}"] = np.frombuffer(
+            _encode(band.tobytes(), codec, level), dtype=np.uint8
+        )
+    return d
+
+
+def is_chunked(d):
+    return "chunk_rows" in d
+
+
+def recover_rows(d, start, stop):
+    """Decode rows [start, stop) of a chunked mask, touching only the bands that overlap them"""
+    shape = tuple(d["shape"])
+    H, W = shape[:2]
+    start, stop, _ = slice(start, stop).indices(H)
+    stop = max(start, stop)
+    chunk_rows = int(d["chunk_rows"])
+    codec = str(d["codec"])
+    index_dtype = np.dtype(str(d["index_dtype"]))
+
+    first, last = start // chunk_rows, (stop - 1) // chunk_rows
+    bands = [
+        np.frombuffer(_decode(d[f"chunk_{i:05d}"].tobytes(), codec), dtype=index_dtype)
+        for i in range(first, last + 1)
+        if stop > start
+    ]
+    indices = np.concatenate(bands) if bands else np.zeros(0, dtype=index_dtype)
+    offset = first * chunk_rows
+    indices = indices.reshape((-1, W))[start - offset : stop - offset]
+    return d["vals"][indices].reshape((stop - start,) + shape[1:])
+
+
 def recover(d):
+    if is_chunked(d):
+        return recover_rows(d, 0, int(d["shape"][0]))
     return d["vals"][d["indices"]].reshape(d["shape"])
 
 
+def load_rows(path, start, stop):
+    """Random-access read of rows [start, stop) from a mask .npz without decoding the rest"""
+    with np.load(path) as d:
+        if is_chunked(d):
+            return recover_rows(d, start, stop)
+        return recover(d)[start:stop]
+
+
+def compress_file(file_path, chunked=True, **kwargs):
+    arr = np.load(file_path)
+    if not (np.issubdtype(arr.dtype, np.integer) and (arr.size > 1000)):
+        return None
+
+    d = compress_chunked(arr, **kwargs) if chunked else compress(arr)
+    if not np.array_equal(recover(d), arr):
+        raise ValueError(f"Compression roundtrip failed for {file_path}, {show(arr)}")
+
+    output_path = file_path.with_suffix(".npz")
+    tmp_path = output_path.with_name(f".{output_path.stem}.tmp.npz")
+    np.savez(tmp_path, **d)
+    os.replace(tmp_path, output_path)
+    file_path.unlink()
+    return output_path
+
+
+def compress_folder(folder, recursive=False, n_workers=1, **kwargs):
+    files = sorted(folder.glob("**/*.npy" if recursive else "*.npy"))
+    func = partial(compress_file, **kwargs)
+    if n_workers == 1:
+        results = [func(f) for f in files]
+    else:
+        with Pool(n_workers) as p:
+            results = list(tqdm(p.imap(func, files), total=len(files)))
+    return [(f, r) for f, r in zip(files, results) if r is not None]
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("target_frames_dir", type=Path)
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--n_workers", type=int, default=1)
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="Write the unchunked vals/indices/shape format",
+    )
+    parser.add_argument("--codec", type=str, default="deflate", choices=CODECS)
+    parser.add_argument("--level", type=int, default=6)
+    parser.add_argument("--chunk_rows", type=int, default=CHUNK_ROWS)
     args = parser.parse_args()
     assert args.target_frames_dir.exists()
-    assert args.target_frames_dir.name.startswith("frames_")
-    for file_path in args.target_frames_dir.glob("*.npy"):
-        arr = np.load(file_path)
-        if np.issubdtype(arr.dtype, np.integer) and (arr.size > 1000):
-            d = compress(arr)
-            assert show(arr) == show(recover(d))
-            np.savez(file_path.with_suffix(".npz"), **d)
-            print(f"{file_path} -> {file_path.with_suffix('.npz')}")
-            file_path.unlink()
+    if not args.recursive:
+        assert args.target_frames_dir.name.startswith("frames_")
+
+    kwargs = {}
+    if not args.legacy:
+        kwargs = dict(codec=args.codec, level=args.level, chunk_rows=args.chunk_rows)
+    written = compress_folder(
+        args.target_frames_dir,
+        recursive=args.recursive,
+        n_workers=args.n_workers,
+        chunked=not args.legacy,
+        **kwargs,
+    )
+    for file_path, output_path in written:
+        print(f"{file_path} -> {output_path}")
@@ -4,104 +4,189 @@
 # Authors: Zeyu Ma
 
 import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
 from pathlib import Path
 
 import cv2
 import numpy as np
-from scipy.interpolate import RegularGridInterpolator
-from suffixes import get_suffix, parse_suffix
 
+from infinigen.tools.suffixes import get_suffix, parse_suffix
 
-def get_mask(depth, flow, dst_depth):
-    H, W = depth.shape
-    x, y = np.meshgrid(np.arange(W), np.arange(H), indexing="xy")
-    target = np.stack((y, x, depth), -1)
-    target[:, :, 0] += flow[:, :, 1] * 2
-    target[:, :, 1] += flow[:, :, 0] * 2
-    target[:, :, 2] += flow[:, :, 2]
-
-    interpolator = RegularGridInterpolator(
-        (np.arange(H), np.arange(W)),
-        dst_depth,
-        method="linear",
-        bounds_error=False,
-        fill_value=0,
-    )
+logger = logging.getLogger(__name__)
 
-    mask = np.zeros((H, W), dtype=bool)
-    interpolated_values = interpolator(target[:, :, :2].reshape((-1, 2)))
-    mask |= (target[:, :, 2] >= 0) & (
-        target[:, :, 2] <= interpolated_values.reshape((H, W))
-    )
-    target[:, :, 0] += 1
-    interpolated_values = interpolator(target[:, :, :2].reshape((-1, 2)))
-    mask |= (target[:, :, 2] >= 0) & (
-        target[:, :, 2] <= interpolated_values.reshape((H, W))
-    )
-    target[:, :, 0] -= 2
-    interpolated_values = interpolator(target[:, :, :2].reshape((-1, 2)))
-    mask |= (target[:, :, 2] >= 0) & (
-        target[:, :, 2] <= interpolated_values.reshape((H, W))
-    )
-    target[:, :, 0] += 1
+# (row, col) offsets of the destination depth samples an occluded point is tested against
+NEIGHBOR_OFFSETS = [(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)]
 
-    target[:, :, 1] += 1
-    interpolated_values = interpolator(target[:, :, :2].reshape((-1, 2)))
-    mask |= (target[:, :, 2] >= 0) & (
-        target[:, :, 2] <= interpolated_values.reshape((H, W))
-    )
-    target[:, :, 1] -= 2
-    interpolated_values = interpolator(target[:, :, :2].reshape((-1, 2)))
-    mask |= (target[:, :, 2] >= 0) & (
-        target[:, :, 2] <= interpolated_values.reshape((H, W))
+
+def interpolate_depth(dst_depth, ys, xs):
+    """
+    Bilinearly sample dst_depth (B, H, W) at float coords ys, xs (B, H, W)
+
+    Matches scipy's RegularGridInterpolator(method="linear", bounds_error=False, fill_value=0)
+    """
+    B, H, W = dst_depth.shape
+    inside = (ys >= 0) & (ys <= H - 1) & (xs >= 0) & (xs <= W - 1)
+    y0 = np.clip(np.floor(np.nan_to_num(ys)), 0, max(H - 2, 0)).astype(np.int64)
+    x0 = np.clip(np.floor(np.nan_to_num(xs)), 0, max(W - 2, 0)).astype(np.int64)
+    y1 = np.minimum(y0 + 1, H - 1)
+    x1 = np.minimum(x0 + 1, W - 1)
+    fy = ys - y0
+    fx = xs - x0
+
+    b = np.arange(B)[:, None, None]
+    values = (
+        dst_depth[b, y0, x0] * (1 - fy) * (1 - fx)
+        + dst_depth[b, y1, x0] * fy * (1 - fx)
+        + dst_depth[b, y0, x1] * (1 - fy) * fx
+        + dst_depth[b, y1, x1] * fy * fx
     )
+    nan_coords = np.isnan(ys) | np.isnan(xs)
+    return np.where(inside, values, np.where(nan_coords, np.nan, 0))
+
+
+def get_masks(depth, flow, dst_depth):
+    """Occlusion masks for a batch of frames, depth/dst_depth are (B, H, W) and flow is (B, H, W, 3)"""
+    B, H, W = depth.shape
+    x, y = np.meshgrid(np.arange(W), np.arange(H), indexing="xy")
+    target_y = y + flow[..., 1] * 2
+    target_x = x + flow[..., 0] * 2
+    target_z = depth + flow[..., 2]
 
+    mask = np.zeros((B, H, W), dtype=bool)
+    for dy, dx in NEIGHBOR_OFFSETS:
+        interpolated_values = interpolate_depth(dst_depth, target_y + dy, target_x + dx)
+        mask |= (target_z >= 0) & (target_z <= interpolated_values)
     return mask
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("target_frames_dir", type=Path)
-    parser.add_argument("point_traj_source_frame", type=int)
-    args = parser.parse_args()
-    assert args.target_frames_dir.exists()
-    assert args.target_frames_dir.name.startswith("frames_")
+def get_mask(depth, flow, dst_depth):
+    return get_masks(depth[None], flow[None], dst_depth[None])[0]
 
-    for file_path in args.target_frames_dir.glob("*.npy"):
-        info = parse_suffix(file_path.name)
+
+def find_jobs(frames_dir, point_traj_source_frame):
+    """List (data_type, flow_path, depth_path, dst_depth_path) for each flow file in frames_dir"""
+    jobs = []
+    for file_path in sorted(frames_dir.glob("*.npy")):
         data_type = file_path.name.split("_")[0]
-        if not file_path.name.endswith(".npy"):
+        if data_type not in ("Flow3D", "PointTraj3D"):
+            continue
+        try:
+            info = parse_suffix(file_path.name)
+        except ValueError:
+            info = None
+        if info is None:
+            logger.warning(f"Skipping {file_path}, its name has no frame suffix")
             continue
+        depth_info = dict(info)
         if data_type == "Flow3D":
-            depth_info = dict(info)
-            depth = np.load(
-                file_path.parent / ("Depth" + get_suffix(depth_info) + ".npy")
-            )
+            depth_path = file_path.parent / ("Depth" + get_suffix(depth_info) + ".npy")
             depth_info["frame"] += 1
-            dst_depth = np.load(
-                file_path.parent / ("Depth" + get_suffix(depth_info) + ".npy")
-            )
-        elif data_type == "PointTraj3D":
-            depth_info = dict(info)
-            depth_info["frame"] = args.point_traj_source_frame
-            depth = np.load(
-                file_path.parent / ("Depth" + get_suffix(depth_info) + ".npy")
+            dst_depth_path = file_path.parent / (
+                "Depth" + get_suffix(depth_info) + ".npy"
             )
+        else:
+            depth_info["frame"] = point_traj_source_frame
+            depth_path = file_path.parent / ("Depth" + get_suffix(depth_info) + ".npy")
             depth_info["frame"] = info["frame"]
-            dst_depth = np.load(
-                file_path.parent / ("Depth" + get_suffix(depth_info) + ".npy")
+            dst_depth_path = file_path.parent / (
+                "Depth" + get_suffix(depth_info) + ".npy"
             )
-        else:
-            continue
-        mask = get_mask(depth, np.load(file_path), dst_depth)
-        np.save(
-            file_path.parent / (data_type + "Mask" + file_path.name[len(data_type) :]),
-            mask,
-        )
-        cv2.imwrite(
-            str(
-                file_path.parent
-                / (data_type + "Mask" + file_path.name[len(data_type) : -4] + ".png")
-            ),
-            mask.astype(np.uint8) * 255,
-        )
+        jobs.append((data_type, file_path, depth_path, dst_depth_path))
+    return jobs
+
+
+def _load_batch(jobs):
+    return [(job, np.load(job[2]), np.load(job[1]), np.load(job[3])) for job in jobs]
+
+
+def iter_loaded_batches(jobs, batch_size):
+    """Yield loaded batches of jobs, reading the next batch from disk while the current one is processed"""
+    chunks = [jobs[i : i + batch_size] for i in range(0, len(jobs), batch_size)]
+    if len(chunks) == 0:
+        return
+    with ThreadPoolExecutor(max_workers=1) as io:
+        future = io.submit(_load_batch, chunks[0])
+        for i in range(len(chunks)):
+            batch = future.result()
+            if i + 1 < len(chunks):
+                future = io.submit(_load_batch, chunks[i + 1])
+            yield batch
+
+
+def save_mask(data_type, file_path, mask):
+    np.save(
+        file_path.parent / (data_type + "Mask" + file_path.name[len(data_type) :]),
+        mask,
+    )
+    cv2.imwrite(
+        str(
+            file_path.parent
+            / (data_type + "Mask" + file_path.name[len(data_type) : -4] + ".png")
+        ),
+        mask.astype(np.uint8) * 255,
+    )
+
+
+def process_jobs(jobs, batch_size=4):
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        writes = []
+        for batch in iter_loaded_batches(jobs, batch_size):
+            by_shape = {}
+            for item in batch:
+                by_shape.setdefault(item[1].shape, []).append(item)
+            for items in by_shape.values():
+                masks = get_masks(
+                    np.stack([it[1] for it in items]),
+                    np.stack([it[2] for it in items]),
+                    np.stack([it[3] for it in items]),
+                )
+                for (job, *_), mask in zip(items, masks):
+                    writes.append(writer.submit(save_mask, job[0], job[1], mask))
+        for w in writes:
+            w.result()
+    return len(jobs)
+
+
+def shard_jobs(frames_dirs, point_traj_source_frame, n_shards):
+    """Split each frames dir's jobs into contiguous shards, so no shard spans two scenes"""
+    per_dir = [find_jobs(d, point_traj_source_frame) for d in frames_dirs]
+    per_dir = [jobs for jobs in per_dir if len(jobs)]
+    splits = max(1, -(-n_shards // max(len(per_dir), 1)))
+    shards = []
+    for jobs in per_dir:
+        size = -(-len(jobs) // splits)
+        shards += [jobs[i : i + size] for i in range(0, len(jobs), size)]
+    return shards
+
+
+def compute_occlusion_masks(
+    frames_dirs, point_traj_source_frame, n_workers=1, batch_size=4
+):
+    shards = shard_jobs(frames_dirs, point_traj_source_frame, n_workers)
+    func = partial(process_jobs, batch_size=batch_size)
+    if n_workers == 1:
+        return sum(func(s) for s in shards)
+    with Pool(n_workers) as p:
+        return sum(p.map(func, shards))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target_frames_dir", type=Path, nargs="+")
+    parser.add_argument("point_traj_source_frame", type=int)
+    parser.add_argument("--n_workers", type=int, default=1)
+    parser.add_argument("--batch_size", type=int, default=4)
+    args = parser.parse_args()
+    for frames_dir in args.target_frames_dir:
+        assert frames_dir.exists()
+        assert frames_dir.name.startswith("frames_")
+
+    compute_occlusion_masks(
+        args.target_frames_dir,
+        args.point_traj_source_frame,
+        n_workers=args.n_workers,
+        batch_size=args.batch_size,
+    )
@@ -186,6 +186,7 @@ def resize_inplace(img_path, target_shape, interp_method, npz_prefix="NPZ_"):
     using_npz_compression = interp_method.startswith(npz_prefix)
     if using_npz_compression:
         interp_method = interp_method[len(npz_prefix) :]
+        using_chunked_npz = compress_masks.is_chunked(img)
         img = compress_masks.recover(img)
 
     curr_shape = np.array(img.shape[:2])
@@ -210,7 +211,10 @@ def resize_inplace(img_path, target_shape, interp_method, npz_prefix="NPZ_"):
             raise ValueError(f"Unrecognized {interp_method=}")
 
     if using_npz_compression:
-        img = compress_masks.compress(img)
+        if using_chunked_npz:
+            img = compress_masks.compress_chunked(img)
+        else:
+            img = compress_masks.compress(img)
 
     match img_path.suffix:
         case ".png":
@@ -5,8 +5,16 @@
 
 import json
 import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# ruff: noqa: E402
+os.environ["OPENCV_IO_ENABLE_OPENEXR"] = "1"  # This must be done BEFORE import cv2.
+# See https://github.com/opencv/opencv/issues/21326#issuecomment-1008517425
+
 import imageio
 import numpy as np
 
@@ -20,7 +28,7 @@ logger = logging.getLogger(__name__)
 ALLOWED_IMAGE_TYPES = {
     # Read docs/GroundTruthAnnotations.md for more explanations
     "Image_png",
-    # ('Image', '.exr'), # NOT IMPLEMENTED
+    "Image_exr",
     "camview_npz",  # intrinisic, extrinsic, etc
     # names available via EITHER blender_gt.gin and opengl_gt.gin
     "Depth_npy",
@@ -57,6 +65,9 @@ ALLOWED_IMAGE_TYPES = {
 }
 
 
+FRAME_INDEX_NAME = "frame_index.json"
+
+
 def get_blocksize(scene_folder):
     first, second, *_ = sorted(scene_folder.glob("frames*_0"))
     return parse_suffix(second)["frame"] - parse_suffix(first)["frame"]
@@ -80,7 +91,7 @@ def get_imagetypes_available(scene_folder):
     for dtype_folder in (scene_folder / "frames").iterdir():
         frames = dtype_folder / "camera_0"
         uniq = set(p.suffix for p in frames.iterdir())
-        dtypes += [f'{dtype_folder.name}_{u.strip(".")}' for u in uniq]
+        dtypes += [f"{dtype_folder.name}_{u.strip('.')}" for u in uniq]
     return dtypes
 
 
@@ -90,6 +101,106 @@ def get_frame_path(scene_folder, cam: int, frame_idx, data_type) -> Path:
     return Path(scene_folder) / "frames" / data_type_name / f"camera_{cam}" / imgname
 
 
+def _camera_folders(scene_folder):
+    frames_folder = Path(scene_folder) / "frames"
+    if not frames_folder.exists():
+        return []
+    return sorted(
+        cam_folder
+        for dtype_folder in frames_folder.iterdir()
+        if dtype_folder.is_dir()
+        for cam_folder in dtype_folder.glob("camera_*")
+    )
+
+
+def build_frame_index(scene_folder, use_cache=True):
+    """
+    Map {data_type: {cam: {frame: filename}}} for every file under scene_folder/frames
+
+    The index is cached in scene_folder/frame_index.json, and is rebuilt whenever the
+    modification time of any frames/<dtype>/camera_<i> folder no longer matches the cache.
+    """
+    scene_folder = Path(scene_folder)
+    cache_path = scene_folder / FRAME_INDEX_NAME
+    folders = _camera_folders(scene_folder)
+    mtimes = {str(f.relative_to(scene_folder)): os.stat(f).st_mtime_ns for f in folders}
+
+    if use_cache and cache_path.exists():
+        try:
+            cached = json.loads(cache_path.read_text())
+            if cached["mtimes"] == mtimes:
+                return {
+                    dtype: {
+                        int(cam): {int(fr): name for fr, name in frames.items()}
+                        for cam, frames in cams.items()
+                    }
+                    for dtype, cams in cached["index"].items()
+                }
+        except (json.JSONDecodeError, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable {cache_path}: {e}")
+
+    index = {}
+    for cam_folder in folders:
+        dtype_name = cam_folder.parent.name
+        cam = int(cam_folder.name.split("_")[-1])
+        for entry in os.scandir(cam_folder):
+            stem, _, ext = entry.name.partition(".")
+            try:
+                suffix = parse_suffix(stem)
+            except ValueError:
+                suffix = None
+            if suffix is None:
+                logger.warning(f"Skipping {entry.path}, its name has no frame suffix")
+                continue
+            if suffix["cam_rig"] != 0 or suffix["resample"] != 0:
+                continue
+            data_type = f"{dtype_name}_{ext}"
+            frames = index.setdefault(data_type, {}).setdefault(cam, {})
+            frames[suffix["frame"]] = entry.name
+
+    if use_cache:
+        try:
+            tmp_path = cache_path.with_suffix(".json.tmp")
+            tmp_path.write_text(json.dumps(dict(mtimes=mtimes, index=index)))
+            tmp_path.replace(cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write frame index cache {cache_path}: {e}")
+
+    return index
+
+
+_executors = {}  # num_threads -> ThreadPoolExecutor shared by every scene dataset
+_executors_lock = threading.Lock()
+
+
+def _shared_executor(num_threads):
+    with _executors_lock:
+        if num_threads not in _executors:
+            _executors[num_threads] = ThreadPoolExecutor(
+                max_workers=num_threads, thread_name_prefix="dataset-loader"
+            )
+        return _executors[num_threads]
+
+
+def close_executors():
+    """Shut down the decoding threads, they are restarted by the next __getitem__"""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown()
+
+
+def _reset_executors_after_fork():
+    # forked processes (e.g. torch DataLoader workers) do not inherit the threads
+    global _executors_lock
+    _executors_lock = threading.Lock()
+    _executors.clear()
+
+
+os.register_at_fork(after_in_child=_reset_executors_after_fork)
+
+
 class InfinigenSceneDataset:
     def __init__(
         self,
@@ -99,12 +210,19 @@ class InfinigenSceneDataset:
         ] = None,  # see ALLOWED_IMAGE_KEYS above. Use 'None' to retrieve all available PNG datatypes
         cameras=None,
         gt_for_first_camera_only=True,
+        num_threads=8,  # threads used to decode the files of one __getitem__ call
+        mmap_npy=False,  # if True, return .npy files as read-only np.memmap arrays
+        use_index_cache=True,
     ):
         self.scene_folder = Path(scene_folder)
         self.gt_for_first_camera_only = gt_for_first_camera_only
+        self.num_threads = num_threads
+        self.mmap_npy = mmap_npy
+
+        self.index = build_frame_index(self.scene_folder, use_cache=use_index_cache)
 
         if data_types is None:
-            data_types = get_imagetypes_available(self.scene_folder)
+            data_types = sorted(self.index.keys())
             logging.info(
                 f"{self.__class__.__name__} recieved data_types=None, using whats available in {scene_folder}: {data_types}"
             )
@@ -116,27 +234,46 @@ class InfinigenSceneDataset:
         self.data_types = data_types
 
         if cameras is None:
-            cameras = get_cameras_available(self.scene_folder)
+            cameras = sorted(self.index.get("Image_png", {}).keys())
+            if len(cameras) == 0:
+                cameras = get_cameras_available(self.scene_folder)
         self.cameras = cameras
 
-        self.framebounds_inclusive = get_framebounds_inclusive(self.scene_folder)
+        rgb_frames = self.index.get("Image_png", {}).get(0)
+        if rgb_frames:
+            self.framebounds_inclusive = (min(rgb_frames), max(rgb_frames))
+        else:
+            self.framebounds_inclusive = get_framebounds_inclusive(self.scene_folder)
 
     def __len__(self):
         first, last = self.framebounds_inclusive
-        return last - first
+        return last - first + 1
+
+    @staticmethod
+    def load_exr(path):
+        try:
+            import cv2
+        except ImportError:
+            return imageio.imread(path)
+        img = cv2.imread(str(path), cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
+        if img is None:
+            raise ValueError(f"cv2 failed to read {path=}")
+        if img.ndim == 3:
+            img = img[..., ::-1]  # BGR(A) -> RGB(A)
+        return np.ascontiguousarray(img)
 
     @staticmethod
-    def load_any_filetype(path):
+    def load_any_filetype(path, mmap_npy=False):
         match path.suffix:
             case ".png":
                 return imageio.imread(path)
             case ".exr":
-                raise NotImplementedError
+                return InfinigenSceneDataset.load_exr(path)
             case ".npy":
-                return np.load(path)
+                return np.load(path, mmap_mode="r" if mmap_npy else None)
             case ".npz":
                 return dict(np.load(path))
-            case "json":
+            case ".json":
                 with path.open("r") as f:
                     return json.load(f)
             case _:
@@ -144,7 +281,7 @@ class InfinigenSceneDataset:
 
     def _imagetypes_to_load(self, cam: int):
         for data_type in self.data_types:
-            dtypename = data_type[0]
+            dtypename = data_type.split("_")[0]
             if (
                 self.gt_for_first_camera_only
                 and cam != 0
@@ -158,8 +295,7 @@ class InfinigenSceneDataset:
         for i in range(len(self)):
             for cam in self.cameras:
                 for dtype in self._imagetypes_to_load(cam):
-                    frame = self.framebounds_inclusive[0]
-                    p = self.frame_path(frame + i, cam, dtype)
+                    p = self.frame_path(i, cam, dtype)
                     if not p.exists():
                         raise ValueError(
                             f"validate() failed for {self.scene_folder}, could not find {p}"
@@ -167,25 +303,67 @@ class InfinigenSceneDataset:
 
     def frame_path(self, i: int, cam: int, dtype: str):
         frame_num = self.framebounds_inclusive[0] + i
-        return get_frame_path(self.scene_folder, cam, frame_num, dtype)
-
-    def __getitem__(self, i):
-        def get_camera_images(cam: int):
-            imgs = {}
+        name = self.index.get(dtype, {}).get(cam, {}).get(frame_num)
+        if name is None:
+            return get_frame_path(self.scene_folder, cam, frame_num, dtype)
+        dtype_name = dtype.split("_")[0]
+        return self.scene_folder / "frames" / dtype_name / f"camera_{cam}" / name
+
+    @property
+    def executor(self):
+        """Decoding threads, shared with all other datasets using the same num_threads"""
+        if self.num_threads <= 1:
+            return None
+        return _shared_executor(self.num_threads)
+
+    def _submit_frame(self, i):
+        """Start decoding every camera/data_type of frame i, returns {(cam, dtype): future}"""
+        jobs = {}
+        for cam in self.cameras:
             for dtype in self._imagetypes_to_load(cam):
                 path = self.frame_path(i, cam, dtype)
-                imgs[dtype] = self.load_any_filetype(path)
-            return imgs
-
-        per_camera_data = [get_camera_images(i) for i in self.cameras]
+                if self.executor is None:
+                    jobs[cam, dtype] = self.load_any_filetype(path, self.mmap_npy)
+                else:
+                    jobs[cam, dtype] = self.executor.submit(
+                        self.load_any_filetype, path, self.mmap_npy
+                    )
+        return jobs
+
+    def _collect_frame(self, jobs):
+        per_camera_data = {cam: {} for cam in self.cameras}
+        for (cam, dtype), job in jobs.items():
+            per_camera_data[cam][dtype] = (
+                job.result() if self.executor is not None else job
+            )
+        per_camera_data = [per_camera_data[cam] for cam in self.cameras]
 
         if len(self.cameras) == 1:
             return per_camera_data[0]
         else:
             return per_camera_data
 
+    def __getitem__(self, i):
+        return self._collect_frame(self._submit_frame(i))
+
+    def prefetch(self, indices=None, depth=2):
+        """Yield self[i] for each i in indices, decoding up to `depth` frames ahead in the background"""
+        if indices is None:
+            indices = range(len(self))
+        pending = deque()
+        for i in indices:
+            pending.append(self._submit_frame(i))
+            if len(pending) > depth:
+                yield self._collect_frame(pending.popleft())
+        while pending:
+            yield self._collect_frame(pending.popleft())
+
 
 def get_infinigen_dataset(data_folder: Path, mode="concat", validate=False, **kwargs):
+    """
+    One InfinigenSceneDataset per scene of data_folder. All scenes decode on the same threads,
+    call close_executors() once done with the dataset to stop them
+    """
     import torch.utils.data
 
     data_folder = Path(data_folder)
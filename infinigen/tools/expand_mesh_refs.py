@@ -0,0 +1,24 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+from pathlib import Path
+
+from infinigen.core.util.mesh_export import expand_refs
+
+"""
+Rewrite the per-frame mesh folders of a save_meshes(incremental=True) output to the full format,
+so every saved_mesh_XXXX.npz holds the geometry of its meshes again (e.g. for customgt).
+
+Usage: python -m infinigen.tools.expand_mesh_refs <savemesh_folder>
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", type=Path)
+    args = parser.parse_args()
+
+    for json_path in sorted(args.folder.glob("frame_*/*/saved_mesh.json")):
+        print(f"Expanding {json_path.parent}")
+        expand_refs(json_path.parent)
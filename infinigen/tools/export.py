@@ -12,6 +12,10 @@ from pathlib import Path
 
 import bpy
 import gin
+import numpy as np
+
+from infinigen.tools import bake_atlas
+from infinigen.tools.bake_cache import bake_key, get_bake_cache
 
 FORMAT_CHOICES = ["fbx", "obj", "usdc", "usda", "stl", "ply"]
 BAKE_TYPES = {
@@ -413,10 +417,21 @@ def process_glass_materials(obj, export_usd):
             create_glass_shader(mat.node_tree, export_usd)
 
 
-def bake_pass(obj, dest: Path, img_size, bake_type, export_usd):
-    img = bpy.data.images.new(f"{obj.name}_{bake_type}", img_size, img_size)
-    clean_name = (obj.name).replace(" ", "_").replace(".", "_")
-    file_path = dest / f"{clean_name}_{bake_type}.png"
+def bake_pass(
+    obj, dest: Path, img_size, bake_type, export_usd, cache_key=None, atlas=None
+):
+    if atlas is None:
+        img = bpy.data.images.new(f"{obj.name}_{bake_type}", img_size, img_size)
+        clean_name = (obj.name).replace(" ", "_").replace(".", "_")
+        file_path = dest / f"{clean_name}_{bake_type}.png"
+    else:
+        # parts sharing an atlas bake into disjoint tiles of the same image
+        name = f"{atlas.tile.name}_{bake_type}"
+        if name not in atlas.images:
+            res = atlas.tile.atlas_res
+            atlas.images[name] = bpy.data.images.new(name, res, res)
+        img = atlas.images[name]
+        file_path = dest / f"{name}.png"
     dest = dest / "textures"
 
     bake_obj = False
@@ -467,11 +482,32 @@ def bake_pass(obj, dest: Path, img_size, bake_type, export_usd):
     else:
         internal_bake_type = bake_type
 
-    if bake_obj:
+    cache = get_bake_cache() if cache_key is not None else None
+    cached_path = None
+    if bake_obj and cache is not None:
+        cached_path = cache.lookup(cache_key, bake_type)
+
+    if cached_path is not None:
+        logging.info(f"Reusing cached {bake_type} pass from {cached_path}")
+        cached_img = bpy.data.images.load(str(cached_path), check_existing=False)
+        pixels = np.empty(len(cached_img.pixels), dtype=np.float32)
+        cached_img.pixels.foreach_get(pixels)
+        img.pixels.foreach_set(pixels)
+        bpy.data.images.remove(cached_img)
+        img.filepath_raw = str(file_path)
+        if not export_usd:
+            img.save()
+    elif bake_obj:
         logging.info(f"Baking {bake_type} pass")
+        bake_settings = bpy.context.scene.render.bake
+        use_clear = bake_settings.use_clear
+        bake_settings.use_clear = atlas is None
         bpy.ops.object.bake(
             type=internal_bake_type, pass_filter={"COLOR"}, save_mode="EXTERNAL"
         )
+        bake_settings.use_clear = use_clear
+        if cache is not None:
+            cache.store(cache_key, bake_type, lambda p: img.save(filepath=str(p)))
         img.filepath_raw = str(file_path)
         if not export_usd:
             img.save()
@@ -484,7 +520,7 @@ def bake_pass(obj, dest: Path, img_size, bake_type, export_usd):
 
 
 def bake_metal(
-    obj, dest, img_size, export_usd
+    obj, dest, img_size, export_usd, cache_key=None, atlas=None
 ):  # metal baking is not really set up for node graphs w/ 2 mixed BSDFs.
     metal_map_mats = []
     for slot in obj.material_slots:
@@ -508,7 +544,7 @@ def bake_metal(
             metal_map_mats.append(mat)
 
     if len(metal_map_mats) != 0:
-        bake_pass(obj, dest, img_size, "METAL", export_usd)
+        bake_pass(obj, dest, img_size, "METAL", export_usd, cache_key, atlas)
 
     for mat in metal_map_mats:
         nodes = mat.node_tree.nodes
@@ -518,7 +554,7 @@ def bake_metal(
         links.new(outputNode.inputs[0], principled_bsdf_node.outputs[0])
 
 
-def bake_normals(obj, dest, img_size, export_usd):
+def bake_normals(obj, dest, img_size, export_usd, cache_key=None, atlas=None):
     bake_obj = False
     for slot in obj.material_slots:
         mat = slot.material
@@ -534,7 +570,7 @@ def bake_normals(obj, dest, img_size, export_usd):
             bake_obj = True
 
     if bake_obj:
-        bake_pass(obj, dest, img_size, "NORMAL", export_usd)
+        bake_pass(obj, dest, img_size, "NORMAL", export_usd, cache_key, atlas)
 
 
 def remove_params(mat, node_tree):
@@ -643,9 +679,47 @@ def set_center_of_mass():
             obj.hide_viewport = view_state
 
 
-def bake_object(obj, dest, img_size, export_usd):
-    if not uv_unwrap(obj):
+def texel_stats(obj):
+    """World-space surface area of obj, and the fraction of UV space its ExportUV islands cover"""
+    mesh = obj.data
+    mesh.calc_loop_triangles()
+    n_tris = len(mesh.loop_triangles)
+    tri_verts = np.empty(n_tris * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", tri_verts)
+    tri_loops = np.empty(n_tris * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("loops", tri_loops)
+
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", co)
+    co = co.reshape(-1, 3)
+    matrix = np.array(obj.matrix_world)
+    co = co @ matrix[:3, :3].T + matrix[:3, 3]
+    surface_area = bake_atlas.triangle_areas(co, tri_verts.reshape(-1, 3)).sum()
+
+    uv_layer = mesh.uv_layers["ExportUV"]
+    uv = np.empty(len(uv_layer.data) * 2, dtype=np.float64)
+    uv_layer.data.foreach_get("uv", uv)
+    uv_area = bake_atlas.triangle_areas(uv.reshape(-1, 2), tri_loops.reshape(-1, 3))
+
+    return surface_area, uv_area.sum()
+
+
+def move_uvs_to_atlas(obj, atlas):
+    if obj.data.users > 1:
+        obj.data = obj.data.copy()  # other objects keep their uvs
+    uv_layer = obj.data.uv_layers["ExportUV"]
+    uv = np.empty(len(uv_layer.data) * 2, dtype=np.float64)
+    uv_layer.data.foreach_get("uv", uv)
+    uv = bake_atlas.remap_uvs(uv.reshape(-1, 2), atlas.tile, atlas.padding)
+    uv_layer.data.foreach_set("uv", uv.reshape(-1).astype(np.float32))
+
+
+def bake_object(obj, dest, img_size, export_usd, atlas=None, unwrapped=False):
+    """unwrapped: obj already got its ExportUV layer from plan_bake_resolutions"""
+    if not unwrapped and not uv_unwrap(obj):
         return
+    if atlas is not None:
+        move_uvs_to_atlas(obj, atlas)
 
     bpy.ops.object.select_all(action="DESELECT")
     obj.select_set(True)
@@ -659,20 +733,74 @@ def bake_object(obj, dest, img_size, export_usd):
 
     process_glass_materials(obj, export_usd)
 
-    bake_metal(obj, dest, img_size, export_usd)
-    bake_normals(obj, dest, img_size, export_usd)
+    cache_key = None
+    if get_bake_cache() is not None and atlas is None:
+        cache_key = bake_key(obj, img_size, export_usd, bpy.context.scene)
+
+    bake_metal(obj, dest, img_size, export_usd, cache_key, atlas)
+    bake_normals(obj, dest, img_size, export_usd, cache_key, atlas)
 
     paramDict = process_interfering_params(obj)
 
     for bake_type in BAKE_TYPES:
-        bake_pass(obj, dest, img_size, bake_type, export_usd)
+        bake_pass(obj, dest, img_size, bake_type, export_usd, cache_key, atlas)
 
     apply_baked_tex(obj, paramDict)
 
     obj.select_set(False)
 
 
-def bake_scene(folderPath: Path, image_res, vertex_colors, export_usd, objs=None):
+def plan_bake_resolutions(
+    objs, image_res, texel_density=None, atlas_res=None, atlas_max_tile=256
+):
+    """
+    Pick a bake resolution per object, and group small objects into shared atlases
+
+    Returns {obj: (img_size, AtlasSlot or None)}. Objects are UV unwrapped here, since texel
+    density depends on how much of UV space their islands cover.
+    """
+    plan = {}
+    for obj in objs:
+        if texel_density is None:
+            plan[obj] = image_res
+            continue
+        if not uv_unwrap(obj):
+            continue
+        surface_area, uv_area = texel_stats(obj)
+        plan[obj] = bake_atlas.resolution_for_texel_density(
+            surface_area, uv_area, texel_density, max_res=image_res
+        )
+        logging.info(
+            f"{obj.name} {surface_area=:.4f} {uv_area=:.3f} bake resolution {plan[obj]}"
+        )
+
+    plan = {obj: (res, None) for obj, res in plan.items()}
+    if atlas_res is None:
+        return plan
+
+    small = [obj for obj, (res, _) in plan.items() if res <= atlas_max_tile]
+    if len(small) < 2:
+        return plan
+    tiles = bake_atlas.pack_atlas([plan[obj][0] for obj in small], atlas_res)
+    padding = bpy.context.scene.render.bake.margin
+    pages = {}
+    for obj, tile in zip(small, tiles):
+        images = pages.setdefault(tile.page, {})
+        plan[obj] = (tile.size, bake_atlas.AtlasSlot(tile, padding, images))
+    logging.info(f"Packed {len(small)} objects into {len(pages)} atlases of {atlas_res=}")
+    return plan
+
+
+def bake_scene(
+    folderPath: Path,
+    image_res,
+    vertex_colors,
+    export_usd,
+    objs=None,
+    texel_density=None,
+    atlas_res=None,
+):
+    to_bake = []
     for obj in (bpy.data.objects if objs is None else objs):
         logging.info("---------------------------")
         logging.info(obj.name)
@@ -687,13 +815,30 @@ def bake_scene(folderPath: Path, image_res, vertex_colors, export_usd, objs=None
         if format == "stl":
             continue
 
+        to_bake.append(obj)
+
+    if not vertex_colors:
+        for obj in to_bake:
+            obj.hide_render = False
+            obj.hide_viewport = False
+        plan = plan_bake_resolutions(to_bake, image_res, texel_density, atlas_res)
+
+    for obj in to_bake:
         obj.hide_render = False
         obj.hide_viewport = False
 
         if vertex_colors:
             bakeVertexColors(obj)
-        else:
-            bake_object(obj, folderPath, image_res, export_usd)
+        elif obj in plan:
+            img_size, atlas = plan[obj]
+            bake_object(
+                obj,
+                folderPath,
+                img_size,
+                export_usd,
+                atlas,
+                unwrapped=texel_density is not None,
+            )
 
         obj.hide_render = True
         obj.hide_viewport = True
@@ -868,6 +1013,8 @@ def export_curr_scene(
     omniverse_export=False,
     pipeline_folder=None,
     task_uniqname=None,
+    texel_density=None,
+    atlas_res=None,
 ) -> Path:
     export_usd = format in ["usda", "usdc"]
 
@@ -928,6 +1075,8 @@ def export_curr_scene(
         image_res=image_res,
         vertex_colors=vertex_colors,
         export_usd=export_usd,
+        texel_density=texel_density,
+        atlas_res=atlas_res,
     )
 
     for collection, status in collection_views.items():
@@ -987,6 +1136,9 @@ def main(args):
         filemode="w+",
     )
 
+    if args.bake_cache is not None:
+        gin.bind_parameter("get_bake_cache.root", args.bake_cache)
+
     targets = sorted(list(args.input_folder.iterdir()))
     for blendfile in targets:
         if blendfile.stem == "solve_state":
@@ -1004,6 +1156,8 @@ def main(args):
             vertex_colors=args.vertex_colors,
             individual_export=args.individual,
             omniverse_export=args.omniverse,
+            texel_density=args.texel_density,
+            atlas_res=args.atlas_res,
         )
         # wanted to use shutil here but kept making corrupted files
         subprocess.call(["zip", "-r", str(folder.with_suffix(".zip")), str(folder)])
@@ -1023,6 +1177,24 @@ def make_args():
     parser.add_argument("-r", "--resolution", default=1024, type=int)
     parser.add_argument("-i", "--individual", action="store_true")
     parser.add_argument("-o", "--omniverse", action="store_true")
+    parser.add_argument(
+        "--texel_density",
+        type=float,
+        default=None,
+        help="Pick each object's bake resolution for this many texels per meter, up to -r",
+    )
+    parser.add_argument(
+        "--atlas_res",
+        type=int,
+        default=None,
+        help="With --texel_density, bake small objects into shared atlases of this resolution",
+    )
+    parser.add_argument(
+        "--bake_cache",
+        type=Path,
+        default=None,
+        help="Folder of baked textures to reuse across objects and runs",
+    )
 
     args = parser.parse_args()
 
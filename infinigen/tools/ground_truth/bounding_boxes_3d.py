@@ -4,7 +4,6 @@
 # Authors: Lahav Lipson
 
 import argparse
-import colorsys
 import json
 import sys
 from pathlib import Path
@@ -22,7 +21,8 @@ except ImportError:
         "GT visualization requires `einops`. Please install optional extras via `pip install .[vis]`."
     )
 
-from infinigen.tools.compress_masks import recover
+from infinigen.core.rendering.post_render import ids_to_colors
+from infinigen.tools.compress_masks import recover, unique_rows
 from infinigen.tools.dataset_loader import get_frame_path
 
 """
@@ -71,14 +71,6 @@ def calc_bbox_pts(min_pt, max_pt):
     return points, faces
 
 
-# Deterministic, but probably slow. Good enough for visualization.
-def arr2color(e):
-    s = np.random.RandomState(np.array(e, dtype=np.uint32))
-    return (
-        np.asarray(colorsys.hsv_to_rgb(s.uniform(0, 1), s.uniform(0.1, 1), 1)) * 255
-    ).astype(np.uint8)
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("folder", type=Path)
@@ -129,7 +121,7 @@ if __name__ == "__main__":
         [object_segmentation_mask, instance_segmentation_mask], "h w *"
     )
     combined_mask = rearrange(combined_mask, "h w d -> (h w) d")
-    visible_instances = np.unique(combined_mask, axis=0)  # this line is a bottleneck
+    visible_instances, _ = unique_rows(combined_mask)
     visible_instances = {tuple(row) for row in visible_instances}
 
     boxes_to_draw = []
@@ -144,7 +136,7 @@ if __name__ == "__main__":
                             model_mat=model_mat,
                             min=obj["min"],
                             max=obj["max"],
-                            color=arr2color(instance_id).tolist(),
+                            color=ids_to_colors([instance_id])[0].tolist(),
                         )
                     )
 
@@ -182,6 +174,6 @@ if __name__ == "__main__":
 
     args.output.mkdir(exist_ok=True)
     imwrite(args.output / "A.png", image)
-    print(f'Wrote {args.output / "A.png"}')
+    print(f"Wrote {args.output / 'A.png'}")
     imwrite(args.output / "B.png", canvas)
-    print(f'Wrote {args.output / "B.png"}')
+    print(f"Wrote {args.output / 'B.png'}")
@@ -4,19 +4,18 @@
 # Authors: Lahav Lipson
 
 import argparse
-import colorsys
 import json
 import sys
 from pathlib import Path
 
 import cv2
-import numba as nb
 import numpy as np
 from imageio.v3 import imread, imwrite
-from numba.types import bool_
 
-from infinigen.tools.compress_masks import recover
+from infinigen.core.rendering.post_render import ids_to_colors
+from infinigen.tools.compress_masks import recover, unique_rows
 from infinigen.tools.dataset_loader import get_frame_path
+from infinigen.tools.ground_truth.batch_processing import compute_boxes, highlight_mask
 
 try:
     from einops import pack, rearrange, repeat
@@ -34,47 +33,6 @@ Output:
 """
 
 
-@nb.njit
-def should_highlight_pixel(arr2d, set1d):
-    """Compute boolean mask for items in arr2d that are also in set1d"""
-    H, W = arr2d.shape
-    output = np.zeros((H, W), dtype=bool_)
-    for i in range(H):
-        for j in range(W):
-            for n in range(set1d.size):
-                output[i, j] = output[i, j] or (arr2d[i, j] == set1d[n])
-    return output
-
-
-@nb.njit
-def compute_boxes(indices, binary_tag_mask):
-    """Compute 2d bounding boxes for highlighted pixels"""
-    H, W = binary_tag_mask.shape
-    num_u = indices.max() + 1
-    x_min = np.full(num_u, W - 1, dtype=np.int32)
-    y_min = np.full(num_u, H - 1, dtype=np.int32)
-    x_max = np.full(num_u, -1, dtype=np.int32)
-    y_max = np.full(num_u, -1, dtype=np.int32)
-    for y in range(H):
-        for x in range(W):
-            idx = indices[y, x]
-            tag_is_present = binary_tag_mask[y, x]
-            if tag_is_present:
-                x_min[idx] = min(x_min[idx], x)
-                x_max[idx] = max(x_max[idx], x)
-                y_min[idx] = min(y_min[idx], y)
-                y_max[idx] = max(y_max[idx], y)
-    return np.stack((x_min, y_min, x_max, y_max), axis=-1)
-
-
-# Deterministic, but probably slow. Good enough for visualization.
-def arr2color(e):
-    s = np.random.RandomState(np.array(e, dtype=np.uint32))
-    return (
-        np.asarray(colorsys.hsv_to_rgb(s.uniform(0, 1), s.uniform(0.1, 1), 1)) * 255
-    ).astype(np.uint8)
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("folder", type=Path)
@@ -123,7 +81,7 @@ if __name__ == "__main__":
     objects_to_highlight = [
         obj for obj in present_objects if (args.query.lower() in obj["name"].lower())
     ]
-    highlighted_pixels = should_highlight_pixel(
+    highlighted_pixels = highlight_mask(
         object_segmentation_mask,
         np.array([o["object_index"] for o in objects_to_highlight]),
     )
@@ -134,13 +92,13 @@ if __name__ == "__main__":
         [object_segmentation_mask, instance_segmentation_mask], "h w *"
     )
     combined_mask = rearrange(combined_mask, "h w d -> (h w) d")
-    uniq_instances, indices = np.unique(
-        combined_mask, return_inverse=True, axis=0
-    )  # this line is the bottleneck
-    unique_colors = np.stack([arr2color(row) for row in uniq_instances])
+    uniq_instances, indices = unique_rows(combined_mask)
+    unique_colors = ids_to_colors(uniq_instances)
 
     if args.boxes:
-        bbox = compute_boxes(indices.reshape((H, W)), highlighted_pixels)
+        bbox = compute_boxes(
+            indices.reshape((H, W)), highlighted_pixels, len(uniq_instances)
+        )
         m = bbox[:, 3] >= 0  # Ignore objects which weren't queried
         bbox = bbox[m]
         unique_colors = unique_colors[m]
@@ -167,6 +125,6 @@ if __name__ == "__main__":
 
     args.output.mkdir(exist_ok=True)
     imwrite(args.output / "A.png", image)
-    print(f'Wrote {args.output / "A.png"}')
+    print(f"Wrote {args.output / 'A.png'}")
     imwrite(args.output / "B.png", canvas)
-    print(f'Wrote {args.output / "B.png"}')
+    print(f"Wrote {args.output / 'B.png'}")
@@ -0,0 +1,123 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from infinigen.core.util.mesh_export import MeshShardWriter, item_arrays
+
+"""
+Throughput of the background MeshShardWriter against the synchronous np.savez path that
+save_obj_and_instances used before, on synthetic meshes. --extract_ms emulates the per-mesh
+depsgraph work of get_all_instances, which the background writer overlaps with writing.
+
+Usage: python -m infinigen.tools.mesh_writer_benchmark --n_meshes 2000 --extract_ms 2
+"""
+
+LEGACY_MAX_NUM_VERTS = int(5e6)
+
+
+def make_items(n_meshes, n_verts, seed=0):
+    rng = np.random.default_rng(seed)
+    base = dict(
+        vertex_lookup=np.round(rng.normal(size=(n_verts, 3)), 3).astype(np.float32),
+        indices=rng.integers(0, n_verts, size=6 * n_verts, dtype=np.int32),
+        loop_totals=np.full(2 * n_verts, 3, dtype=np.int32),
+        masktag=np.zeros(n_verts, dtype=np.int32),
+    )
+    for i in range(n_meshes):
+        yield dict(
+            base,
+            vertex_lookup=base["vertex_lookup"] + np.float32(i),
+            matrices=[np.eye(4, dtype=np.float32)],
+            instance_ids=[(i, 0, 0)],
+            is_instance=True,
+            name=f"mesh_{i}",
+        )
+
+
+def extract(extract_ms):
+    # busy-wait rather than sleep, blender holds the GIL while walking the depsgraph
+    end = time.perf_counter() + extract_ms / 1000
+    while time.perf_counter() < end:
+        pass
+
+
+def legacy_write(folder, items, extract_ms):
+    npz_number, npz_data, running_total_verts = 1, {}, 0
+    for item in items:
+        extract(extract_ms)
+        num_verts = len(item["vertex_lookup"])
+        if npz_data and running_total_verts + num_verts >= LEGACY_MAX_NUM_VERTS:
+            np.savez(folder / f"saved_mesh_{npz_number:04d}.npz", **npz_data)
+            npz_data.clear()
+            running_total_verts = 0
+            npz_number += 1
+        for field, arr in item_arrays(item).items():
+            npz_data[f"{item['name']}_{field}"] = arr
+        running_total_verts += num_verts
+    if npz_data:
+        np.savez(folder / f"saved_mesh_{npz_number:04d}.npz", **npz_data)
+
+
+def writer_write(folder, items, extract_ms, **kwargs):
+    writer = MeshShardWriter(folder, **kwargs)
+    for item in items:
+        extract(extract_ms)
+        writer.add(item["name"], item)
+    writer.close()
+
+
+def run(name, fn, args, **kwargs):
+    folder = Path(tempfile.mkdtemp(dir=args.tmp_dir))
+    try:
+        items = make_items(args.n_meshes, args.n_verts)
+        start = time.perf_counter()
+        fn(folder, items, args.extract_ms, **kwargs)
+        elapsed = time.perf_counter() - start
+        written = sum(p.stat().st_size for p in folder.iterdir())
+    finally:
+        shutil.rmtree(folder)
+    raw = args.n_meshes * sum(
+        np.asarray(a).nbytes
+        for a in item_arrays(next(make_items(1, args.n_verts))).values()
+    )
+    print(
+        f"{name:<28} {elapsed:8.2f}s {raw / 2**20 / elapsed:10.1f} MB/s {written / 2**20:10.1f} MB on disk"
+    )
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_meshes", type=int, default=2000)
+    parser.add_argument("--n_verts", type=int, default=20000)
+    parser.add_argument("--extract_ms", type=float, default=2.0)
+    parser.add_argument("--n_workers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument(
+        "--compression", type=str, nargs="+", default=["none", "deflate"]
+    )
+    parser.add_argument("--level", type=int, default=None)
+    parser.add_argument("--max_shard_bytes", type=int, default=2**26)
+    parser.add_argument("--tmp_dir", type=Path, default=None)
+    args = parser.parse_args()
+
+    print(f"{'':<28} {'time':>9} {'throughput':>15} {'size':>13}")
+    baseline = run("legacy np.savez", legacy_write, args)
+    for compression in args.compression:
+        for n_workers in args.n_workers:
+            elapsed = run(
+                f"{compression}, {n_workers} workers",
+                writer_write,
+                args,
+                max_shard_bytes=args.max_shard_bytes,
+                n_workers=n_workers,
+                compression=compression,
+                level=args.level,
+            )
+            print(f"{'':<28} {baseline / elapsed:8.2f}x vs legacy")
@@ -0,0 +1,155 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+import logging
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import trimesh
+from tqdm import tqdm
+
+from infinigen.tools.obj_io import MaterialLibrary, concatenate, load_obj, write_obj
+
+logger = logging.getLogger(__name__)
+
+"""
+Headless preparation of part libraries: every folder of part OBJs is merged into one mesh that
+is centered on its bounding box and normalized, written to <folder>/whole/whole/whole.obj.
+
+Parts are read one at a time (reusing .npz sidecars) while reducing their joint bounds, so the
+normalization is known before anything is written. Optionally the merged part is first rotated
+into the frame of its oriented bounding box.
+
+Usage: python -m infinigen.tools.normalize_parts <root> [--mode axis|uniform|none] [--canonical] [--n_workers N]
+"""
+
+OUTPUT_NAME = "whole"
+
+
+def part_paths(folder):
+    return sorted(p for p in Path(folder).glob("*.obj") if p.is_file())
+
+
+def output_path(folder):
+    return Path(folder) / OUTPUT_NAME / OUTPUT_NAME / f"{OUTPUT_NAME}.obj"
+
+
+def find_part_folders(root):
+    """Every folder under root directly containing part objs, skipping previous outputs"""
+    folders = {p.parent for p in Path(root).rglob("*.obj")}
+    return sorted(f for f in folders if OUTPUT_NAME not in f.relative_to(root).parts)
+
+
+def canonical_transform(vertices):
+    """Rigid transform moving the oriented bounding box of vertices to the origin, axis-aligned"""
+    to_origin, _ = trimesh.bounds.oriented_bounds(vertices)
+    return to_origin
+
+
+def normalization_transform(lo, hi, mode="axis"):
+    """
+    Center the bounds [lo, hi] on the origin and scale them to unit size
+
+    mode="axis" scales each axis to unit extent (as merge_obj.normalize did), "uniform" scales
+    the largest extent to 1, keeping proportions, and "none" only centers.
+    """
+    extent = hi - lo
+    match mode:
+        case "axis":
+            scale = np.where(extent > 0, 1 / np.where(extent > 0, extent, 1), 1)
+        case "uniform":
+            scale = np.full(3, 1 / extent.max() if extent.max() > 0 else 1)
+        case "none":
+            scale = np.ones(3)
+        case _:
+            raise ValueError(f"Unrecognized normalization {mode=}")
+    transform = np.diag(np.append(scale, 1))
+    transform[:3, 3] = -scale * (lo + hi) / 2
+    return transform
+
+
+def normalize_dir(folder, output=None, mode="axis", canonical=False, sidecar=True):
+    """Merge and normalize the part objs in folder, returning the written path"""
+    folder = Path(folder)
+    output = Path(output) if output is not None else output_path(folder)
+    paths = part_paths(folder)
+    if not paths:
+        raise FileNotFoundError(f"No part objs in {folder}")
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    library = MaterialLibrary(output.parent)
+    parts = []
+    lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+    for path in paths:
+        mesh = load_obj(path, sidecar=sidecar)
+        parts.append((mesh, library.names(path, mesh)))
+        if len(mesh.vertices) > 0:
+            lo = np.minimum(lo, mesh.vertices.min(axis=0))
+            hi = np.maximum(hi, mesh.vertices.max(axis=0))
+    if not np.all(np.isfinite(lo)):
+        raise ValueError(f"Parts in {folder} have no vertices")
+
+    transform = np.eye(4)
+    if canonical:
+        vertices = np.concatenate([m.vertices for m, _ in parts])
+        transform = canonical_transform(vertices)
+        moved = vertices @ transform[:3, :3].T + transform[:3, 3]
+        lo, hi = moved.min(axis=0), moved.max(axis=0)
+    transform = normalization_transform(lo, hi, mode) @ transform
+
+    whole = concatenate(parts, [transform] * len(parts))
+    mtllib = None
+    if library.blocks:
+        mtllib = output.with_suffix(".mtl").name
+        library.write(output.with_suffix(".mtl"))
+    write_obj(output, whole, mtllib=mtllib, name=output.stem)
+    return output
+
+
+def _normalize_or_error(folder, **kwargs):
+    try:
+        return str(normalize_dir(folder, **kwargs))
+    except Exception as e:
+        logger.warning(f"Failed to normalize {folder}: {e!r}")
+        return None
+
+
+def normalize_folders(folders, n_workers=1, **kwargs):
+    """normalize_dir() for every folder, returning {folder: output or None}"""
+    folders = [str(f) for f in folders]
+    func = partial(_normalize_or_error, **kwargs)
+    if n_workers == 1:
+        results = [func(f) for f in tqdm(folders)]
+    else:
+        with Pool(n_workers) as p:
+            results = list(tqdm(p.imap(func, folders, chunksize=4), total=len(folders)))
+    return dict(zip(folders, results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "root", type=Path, help="Folder searched for folders of part objs"
+    )
+    parser.add_argument("--mode", choices=["axis", "uniform", "none"], default="axis")
+    parser.add_argument(
+        "--canonical",
+        action="store_true",
+        help="Rotate each merged part into the frame of its oriented bounding box",
+    )
+    parser.add_argument("--n_workers", type=int, default=1)
+    parser.add_argument("--no_sidecar", action="store_true")
+    args = parser.parse_args()
+
+    results = normalize_folders(
+        find_part_folders(args.root),
+        n_workers=args.n_workers,
+        mode=args.mode,
+        canonical=args.canonical,
+        sidecar=not args.no_sidecar,
+    )
+    n_failed = sum(r is None for r in results.values())
+    print(f"{len(results) - n_failed}/{len(results)} part folders normalized")
@@ -0,0 +1,353 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+"""
+Minimal numpy OBJ/MTL reading and writing for headless mesh tools.
+
+Meshes are triangulated on read, keep their uv/normal indices and per-face materials, and can be
+cached as .npz sidecars so repeated batch jobs skip text parsing.
+"""
+
+SIDECAR_VERSION = 1
+
+
+@dataclass
+class ObjMesh:
+    """
+    Triangulated obj contents. Face index arrays are 0-based, (F, 3); uv/normal indices are -1
+    for faces without them. face_material indexes into materials.
+    """
+
+    vertices: np.ndarray
+    uvs: np.ndarray
+    normals: np.ndarray
+    faces: np.ndarray
+    face_uvs: np.ndarray
+    face_normals: np.ndarray
+    face_material: np.ndarray
+    materials: list
+    mtllibs: list
+
+    def save(self, path):
+        np.savez(
+            path,
+            version=SIDECAR_VERSION,
+            vertices=self.vertices,
+            uvs=self.uvs,
+            normals=self.normals,
+            faces=self.faces,
+            face_uvs=self.face_uvs,
+            face_normals=self.face_normals,
+            face_material=self.face_material,
+            materials=np.array(self.materials, dtype=str),
+            mtllibs=np.array(self.mtllibs, dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            if int(d["version"]) != SIDECAR_VERSION:
+                return None
+            return cls(
+                d["vertices"],
+                d["uvs"],
+                d["normals"],
+                d["faces"],
+                d["face_uvs"],
+                d["face_normals"],
+                d["face_material"],
+                list(d["materials"]),
+                list(d["mtllibs"]),
+            )
+
+
+def _rows(lines, width):
+    if not lines:
+        return np.zeros((0, width))
+    values = np.array(" ".join(lines).split(), dtype=np.float64)
+    if len(values) == len(lines) * len(lines[0].split()):
+        return values.reshape(len(lines), -1)[:, :width]
+    # rows with differing component counts, e.g. some vt with a w component
+    return np.array([l.split()[:width] for l in lines], dtype=np.float64)
+
+
+def _index(token, count):
+    if not token:
+        return -1
+    i = int(token)
+    return i - 1 if i > 0 else count + i
+
+
+def parse_obj(path):
+    v, vt, vn = [], [], []
+    faces, face_material = [], []
+    materials, mtllibs = [], []
+    current = -1
+    with open(path) as f:
+        for line in f:
+            if line.startswith("v "):
+                v.append(line[2:])
+            elif line.startswith("vt "):
+                vt.append(line[3:])
+            elif line.startswith("vn "):
+                vn.append(line[3:])
+            elif line.startswith("f "):
+                corners = []
+                for token in line.split()[1:]:
+                    parts = token.split("/") + ["", ""]
+                    corners.append(
+                        (
+                            _index(parts[0], len(v)),
+                            _index(parts[1], len(vt)),
+                            _index(parts[2], len(vn)),
+                        )
+                    )
+                for k in range(1, len(corners) - 1):
+                    faces.append((corners[0], corners[k], corners[k + 1]))
+                    face_material.append(current)
+            elif line.startswith("usemtl"):
+                name = line.split(maxsplit=1)[1].strip()
+                if name not in materials:
+                    materials.append(name)
+                current = materials.index(name)
+            elif line.startswith("mtllib"):
+                mtllibs.append(line.split(maxsplit=1)[1].strip())
+
+    faces = np.array(faces, dtype=np.int64).reshape(-1, 3, 3)
+    return ObjMesh(
+        _rows(v, 3),
+        _rows(vt, 2),
+        _rows(vn, 3),
+        faces[:, :, 0],
+        faces[:, :, 1],
+        faces[:, :, 2],
+        np.array(face_material, dtype=np.int64),
+        materials,
+        mtllibs,
+    )
+
+
+def sidecar_path(mesh_path):
+    mesh_path = Path(mesh_path)
+    return mesh_path.parent / f".{mesh_path.name}.npz"
+
+
+def load_obj(mesh_path, sidecar=True):
+    """parse_obj(), reusing an .npz sidecar beside the obj while it is newer than the obj"""
+    mesh_path = Path(mesh_path)
+    cache = sidecar_path(mesh_path)
+    if (
+        sidecar
+        and cache.exists()
+        and cache.stat().st_mtime >= mesh_path.stat().st_mtime
+    ):
+        try:
+            mesh = ObjMesh.load(cache)
+            if mesh is not None:
+                return mesh
+        except Exception as e:
+            logger.debug(f"Ignoring unreadable sidecar {cache}: {e!r}")
+    mesh = parse_obj(mesh_path)
+    if sidecar:
+        try:
+            with open(cache, "wb") as f:
+                mesh.save(f)
+        except OSError as e:
+            logger.debug(f"Could not write sidecar {cache}: {e!r}")
+    return mesh
+
+
+def read_mtl(path):
+    """{material name: [lines]} of an mtl file"""
+    blocks, current = {}, None
+    with open(path) as f:
+        for line in f:
+            if line.startswith("newmtl"):
+                current = line.split(maxsplit=1)[1].strip()
+                blocks[current] = []
+            elif current is not None and line.strip():
+                blocks[current].append(line.strip())
+    return blocks
+
+
+def _relocate_maps(lines, src_dir, dst_dir):
+    result = []
+    for line in lines:
+        tokens = line.split()
+        if tokens[0].startswith("map_") or tokens[0] in ("bump", "disp", "refl"):
+            texture = Path(tokens[-1])
+            if not texture.is_absolute():
+                tokens[-1] = os.path.relpath(src_dir / texture, dst_dir)
+            line = " ".join(tokens)
+        result.append(line)
+    return result
+
+
+class MaterialLibrary:
+    """
+    Materials of many part objs merged into one mtl file written to output_dir
+
+    Same-named materials from different mtl files get distinct names, and relative texture paths
+    are rewritten relative to output_dir.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.files = {}
+        self.blocks = {}
+        self.renamed = {}
+
+    def _source(self, mesh_dir, mtllibs, material):
+        for lib in mtllibs:
+            path = mesh_dir / lib
+            if path not in self.files:
+                self.files[path] = read_mtl(path) if path.exists() else {}
+            if material in self.files[path]:
+                return path
+        return None
+
+    def names(self, mesh_path, mesh: ObjMesh):
+        """Merged names of mesh.materials, for concatenate()"""
+        result = []
+        for m in mesh.materials:
+            source = self._source(Path(mesh_path).parent, mesh.mtllibs, m)
+            if (source, m) not in self.renamed:
+                name, k = m, 1
+                while name in self.blocks:
+                    name, k = f"{m}.{k:03d}", k + 1
+                self.renamed[source, m] = name
+                self.blocks[name] = (
+                    []
+                    if source is None
+                    else _relocate_maps(
+                        self.files[source][m], source.parent, self.output_dir
+                    )
+                )
+            result.append(self.renamed[source, m])
+        return result
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for name, lines in self.blocks.items():
+                f.write(f"newmtl {name}\n" + "".join(l + "\n" for l in lines) + "\n")
+
+
+def concatenate(parts, transforms):
+    """
+    One ObjMesh from parts [(ObjMesh, material names)] each moved by its 4x4 transform
+
+    material names map each part's face_material to a shared, global material list.
+    """
+
+    def total(attr):
+        return sum(len(getattr(m, attr)) for m, _ in parts)
+
+    vertices = np.empty((total("vertices"), 3))
+    uvs = np.empty((total("uvs"), 2))
+    normals = np.empty((total("normals"), 3))
+    n_faces = total("faces")
+    faces = np.empty((n_faces, 3), dtype=np.int64)
+    face_uvs = np.empty((n_faces, 3), dtype=np.int64)
+    face_normals = np.empty((n_faces, 3), dtype=np.int64)
+    face_material = np.empty(n_faces, dtype=np.int64)
+    materials = []
+
+    offsets = np.zeros(4, dtype=np.int64)
+    for (mesh, names), transform in zip(parts, transforms):
+        nv, nt, nn, nf = (
+            len(mesh.vertices),
+            len(mesh.uvs),
+            len(mesh.normals),
+            len(mesh.faces),
+        )
+        ov, ot, on, of = offsets
+        vertices[ov : ov + nv] = mesh.vertices @ transform[:3, :3].T + transform[:3, 3]
+        uvs[ot : ot + nt] = mesh.uvs
+        normal_matrix = np.linalg.inv(transform[:3, :3]).T
+        n = mesh.normals @ normal_matrix.T
+        normals[on : on + nn] = n / np.maximum(
+            np.linalg.norm(n, axis=-1, keepdims=True), 1e-12
+        )
+        faces[of : of + nf] = mesh.faces + ov
+        face_uvs[of : of + nf] = np.where(mesh.face_uvs >= 0, mesh.face_uvs + ot, -1)
+        face_normals[of : of + nf] = np.where(
+            mesh.face_normals >= 0, mesh.face_normals + on, -1
+        )
+        lookup = []
+        for name in names:
+            if name not in materials:
+                materials.append(name)
+            lookup.append(materials.index(name))
+        lookup = np.array(lookup + [-1], dtype=np.int64)
+        face_material[of : of + nf] = lookup[mesh.face_material]
+        offsets += (nv, nt, nn, nf)
+
+    return ObjMesh(
+        vertices,
+        uvs,
+        normals,
+        faces,
+        face_uvs,
+        face_normals,
+        face_material,
+        materials,
+        [],
+    )
+
+
+def _face_rows(mesh: ObjMesh, idx):
+    v = mesh.faces[idx] + 1
+    t = mesh.face_uvs[idx] + 1
+    n = mesh.face_normals[idx] + 1
+    has_t, has_n = (t > 0).all(axis=1), (n > 0).all(axis=1)
+    rows = []
+    for i in range(len(v)):
+        if has_t[i] and has_n[i]:
+            rows.append(
+                "f {}/{}/{} {}/{}/{} {}/{}/{}".format(
+                    *np.stack([v[i], t[i], n[i]], -1).reshape(-1)
+                )
+            )
+        elif has_t[i]:
+            rows.append(
+                "f {}/{} {}/{} {}/{}".format(*np.stack([v[i], t[i]], -1).reshape(-1))
+            )
+        elif has_n[i]:
+            rows.append(
+                "f {}//{} {}//{} {}//{}".format(*np.stack([v[i], n[i]], -1).reshape(-1))
+            )
+        else:
+            rows.append("f {} {} {}".format(*v[i]))
+    return rows
+
+
+def write_obj(path, mesh: ObjMesh, mtllib=None, name="whole"):
+    path = Path(path)
+    with open(path, "w") as f:
+        if mtllib is not None:
+            f.write(f"mtllib {mtllib}\n")
+        f.write(f"o {name}\n")
+        np.savetxt(f, mesh.vertices, fmt="v %.6f %.6f %.6f")
+        np.savetxt(f, mesh.uvs, fmt="vt %.6f %.6f")
+        np.savetxt(f, mesh.normals, fmt="vn %.4f %.4f %.4f")
+        # group faces by material, keeping the original order within each material
+        order = np.argsort(mesh.face_material, kind="stable")
+        if not len(order):
+            return
+        materials = mesh.face_material[order]
+        starts = np.flatnonzero(np.r_[True, materials[1:] != materials[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(order)]):
+            m = materials[start]
+            if m >= 0:
+                f.write(f"usemtl {mesh.materials[m]}\n")
+            rows = _face_rows(mesh, order[start:stop])
+            f.write("\n".join(rows) + "\n")
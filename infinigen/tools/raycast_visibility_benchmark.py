@@ -0,0 +1,135 @@
+# Copyright (C) 2023, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+import time
+
+import numpy as np
+
+from infinigen.core.placement.segment_bvh import SegmentBVH
+from infinigen.core.placement.visibility import (
+    FaceVertexIndex,
+    sensor_grid,
+    visibility_mask,
+)
+
+"""
+Speed of split_in_view's batched raycast visibility mask against the per-ray loop it replaced,
+on a synthetic heightfield seen by a camera flying over it. The per-ray loop casts one ray per
+sensor pixel with SegmentBVH.ray_cast and marks the vertices of each polygon hit one by one; it
+is warmed up on one frame, then timed on --reference_frames frames and scaled up to the full shot.
+
+Usage: python -m infinigen.tools.raycast_visibility_benchmark --n_faces 100000 --grid 64 --n_frames 50
+"""
+
+
+def heightfield(n_faces, seed=0):
+    """Vertices and quad faces of a bumpy grid with about n_faces triangles"""
+    n = int(np.sqrt(n_faces / 2)) + 1
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.linspace(-50, 50, n), np.linspace(-50, 50, n))
+    z = 2 * np.sin(x / 5) * np.cos(y / 7) + rng.normal(0, 0.1, x.shape)
+    verts = np.stack([x, y, z], axis=-1).reshape(-1, 3)
+    idx = np.arange(n * n).reshape(n, n)
+    quads = np.stack(
+        [idx[:-1, :-1], idx[:-1, 1:], idx[1:, 1:], idx[1:, :-1]], axis=-1
+    ).reshape(-1, 4)
+    return verts, quads
+
+
+def triangulate(quads):
+    tris = np.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]])
+    tri_faces = np.concatenate([np.arange(len(quads))] * 2)
+    return tris, tri_faces
+
+
+def look_at(location, target):
+    """matrix_world of a blender camera at location looking at target, z up"""
+    forward = np.asarray(target, dtype=np.float64) - location
+    forward /= np.linalg.norm(forward)
+    right = np.cross(forward, (0, 0, 1))
+    right /= np.linalg.norm(right)
+    up = np.cross(right, forward)
+    mat = np.eye(4)
+    mat[:3, 0], mat[:3, 1], mat[:3, 2], mat[:3, 3] = right, up, -forward, location
+    return mat
+
+
+def camera_path(n_frames):
+    for i in range(n_frames):
+        theta = 2 * np.pi * i / max(n_frames, 1)
+        location = np.array([30 * np.cos(theta), 30 * np.sin(theta), 12.0])
+        yield look_at(location, (0, 0, 0))
+
+
+def per_ray_mask(bvh, polygons, tri_faces, n_verts, frames):
+    """The loop raycast_visiblity_mask used to run, one ray_cast per pixel"""
+    mask = np.zeros(n_verts, dtype=bool)
+    for cam_matrix_world, grid, obj_matrix_world in frames:
+        invworld = np.linalg.inv(obj_matrix_world)
+        origin = cam_matrix_world[:3, 3]
+        H, W, _ = grid.shape
+        for y in range(H):
+            for x in range(W):
+                destination = cam_matrix_world[:3, :3] @ grid[y, x] + origin
+                direction = destination - origin
+                direction = direction / np.linalg.norm(direction)
+                _, _, index, dist = bvh.ray_cast(
+                    invworld[:3, :3] @ origin + invworld[:3, 3],
+                    invworld[:3, :3] @ direction,
+                )
+                if dist is None:
+                    continue
+                for vi in polygons[tri_faces[index]]:
+                    mask[vi] = True
+    return mask
+
+
+def make_frames(n_frames, grid_size, obj_matrix_world=np.eye(4)):
+    grid = sensor_grid(50, 18, 18, grid_size, grid_size)
+    return [(cam, grid, obj_matrix_world) for cam in camera_path(n_frames)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_faces", type=int, default=100000)
+    parser.add_argument("--grid", type=int, default=64)
+    parser.add_argument("--n_frames", type=int, default=50)
+    parser.add_argument("--reference_frames", type=int, default=5)
+    parser.add_argument("--n_workers", type=int, default=1)
+    parser.add_argument("--numpy", action="store_true", help="trace without numba")
+    args = parser.parse_args()
+
+    verts, quads = heightfield(args.n_faces)
+    tris, tri_faces = triangulate(quads)
+    start = time.perf_counter()
+    bvh = SegmentBVH(verts, tris, use_numba=False if args.numpy else None)
+    print(f"{len(tris)} triangles, bvh built in {time.perf_counter() - start:.2f}s")
+    face_vertices = FaceVertexIndex.from_faces(quads)
+    frames = make_frames(args.n_frames, args.grid)
+
+    # compiles the kernels of both paths, so it isn't timed below
+    visibility_mask(bvh, face_vertices, len(verts), frames[:1], tri_faces)
+    per_ray_mask(bvh, quads, tri_faces, len(verts), frames[:1])
+
+    start = time.perf_counter()
+    reference = per_ray_mask(
+        bvh, quads, tri_faces, len(verts), frames[: args.reference_frames]
+    )
+    per_frame = (time.perf_counter() - start) / args.reference_frames
+    print(
+        f"per-ray loop   {per_frame * args.n_frames:8.2f}s (from {args.reference_frames} frames)"
+    )
+
+    start = time.perf_counter()
+    mask = visibility_mask(
+        bvh, face_vertices, len(verts), frames, tri_faces, n_workers=args.n_workers
+    )
+    batched = time.perf_counter() - start
+    print(f"batched        {batched:8.2f}s")
+    print(f"speedup        {per_frame * args.n_frames / batched:8.1f}x")
+
+    partial = visibility_mask(
+        bvh, face_vertices, len(verts), frames[: args.reference_frames], tri_faces
+    )
+    assert np.array_equal(partial, reference)
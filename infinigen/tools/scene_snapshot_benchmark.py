@@ -0,0 +1,219 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+import os
+import time
+from functools import lru_cache
+from itertools import product
+from types import SimpleNamespace
+
+import numpy as np
+from tqdm import tqdm
+
+from infinigen.core.util.math import int_hash
+from infinigen.core.util.scene_snapshot import (
+    instance_items,
+    non_instance_items,
+    take_snapshot,
+)
+
+"""
+Speed of the one-pass scene snapshot against the two depsgraph walks get_all_instances and
+get_all_non_instances used to do, on synthetic depsgraph records: n_instances instances of
+n_meshes scattered meshes plus some singleton meshes and curves. Both sides get their geometry
+from the same prebuilt arrays, so only the walking, grouping and bbox work is compared.
+
+Usage: python -m infinigen.tools.scene_snapshot_benchmark --n_instances 100000 --n_meshes 2000
+"""
+
+
+class Data:
+    """Stands in for obj.data, hashed by identity like a bpy datablock"""
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+
+
+def make_records(n_instances, n_meshes, n_singletons=200, seed=0):
+    """Depsgraph object_instances stand-ins, instances of random meshes come in random order"""
+    rng = np.random.default_rng(seed)
+
+    def make_object(name, type, n_verts, modifiers=("NODES",)):
+        verts = rng.normal(size=(n_verts, 3)).astype(np.float32)
+        if type == "CURVES":
+            geometry = dict(vertex_lookup=verts, radii=np.ones(n_verts, np.float32))
+        else:
+            geometry = dict(
+                vertex_lookup=verts,
+                indices=np.arange(n_verts, dtype=np.int32),
+                loop_totals=np.full(n_verts // 4, 4, dtype=np.int32),
+                masktag=np.zeros(n_verts, dtype=np.int32),
+            )
+        lo, hi = verts.min(axis=0), verts.max(axis=0)
+        return SimpleNamespace(
+            name=name,
+            type=type,
+            data=Data(geometry),
+            modifiers=[SimpleNamespace(type=t) for t in modifiers],
+            bound_box=[tuple(np.where(c, hi, lo)) for c in product((0, 1), repeat=3)],
+        )
+
+    def matrix():
+        mat = np.eye(4)
+        mat[:3, :3] *= rng.uniform(0.5, 2)
+        mat[:3, 3] = rng.uniform(-100, 100, 3)
+        return mat
+
+    meshes = [make_object(f"scatter_{i}", "MESH", 32) for i in range(n_meshes)]
+    parents = [SimpleNamespace(name=f"scatter_parent_{i}") for i in range(20)]
+    records = []
+    for i, m in enumerate(rng.integers(0, n_meshes, n_instances)):
+        records.append(
+            SimpleNamespace(
+                object=meshes[m],
+                is_instance=True,
+                matrix_world=matrix(),
+                persistent_id=[i, int(m), *[2**31 - 1] * 6],
+                parent=parents[m % len(parents)],
+            )
+        )
+    for i in range(n_singletons):
+        kind = ["MESH", "CURVES", "LIGHT"][i % 3]
+        obj = make_object(f"singleton_{i}", kind, 40)
+        records.append(
+            SimpleNamespace(
+                object=obj,
+                is_instance=False,
+                matrix_world=matrix(),
+                persistent_id=[0] * 8,
+                parent=None,
+            )
+        )
+    return records
+
+
+cached_int_hash = lru_cache(maxsize=None)(int_hash)  # as exporting.get_id does
+
+
+def extract_geometry(obj):
+    return obj.data.geometry
+
+
+def get_id(i, name_hash=int_hash):
+    """exporting.get_id"""
+    parent_hash = (name_hash(i.parent.name) - 2**31) if (i.parent is not None) else 0
+    t = list(i.persistent_id)
+    if list(t) == [0] * 8:
+        return (0, 0, parent_hash)
+    a, b, *c = t
+    assert c == [2**31 - 1] * 6, t
+    return (a, b, parent_hash)
+
+
+def calc_aa_bbox(pts):
+    xx, yy, zz = zip(pts.min(axis=0), pts.max(axis=0))
+    return np.stack(list(product(xx, yy, zz)))
+
+
+def calc_instance_bbox(matrices, verts):
+    single_bbox = calc_aa_bbox(verts)
+    h_bbox = np.concatenate((single_bbox.T, np.ones((1, 8))), axis=0)
+    all_h_bbox = np.einsum("bij, jk -> bki", matrices, h_bbox)
+    all_bbox = all_h_bbox[..., :3] / all_h_bbox[..., 3:]
+    return calc_aa_bbox(all_bbox.reshape((-1, 3))), single_bbox
+
+
+def two_pass(records, devnull):
+    """get_all_instances and get_all_non_instances as they were, plus their bbox computation"""
+    vertex_info = {}
+    pbar = tqdm(records, file=devnull)
+    for deps_instance in pbar:
+        obj = deps_instance.object
+        pbar.set_description(f"Finding Instances: {obj.name[:20].ljust(20)}")
+        if (
+            (obj.type == "MESH")
+            and (deps_instance.is_instance)
+            and ("PARTICLE_SYSTEM" not in {m.type for m in obj.modifiers})
+        ):
+            mat = np.asarray(deps_instance.matrix_world, dtype=np.float32).copy()
+            if obj.data not in vertex_info:
+                vertex_info[obj.data] = dict(
+                    extract_geometry(obj),
+                    is_instance=True,
+                    matrices=[],
+                    instance_ids=[],
+                    name=obj.name,
+                )
+            vertex_info[obj.data]["matrices"].append(mat)
+            vertex_info[obj.data]["instance_ids"].append(get_id(deps_instance))
+    items = []
+    for v in vertex_info.values():
+        v["bbox"], v["instance_bbox"] = calc_instance_bbox(
+            np.asarray(v["matrices"]), v["vertex_lookup"]
+        )
+        items += [(v["vertex_lookup"].shape[0], v["name"]), v]
+
+    pbar = tqdm(records, file=devnull)
+    for deps_instance in pbar:
+        obj = deps_instance.object
+        pbar.set_description(f"Finding Non-Instances: {obj.name[:20].ljust(20)}")
+        mat = np.asarray(deps_instance.matrix_world, dtype=np.float32).copy()[None]
+        if obj.type not in ("MESH", "CURVES") or deps_instance.is_instance:
+            continue
+        if "PARTICLE_SYSTEM" in {m.type for m in obj.modifiers}:
+            continue
+        geometry = extract_geometry(obj)
+        non_aa_bbox = np.asarray(
+            [mat[0, :3, :3] @ v + mat[0, :3, 3] for v in obj.bound_box],
+            dtype=np.float32,
+        )
+        num_verts = len(geometry["vertex_lookup"])
+        if obj.type == "CURVES":
+            num_verts //= 5
+        items += [
+            (num_verts, obj.name),
+            dict(
+                geometry,
+                name=obj.name,
+                matrices=mat,
+                instance_ids=[get_id(deps_instance)],
+                is_instance=False,
+                instance_bbox=calc_aa_bbox(non_aa_bbox),
+            ),
+        ]
+    return items
+
+
+def one_pass(records, devnull):
+    snapshot = take_snapshot(
+        records, lambda i: get_id(i, cached_int_hash), extract_geometry
+    )
+    return [*instance_items(snapshot), *non_instance_items(snapshot)]
+
+
+def timed(fn, records, devnull):
+    start = time.perf_counter()
+    items = fn(records, devnull)
+    return time.perf_counter() - start, items
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_instances", type=int, default=100000)
+    parser.add_argument("--n_meshes", type=int, default=2000)
+    parser.add_argument("--n_sizes", type=int, default=4)
+    args = parser.parse_args()
+
+    print(
+        f"{'instances':>10} {'two pass':>10} {'one pass':>10} {'us/inst':>8} {'speedup':>8}"
+    )
+    with open(os.devnull, "w") as devnull:
+        for k in reversed(range(args.n_sizes)):
+            n = args.n_instances // 2**k
+            records = make_records(n, args.n_meshes)
+            before, _ = timed(two_pass, records, devnull)
+            after, _ = timed(one_pass, records, devnull)
+            print(
+                f"{n:>10} {before:>9.2f}s {after:>9.2f}s {after / n * 1e6:>8.2f} {before / after:>7.1f}x"
+            )
@@ -0,0 +1,80 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+from pathlib import Path
+
+from infinigen.core.util.checkpoint import (
+    MANIFEST_NAME,
+    load_manifest,
+    prune,
+    stale_keys,
+)
+
+"""
+Inspect or prune the stage checkpoints of a scene folder.
+
+Usage:
+  python -m infinigen.tools.stage_checkpoints <scene_folder>                  # list stages
+  python -m infinigen.tools.stage_checkpoints <scene_folder> --prune stale    # drop entries unused by the last run
+  python -m infinigen.tools.stage_checkpoints <scene_folder> --prune failed   # drop running/failed/corrupt entries
+  python -m infinigen.tools.stage_checkpoints <scene_folder> --prune all
+  python -m infinigen.tools.stage_checkpoints <scene_folder> --prune_stage <name>  # force a stage to rerun
+"""
+
+
+def checkpoint_folder(folder):
+    folder = Path(folder)
+    if (folder / MANIFEST_NAME).exists():
+        return folder
+    return folder / "checkpoints"
+
+
+def format_size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.1f}{unit}" if unit != "B" else f"{n}B"
+        n /= 1024
+
+
+def print_manifest(manifest):
+    entries = sorted(manifest["stages"].values(), key=lambda e: e["updated"])
+    stale = set(stale_keys(manifest))
+    print(f"{'stage':<32} {'status':<9} {'serializer':<10} {'size':>9}  key")
+    for e in entries:
+        status = "stale" if e["key"] in stale else e["status"]
+        print(
+            f"{e['name']:<32} {status:<9} {e['serializer']:<10} "
+            f"{format_size(e['size']):>9}  {e['key'][:16]}"
+        )
+    total = sum(e["size"] for e in entries)
+    print(f"{len(entries)} checkpoints, {format_size(total)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "folder", type=Path, help="Scene output folder or its checkpoints folder"
+    )
+    parser.add_argument("--prune", choices=["stale", "failed", "all"], default=None)
+    parser.add_argument("--prune_stage", type=str, default=None)
+    args = parser.parse_args()
+
+    folder = checkpoint_folder(args.folder)
+    manifest = load_manifest(folder / MANIFEST_NAME)
+    entries = manifest["stages"].values()
+    keys = []
+    if args.prune == "stale":
+        keys = stale_keys(manifest)
+    elif args.prune == "failed":
+        keys = [e["key"] for e in entries if e["status"] != "complete"]
+    elif args.prune == "all":
+        keys = [e["key"] for e in entries]
+    if args.prune_stage is not None:
+        keys += [e["key"] for e in entries if e["name"] == args.prune_stage]
+
+    if args.prune is not None or args.prune_stage is not None:
+        freed = prune(folder, keys)
+        print(f"Pruned {len(set(keys))} checkpoints, freed {format_size(freed)}")
+        manifest = load_manifest(folder / MANIFEST_NAME)
+    print_manifest(manifest)
@@ -0,0 +1,370 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+import json
+import logging
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from infinigen.tools.obj_io import load_obj
+from infinigen.tools.urdf_to_whole import (
+    find_all_urdfs,
+    link_fk,
+    parse_urdf,
+    part_transform,
+    resolve_mesh_path,
+)
+
+logger = logging.getLogger(__name__)
+
+"""
+Seeded preview thumbnails of articulated assets, rasterized on the CPU with numpy.
+
+Each URDF is posed at a few joint configurations (rest plus seeded samples within the joint limits,
+or given explicitly) and rendered from n_views cameras orbiting the asset. Rows of the saved grid
+are configurations and columns are views. Modes are "flat" (per-link colors, headlight shading),
+"normal" (camera-space normals) and "depth" (near is bright).
+
+Usage: python -m infinigen.tools.thumbnails <folder> [--modes flat normal depth] [--n_workers N]
+Output:
+- <urdf folder>/thumbnail_<mode>.png, or <output_folder>/<asset>_<mode>.png
+"""
+
+CONTINUOUS_RANGE = (-np.pi, np.pi)
+BACKGROUND = {"flat": 255, "normal": 0, "depth": 0}
+MODES = ("flat", "normal", "depth")
+
+
+def look_at(eye, target, up=(0, 0, 1)):
+    """World-to-camera matrix of a camera at eye looking at target, along its -z axis"""
+    eye, target, up = (np.asarray(a, dtype=np.float64) for a in (eye, target, up))
+    forward = target - eye
+    forward /= np.linalg.norm(forward)
+    right = np.cross(forward, up)
+    if np.linalg.norm(right) < 1e-8:
+        right = np.cross(forward, (0, 1, 0))
+    right /= np.linalg.norm(right)
+    true_up = np.cross(right, forward)
+    m = np.eye(4)
+    m[:3, :3] = np.stack([right, true_up, -forward])
+    m[:3, 3] = -m[:3, :3] @ eye
+    return m
+
+
+def orbit_cameras(center, radius, n_views, fov, elevation=np.deg2rad(25), seed=0):
+    """n_views world-to-camera matrices evenly around center, with a seeded start angle"""
+    rng = np.random.default_rng(seed)
+    azimuth = rng.uniform(0, 2 * np.pi) + 2 * np.pi * np.arange(n_views) / n_views
+    distance = max(radius, 1e-3) / np.sin(fov / 2) * 1.05
+    offsets = distance * np.stack(
+        [
+            np.cos(azimuth) * np.cos(elevation),
+            np.sin(azimuth) * np.cos(elevation),
+            np.full(n_views, np.sin(elevation)),
+        ],
+        axis=-1,
+    )
+    return [look_at(center + o, center) for o in offsets]
+
+
+def project(points, world_to_cam, fov, resolution):
+    """Pixel coordinates (..., 2) and positive depth (...) of world points"""
+    cam = points @ world_to_cam[:3, :3].T + world_to_cam[:3, 3]
+    depth = -cam[..., 2]
+    focal = 1 / np.tan(fov / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ndc = focal * cam[..., :2] / depth[..., None]
+    px = (ndc[..., 0] + 1) / 2 * resolution
+    py = (1 - ndc[..., 1]) / 2 * resolution
+    return np.stack([px, py], axis=-1), depth
+
+
+def rasterize(tri_px, tri_depth, resolution, near=1e-4, max_candidates=1 << 22):
+    """
+    Z-buffered visibility of triangles given in pixel coordinates
+
+    tri_px is (F, 3, 2), tri_depth (F, 3). Every triangle is expanded to the pixel centers in its
+    bounding box, in chunks of at most max_candidates pixels, and tested with edge functions;
+    depth is interpolated perspective-correctly. Returns face index (H, W), -1 for background,
+    and depth (H, W), inf for background.
+    """
+    n_pixels = resolution * resolution
+    zbuf = np.full(n_pixels, np.inf)
+    fbuf = np.full(n_pixels, -1, dtype=np.int64)
+
+    lo = np.ceil(tri_px.min(axis=1) - 0.5).astype(np.int64)
+    hi = np.floor(tri_px.max(axis=1) - 0.5).astype(np.int64)
+    lo, hi = np.maximum(lo, 0), np.minimum(hi, resolution - 1)
+    valid = np.all(hi >= lo, axis=1) & np.all(tri_depth > near, axis=1)
+    v0, v1, v2 = tri_px[:, 0], tri_px[:, 1], tri_px[:, 2]
+    area = (v1[:, 0] - v0[:, 0]) * (v2[:, 1] - v0[:, 1]) - (v1[:, 1] - v0[:, 1]) * (
+        v2[:, 0] - v0[:, 0]
+    )
+    valid &= np.abs(area) > 1e-12
+    faces = np.flatnonzero(valid)
+    if len(faces) == 0:
+        return fbuf.reshape(resolution, resolution), zbuf.reshape(
+            resolution, resolution
+        )
+
+    width = hi[faces, 0] - lo[faces, 0] + 1
+    counts = width * (hi[faces, 1] - lo[faces, 1] + 1)
+    chunk_ids = np.cumsum(counts) // max_candidates
+    for chunk in np.unique(chunk_ids):
+        sel = chunk_ids == chunk
+        f, c, w = faces[sel], counts[sel], width[sel]
+        owner = np.repeat(np.arange(len(f)), c)
+        local = np.arange(c.sum()) - np.repeat(np.cumsum(c) - c, c)
+        fi = f[owner]
+        x = lo[fi, 0] + local % w[owner]
+        y = lo[fi, 1] + local // w[owner]
+        p = np.stack([x + 0.5, y + 0.5], axis=-1)
+
+        def edge(a, b):
+            return (b[:, 0] - a[:, 0]) * (p[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (
+                p[:, 0] - a[:, 0]
+            )
+
+        a = area[fi]
+        b0 = edge(v1[fi], v2[fi]) / a
+        b1 = edge(v2[fi], v0[fi]) / a
+        b2 = 1 - b0 - b1
+        inside = (b0 >= 0) & (b1 >= 0) & (b2 >= 0)
+        if not inside.any():
+            continue
+        d = tri_depth[fi[inside]]
+        inv_z = b0[inside] / d[:, 0] + b1[inside] / d[:, 1] + b2[inside] / d[:, 2]
+        z = 1 / inv_z
+        pix = y[inside] * resolution + x[inside]
+        fid = fi[inside]
+
+        # nearest fragment per pixel within the chunk, then merge into the buffers
+        order = np.lexsort((z, pix))
+        pix, z, fid = pix[order], z[order], fid[order]
+        first = np.r_[True, pix[1:] != pix[:-1]]
+        pix, z, fid = pix[first], z[first], fid[first]
+        closer = z < zbuf[pix]
+        zbuf[pix[closer]] = z[closer]
+        fbuf[pix[closer]] = fid[closer]
+
+    return fbuf.reshape(resolution, resolution), zbuf.reshape(resolution, resolution)
+
+
+def face_normals(triangles):
+    n = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    return n / np.maximum(np.linalg.norm(n, axis=-1, keepdims=True), 1e-12)
+
+
+def link_palette(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.25, 0.9, (n, 3))
+
+
+def shade(mode, face_id, depth, normals_cam, face_color):
+    """uint8 (H, W, 3) image of a rasterized view"""
+    hit = face_id >= 0
+    image = np.full(face_id.shape + (3,), BACKGROUND[mode], dtype=np.float64) / 255
+    if not hit.any():
+        return (image * 255).astype(np.uint8)
+    n = normals_cam[face_id[hit]]
+    # meshes may have inconsistent winding, so always face normals towards the camera
+    n = np.where(n[:, 2:] < 0, -n, n)
+    match mode:
+        case "flat":
+            image[hit] = face_color[face_id[hit]] * (0.3 + 0.7 * n[:, 2:])
+        case "normal":
+            image[hit] = n * 0.5 + 0.5
+        case "depth":
+            z = depth[hit]
+            span = max(z.max() - z.min(), 1e-9)
+            image[hit] = (1 - 0.8 * (z - z.min()) / span)[:, None]
+        case _:
+            raise ValueError(f"Unrecognized thumbnail {mode=}")
+    return (np.clip(image, 0, 1) * 255).astype(np.uint8)
+
+
+def render_views(triangles, face_color, cameras, fov, resolution, modes=("flat",)):
+    """{mode: [image per camera]} of world-space triangles (F, 3, 3)"""
+    normals = face_normals(triangles)
+    result = {m: [] for m in modes}
+    for world_to_cam in cameras:
+        tri_px, tri_depth = project(triangles, world_to_cam, fov, resolution)
+        face_id, depth = rasterize(tri_px, tri_depth, resolution)
+        normals_cam = normals @ world_to_cam[:3, :3].T
+        for m in modes:
+            result[m].append(shade(m, face_id, depth, normals_cam, face_color))
+    return result
+
+
+def tile(images, n_cols):
+    """Grid of equally sized (H, W, 3) images, row-major"""
+    h, w, c = images[0].shape
+    n_rows = -(-len(images) // n_cols)
+    grid = np.zeros((n_rows * h, n_cols * w, c), dtype=images[0].dtype)
+    for i, image in enumerate(images):
+        r, col = divmod(i, n_cols)
+        grid[r * h : (r + 1) * h, col * w : (col + 1) * w] = image
+    return grid
+
+
+def joint_range(joint):
+    if joint.joint_type == "continuous":
+        return CONTINUOUS_RANGE
+    if joint.joint_type not in ("revolute", "prismatic") or joint.limit is None:
+        return None
+    return joint.limit
+
+
+def sample_configs(joints, n_configs, seed=0):
+    """Rest configuration followed by n_configs - 1 seeded uniform samples within joint limits"""
+    rng = np.random.default_rng(seed)
+    ranges = {j.name: joint_range(j) for j in joints}
+    ranges = {k: r for k, r in ranges.items() if r is not None and r[0] <= r[1]}
+    cfgs = [{k: float(np.clip(0, *r)) for k, r in ranges.items()}]
+    for _ in range(n_configs - 1):
+        cfgs.append({k: float(rng.uniform(*r)) for k, r in ranges.items()})
+    return cfgs
+
+
+class ArticulatedAsset:
+    """Link meshes of a URDF, loaded once and posed for any joint configuration"""
+
+    def __init__(self, urdf_path, sidecar=True):
+        self.links, visuals, self.joints = parse_urdf(urdf_path)
+        self.parts = []
+        for visual in visuals:
+            mesh = load_obj(
+                resolve_mesh_path(urdf_path, visual.filename), sidecar=sidecar
+            )
+            self.parts.append((visual, mesh.vertices[mesh.faces]))
+        link_index = {name: i for i, name in enumerate(self.links)}
+        self.face_link = np.concatenate(
+            [np.full(len(t), link_index[v.link]) for v, t in self.parts]
+            or [np.zeros(0, dtype=np.int64)]
+        )
+
+    def triangles(self, cfg=None):
+        """World-space (F, 3, 3) triangles of all links at joint configuration cfg"""
+        poses = link_fk(self.links, self.joints, cfg)
+        result = [np.zeros((0, 3, 3))]
+        for visual, tris in self.parts:
+            if visual.link not in poses:
+                continue
+            t = part_transform(poses[visual.link], visual, "urdf")
+            result.append(tris @ t[:3, :3].T + t[:3, 3])
+        return np.concatenate(result)
+
+
+def render_urdf(
+    urdf_path,
+    output=None,
+    cfgs=None,
+    n_configs=3,
+    n_views=4,
+    resolution=256,
+    fov=np.deg2rad(40),
+    modes=("flat",),
+    seed=0,
+    sidecar=True,
+):
+    """
+    Render a configs x views grid per mode for one URDF, returning {mode: written path}
+
+    output is a path prefix, by default <urdf folder>/thumbnail; files are <output>_<mode>.png.
+    """
+    urdf_path = Path(urdf_path)
+    output = Path(output) if output is not None else urdf_path.parent / "thumbnail"
+    asset = ArticulatedAsset(urdf_path, sidecar=sidecar)
+    if cfgs is None:
+        cfgs = sample_configs(asset.joints, n_configs, seed)
+    posed = [asset.triangles(cfg) for cfg in cfgs]
+    if sum(len(t) for t in posed) == 0:
+        raise ValueError(f"{urdf_path} has no visual geometry")
+
+    # frame every configuration with the same cameras so that motion is visible
+    points = np.concatenate([t.reshape(-1, 3) for t in posed])
+    center = (points.min(axis=0) + points.max(axis=0)) / 2
+    radius = np.linalg.norm(points - center, axis=-1).max()
+    cameras = orbit_cameras(center, radius, n_views, fov, seed=seed)
+    face_color = link_palette(len(asset.links), seed)[asset.face_link]
+
+    images = {m: [] for m in modes}
+    for tris in posed:
+        for m, views in render_views(
+            tris, face_color, cameras, fov, resolution, modes
+        ).items():
+            images[m].extend(views)
+
+    written = {}
+    for m, views in images.items():
+        path = output.parent / f"{output.name}_{m}.png"
+        Image.fromarray(tile(views, n_views)).save(path)
+        written[m] = str(path)
+    return written
+
+
+def _render_or_error(urdf_path, output_folder=None, root=None, **kwargs):
+    output = None
+    if output_folder is not None:
+        rel = Path(urdf_path).parent.relative_to(root)
+        name = "_".join(rel.parts) or Path(urdf_path).stem
+        output = Path(output_folder) / name
+    try:
+        return render_urdf(urdf_path, output=output, **kwargs)
+    except Exception as e:
+        logger.warning(f"Failed to render {urdf_path}: {e!r}")
+        return None
+
+
+def render_folder(root, n_workers=1, output_folder=None, **kwargs):
+    """render_urdf() for every URDF under root, returning {urdf: {mode: path} or None}"""
+    urdfs = find_all_urdfs(root)
+    if output_folder is not None:
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+    func = partial(_render_or_error, output_folder=output_folder, root=root, **kwargs)
+    if n_workers == 1:
+        results = [func(p) for p in tqdm(urdfs)]
+    else:
+        with Pool(n_workers) as p:
+            results = list(tqdm(p.imap(func, urdfs), total=len(urdfs)))
+    return dict(zip(urdfs, results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--output_folder", type=Path, default=None)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["flat"])
+    parser.add_argument("--n_views", type=int, default=4)
+    parser.add_argument("--n_configs", type=int, default=3)
+    parser.add_argument(
+        "--configs",
+        type=Path,
+        default=None,
+        help="JSON list of {joint name: value} used for every asset instead of sampling",
+    )
+    parser.add_argument("--resolution", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n_workers", type=int, default=1)
+    args = parser.parse_args()
+
+    cfgs = json.loads(args.configs.read_text()) if args.configs is not None else None
+    results = render_folder(
+        args.folder,
+        n_workers=args.n_workers,
+        output_folder=args.output_folder,
+        cfgs=cfgs,
+        n_configs=args.n_configs,
+        n_views=args.n_views,
+        resolution=args.resolution,
+        modes=tuple(args.modes),
+        seed=args.seed,
+    )
+    n_failed = sum(r is None for r in results.values())
+    print(f"{len(results) - n_failed}/{len(results)} assets rendered")
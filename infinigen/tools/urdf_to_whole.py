@@ -0,0 +1,268 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import argparse
+import logging
+import os
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from infinigen.tools.obj_io import MaterialLibrary, concatenate, load_obj, write_obj
+
+logger = logging.getLogger(__name__)
+
+"""
+Headless reconstruction of the assembled mesh of an articulated asset from its URDF.
+
+The URDF is parsed directly (no mesh loading), link poses are computed by forward kinematics at a
+given joint configuration, and each visual OBJ is read with a small numpy parser whose result can
+be cached as an .npz sidecar. All parts are written into pre-sized buffers and exported as a
+single whole.obj (+ whole.mtl with the parts' materials) next to the URDF.
+
+Usage: python -m infinigen.tools.urdf_to_whole <folder> [--n_workers N]
+"""
+
+# obj files are y-up; blender imports them z-up via (x, y, z) -> (x, -z, y)
+OBJ_TO_BLENDER = np.array(
+    [[1, 0, 0, 0], [0, 0, -1, 0], [0, 1, 0, 0], [0, 0, 0, 1]], dtype=np.float64
+)
+
+
+def find_all_urdfs(path) -> list[str]:
+    urdfs = []
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            if file.endswith(".urdf"):
+                urdfs.append(os.path.join(root, file))
+    return sorted(urdfs)
+
+
+def rpy_matrix(rpy):
+    r, p, y = rpy
+    cr, sr, cp, sp, cy, sy = (
+        np.cos(r),
+        np.sin(r),
+        np.cos(p),
+        np.sin(p),
+        np.cos(y),
+        np.sin(y),
+    )
+    return np.array(
+        [
+            [cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+            [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+            [-sp, cp * sr, cp * cr],
+        ]
+    )
+
+
+def axis_angle_matrix(axis, angle):
+    axis = np.asarray(axis, dtype=np.float64)
+    axis = axis / np.linalg.norm(axis)
+    k = np.array(
+        [[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]]
+    )
+    return np.eye(3) + np.sin(angle) * k + (1 - np.cos(angle)) * k @ k
+
+
+def _floats(text, default):
+    return np.array(text.split(), dtype=np.float64) if text else np.array(default)
+
+
+def _origin(elem):
+    """4x4 transform of an <origin xyz rpy> child of elem, identity if absent"""
+    m = np.eye(4)
+    o = elem.find("origin") if elem is not None else None
+    if o is not None:
+        m[:3, :3] = rpy_matrix(_floats(o.get("rpy"), (0, 0, 0)))
+        m[:3, 3] = _floats(o.get("xyz"), (0, 0, 0))
+    return m
+
+
+@dataclass
+class URDFVisual:
+    link: str
+    filename: str
+    origin: np.ndarray
+    scale: np.ndarray
+
+
+@dataclass
+class URDFJoint:
+    name: str
+    joint_type: str
+    parent: str
+    child: str
+    origin: np.ndarray
+    axis: np.ndarray
+    limit: tuple = None
+
+
+def parse_urdf(urdf_path):
+    """(link names, visual meshes, joints) of a URDF, without loading any mesh"""
+    root = ET.parse(urdf_path).getroot()
+    links, visuals, joints = [], [], []
+    for link in root.findall("link"):
+        links.append(link.get("name"))
+        for visual in link.findall("visual"):
+            mesh = visual.find("geometry/mesh")
+            if mesh is None:
+                continue
+            visuals.append(
+                URDFVisual(
+                    link.get("name"),
+                    mesh.get("filename"),
+                    _origin(visual),
+                    _floats(mesh.get("scale"), (1, 1, 1)),
+                )
+            )
+    for joint in root.findall("joint"):
+        axis = joint.find("axis")
+        limit = joint.find("limit")
+        if limit is not None:
+            limit = float(limit.get("lower", 0)), float(limit.get("upper", 0))
+        joints.append(
+            URDFJoint(
+                joint.get("name"),
+                joint.get("type"),
+                joint.find("parent").get("link"),
+                joint.find("child").get("link"),
+                _origin(joint),
+                _floats(axis.get("xyz") if axis is not None else None, (1, 0, 0)),
+                limit,
+            )
+        )
+    return links, visuals, joints
+
+
+def joint_motion(joint: URDFJoint, value):
+    m = np.eye(4)
+    if value == 0:
+        return m
+    if joint.joint_type in ("revolute", "continuous"):
+        m[:3, :3] = axis_angle_matrix(joint.axis, value)
+    elif joint.joint_type == "prismatic":
+        m[:3, 3] = joint.axis / np.linalg.norm(joint.axis) * value
+    return m
+
+
+def link_fk(links, joints, cfg=None):
+    """{link: pose in the root frame} with joints set to cfg {joint name: value}, default 0"""
+    cfg = cfg or {}
+    children = {}
+    for j in joints:
+        children.setdefault(j.parent, []).append(j)
+    child_links = {j.child for j in joints}
+    poses = {}
+    stack = [(l, np.eye(4)) for l in links if l not in child_links]
+    while stack:
+        name, pose = stack.pop()
+        poses[name] = pose
+        for j in children.get(name, []):
+            motion = joint_motion(j, cfg.get(j.name, 0))
+            stack.append((j.child, pose @ j.origin @ motion))
+    return poses
+
+
+def resolve_mesh_path(urdf_path, filename):
+    if filename.startswith("package://"):
+        filename = filename[len("package://") :]
+    path = Path(filename)
+    return path if path.is_absolute() else Path(urdf_path).parent / path
+
+
+def part_transform(pose, visual: URDFVisual, axes):
+    """Matrix applied to the raw obj coordinates of a visual"""
+    scale = np.diag(np.append(visual.scale, 1))
+    transform = pose @ visual.origin @ scale
+    if axes == "blender":
+        # the urdf frames are interpreted in blender's z-up frame, as when importing parts there
+        return np.linalg.inv(OBJ_TO_BLENDER) @ transform @ OBJ_TO_BLENDER
+    elif axes == "urdf":
+        return transform
+    raise ValueError(f"Unrecognized {axes=}")
+
+
+def reconstruct_whole(
+    urdf_path, output=None, cfg=None, axes="blender", sidecar=True, materials=True
+):
+    """
+    Write the assembled mesh of a URDF at joint configuration cfg, returning the output path
+
+    axes="blender" applies the URDF transforms in blender's z-up frame to the y-up obj parts,
+    matching whole.obj files made by importing the parts into blender; axes="urdf" applies them
+    to the raw obj coordinates, as URDF viewers do.
+    """
+    urdf_path = Path(urdf_path)
+    output = Path(output) if output is not None else urdf_path.parent / "whole.obj"
+    links, visuals, joints = parse_urdf(urdf_path)
+    poses = link_fk(links, joints, cfg)
+
+    parts, transforms = [], []
+    library = MaterialLibrary(output.parent)
+    for visual in visuals:
+        if visual.link not in poses:
+            logger.warning(
+                f"{urdf_path}: link {visual.link} is not connected to a root"
+            )
+            continue
+        mesh_path = resolve_mesh_path(urdf_path, visual.filename)
+        mesh = load_obj(mesh_path, sidecar=sidecar)
+        parts.append((mesh, library.names(mesh_path, mesh)))
+        transforms.append(part_transform(poses[visual.link], visual, axes))
+
+    whole = concatenate(parts, transforms)
+    mtllib = None
+    if materials and library.blocks:
+        mtllib = output.with_suffix(".mtl").name
+        library.write(output.with_suffix(".mtl"))
+    write_obj(output, whole, mtllib=mtllib, name=output.stem)
+    return output
+
+
+def _reconstruct_or_error(urdf_path, **kwargs):
+    try:
+        return str(reconstruct_whole(urdf_path, **kwargs))
+    except Exception as e:
+        logger.warning(f"Failed to reconstruct {urdf_path}: {e!r}")
+        return None
+
+
+def reconstruct_folder(folder, n_workers=1, **kwargs):
+    """reconstruct_whole() for every URDF under folder, returning {urdf: output or None}"""
+    urdfs = find_all_urdfs(folder)
+    func = partial(_reconstruct_or_error, **kwargs)
+    if n_workers == 1:
+        results = [func(p) for p in tqdm(urdfs)]
+    else:
+        with Pool(n_workers) as p:
+            results = list(tqdm(p.imap(func, urdfs, chunksize=4), total=len(urdfs)))
+    return dict(zip(urdfs, results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--n_workers", type=int, default=1)
+    parser.add_argument("--axes", choices=["blender", "urdf"], default="blender")
+    parser.add_argument(
+        "--no_sidecar",
+        action="store_true",
+        help="Do not read or write .npz caches of parsed part meshes",
+    )
+    args = parser.parse_args()
+
+    results = reconstruct_folder(
+        args.folder,
+        n_workers=args.n_workers,
+        axes=args.axes,
+        sidecar=not args.no_sidecar,
+    )
+    n_failed = sum(r is None for r in results.values())
+    print(f"{len(results) - n_failed}/{len(results)} reconstructed")
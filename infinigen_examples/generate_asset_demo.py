@@ -27,8 +27,8 @@ from infinigen.assets.objects.creatures.util.animation.run_cycle import follow_p
 from infinigen.assets.scatters import grass, pebbles, pine_needle, pinecone
 from infinigen.assets.weather import kole_clouds
 from infinigen.core import execute_tasks, init, surface
+from infinigen.core.placement import animation_policy, placement
 from infinigen.core.placement import camera as cam_util
-from infinigen.core.placement import placement
 from infinigen.core.placement.split_in_view import split_inview
 from infinigen.core.util import blender as butil
 from infinigen.terrain import Terrain
@@ -122,9 +122,7 @@ def compose_scene(
         on_the_fly_asset_folder=output_folder / "assets",
     )
     terrain_mesh = terrain.coarse_terrain()
-    scene_bvh = bvhtree.BVHTree.FromObject(
-        terrain_mesh, bpy.context.evaluated_depsgraph_get()
-    )
+    scene_bvh = animation_policy.SceneBVH(terrain_mesh)
     if asset_factory is not None:
         center = find_flat_location(
             terrain_mesh,
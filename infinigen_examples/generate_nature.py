@@ -77,11 +77,12 @@ from infinigen.assets.scatters import (
 )
 from infinigen.assets.scatters.utils.selection import scatter_lower, scatter_upward
 from infinigen.core import execute_tasks, init, surface
+from infinigen.core.placement import animation_policy, density, placement, split_in_view
 from infinigen.core.placement import camera as cam_util
-from infinigen.core.placement import density, placement, split_in_view
 from infinigen.core.util import blender as butil
 from infinigen.core.util import logging as logging_util
 from infinigen.core.util import pipeline
+from infinigen.core.util.checkpoint import checkpointable
 from infinigen.core.util.imu import save_imu_tum_files
 from infinigen.core.util.math import FixedSeed, int_hash
 from infinigen.core.util.organization import Tags, Task
@@ -115,9 +116,7 @@ def compose_nature(output_folder, scene_seed, **params):
         terrain_mesh = butil.create_noise_plane()
         density.set_tag_dict({})
 
-    scene_bvh = mathutils.bvhtree.BVHTree.FromObject(
-        terrain_mesh, bpy.context.evaluated_depsgraph_get()
-    )
+    scene_bvh = animation_policy.SceneBVH(terrain_mesh)
 
     land_domain = params.get("land_domain_tags")
     underwater_domain = params.get("underwater_domain_tags")
@@ -128,6 +127,7 @@ def compose_nature(output_folder, scene_seed, **params):
     season = p.run_stage("season", trees.random_season, use_chance=False)
     logging.info(f"{season=}")
 
+    @checkpointable("pickle", params=("max_tree_species", "tree_density"))
     def choose_forest_params():
         # params to be shared between unique and instanced trees
         n_tree_species = randint(1, params.get("max_tree_species", 3) + 1)
@@ -146,6 +146,7 @@ def compose_nature(output_folder, scene_seed, **params):
         "forest_params", choose_forest_params, use_chance=False
     )
 
+    @checkpointable("blend", params=("land_domain_tags",))
     def add_trees(terrain_mesh):
         for i, params in enumerate(tree_species_params):
             fac = trees.TreeFactory(np.random.randint(1e7), coarse=True)
@@ -161,6 +162,9 @@ def compose_nature(output_folder, scene_seed, **params):
 
     p.run_stage("trees", add_trees, terrain_mesh)
 
+    @checkpointable(
+        "blend", params=("max_bush_species", "bush_density", "land_domain_tags")
+    )
     def add_bushes(terrain_mesh):
         n_bush_species = randint(1, params.get("max_bush_species", 2) + 1)
         for i in range(n_bush_species):
@@ -193,6 +197,10 @@ def compose_nature(output_folder, scene_seed, **params):
 
     p.run_stage("clouds", add_clouds, terrain_mesh)
 
+    @checkpointable(
+        "blend",
+        params=("max_boulder_species", "boulder_density", "nonliving_domain_tags"),
+    )
     def add_boulders(terrain_mesh):
         n_boulder_species = randint(1, params.get("max_boulder_species", 5))
         for i in range(n_boulder_species):
@@ -399,7 +407,7 @@ def compose_nature(output_folder, scene_seed, **params):
         butil.modify_mesh(terrain_near, "SUBSURF", levels=2, apply=True)
 
         deps = bpy.context.evaluated_depsgraph_get()
-        terrain_inview_bvh = mathutils.bvhtree.BVHTree.FromObject(terrain_inview, deps)
+        terrain_inview_bvh = animation_policy.SceneBVH(terrain_inview, deps)
 
     p.run_stage("caustics", lambda: lighting.caustics_lamp.add_caustics(terrain_near))
 
@@ -728,6 +736,7 @@ def compose_nature(output_folder, scene_seed, **params):
     p.run_stage("tilted_river", add_tilted_river, use_chance=False)
 
     p.save_results(output_folder / "pipeline_coarse.csv")
+    p.close()
     return {
         "height_offset": 0,
         "whole_bbox": None,
@@ -951,6 +960,7 @@ def populate_scene(output_folder, scene_seed, **params):
     )
 
     p.save_results(output_folder / "pipeline_fine.csv")
+    p.close()
 
 
 def main(args):
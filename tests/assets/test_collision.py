@@ -0,0 +1,51 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+import trimesh
+
+from infinigen.assets.utils import collision
+
+
+def l_shape():
+    a = trimesh.creation.box(extents=(2, 0.2, 0.2))
+    b = trimesh.creation.box(extents=(0.2, 2, 0.2))
+    b.apply_translation((-0.9, 0.9, 0))
+    return trimesh.util.concatenate([a, b]).subdivide().subdivide()
+
+
+def test_bisect_reduces_concave_hull_volume():
+    mesh = l_shape()
+    hulls = collision.decompose(
+        mesh.vertices, mesh.faces, max_hulls=8, max_hull_vertices=32, method="bisect"
+    )
+    assert 1 < len(hulls) <= 8
+    assert all(len(h.vertices) <= 32 for h in hulls)
+    assert sum(h.volume for h in hulls) < 0.5 * mesh.convex_hull.volume
+    # every input vertex is covered by some hull
+    inside = np.zeros(len(mesh.vertices), dtype=bool)
+    for h in hulls:
+        inside |= h.contains(mesh.vertices * 0.99 + mesh.centroid * 0.01) | (
+            np.abs(h.nearest.signed_distance(mesh.vertices)) < 1e-6
+        )
+    assert inside.mean() > 0.95
+
+
+def test_vertex_budget():
+    sphere = trimesh.creation.icosphere(subdivisions=4)
+    (hull,) = collision.decompose(
+        sphere.vertices, sphere.faces, max_hull_vertices=20, method="hull"
+    )
+    assert len(hull.vertices) <= 20
+    assert hull.volume > 0.5 * sphere.volume
+
+
+def test_cache_roundtrip(tmp_path):
+    mesh = l_shape()
+    hulls = collision.collision_hulls(mesh, method="bisect", cache_root=tmp_path)
+    assert len(list(tmp_path.glob("*/*.npz"))) == 1
+    cached = collision.collision_hulls(mesh, method="bisect", cache_root=tmp_path)
+    assert len(cached) == len(hulls)
+    for a, b in zip(hulls, cached):
+        assert np.allclose(a.vertices, b.vertices)
@@ -0,0 +1,44 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+import trimesh
+
+from infinigen.assets.utils import lod
+
+
+def test_decimate_hits_target_within_error():
+    mesh = trimesh.creation.icosphere(subdivisions=5)
+    for ratio in (0.5, 0.2, 0.05):
+        result = lod.decimate(mesh, ratio, max_error=0.1)
+        assert len(result.faces) < len(mesh.faces) * min(2 * ratio, 0.9)
+        error = np.abs(trimesh.proximity.signed_distance(result, mesh.vertices)).max()
+        assert error <= 0.1 * np.linalg.norm(mesh.extents)
+
+
+def test_error_bound_limits_decimation():
+    mesh = trimesh.creation.icosphere(subdivisions=4)
+    loose = lod.decimate(mesh, 0.05, max_error=0.1)
+    strict = lod.decimate(mesh, 0.05, max_error=0.002)
+    assert len(strict.faces) > len(loose.faces)
+
+
+def test_cluster_vertices_preserves_uv_seams():
+    vertices = np.array([[0, 0, 0], [0, 0, 0.001], [1, 0, 0], [0, 1, 0]], dtype=float)
+    faces = np.array([[0, 2, 3], [1, 3, 2]])
+    uv = np.array([[0, 0], [0.5, 0.5], [1, 0], [0, 1]], dtype=float)
+    v, f, _ = lod.cluster_vertices(vertices, faces, cell=0.1)
+    assert len(v) == 3
+    v, f, new_uv = lod.cluster_vertices(vertices, faces, cell=0.1, uv=uv)
+    assert len(v) == 4 and len(new_uv) == 4
+
+
+def test_generate_lods(tmp_path):
+    path = tmp_path / "0.obj"
+    trimesh.creation.icosphere(subdivisions=4).export(path)
+    levels = lod.generate_lods(path, ratios=(0.5, 0.1), max_error=0.1)
+    assert [p.name for p, _ in levels] == ["0.obj", "0_lod1.obj", "0_lod2.obj"]
+    faces = [n for _, n in levels]
+    assert faces[0] > faces[1] > faces[2]
+    assert all(p.exists() for p, _ in levels)
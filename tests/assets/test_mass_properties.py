@@ -0,0 +1,41 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+import trimesh
+
+from infinigen.assets.utils import mass_properties as mp
+
+
+def test_matches_trimesh():
+    box = trimesh.creation.box(extents=(1, 2, 3))
+    box.apply_translation((1, 2, 3))
+    sphere = trimesh.creation.icosphere(subdivisions=3)
+    props = mp.meshes_mass_properties([box, sphere], densities=[1000, 500])
+    for i, (mesh, density) in enumerate([(box, 1000), (sphere, 500)]):
+        mesh.density = density
+        assert np.isclose(props["mass"][i], mesh.mass)
+        assert np.allclose(props["center_mass"][i], mesh.center_mass)
+        assert np.allclose(props["inertia"][i], mesh.moment_inertia)
+
+
+def test_open_mesh_uses_hull():
+    box = trimesh.creation.box()
+    open_box = trimesh.Trimesh(box.vertices, box.faces[:-2])
+    props = mp.meshes_mass_properties([open_box])
+    assert np.isclose(props["volume"][0], 1.0)
+    assert np.allclose(props["center_mass"][0], 0)
+
+
+def test_material_density():
+    assert mp.material_category(["shader_Oak_floor"]) == "wood"
+    assert mp.material_category(["brushed_steel"]) == "metal"
+    assert mp.material_category(["unknown"]) is None
+    assert mp.material_category(["BrushedMetal.001", "rug"]) == "metal"
+    assert mp.material_category(["floor_tiles"]) == "ceramic"
+    # keywords only match whole words
+    assert mp.material_category(["environment", "cabinet_painting"]) is None
+    assert mp.material_category(["shader_glass_panel"]) == "glass"
+    assert mp.density_for("metal") > mp.density_for("wood")
+    assert mp.density_for(None) == mp.DEFAULT_DENSITY
@@ -0,0 +1,183 @@
+# Copyright (c) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import time
+from math import ceil, floor
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from infinigen.core.util.fcurves import KeyframeArrays, evaluate_fcurve
+from infinigen.core.util.imu import (
+    a_of_bezier,
+    bezier_zeros,
+    data_from_keyframes,
+    v_of_bezier,
+    y_of_bezier,
+)
+
+
+def scalar_data_from_keyframes(
+    keyframe_points, frame_start, frame_end, for_acceleration
+):
+    """The per-frame implementation data_from_keyframes had before evaluate_fcurve"""
+    frame_start = int(ceil(frame_start))
+    frame_end = int(floor(frame_end))
+
+    def f_to_i(frame, is_ceil):
+        f = min(max(frame, frame_start), frame_end) - frame_start
+        return ceil(f) if is_ceil else floor(f)
+
+    data = np.zeros(frame_end - frame_start + 1)
+    locs = np.zeros(frame_end - frame_start + 1)
+    locs[: f_to_i(keyframe_points[0].co[0], False)] = keyframe_points[0].co[1]
+    locs[f_to_i(keyframe_points[-1].co[0], True) :] = keyframe_points[-1].co[1]
+
+    for i in range(len(keyframe_points) - 1):
+        kfs, kls = keyframe_points[i].co
+        kfe, kle = keyframe_points[i + 1].co
+        if kfs > frame_end or kfe < frame_start:
+            continue
+        frames = range(f_to_i(kfs, True), f_to_i(kfe, False) + 1)
+
+        if keyframe_points[i].interpolation == "CONSTANT":
+            locs[frames.start : frames.stop] = kls
+            data[frames.start : frames.stop] = 0
+        elif keyframe_points[i].interpolation == "LINEAR":
+            slope = (kle - kls) / (kfe - kfs)
+            for j in frames:
+                locs[j] = kls + (j + frame_start - kfs) * slope
+                data[j] = 0 if for_acceleration else slope
+        else:
+            cx, cy = scalar_control_points(keyframe_points, i)
+            for j in frames:
+                roots = bezier_zeros(j + frame_start, *cx)
+                if len(roots) == 0:
+                    raise Exception(f"Bezier interpolation failed at frame {j}")
+                data[j] = (
+                    a_of_bezier(roots[0], cx, cy)
+                    if for_acceleration
+                    else v_of_bezier(roots[0], cx, cy)
+                )
+                locs[j] = y_of_bezier(roots[0], cy)
+    return data, locs
+
+
+def scalar_control_points(keyframe_points, i):
+    (kfs, kls), (kfe, kle) = keyframe_points[i].co, keyframe_points[i + 1].co
+    hr, hl = keyframe_points[i].handle_right, keyframe_points[i + 1].handle_left
+    cx, cy = np.array([kfs, *hr[:1], *hl[:1], kfe]), np.array([kls, hr[1], hl[1], kle])
+    if hr[0] > kfe:
+        cx[1], cy[1] = kfe, kls + (kfe - kfs) * ((hr[1] - kls) / (hr[0] - kfs))
+    if hl[0] < kfs:
+        cx[2], cy[2] = kfs, kle + (kfs - kfe) * ((hl[1] - kle) / (hl[0] - kfe))
+    return cx, cy
+
+
+def random_keyframes(rng, n, modes=("CONSTANT", "LINEAR", "BEZIER"), start=1):
+    times = start + np.concatenate([[0], np.cumsum(rng.uniform(1, 20, n - 1))])
+    times[-1] = np.round(times[-1])
+    values = rng.normal(0, 5, n)
+    right = rng.uniform(0.05, 0.45, n) * np.append(np.diff(times), 1)
+    left = rng.uniform(0.05, 0.45, n) * np.insert(np.diff(times), 0, 1)
+    # some handles overshoot the neighbouring keyframe, but not both of one segment
+    overshoot = rng.uniform(size=n) < 0.2
+    right[overshoot[:-1].nonzero()] *= 3
+    left[1:][(overshoot[1:] & ~overshoot[:-1]).nonzero()] *= 3
+
+    keyframes = []
+    for i in range(n):
+        slope = rng.normal(0, 1)
+        keyframes.append(
+            SimpleNamespace(
+                co=(times[i], values[i]),
+                handle_left=(times[i] - left[i], values[i] - slope * left[i]),
+                handle_right=(times[i] + right[i], values[i] + slope * right[i]),
+                interpolation=str(rng.choice(modes)),
+            )
+        )
+    return keyframes
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_scalar(seed):
+    rng = np.random.default_rng(seed)
+    keyframes = random_keyframes(rng, 8)
+    start, end = keyframes[0].co[0] - 3, keyframes[-1].co[0] + 3
+    for for_acceleration in (True, False):
+        expected = scalar_data_from_keyframes(keyframes, start, end, for_acceleration)
+        actual = data_from_keyframes(keyframes, start, end, for_acceleration)
+        for a, e in zip(actual, expected):
+            np.testing.assert_allclose(a, e, rtol=1e-8, atol=1e-8)
+
+
+def test_subframes():
+    rng = np.random.default_rng(0)
+    keyframes = random_keyframes(rng, 6, modes=("BEZIER",))
+    kf = KeyframeArrays.from_keyframe_points(keyframes)
+    frames = np.linspace(keyframes[0].co[0], keyframes[-1].co[0], 1001)
+    values, velocity, acceleration, valid = evaluate_fcurve(kf, frames)
+    assert valid.all()
+
+    key_frames = kf.co[:, 0]
+    for j in range(0, len(frames), 10):
+        i = min(np.searchsorted(key_frames, frames[j], side="right") - 1, len(kf) - 2)
+        cx, cy = scalar_control_points(keyframes, i)
+        (root,) = bezier_zeros(frames[j], *cx)
+        assert values[j] == pytest.approx(y_of_bezier(root, cy), rel=1e-8, abs=1e-8)
+        assert velocity[j] == pytest.approx(
+            v_of_bezier(root, cx, cy), rel=1e-8, abs=1e-8
+        )
+        assert acceleration[j] == pytest.approx(
+            a_of_bezier(root, cx, cy), rel=1e-8, abs=1e-8
+        )
+
+    integer = data_from_keyframes(keyframes, frames[0], frames[-1], False)
+    subframe = data_from_keyframes(keyframes, frames[0], frames[-1], False, rate=4)
+    np.testing.assert_array_equal(subframe[0][::4], integer[0])
+    np.testing.assert_array_equal(subframe[1][::4], integer[1])
+
+
+def test_failures_reported_per_sample():
+    rng = np.random.default_rng(1)
+    keyframes = random_keyframes(rng, 5, modes=("BEZIER",))
+    bad = keyframes[2]
+    bad.handle_right = (np.nan, bad.handle_right[1])
+    kf = KeyframeArrays.from_keyframe_points(keyframes)
+    frames = np.arange(ceil(keyframes[0].co[0]), floor(keyframes[-1].co[0]) + 1)
+    *_, valid = evaluate_fcurve(kf, frames)
+    in_bad_segment = (frames >= keyframes[2].co[0]) & (frames < keyframes[3].co[0])
+    np.testing.assert_array_equal(valid, ~in_bad_segment)
+
+    first_bad = frames[in_bad_segment][0]
+    with pytest.raises(Exception, match=f"failed at frame {first_bad}"):
+        data_from_keyframes(keyframes, frames[0], frames[-1], True)
+
+    keyframes[1].interpolation = "ELASTIC"
+    with pytest.raises(Exception, match="ELASTIC not a supported mode"):
+        data_from_keyframes(keyframes, frames[0], frames[-1], True)
+
+
+def test_speedup():
+    rng = np.random.default_rng(2)
+    keyframes = random_keyframes(rng, 1200, modes=("BEZIER",))
+    start, end = keyframes[0].co[0], keyframes[0].co[0] + 10000 - 1
+    assert keyframes[-1].co[0] > end
+
+    t0 = time.perf_counter()
+    expected = scalar_data_from_keyframes(keyframes, start, end, True)
+    scalar = time.perf_counter() - t0
+
+    vectorized = np.inf
+    for _ in range(5):
+        t0 = time.perf_counter()
+        actual = data_from_keyframes(keyframes, start, end, True)
+        vectorized = min(vectorized, time.perf_counter() - t0)
+
+    assert len(actual[0]) == 10000
+    np.testing.assert_allclose(actual[1], expected[1], rtol=1e-8, atol=1e-8)
+    print(
+        f"scalar {scalar:.3f}s, vectorized {vectorized:.4f}s, {scalar / vectorized:.0f}x"
+    )
+    assert scalar > 50 * vectorized
@@ -0,0 +1,131 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from infinigen.core.util.frame_export import (
+    FrameExportError,
+    FrameExportPool,
+    FrameSnapshot,
+)
+from infinigen.core.util.mesh_export import MeshHistory
+
+
+def make_item(rng, n_verts, n_instances):
+    return dict(
+        vertex_lookup=rng.normal(size=(n_verts, 3)).astype(np.float32),
+        indices=np.arange(n_verts, dtype=np.int32),
+        loop_totals=np.full(n_verts // 4, 4, dtype=np.int32),
+        masktag=np.zeros(n_verts, dtype=np.int32),
+        matrices=rng.normal(size=(n_instances, 4, 4)).astype(np.float32),
+        instance_ids=np.stack(
+            [np.arange(n_instances), np.zeros(n_instances), np.zeros(n_instances)],
+            axis=-1,
+        ).astype(np.int64),
+    )
+
+
+def synthetic_frames(n_frames, n_meshes=12, n_verts=20000, seed=0):
+    """Snapshots of n_frames frames, the first half of the meshes never change"""
+    rng = np.random.default_rng(seed)
+    static = [make_item(rng, n_verts, 8) for _ in range(n_meshes // 2)]
+    frames = []
+    for frame in range(1, n_frames + 1):
+        items = static + [make_item(rng, n_verts, 8) for _ in range(n_meshes // 2)]
+        meshes = [
+            (dict(object_name=f"obj_{i}", mesh_id=f"mesh_{i}"), f"mesh_{i}", item)
+            for i, item in enumerate(items)
+        ]
+        meshes.append((dict(object_name="light", mesh_id=None), None, None))
+        cameras = {
+            f"camview_0_0_{frame:04d}_0.npz": dict(
+                K=np.eye(3), T=rng.normal(size=(4, 4)), HW=np.array((720, 1280))
+            )
+        }
+        frames.append(FrameSnapshot(frame, meshes, cameras))
+    return frames
+
+
+def read_tree(folder):
+    return {
+        str(path.relative_to(folder)): path.read_bytes()
+        for path in sorted(folder.rglob("*"))
+        if path.is_file()
+    }
+
+
+def export(folder, frames, n_workers, history=None, **kwargs):
+    start = time.perf_counter()
+    pool = FrameExportPool(folder, history=history, n_workers=n_workers, **kwargs)
+    for snapshot in frames:
+        pool.submit(snapshot)
+    pool.close()
+    return time.perf_counter() - start
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_workers_write_identical_trees(tmp_path, incremental):
+    frames = synthetic_frames(64, n_verts=2000)
+    trees = []
+    for n_workers in (1, 8):
+        folder = tmp_path / f"{n_workers}_workers"
+        history = MeshHistory() if incremental else None
+        export(folder, frames, n_workers, history, max_inflight_bytes=2**22)
+        trees.append(read_tree(folder))
+    assert trees[0] == trees[1]
+    assert len({p.split("/")[0] for p in trees[0]}) == 64
+    refs = [p for p in trees[0] if p.endswith("saved_mesh.json")]
+    assert all(b'"data_ref"' in trees[0][p] for p in refs[1:]) == incremental
+
+
+def test_parallel_speedup(tmp_path):
+    if (os.cpu_count() or 1) < 4:
+        pytest.skip("needs a multi-core machine")
+    frames = synthetic_frames(64)
+    serial = export(tmp_path / "serial", frames, 1)
+    parallel = export(tmp_path / "parallel", frames, 8)
+    print(f"1 worker {serial:.2f}s, 8 workers {parallel:.2f}s")
+    assert parallel < serial
+
+
+def test_byte_budget(tmp_path):
+    frames = synthetic_frames(16)  # about 5MB of arrays each
+    frames[8:] = [FrameSnapshot(f.frame, f.meshes[:2], f.cameras) for f in frames[8:]]
+    export(tmp_path / "serial", frames, 1, MeshHistory())
+
+    budget = 2**21  # the first half of the frames are over it on their own
+    pool = FrameExportPool(
+        tmp_path / "pool", MeshHistory(), n_workers=8, max_inflight_bytes=budget
+    )
+    for snapshot in frames:
+        entries = iter(snapshot.meshes)
+        pool.submit(FrameSnapshot(snapshot.frame, entries, snapshot.cameras))
+        assert next(entries, None) is None  # read while blender is still on the frame
+    pool.close()
+    assert 0 < pool.peak_inflight_bytes <= budget
+    assert read_tree(tmp_path / "serial") == read_tree(tmp_path / "pool")
+
+
+def test_failed_frame(tmp_path):
+    frames = synthetic_frames(64, n_verts=2000)
+    item = frames[16].meshes[-2][2]  # a mesh of frame 17 only
+    item["instance_ids"] = np.zeros_like(item["instance_ids"])  # duplicates, rejected
+
+    for n_workers in (1, 8):
+        folder = tmp_path / f"{n_workers}_workers"
+        # frame 17 shares its folder with an earlier export, which has to survive
+        (folder / "frame_0017" / "static_mesh").mkdir(parents=True)
+        with pytest.raises(FrameExportError, match="frame 17") as excinfo:
+            export(folder, frames, n_workers, MeshHistory())
+        assert excinfo.value.frame == 17
+
+        assert [p.name for p in (folder / "frame_0017").iterdir()] == ["static_mesh"]
+        written = sorted(p for p in folder.iterdir() if p.name != "frame_0017")
+        assert [p.name for p in written] == [f"frame_{i:04d}" for i in range(1, 17)]
+        for path in written:
+            assert sorted(p.name for p in path.iterdir()) == ["cameras", "mesh"]
+            assert (path / "mesh" / "saved_mesh.json").exists()
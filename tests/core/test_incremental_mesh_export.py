@@ -0,0 +1,148 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import json
+import shutil
+
+import numpy as np
+
+from infinigen.core.util.mesh_export import (
+    MeshHistory,
+    MeshShardWriter,
+    expand_refs,
+    item_arrays,
+    read_mesh_arrays,
+    verify_shards,
+)
+
+N_FRAMES = 48
+N_MESHES = 200
+
+
+def make_meshes(rng, n_verts=400, n_faces=800):
+    meshes = []
+    for i in range(N_MESHES - 1):
+        meshes.append(
+            dict(
+                vertex_lookup=rng.uniform(size=(n_verts, 3)).astype(np.float32),
+                indices=rng.integers(0, n_verts, size=3 * n_faces, dtype=np.int32),
+                loop_totals=np.full(n_faces, 3, dtype=np.int32),
+                masktag=np.zeros(n_verts, dtype=np.int32),
+                is_instance=True,
+                name=f"mesh_{i:03d}",
+            )
+        )
+    meshes.append(
+        dict(
+            vertex_lookup=rng.uniform(size=(5 * n_verts, 3)).astype(np.float32),
+            radii=rng.uniform(size=5 * n_verts).astype(np.float32),
+            is_instance=False,
+            name="hair",
+        )
+    )
+    return meshes
+
+
+def frame_items(meshes, frame):
+    """Items in the form get_all_instances yields; mesh_000 deforms, everything moves"""
+    for i, mesh in enumerate(meshes):
+        item = dict(mesh)
+        if i == 0:
+            item["vertex_lookup"] = mesh["vertex_lookup"] + np.float32(0.01 * frame)
+        matrices = []
+        for k in range(1 + i % 3):
+            mat = np.eye(4, dtype=np.float32)
+            mat[:3, 3] = (frame, i, k)
+            matrices.append(mat)
+        item["matrices"] = matrices
+        item["instance_ids"] = [(i, k, 0) for k in range(len(matrices))]
+        yield (item["vertex_lookup"].shape[0], item["name"])
+        yield item
+
+
+def write_frame(folder, items, history=None, frame=None):
+    """Mirrors the writer loop of exporting.save_obj_and_instances"""
+    writer = MeshShardWriter(
+        folder, history=history, frame=frame, max_shard_bytes=2**20
+    )
+    json_data, expected = [], {}
+    for item in items:
+        if isinstance(item, tuple):
+            continue
+        mesh_id = item["name"]
+        json_data.append(dict(mesh_id=mesh_id, **writer.add(mesh_id, item)))
+        expected[mesh_id] = item_arrays(item)
+    shards = writer.close()
+    for json_val in json_data:
+        json_val.update(shards[json_val["filename"]])
+    (folder / "saved_mesh.json").write_text(json.dumps(json_data, indent=4))
+    return expected
+
+
+def folder_size(folder):
+    return sum(p.stat().st_size for p in folder.rglob("*") if p.is_file())
+
+
+def assert_identical(actual, expected):
+    assert actual.keys() == expected.keys()
+    for mesh_id, arrays in expected.items():
+        assert list(actual[mesh_id]) == list(arrays)
+        for field, arr in arrays.items():
+            arr = np.asarray(arr)
+            assert actual[mesh_id][field].dtype == arr.dtype
+            assert actual[mesh_id][field].shape == arr.shape
+            assert actual[mesh_id][field].tobytes() == arr.tobytes()
+
+
+def test_incremental_export(tmp_path):
+    meshes = make_meshes(np.random.default_rng(0))
+
+    baseline_size = 0
+    for frame in range(N_FRAMES):
+        folder = tmp_path / "baseline"
+        write_frame(folder, frame_items(meshes, frame))
+        baseline_size += folder_size(folder)
+        shutil.rmtree(folder)
+
+    history = MeshHistory()
+    expected = {}
+    for frame in range(N_FRAMES):
+        folder = tmp_path / "incremental" / f"frame_{frame:04d}" / "mesh"
+        expected[frame] = write_frame(
+            folder, frame_items(meshes, frame), history, frame
+        )
+    incremental_size = folder_size(tmp_path / "incremental")
+    assert baseline_size > 10 * incremental_size
+
+    entries = json.loads(
+        (tmp_path / "incremental/frame_0005/mesh/saved_mesh.json").read_text()
+    )
+    refs = {e["mesh_id"]: e.get("data_ref") for e in entries}
+    assert refs["mesh_000"] is None
+    assert refs["hair"]["frame"] == 0 and refs["hair"]["key"] == "hair"
+    assert sum(r is not None for r in refs.values()) == N_MESHES - 1
+
+    for frame in range(N_FRAMES):
+        folder = tmp_path / "incremental" / f"frame_{frame:04d}" / "mesh"
+        assert_identical(read_mesh_arrays(folder), expected[frame])
+
+
+def test_expand_refs(tmp_path):
+    meshes = make_meshes(np.random.default_rng(1))[::20]
+    history = MeshHistory()
+    expected = {}
+    for frame in range(3):
+        folder = tmp_path / f"frame_{frame:04d}" / "mesh"
+        expected[frame] = write_frame(
+            folder, frame_items(meshes, frame), history, frame
+        )
+    for frame in range(3):
+        expand_refs(tmp_path / f"frame_{frame:04d}" / "mesh")
+    shutil.rmtree(tmp_path / "frame_0000")
+
+    folder = tmp_path / "frame_0002" / "mesh"
+    entries = json.loads((folder / "saved_mesh.json").read_text())
+    assert not any("data_ref" in e for e in entries)
+    assert verify_shards(folder) == []
+    assert_identical(read_mesh_arrays(folder), expected[2])
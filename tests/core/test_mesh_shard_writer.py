@@ -0,0 +1,145 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import json
+
+import numpy as np
+import pytest
+
+from infinigen.core.util import mesh_export
+from infinigen.core.util.mesh_export import (
+    MeshShardWriter,
+    item_arrays,
+    load_shard,
+    read_mesh_arrays,
+    verify_shards,
+)
+
+
+def make_items(n, rng):
+    for i in range(n):
+        n_verts = int(rng.integers(100, 3000))
+        if i % 10 == 9:
+            yield dict(
+                vertex_lookup=rng.normal(size=(n_verts, 3)).astype(np.float32),
+                radii=rng.uniform(size=n_verts).astype(np.float32),
+                matrices=np.eye(4, dtype=np.float32)[None],
+                instance_ids=[(i, 0, 0)],
+                is_instance=False,
+                name=f"hair_{i}",
+            )
+            continue
+        n_faces = 2 * n_verts
+        yield dict(
+            # rounded so deflate has something to do
+            vertex_lookup=np.round(rng.normal(size=(n_verts, 3)), 2).astype(np.float32),
+            indices=rng.integers(0, n_verts, size=3 * n_faces, dtype=np.int32),
+            loop_totals=np.full(n_faces, 3, dtype=np.int32),
+            masktag=np.zeros(n_verts, dtype=np.int32),
+            matrices=[np.eye(4, dtype=np.float32)] * 2,
+            instance_ids=[(i, 0, 0), (i, 1, 0)],
+            is_instance=True,
+            name=f"mesh_{i}",
+        )
+
+
+def write_items(folder, items, **kwargs):
+    writer = MeshShardWriter(folder, **kwargs)
+    json_data, expected = [], {}
+    try:
+        for item in items:
+            json_data.append(
+                dict(mesh_id=item["name"], **writer.add(item["name"], item))
+            )
+            expected[item["name"]] = item_arrays(item)
+    finally:
+        shards = writer.close()
+    for json_val in json_data:
+        json_val.update(shards[json_val["filename"]])
+    (folder / "saved_mesh.json").write_text(json.dumps(json_data))
+    return writer, expected
+
+
+@pytest.mark.parametrize(
+    "compression,level",
+    [
+        ("none", None),
+        ("deflate", 6),
+        pytest.param(
+            "zstd",
+            3,
+            marks=pytest.mark.skipif(
+                mesh_export.zstandard is None, reason="zstandard not installed"
+            ),
+        ),
+    ],
+)
+def test_background_writer(tmp_path, compression, level):
+    cap = 2**20
+    writer, expected = write_items(
+        tmp_path,
+        make_items(200, np.random.default_rng(0)),
+        max_shard_bytes=2**18,
+        max_inflight_bytes=cap,
+        n_workers=4,
+        compression=compression,
+        level=level,
+    )
+    assert 0 < writer.pool.peak_inflight_bytes <= cap
+    assert writer.pool.inflight_bytes == 0
+    shards = sorted(tmp_path.glob("saved_mesh_*"))
+    assert len(shards) > 10
+    assert not list(tmp_path.glob(".*"))
+
+    actual = read_mesh_arrays(tmp_path)
+    assert actual.keys() == expected.keys()
+    for mesh_id, arrays in expected.items():
+        assert list(actual[mesh_id]) == list(arrays)
+        for field, arr in arrays.items():
+            np.testing.assert_array_equal(actual[mesh_id][field], arr)
+            assert actual[mesh_id][field].dtype == np.asarray(arr).dtype
+
+    assert verify_shards(tmp_path) == []
+    with open(shards[3], "r+b") as f:
+        f.seek(100)
+        byte = f.read(1)
+        f.seek(100)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    assert verify_shards(tmp_path) == [shards[3].name]
+
+
+def test_deterministic_shards(tmp_path):
+    """Shards don't depend on worker count or write time, so checksums are reproducible"""
+    hashes = []
+    for i, n_workers in enumerate([0, 3]):
+        folder = tmp_path / str(i)
+        folder.mkdir()
+        write_items(
+            folder,
+            make_items(50, np.random.default_rng(1)),
+            max_shard_bytes=2**18,
+            n_workers=n_workers,
+        )
+        hashes.append(json.loads((folder / "saved_mesh.json").read_text()))
+    assert hashes[0] == hashes[1]
+    with load_shard(tmp_path / "0" / "saved_mesh_0001.npz") as d:
+        assert "mesh_0_vertices" in d.files
+
+
+def test_crash_leaves_no_partial_npz(tmp_path):
+    items = list(make_items(60, np.random.default_rng(2)))
+    # not serializable without pickle, so writing its shard fails halfway through
+    items[30]["masktag"] = np.array([object()] * 10)
+    with pytest.raises(ValueError):
+        write_items(tmp_path, items, max_shard_bytes=2**18, n_workers=2)
+
+    assert not list(tmp_path.glob(".*"))
+    assert not (tmp_path / "saved_mesh.json").exists()
+    written = sorted(tmp_path.glob("*.npz"))
+    assert 0 < len(written)
+    for path in written:
+        with np.load(path) as d:
+            assert "mesh_30_masktag" not in d.files
+            for key in d.files:
+                d[key]
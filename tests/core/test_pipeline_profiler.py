@@ -0,0 +1,129 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import json
+import numbers
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from infinigen.core.util.pipeline import RandomStageExecutor
+
+PHASES = {"X", "i", "C", "M"}
+
+
+def validate_trace_event(event):
+    """Checks one event against the Chrome trace-event format for the phases we emit"""
+    assert isinstance(event["name"], str)
+    assert event["ph"] in PHASES
+    assert isinstance(event["pid"], int) and isinstance(event["tid"], int)
+    assert isinstance(event.get("args", {}), dict)
+    if event["ph"] == "M":
+        return
+    assert isinstance(event["ts"], numbers.Real) and event["ts"] >= 0
+    if event["ph"] == "X":
+        assert isinstance(event["dur"], numbers.Real) and event["dur"] >= 0
+    if event["ph"] == "i":
+        assert event["s"] in ("g", "p", "t")
+    if event["ph"] == "C":
+        assert all(isinstance(v, numbers.Real) for v in event["args"].values())
+    json.dumps(event)
+
+
+def make_executor(scene, params=None, profile=True):
+    counters = {
+        "obj_count": lambda: len(scene),
+        "instance_count": lambda: 0,
+        "materials": lambda: sum(o == "material" for o in scene),
+    }
+    return RandomStageExecutor(
+        0, None, params or {}, profile=profile, counters=counters, sample_interval=0.005
+    )
+
+
+def test_profiled_stages(tmp_path):
+    scene = []
+    params = {"disabled_enabled": False, "unlucky_chance": 0}
+    p = make_executor(scene, params)
+
+    def alloc():
+        data = np.ones(64 * 2**20 // 8)
+        time.sleep(0.05)
+        del data
+        scene.append("mesh")
+
+    def outer():
+        time.sleep(0.01)
+        p.run_stage(
+            "inner",
+            lambda: scene.extend(["mesh", "material"]),
+            gc=False,
+            use_chance=False,
+        )
+        time.sleep(0.01)
+        return "done"
+
+    p.run_stage("alloc", alloc, gc=False, use_chance=False)
+    assert p.run_stage("outer", outer, gc=False, use_chance=False) == "done"
+    p.run_stage("disabled", alloc, gc=False, use_chance=False)
+    p.run_stage("unlucky", alloc, gc=False)
+    assert p.run_stage("after", alloc, gc=False, prereq="disabled", default=3) == 3
+    p.close()
+
+    rows = {r["name"]: r for r in p.results}
+    assert rows["disabled"]["skip_reason"] == "disabled"
+    assert rows["unlucky"]["skip_reason"] == "chance"
+    assert rows["after"]["skip_reason"] == "prereq"
+    assert rows["alloc"]["skip_reason"] is None and rows["alloc"]["ran"]
+
+    # nesting
+    outer_row, inner_row = rows["outer"], rows["inner"]
+    assert inner_row["parent_id"] == outer_row["span_id"]
+    assert inner_row["depth"] == 1 and outer_row["depth"] == 0
+    assert inner_row["start_s"] >= outer_row["start_s"]
+    assert (
+        inner_row["start_s"] + inner_row["wall_s"]
+        <= outer_row["start_s"] + outer_row["wall_s"]
+    )
+    assert outer_row["materials"] - outer_row["materials_before"] == 1
+    assert inner_row["obj_count"] - inner_row["obj_count_before"] == 2
+
+    # timestamps, memory and cpu time
+    spans = sorted(p.profiler.spans, key=lambda s: s["span_id"])
+    starts = [s["start_s"] for s in spans]
+    assert starts == sorted(starts)
+    for s in spans:
+        assert s["rss_peak"] >= s["rss_after"] and s["rss_peak"] >= s["rss_before"]
+        assert s["wall_s"] >= 0 and s["cpu_s"] >= 0
+    assert rows["alloc"]["rss_peak"] > rows["alloc"]["rss_before"]
+
+    p.save_results(tmp_path / "pipeline.csv")
+    df = pd.read_csv(tmp_path / "pipeline.csv")
+    assert {"wall_s", "cpu_s", "rss_peak", "skip_reason", "obj_count_before"} <= set(
+        df.columns
+    )
+    trace = json.loads((tmp_path / "pipeline.trace.json").read_text())
+    assert isinstance(trace["traceEvents"], list)
+    for event in trace["traceEvents"]:
+        validate_trace_event(event)
+    complete = [e["name"] for e in trace["traceEvents"] if e["ph"] == "X"]
+    instant = [e["name"] for e in trace["traceEvents"] if e["ph"] == "i"]
+    assert sorted(complete) == ["alloc", "inner", "outer"]
+    assert sorted(instant) == ["after", "disabled", "unlucky"]
+
+
+def n_samplers():
+    return sum(t.name == "rss-sampler" for t in threading.enumerate())
+
+
+def test_profiling_disabled():
+    scene = []
+    before = n_samplers()
+    p = make_executor(scene, profile=False)
+    p.run_stage("stage", lambda: scene.append("mesh"), gc=False, use_chance=False)
+    assert p.profiler is None and n_samplers() == before
+    (row,) = p.results
+    assert row["obj_count"] == 1 and row["ran"] and "wall_s" not in row
@@ -0,0 +1,34 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import colorsys
+
+import numpy as np
+
+from infinigen.core.rendering.post_render import colorize_int_array, hsv_to_rgb
+
+
+def test_hsv_to_rgb_matches_colorsys():
+    h, s, v = np.random.default_rng(0).random((3, 1000))
+    expected = np.array([colorsys.hsv_to_rgb(*hsv) for hsv in zip(h, s, v)])
+    assert np.allclose(hsv_to_rgb(h, s, v), expected)
+
+
+def test_colorize_int_array_deterministic():
+    data = np.random.default_rng(0).integers(0, 20, size=(32, 48, 3)).astype(np.int32)
+    colors = colorize_int_array(data, color_seed=4)
+    assert colors.shape == (32, 48, 3) and colors.dtype == np.uint8
+    assert np.array_equal(colors, colorize_int_array(data.copy(), color_seed=4))
+    assert not np.array_equal(colors, colorize_int_array(data, color_seed=5))
+
+    # only the first two channels contribute to the color
+    shuffled = data.copy()
+    shuffled[..., 2] += 7
+    assert np.array_equal(colors, colorize_int_array(shuffled, color_seed=4))
+
+    flat = data.reshape(-1, 3)[:, :2]
+    _, first, inverse = np.unique(flat, axis=0, return_index=True, return_inverse=True)
+    assert np.array_equal(
+        colors.reshape(-1, 3), colors.reshape(-1, 3)[first][inverse.reshape(-1)]
+    )
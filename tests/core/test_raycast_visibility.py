@@ -0,0 +1,152 @@
+# Copyright (C) 2023, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import time
+
+import numpy as np
+import pytest
+import trimesh
+
+from infinigen.core.placement import segment_bvh
+from infinigen.core.placement.segment_bvh import SegmentBVH
+from infinigen.core.placement.visibility import (
+    FaceVertexIndex,
+    ray_bundle,
+    sensor_grid,
+    visibility_mask,
+)
+from infinigen.tools.raycast_visibility_benchmark import (
+    heightfield,
+    make_frames,
+    per_ray_mask,
+    triangulate,
+)
+
+backends = [
+    False,
+    pytest.param(
+        True,
+        marks=pytest.mark.skipif(
+            segment_bvh.numba is None, reason="numba not installed"
+        ),
+    ),
+]
+
+
+def object_matrix():
+    mat = np.eye(4)
+    c, s = np.cos(0.3), np.sin(0.3)
+    mat[:2, :2] = [[c, -s], [s, c]]
+    mat[:3, 3] = (2, -1, 0.5)
+    return mat
+
+
+def trimesh_per_ray_mask(verts, tris, tri_faces, polygons, frames):
+    """raycast_visiblity_mask's per-pixel loop, tracing with trimesh instead of a SegmentBVH"""
+    intersector = trimesh.ray.ray_triangle.RayMeshIntersector(
+        trimesh.Trimesh(verts, tris, process=False)
+    )
+    mask = np.zeros(len(verts), dtype=bool)
+    for cam_matrix_world, grid, obj_matrix_world in frames:
+        invworld = np.linalg.inv(obj_matrix_world)
+        origin = cam_matrix_world[:3, 3]
+        for destination in grid.reshape(-1, 3) @ cam_matrix_world[:3, :3].T + origin:
+            direction = (destination - origin) / np.linalg.norm(destination - origin)
+            (index,) = intersector.intersects_first(
+                [invworld[:3, :3] @ origin + invworld[:3, 3]],
+                [invworld[:3, :3] @ direction],
+            )
+            if index < 0:
+                continue
+            for vi in polygons[tri_faces[index]]:
+                mask[vi] = True
+    return mask
+
+
+@pytest.mark.parametrize("use_numba", backends)
+def test_matches_per_ray(use_numba):
+    verts, quads = heightfield(2000, seed=1)
+    tris, tri_faces = triangulate(quads)
+    frames = make_frames(6, 12, obj_matrix_world=object_matrix())
+    bvh = SegmentBVH(verts, tris, use_numba=use_numba)
+    face_vertices = FaceVertexIndex.from_faces(quads)
+
+    expected = trimesh_per_ray_mask(verts, tris, tri_faces, quads, frames)
+    assert 0 < expected.sum() < len(verts)
+    for n_workers in (1, 3):
+        actual = visibility_mask(
+            bvh, face_vertices, len(verts), frames, tri_faces, n_workers=n_workers
+        )
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_backends_agree():
+    if segment_bvh.numba is None:
+        pytest.skip("numba not installed")
+    verts, quads = heightfield(20000, seed=2)
+    tris, _ = triangulate(quads)
+    origins, directions = ray_bundle(
+        make_frames(1, 32)[0][0], sensor_grid(35, 36, 24, 40, 60)
+    )
+    t_numpy, face_numpy = SegmentBVH(verts, tris, use_numba=False).ray_hits(
+        origins, directions
+    )
+    t_numba, face_numba = SegmentBVH(verts, tris, use_numba=True).ray_hits(
+        origins, directions
+    )
+    assert (face_numba >= 0).any() and (face_numba < 0).any()
+    np.testing.assert_array_equal(face_numba >= 0, face_numpy >= 0)
+    np.testing.assert_allclose(t_numba, t_numpy, rtol=1e-12)
+    # rays through an edge may report either triangle, depending on rounding
+    for i in np.flatnonzero(face_numba != face_numpy):
+        shared = set(tris[face_numba[i]]) & set(tris[face_numpy[i]])
+        assert len(shared) == 2
+
+
+def test_face_vertex_index():
+    rng = np.random.default_rng(0)
+    polygons = [
+        rng.choice(50, size=rng.integers(3, 7), replace=False) for _ in range(30)
+    ]
+    # blender doesn't promise polygon loops are stored in polygon order
+    order = rng.permutation(len(polygons))
+    loop_vertices = np.concatenate([polygons[i] for i in order])
+    loop_total = np.array([len(p) for p in polygons])
+    loop_start = np.zeros(len(polygons), dtype=int)
+    loop_start[order] = np.cumsum(loop_total[order]) - loop_total[order]
+
+    index = FaceVertexIndex.from_polygons(loop_start, loop_total, loop_vertices)
+    face_mask = rng.uniform(size=len(polygons)) < 0.3
+    expected = np.zeros(50, dtype=bool)
+    for i in np.flatnonzero(face_mask):
+        expected[polygons[i]] = True
+    np.testing.assert_array_equal(index.vertex_mask(face_mask, 50), expected)
+
+
+def test_speedup():
+    if segment_bvh.numba is None:
+        pytest.skip("numba not installed")
+    verts, quads = heightfield(100000)
+    tris, tri_faces = triangulate(quads)
+    bvh = SegmentBVH(verts, tris)
+    face_vertices = FaceVertexIndex.from_faces(quads)
+    frames = make_frames(50, 64)
+    # compile both paths before timing them
+    visibility_mask(bvh, face_vertices, len(verts), frames[:1], tri_faces)
+    expected = per_ray_mask(bvh, quads, tri_faces, len(verts), frames[:1])
+
+    t0 = time.perf_counter()
+    per_ray_mask(bvh, quads, tri_faces, len(verts), frames[1:4])
+    reference = (time.perf_counter() - t0) / 3 * len(frames)
+
+    t0 = time.perf_counter()
+    visibility_mask(bvh, face_vertices, len(verts), frames, tri_faces)
+    batched = time.perf_counter() - t0
+
+    actual = visibility_mask(bvh, face_vertices, len(verts), frames[:1], tri_faces)
+    np.testing.assert_array_equal(actual, expected)
+    print(
+        f"per-ray {reference:.1f}s, batched {batched:.2f}s, {reference / batched:.0f}x"
+    )
+    # about 13x on one core once both are compiled, leave margin for noisy machines
+    assert reference > 5 * batched
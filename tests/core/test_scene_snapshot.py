@@ -0,0 +1,150 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import os
+import time
+
+import numpy as np
+
+from infinigen.core.util.scene_snapshot import (
+    aabb_corners,
+    duplicate_ids,
+    group_bounds,
+    group_rows,
+    instance_items,
+    local_bounds,
+    non_instance_items,
+    take_snapshot,
+    transformed_bounds,
+)
+from infinigen.tools.scene_snapshot_benchmark import (
+    calc_aa_bbox,
+    calc_instance_bbox,
+    extract_geometry,
+    get_id,
+    make_records,
+    one_pass,
+    two_pass,
+)
+
+
+def test_group_rows():
+    rng = np.random.default_rng(0)
+    keys = rng.integers(0, 50, 2000)
+    mask = rng.uniform(size=2000) < 0.7
+
+    expected = {}
+    for row in np.flatnonzero(mask):
+        expected.setdefault(keys[row], []).append(row)
+
+    groups = group_rows(keys, mask)
+    assert list(groups.keys) == list(expected)
+    for i, rows in enumerate(expected.values()):
+        np.testing.assert_array_equal(groups.members(i), rows)
+    np.testing.assert_array_equal(groups.sizes, [len(r) for r in expected.values()])
+
+
+def test_bounds_match_per_mesh():
+    rng = np.random.default_rng(1)
+    n_meshes = 30
+    verts = [rng.normal(size=(rng.integers(1, 50), 3)) for _ in range(n_meshes)]
+    keys = rng.integers(0, n_meshes, 500)
+    matrices = np.tile(np.eye(4, dtype=np.float32), (500, 1, 1))
+    matrices[:, :3, :] = rng.normal(size=(500, 3, 4))
+    matrices[:, 3, :3] = rng.uniform(-0.05, 0.05, (500, 3))  # exercises the divide
+
+    groups = group_rows(keys, np.ones(500, dtype=bool))
+    bounds = np.array([local_bounds(verts[k]) for k in groups.keys])
+    combined = aabb_corners(*group_bounds(groups, matrices, bounds[:, 0], bounds[:, 1]))
+    for i, key in enumerate(groups.keys):
+        expected, single = calc_instance_bbox(matrices[groups.members(i)], verts[key])
+        np.testing.assert_allclose(combined[i], expected, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(aabb_corners(*bounds[i]), single)
+
+    # objects, transforming their local bound_box corners one by one
+    lo, hi = transformed_bounds(
+        matrices[:20],
+        np.stack([v.min(axis=0) for v in verts[:20]]),
+        np.stack([v.max(axis=0) for v in verts[:20]]),
+    )
+    for i in range(20):
+        corners = aabb_corners(verts[i].min(axis=0), verts[i].max(axis=0))
+        h = np.concatenate([corners, np.ones((8, 1))], axis=1) @ matrices[i].T
+        expected = calc_aa_bbox(h[:, :3] / h[:, 3:])
+        np.testing.assert_allclose(aabb_corners(lo[i], hi[i]), expected, atol=1e-9)
+
+
+def test_duplicate_ids():
+    rng = np.random.default_rng(2)
+    keys = rng.integers(0, 10, 300)
+    ids = np.stack([np.arange(300), keys, np.zeros(300)], axis=-1).astype(np.int64)
+    groups = group_rows(keys, np.ones(300, dtype=bool))
+    assert len(duplicate_ids(groups, ids)) == 0
+
+    # the same id in two meshes is fine, twice in one mesh is not
+    a, b = groups.members(3)[:2]
+    c = groups.members(5)[0]
+    ids[c] = ids[a]
+    assert len(duplicate_ids(groups, ids)) == 0
+    ids[b] = ids[a]
+    np.testing.assert_array_equal(duplicate_ids(groups, ids), [3])
+
+
+def test_matches_two_pass():
+    records = make_records(3000, 100, n_singletons=30)
+    with open(os.devnull, "w") as devnull:
+        expected = two_pass(records, devnull)
+    snapshot = take_snapshot(records, get_id, extract_geometry)
+    actual = [*instance_items(snapshot), *non_instance_items(snapshot)]
+
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        if isinstance(e, tuple):
+            assert a == e
+            continue
+        assert a.keys() == e.keys()
+        for field in e:
+            if field in ("bbox", "instance_bbox"):
+                np.testing.assert_allclose(a[field], e[field], rtol=1e-5)
+            elif field == "instance_ids":
+                np.testing.assert_array_equal(a[field], e[field])
+            else:
+                np.testing.assert_array_equal(
+                    np.asarray(a[field]), np.asarray(e[field])
+                )
+
+
+def test_non_instances_extracted_lazily():
+    records = make_records(500, 20, n_singletons=30)
+    extracted = []
+
+    def counting_extract(obj):
+        extracted.append(obj.name)
+        return extract_geometry(obj)
+
+    snapshot = take_snapshot(records, get_id, counting_extract)
+    # only the instanced data blocks, each once
+    assert sorted(extracted) == sorted(set(r.object.name for r in records[:500]))
+
+    extracted.clear()
+    items = non_instance_items(snapshot)
+    assert extracted == []
+    for i in range(3):
+        _, name = next(items)
+        assert extracted[i] == name and len(extracted) == i + 1
+        assert next(items)["name"] == name
+
+
+def test_speedup():
+    records = make_records(25000, 2000)
+    with open(os.devnull, "w") as devnull:
+        one_pass(records[:1000], devnull)
+        t0 = time.perf_counter()
+        two_pass(records, devnull)
+        before = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        one_pass(records, devnull)
+        after = time.perf_counter() - t0
+    print(f"two pass {before:.2f}s, one pass {after:.2f}s, {before / after:.1f}x")
+    # the benchmark shows 8x+ from 12k to 100k instances, leave margin for noisy machines
+    assert before > 4 * after
@@ -0,0 +1,128 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import logging
+
+import numpy as np
+import pytest
+
+from infinigen.core.util.checkpoint import checkpointable, load_manifest
+from infinigen.core.util.pipeline import RandomStageExecutor
+
+
+def make_stages(calls):
+    @checkpointable("pickle")
+    def terrain(size):
+        calls.append("terrain")
+        return {"size": size, "heights": list(np.random.uniform(size=size))}
+
+    @checkpointable("pickle", params=("season_weights",))
+    def season():
+        calls.append("season")
+        return str(np.random.choice(["summer", "autumn", "winter"]))
+
+    @checkpointable("npz")
+    def trees(terrain):
+        calls.append("trees")
+        return np.random.uniform(size=(terrain["size"], 3))
+
+    return terrain, season, trees
+
+
+def run_scene(folder, params=None):
+    calls = []
+    terrain, season, trees = make_stages(calls)
+    p = RandomStageExecutor(
+        0,
+        folder,
+        params or {},
+        counters={},
+        checkpoint=True,
+    )
+    t = p.run_stage("terrain", terrain, 4, use_chance=False, gc=False)
+    s = p.run_stage("season", season, use_chance=False, gc=False)
+    tr = p.run_stage("trees", trees, t, use_chance=False, gc=False)
+    return (t, s, tr), calls, p
+
+
+def assert_same(a, b):
+    assert a[0] == b[0] and a[1] == b[1]
+    np.testing.assert_array_equal(a[2], b[2])
+
+
+def test_rerun_restores_everything(tmp_path):
+    first, calls, _ = run_scene(tmp_path)
+    assert calls == ["terrain", "season", "trees"]
+    second, calls, p = run_scene(tmp_path)
+    assert calls == []
+    assert_same(first, second)
+    assert all(r["restored"] for r in p.results)
+
+    manifest = load_manifest(tmp_path / "checkpoints" / "manifest.json")
+    entries = list(manifest["stages"].values())
+    assert sorted(e["name"] for e in entries) == ["season", "terrain", "trees"]
+    assert all(e["status"] == "complete" and e["size"] > 0 for e in entries)
+
+
+def test_param_change_invalidates_downstream(tmp_path):
+    run_scene(tmp_path)
+    _, calls, _ = run_scene(tmp_path, params={"season_seed": 123})
+    assert calls == ["season", "trees"]
+    # the new checkpoints are reused as well
+    _, calls, _ = run_scene(tmp_path, params={"season_seed": 123})
+    assert calls == []
+    # declared params are part of the key as well, others are not
+    _, calls, _ = run_scene(tmp_path, params={"season_seed": 123, "season_weights": 1})
+    assert calls == ["season", "trees"]
+    _, calls, _ = run_scene(
+        tmp_path, params={"season_seed": 123, "season_weights": 1, "unused": 2}
+    )
+    assert calls == []
+
+
+def test_corrupt_artifact_recomputes(tmp_path, caplog):
+    first, _, _ = run_scene(tmp_path)
+    (artifact,) = (tmp_path / "checkpoints").glob("season-*/ret.pkl")
+    artifact.write_bytes(b"not a pickle")
+    with caplog.at_level(logging.WARNING):
+        second, calls, _ = run_scene(tmp_path)
+    assert calls == ["season"]
+    assert "recomputing" in caplog.text
+    assert_same(first, second)
+
+
+def test_blend_checkpoint_restores_collections(tmp_path):
+    bpy = pytest.importorskip("bpy")
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    calls = []
+
+    @checkpointable("blend")
+    def add_rocks(n):
+        calls.append("rocks")
+        parent = bpy.data.collections.new("placeholders")
+        bpy.context.scene.collection.children.link(parent)
+        col = bpy.data.collections.new("placeholders:rocks")
+        parent.children.link(col)
+        for i in range(n):
+            mesh = bpy.data.meshes.new(f"rock_{i}")
+            mesh.from_pydata([(0, 0, 0), (1, 0, 0), (0, 1, 0)], [], [(0, 1, 2)])
+            obj = bpy.data.objects.new(f"rock_{i}", mesh)
+            obj.location = np.random.uniform(size=3)
+            col.objects.link(obj)
+        return [tuple(o.location) for o in col.objects]
+
+    def run():
+        p = RandomStageExecutor(0, tmp_path, {}, counters={}, checkpoint=True)
+        return p.run_stage("rocks", add_rocks, 3, use_chance=False, gc=False)
+
+    first = run()
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    second = run()
+    assert calls == ["rocks"]
+    assert second == first
+
+    col = bpy.data.collections["placeholders:rocks"]
+    assert bpy.data.collections["placeholders"].children[0] == col
+    assert sorted(o.name for o in col.objects) == ["rock_0", "rock_1", "rock_2"]
+    assert [tuple(o.location) for o in col.objects] == first
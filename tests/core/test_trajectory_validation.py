@@ -0,0 +1,215 @@
+# Copyright (C) 2023, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory of this source tree.
+
+import time
+
+import numpy as np
+import pytest
+import trimesh
+
+from infinigen.core.placement.segment_bvh import SegmentBVH
+from infinigen.core.placement.trajectory_validation import check_freespace
+from infinigen.core.util.fcurves import BEZIER, KeyframeArrays
+
+
+def make_scene(rng, n_obstacles=12, subdivisions=3):
+    ground = trimesh.creation.box(extents=(200, 200, 1))
+    ground.apply_translation((0, 0, -0.5))
+    parts = [ground]
+    for _ in range(n_obstacles):
+        if rng.uniform() < 0.5:
+            part = trimesh.creation.icosphere(subdivisions, radius=rng.uniform(2, 5))
+        else:
+            part = trimesh.creation.box(extents=rng.uniform(2, 8, 3))
+        part.apply_translation((*rng.uniform(-40, 40, 2), rng.uniform(0, 6)))
+        parts.append(part)
+    return trimesh.util.concatenate(parts)
+
+
+def make_trajectory(rng, n_keys, duration, z_range):
+    """Bezier fcurves for location, with handles that don't overshoot neighbouring keys"""
+    times = np.linspace(0, duration, n_keys)
+    gap = duration / (n_keys - 1)
+    fcurves = {}
+    for index in range(3):
+        if index == 2:
+            values = rng.uniform(*z_range, n_keys)
+        else:
+            values = np.cumsum(rng.normal(0, 15, n_keys)) - 40 * (index - 0.5)
+        slopes = rng.normal(0, 0.5, n_keys)
+        offset = gap * rng.uniform(0.1, 0.4, n_keys)
+        co = np.stack([times, values], axis=-1)
+        fcurves[("location", index)] = KeyframeArrays(
+            co=co,
+            handle_left=co - np.stack([offset, slopes * offset], axis=-1),
+            handle_right=co + np.stack([offset, slopes * offset], axis=-1),
+            interpolation=np.full(n_keys, BEZIER, dtype=np.int8),
+            interpolation_names=("BEZIER",) * n_keys,
+        )
+    return fcurves
+
+
+def scalar_value(kf, frame):
+    """One channel at one frame, as frame_set would evaluate it"""
+    keys = kf.co[:, 0]
+    if frame <= keys[0]:
+        return kf.co[0, 1]
+    if frame >= keys[-1]:
+        return kf.co[-1, 1]
+    i = int(np.searchsorted(keys, frame, side="right")) - 1
+    px = (kf.co[i, 0], kf.handle_right[i, 0], kf.handle_left[i + 1, 0], kf.co[i + 1, 0])
+    py = (kf.co[i, 1], kf.handle_right[i, 1], kf.handle_left[i + 1, 1], kf.co[i + 1, 1])
+
+    def bezier(p, t):
+        s = 1 - t
+        return s**3 * p[0] + 3 * s**2 * t * p[1] + 3 * s * t**2 * p[2] + t**3 * p[3]
+
+    lo, hi = 0.0, 1.0
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if bezier(px, mid) < frame:
+            lo = mid
+        else:
+            hi = mid
+    return bezier(py, (lo + hi) / 2)
+
+
+def reference_first_failing(mesh, fcurves, start_frame, end_frame, location, stride):
+    """The per-frame loop of validate_keyframe_range, one ray cast per checked frame"""
+    intersector = trimesh.ray.ray_triangle.RayMeshIntersector(mesh)
+
+    def pose(frame):
+        loc = np.array(location, dtype=np.float64)
+        for (_, index), kf in fcurves.items():
+            loc[index] = scalar_value(kf, frame)
+        return loc
+
+    def freespace_ray_check(a, b):
+        length = np.linalg.norm(b - a)
+        if length == 0:
+            return True
+        hits, *_ = intersector.intersects_location([a], [(b - a) / length])
+        dist = np.linalg.norm(np.reshape(hits, (-1, 3)) - a, axis=-1)
+        return not (dist <= length).any()
+
+    last_pos = np.array(location, dtype=np.float64)
+    if not freespace_ray_check(last_pos, pose(end_frame)):
+        return start_frame
+    for frame_idx in range(start_frame, end_frame + 1, stride):
+        pos = pose(frame_idx)
+        if not freespace_ray_check(last_pos, pos):
+            return frame_idx
+        last_pos = pos
+    return None
+
+
+def batched_first_failing(bvh, fcurves, start_frame, end_frame, location, stride):
+    frames, n_clear = check_freespace(
+        bvh, fcurves, start_frame, end_frame, location, stride=stride
+    )
+    return None if n_clear == len(frames) else int(frames[n_clear])
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_matches_per_frame(seed):
+    rng = np.random.default_rng(seed)
+    mesh = make_scene(rng)
+    bvh = SegmentBVH.from_trimesh(mesh)
+    fcurves = make_trajectory(rng, 6, 120, z_range=(1, 12))
+    location = [fcurves[("location", i)].co[0, 1] for i in range(3)]
+    location[2] += 0.5
+
+    for stride in (1, 5):
+        expected = reference_first_failing(mesh, fcurves, 0, 120, location, stride)
+        actual = batched_first_failing(bvh, fcurves, 0, 120, location, stride)
+        assert actual == expected
+
+
+def test_blocked_and_clear():
+    mesh = trimesh.creation.box(extents=(2, 2, 2))
+    bvh = SegmentBVH.from_trimesh(mesh)
+    a = np.array([[-5, 0, 0], [-5, 5, 0], [0, 0, 0.5]])
+    b = np.array([[5, 0, 0], [5, 5, 0], [0, 0, 0.5]])
+    frac, face = bvh.segment_hits(a, b)
+    assert frac[0] == pytest.approx(0.4)
+    assert face[0] >= 0 and mesh.face_normals[face[0]][0] == pytest.approx(-1)
+    assert np.isinf(frac[1:]).all() and (face[1:] == -1).all()
+
+    location, normal, index, dist = bvh.ray_cast((0, 0, 10), (0, 0, -3))
+    assert dist == pytest.approx(9)
+    np.testing.assert_allclose(normal, mesh.face_normals[index])
+    assert normal[2] == pytest.approx(1)
+    np.testing.assert_allclose(location, (0, 0, 1))
+    assert bvh.ray_cast((0, 0, 10), (0, 0, -1), 5)[0] is None
+    assert bvh.ray_cast((0, 0, 10), (0, 0, 1))[0] is None
+
+
+def test_speedup():
+    rng = np.random.default_rng(100)
+    mesh = make_scene(rng, n_obstacles=40)
+    bvh = SegmentBVH.from_trimesh(mesh)
+    # flies over every obstacle, so both implementations check all 600 frames
+    fcurves = make_trajectory(rng, 12, 599, z_range=(20, 30))
+    location = [fcurves[("location", i)].co[0, 1] for i in range(3)]
+
+    t0 = time.perf_counter()
+    expected = reference_first_failing(mesh, fcurves, 0, 599, location, 1)
+    reference = time.perf_counter() - t0
+
+    batched = np.inf
+    for _ in range(3):
+        t0 = time.perf_counter()
+        actual = batched_first_failing(bvh, fcurves, 0, 599, location, 1)
+        batched = min(batched, time.perf_counter() - t0)
+
+    assert actual == expected is None
+    print(
+        f"per-frame {reference:.3f}s, batched {batched:.4f}s, {reference / batched:.0f}x"
+    )
+    assert reference > 20 * batched
+
+
+def test_scene_bvh_validates_in_batches(monkeypatch):
+    bpy = pytest.importorskip("bpy")
+    from mathutils import Vector
+
+    from infinigen.core.placement import animation_policy
+
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    wall = trimesh.creation.box(extents=(1, 20, 20))
+    wall.apply_translation((5, 0, 0))
+    mesh = bpy.data.meshes.new("wall")
+    mesh.from_pydata(wall.vertices.tolist(), [], wall.faces.tolist())
+    obj = bpy.data.objects.new("wall", mesh)
+    bpy.context.scene.collection.objects.link(obj)
+
+    scene_bvh = animation_policy.SceneBVH(obj)
+    for direction in ((1, 0, 0), (1, 0.3, 0.1), (-1, 0, 0)):
+        expected = scene_bvh.ray_cast(Vector((0, 0, 0)), Vector(direction))
+        actual = scene_bvh.segment_bvh.ray_cast((0, 0, 0), direction)
+        if expected[0] is None:
+            assert actual[0] is None
+        else:
+            np.testing.assert_allclose(actual[0], expected[0], atol=1e-5)
+            assert actual[3] == pytest.approx(expected[3])
+
+    batched = []
+
+    def record(*args, **kwargs):
+        batched.append(validate(*args, **kwargs))
+        return batched[-1]
+
+    validate = animation_policy.validate_keyframe_range_batched
+    monkeypatch.setattr(animation_policy, "validate_keyframe_range_batched", record)
+
+    mover = bpy.data.objects.new("mover", None)
+    bpy.context.scene.collection.objects.link(mover)
+    for target, valid in (((10, 0, 0), False), ((3, 5, 0), True)):
+        mover.animation_data_clear()
+        for frame, loc in ((1, (0, 0, 0)), (20, target)):
+            mover.location = loc
+            mover.keyframe_insert("location", frame=frame)
+        assert (
+            animation_policy.validate_keyframe_range(mover, 1, 20, scene_bvh) == valid
+        )
+    assert batched == [False, True]
@@ -0,0 +1,56 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+import pytest
+
+from infinigen.tools.bake_atlas import (
+    pack_atlas,
+    remap_uvs,
+    resolution_for_texel_density,
+    triangle_areas,
+)
+
+
+def test_triangle_areas():
+    verts = np.array([[0, 0, 0], [2, 0, 0], [0, 3, 0], [0, 0, 1]], dtype=float)
+    tris = np.array([[0, 1, 2], [0, 1, 3]])
+    assert np.allclose(triangle_areas(verts, tris), [3, 1])
+    assert np.allclose(triangle_areas(verts[:, :2], tris[:1]), [3])
+
+
+def test_resolution_for_texel_density():
+    # 1m^2 fully covering UV space at 512 texels/m
+    assert resolution_for_texel_density(1.0, 1.0, 512) == 512
+    # half the UV square wasted on padding needs a bigger texture
+    assert resolution_for_texel_density(1.0, 0.5, 512) == 1024
+    assert resolution_for_texel_density(1e-6, 1.0, 512) == 32
+    assert resolution_for_texel_density(100.0, 1.0, 512, max_res=2048) == 2048
+
+
+def test_pack_atlas_no_overlap():
+    rng = np.random.default_rng(0)
+    sizes = 2 ** rng.integers(4, 9, size=60)
+    tiles = pack_atlas(sizes, 1024)
+    assert [t.size for t in tiles] == list(sizes)
+
+    pages = {}
+    for t in tiles:
+        assert 0 <= t.x and t.x + t.size <= 1024
+        assert 0 <= t.y and t.y + t.size <= 1024
+        canvas = pages.setdefault(t.page, np.zeros((1024, 1024), dtype=int))
+        canvas[t.y : t.y + t.size, t.x : t.x + t.size] += 1
+    assert all(c.max() == 1 for c in pages.values())
+    assert sum(c.sum() for c in pages.values()) == (sizes**2).sum()
+    assert len(pages) == int(np.ceil((sizes**2).sum() / 1024**2))
+
+    with pytest.raises(ValueError):
+        pack_atlas([48], 1024)
+
+
+def test_remap_uvs():
+    (tile,) = pack_atlas([256], 1024)
+    tile.x, tile.y = 512, 256
+    uv = remap_uvs(np.array([[0, 0], [1, 1]], dtype=float), tile, padding=8)
+    assert np.allclose(uv * 1024, [[520, 264], [760, 504]])
@@ -0,0 +1,83 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import os
+import time
+
+import pytest
+
+from infinigen.tools.bake_cache import BakeCache, bake_key
+
+
+def write_bytes(n):
+    def write(path):
+        path.write_bytes(b"x" * n)
+
+    return write
+
+
+def test_bake_cache_store_lookup(tmp_path):
+    cache = BakeCache(tmp_path / "cache")
+    assert cache.lookup("ab" * 32, "DIFFUSE") is None
+
+    path = cache.store("ab" * 32, "DIFFUSE", write_bytes(10))
+    assert path.read_bytes() == b"x" * 10
+    assert cache.lookup("ab" * 32, "DIFFUSE") == path
+    assert cache.lookup("ab" * 32, "ROUGHNESS") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert not any(p.name.endswith(".tmp.png") for p in path.parent.iterdir())
+
+
+def test_bake_cache_evicts_least_recently_used(tmp_path):
+    cache = BakeCache(tmp_path / "cache", max_bytes=350)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.store(key, "DIFFUSE", write_bytes(100))
+        os.utime(cache.entry_folder(key), (i, i))  # deterministic LRU order
+
+    assert cache.lookup(keys[0], "DIFFUSE") is not None  # refreshes keys[0]
+    time.sleep(0.01)
+    cache.store("ff" * 32, "DIFFUSE", write_bytes(100))
+
+    assert cache.size_bytes() <= 350
+    assert cache.lookup(keys[0], "DIFFUSE") is not None
+    assert cache.lookup(keys[1], "DIFFUSE") is None
+    assert cache.lookup("ff" * 32, "DIFFUSE") is not None
+
+
+def make_part(bpy, mesh, location):
+    obj = bpy.data.objects.new("part", mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    obj.location = location
+    return obj
+
+
+def material(bpy, geometry_output):
+    mat = bpy.data.materials.new(geometry_output)
+    mat.use_nodes = True
+    nodes, links = mat.node_tree.nodes, mat.node_tree.links
+    geometry = nodes.new("ShaderNodeNewGeometry")
+    links.new(geometry.outputs[geometry_output], nodes["Principled BSDF"].inputs[0])
+    return mat
+
+
+@pytest.mark.parametrize(
+    "output, per_object", [("Pointiness", False), ("Position", True)]
+)
+def test_bake_key_world_space_inputs(output, per_object):
+    bpy = pytest.importorskip("bpy")
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    scene = bpy.context.scene
+    bpy.ops.mesh.primitive_cube_add()
+    mesh = bpy.context.object.data
+    mesh.materials.append(material(bpy, output))
+
+    a = make_part(bpy, mesh, (0, 0, 0))
+    b = make_part(bpy, mesh, (3, 0, 0))
+    bpy.context.view_layer.update()
+    key = bake_key(a, 512, False, scene)
+    assert (key != bake_key(b, 512, False, scene)) == per_object
+
+    scene.render.bake.margin += 4
+    assert bake_key(a, 512, False, scene) != key
@@ -0,0 +1,153 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+import pytest
+import trimesh
+
+from infinigen.tools.check_articulation import (
+    LinkSDF,
+    check_urdf,
+    collision_intervals,
+    penetration_depth,
+    sample_points,
+    sweep_configurations,
+)
+
+
+def test_link_sdf_depth():
+    sdf = LinkSDF(trimesh.creation.box(extents=(1, 1, 1)), resolution=32)
+    depth = sdf.query(np.array([[0, 0, 0], [0.6, 0, 0], [5, 5, 5]]))
+    assert abs(depth[0] - 0.5) < 0.05
+    assert depth[1] == 0 and depth[2] == 0
+
+
+def test_sliding_box_penetration():
+    box = trimesh.creation.box(extents=(1, 1, 1))
+    sdf, points = LinkSDF(box, 32), sample_points(box, 256)
+    offsets = np.linspace(0, 2, 9)
+    poses_a = np.tile(np.eye(4), (len(offsets), 1, 1))
+    poses_b = poses_a.copy()
+    poses_b[:, 0, 3] = offsets
+    depth = penetration_depth(sdf, points, sdf, points, poses_a, poses_b)
+    # overlapping between offsets 0.25..0.75, touching at 1, separate beyond
+    assert np.all(depth[(offsets > 0.2) & (offsets < 0.8)] > 0.1)
+    assert np.all(depth[offsets >= 1] == 0)
+
+
+def test_collision_intervals():
+    values = np.arange(8) / 10
+    colliding = [0, 1, 1, 0, 0, 1, 1, 1]
+    assert collision_intervals(values, colliding) == [(0.1, 0.2), (0.5, 0.7)]
+    assert collision_intervals(values, np.zeros(8)) == []
+
+
+def test_sweep_configurations():
+    values, cfgs = sweep_configurations(np.array([0.1, 0.2, 0.3]), 1, -1, 1, 5)
+    assert np.allclose(values, np.linspace(-1, 1, 5))
+    assert np.allclose(cfgs[:, 1], values)
+    assert np.allclose(cfgs[:, [0, 2]], [[0.1, 0.3]] * 5)
+
+
+URDF = """<robot name="slider">
+  <link name="world"/>
+  <link name="base">
+    <visual><geometry><mesh filename="box.obj"/></geometry></visual>
+    <collision><geometry><mesh filename="hull.obj"/></geometry></collision>
+  </link>
+  <link name="drawer">
+    <visual><geometry><mesh filename="box.obj"/></geometry></visual>
+  </link>
+  <joint name="fixed" type="fixed"><parent link="world"/><child link="base"/></joint>
+  <joint name="slide" type="prismatic">
+    <parent link="world"/><child link="drawer"/>
+    <origin xyz="2 0 0"/><axis xyz="1 0 0"/>
+    <limit lower="-2" upper="0" effort="1" velocity="1"/>
+  </joint>
+  <joint name="broken" type="prismatic">
+    <parent link="drawer"/><child link="handle"/>
+    <limit lower="1" upper="-1" effort="1" velocity="1"/>
+  </joint>
+  <link name="handle"/>
+</robot>
+"""
+
+
+def test_check_urdf(tmp_path):
+    pytest.importorskip("urdfpy")
+    trimesh.creation.box(extents=(1, 1, 1)).export(tmp_path / "box.obj")
+    # a hull wider than the base, reaching into the drawer at rest
+    trimesh.creation.box(extents=(3.5, 1, 1)).export(tmp_path / "hull.obj")
+    (tmp_path / "slider.urdf").write_text(URDF)
+
+    report = check_urdf(tmp_path / "slider.urdf", n_samples=21, sdf_resolution=32)
+    assert not report["valid"]
+    assert report["invalid_limits"] == ["broken"]
+    assert report["rest_collisions"] == []
+    (hit,) = report["collisions"]["slide"]
+    assert hit["links"] == ["base", "drawer"]
+    # the drawer slides from x=2 to x=0, it is inside the base below x=1
+    ((first, last),) = hit["intervals"]
+    assert -2 <= first <= -1.8 and -1.2 <= last < -1
+
+    report = check_urdf(
+        tmp_path / "slider.urdf", n_samples=21, sdf_resolution=32, use_collision=True
+    )
+    assert report["rest_collisions"] == [["base", "drawer"]]
+    # only sliding deeper into the hull than at rest counts
+    (hit,) = report["collisions"]["slide"]
+    ((first, last),) = hit["intervals"]
+    assert first == -2 and -0.2 <= last < 0
+
+
+BODY_URDF = """<robot name="cabinet">
+  <link name="body">
+    <visual><geometry><mesh filename="box.obj"/></geometry></visual>
+  </link>
+  <link name="drawer">
+    <visual><geometry><mesh filename="box.obj"/></geometry></visual>
+  </link>
+  <joint name="slide" type="prismatic">
+    <parent link="body"/><child link="drawer"/>
+    <origin xyz="1 0 0"/><axis xyz="1 0 0"/>
+    <limit lower="-1" upper="0.5" effort="1" velocity="1"/>
+  </joint>
+</robot>
+"""
+
+PANEL_URDF = """<robot name="panel">
+  <link name="body">
+    <visual><geometry><mesh filename="box.obj"/></geometry></visual>
+  </link>
+  <link name="panel">
+    <visual><geometry><mesh filename="box.obj"/></geometry></visual>
+  </link>
+  <joint name="attach" type="fixed">
+    <parent link="body"/><child link="panel"/><origin xyz="0.5 0 0"/>
+  </joint>
+</robot>
+"""
+
+
+def test_check_urdf_against_parent_body(tmp_path):
+    pytest.importorskip("urdfpy")
+    trimesh.creation.box(extents=(1, 1, 1)).export(tmp_path / "box.obj")
+    (tmp_path / "cabinet.urdf").write_text(BODY_URDF)
+    (tmp_path / "panel.urdf").write_text(PANEL_URDF)
+
+    # the drawer touches its body at rest and slides into it below 0
+    report = check_urdf(tmp_path / "cabinet.urdf", n_samples=21, sdf_resolution=32)
+    assert report["rest_collisions"] == []
+    assert not report["valid"]
+    (hit,) = report["collisions"]["slide"]
+    assert hit["links"] == ["body", "drawer"]
+    # fully coincident boxes only touch at their surface samples, so -1 may not count
+    ((first, last),) = hit["intervals"]
+    assert first <= -0.5 and -0.2 <= last < 0
+
+    # half of the panel is inside the body it is fixed to
+    report = check_urdf(tmp_path / "panel.urdf", sdf_resolution=32)
+    assert report["rest_collisions"] == [["body", "panel"]]
+    assert report["collisions"] == {}
+    assert not report["valid"]
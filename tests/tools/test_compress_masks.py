@@ -0,0 +1,88 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+import pytest
+
+from infinigen.tools import compress_masks
+
+
+def make_mask(H=150, W=97, channels=None, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (H, W) if channels is None else (H, W, channels)
+    return rng.integers(0, 300, size=shape).astype(np.int32)
+
+
+@pytest.mark.parametrize("channels", [None, 3])
+def test_chunked_roundtrip(channels):
+    arr = make_mask(channels=channels)
+    d = compress_masks.compress_chunked(arr, chunk_rows=16)
+    assert compress_masks.is_chunked(d)
+    rec = compress_masks.recover(d)
+    assert rec.dtype == arr.dtype
+    assert np.array_equal(rec, arr)
+    assert np.array_equal(compress_masks.recover(compress_masks.compress(arr)), arr)
+
+
+def test_random_access_rows(tmp_path):
+    arr = make_mask()
+    path = tmp_path / "mask.npz"
+    np.savez(path, **compress_masks.compress_chunked(arr, chunk_rows=16))
+    for start, stop in [(0, 1), (15, 17), (40, 150), (149, 150), (10, 10)]:
+        assert np.array_equal(
+            compress_masks.load_rows(path, start, stop), arr[start:stop]
+        )
+
+
+def test_compress_folder(tmp_path):
+    folder = tmp_path / "frames_0"
+    folder.mkdir()
+    arrs = {f"mask_{i}": make_mask(seed=i) for i in range(4)}
+    for name, arr in arrs.items():
+        np.save(folder / f"{name}.npy", arr)
+    np.save(folder / "small.npy", np.zeros(10, dtype=np.int32))
+
+    written = compress_masks.compress_folder(folder, n_workers=2)
+    assert len(written) == 4
+    assert (folder / "small.npy").exists()
+    for name, arr in arrs.items():
+        assert not (folder / f"{name}.npy").exists()
+        assert np.array_equal(
+            compress_masks.recover(np.load(folder / f"{name}.npz")), arr
+        )
+
+
+def test_unique_rows_matches_numpy():
+    rng = np.random.default_rng(0)
+    rows = rng.integers(-5, 20, size=(1000, 3))
+    uniq, inverse = compress_masks.unique_rows(rows)
+    ref_uniq, ref_inverse = np.unique(rows, axis=0, return_inverse=True)
+    assert np.array_equal(uniq, ref_uniq)
+    assert np.array_equal(inverse, ref_inverse.reshape(-1))
+    assert np.array_equal(uniq[inverse], rows)
+
+
+def test_unique_rows_wide_range():
+    info = np.iinfo(np.int64)
+    rows = np.array([[info.min, 0], [info.max, 1], [0, 0], [0, 0]])
+    uniq, inverse = compress_masks.unique_rows(rows)
+    assert np.array_equal(uniq, np.unique(rows, axis=0))
+    assert np.array_equal(uniq[inverse], rows)
+
+    rows = np.array([[2**64 - 1, 3], [2**63, 3], [2**63, 3]], dtype=np.uint64)
+    uniq, inverse = compress_masks.unique_rows(rows)
+    assert np.array_equal(uniq, np.unique(rows, axis=0))
+    assert np.array_equal(uniq[inverse], rows)
+
+
+def test_unique_rows_wide_int32_span():
+    info = np.iinfo(np.int32)
+    rows = np.array(
+        [[info.max, 1], [info.min, 1], [0, 2], [info.max, 0], [info.min, 1]],
+        dtype=np.int32,
+    )
+    uniq, inverse = compress_masks.unique_rows(rows)
+    ref_uniq, ref_inverse = np.unique(rows, axis=0, return_inverse=True)
+    assert np.array_equal(uniq, ref_uniq)
+    assert np.array_equal(inverse, ref_inverse.reshape(-1))
@@ -0,0 +1,78 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import imageio
+import numpy as np
+
+from infinigen.tools.dataset_loader import (
+    FRAME_INDEX_NAME,
+    InfinigenSceneDataset,
+    close_executors,
+    get_frame_path,
+)
+
+FRAMES = range(1, 6)
+CAMERAS = [0, 1]
+
+
+def make_scene(folder):
+    for cam in CAMERAS:
+        for frame in FRAMES:
+            path = get_frame_path(folder, cam, frame, "Image_png")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            imageio.imwrite(path, np.full((4, 6, 3), frame, dtype=np.uint8))
+
+            path = get_frame_path(folder, cam, frame, "Depth_npy")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(path, np.full((4, 6), frame + cam / 10, dtype=np.float32))
+
+
+def test_dataset_loader(tmp_path):
+    make_scene(tmp_path)
+    dset = InfinigenSceneDataset(
+        tmp_path, data_types=["Image_png", "Depth_npy"], mmap_npy=True
+    )
+    assert (tmp_path / FRAME_INDEX_NAME).exists()
+    assert len(dset) == len(FRAMES)
+    assert dset.cameras == CAMERAS
+    dset.validate()
+
+    item = dset[2]
+    assert len(item) == 2
+    assert item[0]["Image_png"][0, 0, 0] == FRAMES[2]
+    assert isinstance(item[0]["Depth_npy"], np.memmap)
+    assert np.allclose(item[0]["Depth_npy"], FRAMES[2])
+    assert "Depth_npy" not in item[1]  # gt_for_first_camera_only
+
+    for i, item in enumerate(dset.prefetch(depth=3)):
+        assert item[1]["Image_png"][0, 0, 0] == FRAMES[i]
+    assert i == len(FRAMES) - 1
+
+    cached = InfinigenSceneDataset(tmp_path, data_types=["Depth_npy"], num_threads=1)
+    assert cached.index == dset.index
+    assert np.allclose(cached[4][0]["Depth_npy"], FRAMES[4])
+
+
+def test_scenes_share_threads(tmp_path):
+    scenes = [tmp_path / "a", tmp_path / "b"]
+    for folder in scenes:
+        make_scene(folder)
+    dsets = [InfinigenSceneDataset(f, data_types=["Depth_npy"]) for f in scenes]
+    assert dsets[0].executor is dsets[1].executor
+    assert all(np.allclose(d[1][0]["Depth_npy"], FRAMES[1]) for d in dsets)
+
+    close_executors()
+    assert dsets[0].executor is not None
+    assert np.allclose(dsets[1][0][0]["Depth_npy"], FRAMES[0])
+    close_executors()
+
+
+def test_stray_files_skipped(tmp_path):
+    make_scene(tmp_path)
+    cam_folder = get_frame_path(tmp_path, 0, 1, "Image_png").parent
+    (cam_folder / "notes_a_b_c_d.txt").write_text("")
+    (cam_folder / "Thumbs.db").write_bytes(b"")
+    dset = InfinigenSceneDataset(tmp_path, data_types=["Image_png"], num_threads=1)
+    assert sorted(dset.index) == ["Depth_npy", "Image_png"]
+    assert len(dset) == len(FRAMES)
@@ -0,0 +1,57 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+
+from infinigen.core.rendering.post_render import ids_to_colors
+from infinigen.tools.ground_truth.batch_processing import compute_boxes, highlight_mask
+
+
+def reference_boxes(indices, mask, num_u):
+    H, W = indices.shape
+    out = np.stack(
+        [
+            np.full(num_u, W - 1),
+            np.full(num_u, H - 1),
+            np.full(num_u, -1),
+            np.full(num_u, -1),
+        ],
+        axis=-1,
+    )
+    for y in range(H):
+        for x in range(W):
+            if mask[y, x]:
+                i = indices[y, x]
+                out[i] = (
+                    min(out[i, 0], x),
+                    min(out[i, 1], y),
+                    max(out[i, 2], x),
+                    max(out[i, 3], y),
+                )
+    return out
+
+
+def test_highlight_mask():
+    rng = np.random.default_rng(0)
+    arr = rng.integers(0, 50, size=(40, 30))
+    query = np.array([3, 7, 49, 1000])
+    assert np.array_equal(highlight_mask(arr, query), np.isin(arr, query))
+    assert not highlight_mask(arr, []).any()
+
+
+def test_compute_boxes_matches_reference():
+    rng = np.random.default_rng(1)
+    indices = rng.integers(0, 12, size=(23, 31))
+    mask = rng.random((23, 31)) > 0.7
+    boxes = compute_boxes(indices, mask, num_instances=14)
+    assert np.array_equal(boxes, reference_boxes(indices, mask, 14))
+
+
+def test_ids_to_colors_deterministic():
+    rows = np.array([[1, 2], [1, 2], [2, 1]])
+    colors = ids_to_colors(rows)
+    assert colors.dtype == np.uint8 and colors.shape == (3, 3)
+    assert np.array_equal(colors[0], colors[1])
+    assert not np.array_equal(colors[0], colors[2])
+    assert np.array_equal(ids_to_colors(rows, seed=1), ids_to_colors(rows, seed=1))
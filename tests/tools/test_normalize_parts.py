@@ -0,0 +1,59 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+import trimesh
+
+from infinigen.tools.normalize_parts import (
+    find_part_folders,
+    normalization_transform,
+    normalize_folders,
+    output_path,
+)
+from infinigen.tools.obj_io import parse_obj
+
+
+def write_box(path, extents, center=(0, 0, 0), rotation=None):
+    box = trimesh.creation.box(extents=extents)
+    if rotation is not None:
+        box.apply_transform(rotation)
+    box.apply_translation(center)
+    box.export(path)
+
+
+def test_normalization_transform():
+    lo, hi = np.array([0, 0, 0]), np.array([2, 4, 1])
+    t = normalization_transform(lo, hi, "axis")
+    corners = np.array([lo, hi, [1, 2, 0.5]])
+    moved = corners @ t[:3, :3].T + t[:3, 3]
+    np.testing.assert_allclose(moved, [[-0.5] * 3, [0.5] * 3, [0] * 3])
+    t = normalization_transform(lo, hi, "uniform")
+    np.testing.assert_allclose(np.diag(t)[:3], [0.25] * 3)
+
+
+def test_normalize_folders(tmp_path):
+    for i in range(3):
+        folder = tmp_path / "handles" / str(i)
+        folder.mkdir(parents=True)
+        write_box(folder / "a.obj", (1, 1, 1))
+        write_box(folder / "b.obj", (1, 2, 1), center=(3, 0, i))
+    folders = find_part_folders(tmp_path)
+    assert len(folders) == 3
+
+    results = normalize_folders(folders, n_workers=2)
+    assert all(r is not None for r in results.values())
+    whole = parse_obj(output_path(folders[0]))
+    assert len(whole.faces) == 24
+    np.testing.assert_allclose(whole.vertices.min(axis=0), [-0.5] * 3, atol=1e-6)
+    np.testing.assert_allclose(whole.vertices.max(axis=0), [0.5] * 3, atol=1e-6)
+    # outputs are not picked up as part folders on the next run
+    assert find_part_folders(tmp_path) == folders
+
+
+def test_canonical(tmp_path):
+    rotation = trimesh.transformations.rotation_matrix(0.5, (0, 0, 1))
+    write_box(tmp_path / "a.obj", (4, 2, 1), rotation=rotation)
+    normalize_folders([tmp_path], mode="none", canonical=True)
+    extents = np.ptp(parse_obj(output_path(tmp_path)).vertices, axis=0)
+    np.testing.assert_allclose(np.sort(extents), [1, 2, 4], atol=1e-6)
@@ -0,0 +1,74 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from infinigen.tools.compute_occlusion_masks import (
+    NEIGHBOR_OFFSETS,
+    compute_occlusion_masks,
+    get_mask,
+)
+from infinigen.tools.suffixes import get_suffix
+
+
+def reference_mask(depth, flow, dst_depth):
+    H, W = depth.shape
+    interpolator = RegularGridInterpolator(
+        (np.arange(H), np.arange(W)),
+        dst_depth,
+        method="linear",
+        bounds_error=False,
+        fill_value=0,
+    )
+    x, y = np.meshgrid(np.arange(W), np.arange(H), indexing="xy")
+    ty, tx, tz = y + flow[..., 1] * 2, x + flow[..., 0] * 2, depth + flow[..., 2]
+    mask = np.zeros((H, W), dtype=bool)
+    for dy, dx in NEIGHBOR_OFFSETS:
+        pts = np.stack([ty + dy, tx + dx], -1).reshape(-1, 2)
+        mask |= (tz >= 0) & (tz <= interpolator(pts).reshape(H, W))
+    return mask
+
+
+def random_frame(rng, H=30, W=40):
+    depth = rng.random((H, W)) * 5
+    flow = rng.normal(size=(H, W, 3)) * 8
+    return depth, flow
+
+
+def test_get_mask_matches_scipy():
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        depth, flow = random_frame(rng)
+        dst_depth = rng.random(depth.shape) * 5
+        assert np.array_equal(
+            get_mask(depth, flow, dst_depth), reference_mask(depth, flow, dst_depth)
+        )
+
+
+def test_compute_occlusion_masks_folder(tmp_path):
+    rng = np.random.default_rng(1)
+    frames_dir = tmp_path / "frames_0"
+    frames_dir.mkdir()
+    depths = {}
+    for frame in range(1, 8):
+        depth, flow = random_frame(rng)
+        depths[frame] = depth
+        suffix = get_suffix(dict(frame=frame))
+        np.save(frames_dir / f"Depth{suffix}.npy", depth)
+        if frame < 7:
+            np.save(frames_dir / f"Flow3D{suffix}.npy", flow)
+    # files without a frame suffix are skipped
+    np.save(frames_dir / "Flow3D_preview.npy", flow)
+    np.save(frames_dir / "Flow3D_a_b_c_d.npy", flow)
+
+    assert compute_occlusion_masks([frames_dir], 1, n_workers=2, batch_size=2) == 6
+    for frame in range(1, 7):
+        suffix = get_suffix(dict(frame=frame))
+        flow = np.load(frames_dir / f"Flow3D{suffix}.npy")
+        mask = np.load(frames_dir / f"Flow3DMask{suffix}.npy")
+        assert (frames_dir / f"Flow3DMask{suffix}.png").exists()
+        assert np.array_equal(
+            mask, reference_mask(depths[frame], flow, depths[frame + 1])
+        )
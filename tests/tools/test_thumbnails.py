@@ -0,0 +1,70 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+import trimesh
+from PIL import Image
+
+from infinigen.tools.thumbnails import rasterize, render_folder, tile
+
+URDF = """<robot name="cabinet">
+  <link name="base"><visual><geometry><mesh filename="base.obj"/></geometry></visual></link>
+  <link name="door"><visual><geometry><mesh filename="door.obj"/></geometry></visual></link>
+  <joint name="hinge" type="revolute">
+    <parent link="base"/><child link="door"/>
+    <origin xyz="0.5 0.5 0"/><axis xyz="0 0 1"/><limit lower="0" upper="1.5"/>
+  </joint>
+</robot>
+"""
+
+
+def make_asset(folder):
+    folder.mkdir(parents=True)
+    trimesh.creation.box(extents=(1, 1, 1)).export(folder / "base.obj")
+    door = trimesh.creation.box(extents=(1, 0.1, 1))
+    door.apply_translation((-0.5, 0.05, 0))
+    door.export(folder / "door.obj")
+    (folder / "mobility.urdf").write_text(URDF)
+
+
+def test_rasterize_depth_order():
+    near = [[[2, 2], [30, 2], [2, 30]]]
+    far = [[[0, 0], [32, 0], [0, 32]]]
+    tri_px = np.array(far + near, dtype=np.float64)
+    tri_depth = np.array([[2.0] * 3, [1.0] * 3])
+    face_id, depth = rasterize(tri_px, tri_depth, 32, max_candidates=64)
+    assert face_id[5, 5] == 1 and depth[5, 5] == 1
+    assert face_id[0, 0] == 0 and depth[0, 0] == 2
+    assert face_id[31, 31] == -1 and np.isinf(depth[31, 31])
+    # the far triangle covers half the image
+    assert abs((face_id >= 0).mean() - 0.5) < 0.05
+
+
+def test_tile():
+    images = [np.full((2, 3, 3), i, dtype=np.uint8) for i in range(5)]
+    grid = tile(images, 2)
+    assert grid.shape == (6, 6, 3)
+    assert grid[2, 4, 0] == 3 and grid[4, 4, 0] == 0
+
+
+def test_render_folder(tmp_path):
+    make_asset(tmp_path / "assets" / "0")
+    kwargs = dict(n_configs=2, n_views=3, resolution=32, modes=("flat", "depth"))
+    results = render_folder(
+        tmp_path / "assets", output_folder=tmp_path / "out", **kwargs
+    )
+    paths = list(results.values())[0]
+    flat = np.asarray(Image.open(paths["flat"]))
+    assert flat.shape == (64, 96, 3)
+    # the asset is framed in every view, and the door moves between configurations
+    for r in range(2):
+        for c in range(3):
+            assert (flat[r * 32 : (r + 1) * 32, c * 32 : (c + 1) * 32] != 255).any()
+    assert (flat[:32] != flat[32:]).any()
+
+    again = render_folder(
+        tmp_path / "assets", output_folder=tmp_path / "again", **kwargs
+    )
+    again = np.asarray(Image.open(list(again.values())[0]["flat"]))
+    np.testing.assert_array_equal(flat, again)
@@ -0,0 +1,105 @@
+# Copyright (C) 2024, Princeton University.
+# This source code is licensed under the BSD 3-Clause license found in the LICENSE file in the root directory
+# of this source tree.
+
+import numpy as np
+
+from infinigen.tools.obj_io import load_obj, parse_obj, sidecar_path, write_obj
+from infinigen.tools.urdf_to_whole import reconstruct_folder, rpy_matrix
+
+CUBE_OBJ = """mtllib part.mtl
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vt 1 0
+vt 1 1
+vt 0 1
+usemtl wood
+f 1/1 2/2 3/3 4/4
+"""
+
+URDF = """<robot name="asset">
+  <link name="base"><visual><geometry><mesh filename="a/part.obj"/></geometry></visual></link>
+  <link name="door"><visual><geometry><mesh filename="b/part.obj"/></geometry></visual></link>
+  <joint name="hinge" type="revolute">
+    <parent link="base"/><child link="door"/>
+    <origin xyz="2 0 1" rpy="0 0 0"/><axis xyz="0 0 1"/>
+  </joint>
+</robot>
+"""
+
+
+def make_asset(root):
+    for sub, color in [("a", "0.5 0.3 0.1"), ("b", "0.9 0.9 0.9")]:
+        (root / sub).mkdir(parents=True)
+        (root / sub / "part.obj").write_text(CUBE_OBJ)
+        (root / sub / "part.mtl").write_text(
+            f"newmtl wood\nKd {color}\nmap_Kd tex.png\n"
+        )
+    (root / "mobility.urdf").write_text(URDF)
+
+
+def test_parse_obj_triangulates(tmp_path):
+    (tmp_path / "part.obj").write_text(CUBE_OBJ)
+    mesh = parse_obj(tmp_path / "part.obj")
+    np.testing.assert_array_equal(mesh.faces, [[0, 1, 2], [0, 2, 3]])
+    np.testing.assert_array_equal(mesh.face_uvs, mesh.faces)
+    assert (mesh.face_normals == -1).all()
+    np.testing.assert_array_equal(mesh.face_material, [0, 0])
+
+
+def test_write_obj_without_faces(tmp_path):
+    (tmp_path / "part.obj").write_text(CUBE_OBJ.split("usemtl")[0])
+    mesh = parse_obj(tmp_path / "part.obj")
+    assert len(mesh.faces) == 0
+    write_obj(tmp_path / "whole.obj", mesh)
+    np.testing.assert_array_equal(
+        parse_obj(tmp_path / "whole.obj").vertices, mesh.vertices
+    )
+
+
+def test_rpy_matrix():
+    np.testing.assert_allclose(
+        rpy_matrix((0, 0, np.pi / 2)) @ [1, 0, 0], [0, 1, 0], atol=1e-12
+    )
+    r = rpy_matrix((0.3, -0.2, 1.1))
+    np.testing.assert_allclose(r @ r.T, np.eye(3), atol=1e-12)
+
+
+def test_reconstruct_whole(tmp_path):
+    make_asset(tmp_path)
+    results = reconstruct_folder(tmp_path, axes="urdf")
+    output = tmp_path / "whole.obj"
+    assert results == {str(tmp_path / "mobility.urdf"): str(output)}
+
+    whole = parse_obj(output)
+    assert len(whole.vertices) == 8 and len(whole.faces) == 4
+    # the door is moved by the joint origin
+    np.testing.assert_allclose(whole.vertices[4:] - whole.vertices[:4], [[2, 0, 1]] * 4)
+    assert whole.faces.min() == 0 and whole.faces.max() == 7
+    assert (whole.face_uvs >= 0).all()
+
+    # the two parts' different "wood" materials stay distinct, textures point at the parts
+    assert sorted(whole.materials) == ["wood", "wood.001"]
+    mtl = (tmp_path / "whole.mtl").read_text()
+    assert "map_Kd a/tex.png" in mtl and "map_Kd b/tex.png" in mtl
+
+
+def test_blender_axes(tmp_path):
+    make_asset(tmp_path)
+    reconstruct_folder(tmp_path, axes="blender")
+    whole = parse_obj(tmp_path / "whole.obj")
+    # the joint's z offset is blender's up axis, which is y in obj coordinates
+    np.testing.assert_allclose(whole.vertices[4:] - whole.vertices[:4], [[2, 1, 0]] * 4)
+
+
+def test_sidecar(tmp_path):
+    make_asset(tmp_path)
+    mesh_path = tmp_path / "a" / "part.obj"
+    first = load_obj(mesh_path)
+    assert sidecar_path(mesh_path).exists()
+    cached = load_obj(mesh_path)
+    np.testing.assert_array_equal(first.faces, cached.faces)
+    assert cached.materials == ["wood"] and cached.mtllibs == ["part.mtl"]